@@ -88,22 +88,20 @@ class PythonPluginTestCase(integration_tests.TestCase):
         self.assertEqual('#!/usr/bin/env python3', python3_shebang)
         self.assertEqual('#!/usr/bin/env python3', python_shebang)
 
-    def test_build_does_not_keep_pyc_or_pth_files_in_install(self):
-        # .pyc and .pyc files collide between parts.
-        # There is no way to tell pip or setup.py to disable generation of
-        # .pyc
+    def test_build_compiles_bytecode_but_does_not_keep_pth_files(self):
+        # Snaps are read-only, so the bytecode is compiled at build time.
         # The .pth files are only relevant if found inside the pre compiled
-        # site-packges directory so we don't want those either.
+        # site-packges directory so we don't want those.
         project_dir = 'pip-requirements-file'
-        self.run_snapcraft('stage', project_dir)
+        self.run_snapcraft('prime', project_dir)
 
         pyc_files = []
         pth_files = []
-        for _, _, files in os.walk(os.path.join(project_dir, 'stage')):
+        for _, _, files in os.walk(os.path.join(project_dir, 'prime')):
             pyc_files.extend([f for f in files if f.endswith('pyc')])
             pth_files.extend([f for f in files if f.endswith('pth')])
 
-        self.assertEqual([], pyc_files)
+        self.assertIn('argparse.cpython-35.pyc', pyc_files)
         self.assertEqual([], pth_files)
 
     def test_build_doesnt_get_bad_install_directory_lp1586546(self):
@@ -293,6 +293,7 @@ from snapcraft._store import (                      # noqa
     login,
     logout,
     push,
+    push_many,
     register,
     register_key,
     release,
@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 import datetime
 import getpass
@@ -23,7 +24,7 @@ import operator
 import os
 import re
 import subprocess
-import tempfile
+import time
 
 from subprocess import Popen
 
@@ -33,25 +34,30 @@ import yaml
 from snapcraft import storeapi
 from snapcraft.internal import (
     cache,
+    common,
+    deltas,
+    errors,
     repo,
+    squashfs,
 )
 
 
 logger = logging.getLogger(__name__)
 
+# Upper bound of snaps pushed at the same time by push_many.
+_PUSH_MANY_JOBS = 4
+
 
 def _get_data_from_snap_file(snap_path):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        output = subprocess.check_output(
-            ['unsquashfs', '-d',
-             os.path.join(temp_dir, 'squashfs-root'),
-             snap_path, '-e', os.path.join('meta', 'snap.yaml')])
-        logger.debug(output)
-        with open(os.path.join(
-                temp_dir, 'squashfs-root', 'meta', 'snap.yaml')
-        ) as yaml_file:
-            snap_yaml = yaml.load(yaml_file)
-    return snap_yaml
+    with squashfs.SquashfsImage(snap_path) as image:
+        return yaml.load(image.read('meta/snap.yaml'))
+
+
+def _check_pack_profile(snap_filename):
+    profile = squashfs.get_pack_profile(snap_filename)
+    if profile != 'store':
+        raise errors.StoreIncompatiblePackError(
+            path=snap_filename, profile=profile)
 
 
 def _fail_login(msg=''):
@@ -409,16 +415,18 @@ def push(snap_filename, release_channels=None):
         raise FileNotFoundError(
             'The file {!r} does not exist.'.format(snap_filename))
 
+    _check_pack_profile(snap_filename)
     snap_yaml = _get_data_from_snap_file(snap_filename)
     snap_name = snap_yaml['name']
     store = storeapi.StoreClient()
 
+    delta_manager = _start_delta(snap_yaml, snap_filename)
     logger.info('Pushing {!r} to the store.'.format(snap_filename))
-    with _requires_login():
+    with _cancel_delta_on_error(delta_manager), _requires_login():
         store.push_precheck(snap_name)
 
     with _requires_login():
-        tracker = store.upload(snap_name, snap_filename)
+        tracker = _upload(store, snap_name, snap_filename, delta_manager)
 
     result = tracker.track()
     # This is workaround until LP: #1599875 is solved
@@ -429,15 +437,156 @@ def push(snap_filename, release_channels=None):
         logger.info('Uploaded {!r}'.format(snap_name))
     tracker.raise_for_code()
 
-    if os.environ.get('DELTA_UPLOADS_EXPERIMENTAL'):
-        snap_cache = cache.SnapCache(project_name=snap_name)
-        snap_cache.cache(snap_filename, result['revision'])
-        snap_cache.prune(keep_revision=result['revision'])
+    _cache_pushed_snap(snap_name, snap_filename, result['revision'])
+
+    logger.debug('Store traffic: {}'.format(store.transport.metrics))
 
     if release_channels:
         release(snap_name, result['revision'], release_channels)
 
 
+def _start_delta(snap_yaml, snap_filename):
+    """Start the delta from the last pushed revision, if there is one."""
+    if not os.environ.get('DELTA_UPLOADS_EXPERIMENTAL'):
+        return None
+
+    # The cached revisions are named like the snap files.
+    deb_arch = common.format_snap_arch(snap_yaml.get('architectures'))
+    source_path = cache.SnapCache(project_name=snap_yaml['name']).get(
+        deb_arch=deb_arch)
+    if source_path is None:
+        return None
+
+    delta_manager = deltas.DeltaManager(
+        project_name=snap_yaml['name'], source_path=source_path,
+        target_path=snap_filename)
+    delta_manager.start()
+    return delta_manager
+
+
+@contextmanager
+def _cancel_delta_on_error(delta_manager):
+    """Stop getting the delta when the push fails before using it."""
+    try:
+        yield
+    except Exception:
+        if delta_manager:
+            delta_manager.cancel()
+        raise
+
+
+def _upload(store, snap_name, snap_filename, delta_manager, **kwargs):
+    delta = delta_manager.result() if delta_manager else None
+    if delta:
+        try:
+            return store.upload(
+                snap_name, delta.path, delta_format=delta.delta_format,
+                source_hash=delta.source_hash, target_hash=delta.target_hash,
+                delta_hash=delta.delta_hash, **kwargs)
+        except (storeapi.errors.StorePushError,
+                storeapi.errors.StoreUploadError) as e:
+            logger.warning(
+                'Unable to push the delta for {!r}, pushing the full snap: '
+                '{}'.format(snap_filename, e))
+    return store.upload(snap_name, snap_filename, **kwargs)
+
+
+def _cache_pushed_snap(snap_name, snap_filename, revision):
+    if os.environ.get('DELTA_UPLOADS_EXPERIMENTAL'):
+        snap_cache = cache.SnapCache(project_name=snap_name)
+        snap_cache.cache(snap_filename, revision)
+        snap_cache.prune(keep_revision=revision)
+        # Deltas are only generated from the last pushed revision.
+        cache.DeltaCache(project_name=snap_name).prune()
+
+
+@contextmanager
+def _timed(timings, step):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[step] = round(time.monotonic() - start, 3)
+
+
+def _push_one(store, snap_filename, release_channels, pushed):
+    summary = {'snap': snap_filename, 'timings': {}}
+    timings = summary['timings']
+    try:
+        with _timed(timings, 'total'):
+            with _timed(timings, 'metadata'):
+                _check_pack_profile(snap_filename)
+                snap_yaml = _get_data_from_snap_file(snap_filename)
+                snap_name = snap_yaml['name']
+            summary['name'] = snap_name
+            delta_manager = _start_delta(snap_yaml, snap_filename)
+            with _timed(timings, 'precheck'), \
+                    _cancel_delta_on_error(delta_manager):
+                store.push_precheck(snap_name)
+            with _timed(timings, 'upload'):
+                tracker = _upload(store, snap_name, snap_filename,
+                                  delta_manager, show_progress=False)
+            with _timed(timings, 'processing'):
+                result = tracker.wait()
+            summary['status'] = result['code']
+            summary['revision'] = result.get('revision')
+            tracker.raise_for_code()
+            # Caching prunes the revisions and deltas other pushes of the
+            # same snap may be using, so it is left until they are done.
+            pushed.append((snap_name, snap_filename, result['revision']))
+            if release_channels:
+                with _timed(timings, 'release'):
+                    store.release(
+                        snap_name, result['revision'], release_channels)
+                summary['released'] = release_channels
+    except Exception as e:
+        logger.debug('Failed to push {!r}'.format(snap_filename),
+                     exc_info=True)
+        summary['error'] = str(e)
+    else:
+        logger.info('Pushed {!r} as revision {!r} of {!r}.'.format(
+            snap_filename, summary['revision'], snap_name))
+    return summary
+
+
+def push_many(snap_filenames, release_channels=None, jobs=None):
+    """Push several snap files to the store concurrently.
+
+    Every snap goes through the same steps as with push, using a single
+    authenticated StoreClient, with at most jobs snaps in flight at a time.
+
+    :returns: a summary per snap, in the same order as snap_filenames, with
+              the name, revision, status, release channels or error, and
+              the time in seconds spent in each step.
+    """
+    if not snap_filenames:
+        raise ValueError('No snap files to push.')
+    missing = [f for f in snap_filenames if not os.path.exists(f)]
+    if missing:
+        raise FileNotFoundError(
+            'The file {!r} does not exist.'.format(missing[0]))
+    if jobs is None:
+        jobs = min(len(snap_filenames), _PUSH_MANY_JOBS)
+
+    store = storeapi.StoreClient()
+    # Check the credentials once, instead of failing on every snap.
+    with _requires_login():
+        store.get_account_information()
+
+    logger.info('Pushing {} snaps to the store, {} at a time.'.format(
+        len(snap_filenames), jobs))
+    pushed = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        summaries = list(executor.map(
+            lambda f: _push_one(store, f, release_channels, pushed),
+            snap_filenames))
+    for snap_name, snap_filename, revision in pushed:
+        _cache_pushed_snap(snap_name, snap_filename, revision)
+    logger.debug('Store traffic: {}'.format(store.transport.metrics))
+
+    return summaries
+
+
 def _get_text_for_opened_channels(opened_channels):
     if len(opened_channels) == 1:
         return 'The {!r} channel is now open.'.format(opened_channels[0])
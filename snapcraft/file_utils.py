@@ -14,8 +14,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import contextmanager
+import mmap
+import multiprocessing
 import os
+import pickle
+import re
 import shutil
 import subprocess
 import logging
@@ -30,6 +36,18 @@ from snapcraft.internal.errors import (
 logger = logging.getLogger(__name__)
 
 
+# Only this much of a file is read to decide whether or not it's binary.
+_BINARY_SNIFF_SIZE = 8192
+
+# Characters with a special meaning in a regular expression, used to find
+# the literal text a search pattern starts with.
+_REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]()|\\')
+_REGEX_QUANTIFIERS = frozenset('*+?{')
+
+# Below this many bytes to rewrite, starting workers costs more than it saves.
+_PARALLEL_REPLACE_MIN_SIZE = 1024 * 1024
+
+
 def replace_in_file(directory, file_pattern, search_pattern, replacement):
     """Searches and replaces patterns that match a file pattern.
     :param str directory: The directory to look for files.
@@ -40,11 +58,79 @@ def replace_in_file(directory, file_pattern, search_pattern, replacement):
                             with.
     """
 
+    replace_in_files(directory, [(file_pattern, search_pattern, replacement)])
+
+
+def replace_in_files(directory, replacements):
+    """Apply several search and replace passes in a single directory walk.
+
+    Binary files are skipped, and files are only decoded if they contain
+    text a pass could match. Unless there is little to do, matching files
+    are rewritten in a pool of processes, or of threads if a replacement
+    cannot be pickled (e.g. a closure).
+
+    :param str directory: The directory to look for files.
+    :param list replacements: (file_pattern, search_pattern, replacement)
+                              tuples, as taken by replace_in_file. They are
+                              applied in order to every file they match.
+    """
+
+    passes = [(file_pattern, search_pattern, replacement,
+               _get_required_literal(search_pattern))
+              for file_pattern, search_pattern, replacement in replacements]
+
+    # Hard links to a file are only rewritten once, with the passes matching
+    # any of its names, so no two workers ever write the same file.
+    jobs = collections.OrderedDict()
+    total_size = 0
     for root, directories, files in os.walk(directory):
         for file_name in files:
-            if file_pattern.match(file_name):
-                _search_and_replace_contents(os.path.join(root, file_name),
-                                             search_pattern, replacement)
+            file_path = os.path.join(root, file_name)
+            # Don't bother trying to rewrite a symlink. It's either invalid
+            # or the linked file will be rewritten on its own.
+            if os.path.islink(file_path):
+                continue
+            file_passes = [p for p in passes if p[0].match(file_name)]
+            if not file_passes:
+                continue
+            file_stat = os.stat(file_path)
+            inode = (file_stat.st_dev, file_stat.st_ino)
+            if inode in jobs:
+                file_passes = [p for p in passes
+                               if p in jobs[inode][1] or p in file_passes]
+                file_path = jobs[inode][0]
+            else:
+                total_size += file_stat.st_size
+            jobs[inode] = (file_path, file_passes)
+
+    if len(jobs) < 2 or total_size < _PARALLEL_REPLACE_MIN_SIZE:
+        _log_warnings(map(_search_and_replace_job, jobs.values()))
+        return
+
+    workers = multiprocessing.cpu_count()
+    if _can_pickle(passes):
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    with executor:
+        # Consuming the results raises the errors from the workers here.
+        _log_warnings(executor.map(
+            _search_and_replace_job, jobs.values(),
+            chunksize=max(1, len(jobs) // (workers * 4))))
+
+
+def _log_warnings(warnings):
+    for warning in warnings:
+        if warning:
+            logger.warning(warning)
+
+
+def _can_pickle(value):
+    try:
+        pickle.dumps(value)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
 
 
 def link_or_copy(source, destination, follow_symlinks=False):
@@ -151,28 +237,89 @@ def create_similar_directory(source, destination, follow_symlinks=False):
     shutil.copystat(source, destination, follow_symlinks=follow_symlinks)
 
 
-def _search_and_replace_contents(file_path, search_pattern, replacement):
-    # Don't bother trying to rewrite a symlink. It's either invalid or the
-    # linked file will be rewritten on its own.
-    if os.path.islink(file_path):
-        return
+def _get_required_literal(search_pattern):
+    """Return the literal text every match of search_pattern starts with.
 
+    The literal is returned UTF-8 encoded so it can be looked for in the raw
+    file contents, or None if there is no such literal. Only the plain text
+    at the start of the pattern is considered, anything else gets None.
+    """
+    pattern = search_pattern.pattern
+    if (search_pattern.flags & (re.IGNORECASE | re.VERBOSE) or
+            '|' in pattern):
+        return None
+
+    literal = ''
+    index = 1 if pattern.startswith('^') else 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '\\':
+            # Only escaped punctuation stands for itself.
+            char = pattern[index + 1:index + 2]
+            if not char or char.isalnum():
+                break
+            index += 2
+        elif char in _REGEX_SPECIAL_CHARS:
+            break
+        else:
+            index += 1
+        # A quantified character may not be there at all.
+        if pattern[index:index + 1] in _REGEX_QUANTIFIERS:
+            break
+        literal += char
+
+    return literal.encode() if literal else None
+
+
+def _skip_unmatched_passes(contents, passes):
+    # Skip the passes that cannot match. Once one pass may change the
+    # contents, the rest need to be applied to its result.
+    for index, (_, _, _, literal) in enumerate(passes):
+        if literal is None or contents.find(literal) != -1:
+            return passes[index:]
+    return []
+
+
+def _search_and_replace_job(job):
+    return _search_and_replace_contents(*job)
+
+
+def _search_and_replace_contents(file_path, passes):
+    """Apply passes to file_path.
+
+    :returns: a warning for the caller to log, or None.
+    """
     try:
-        with open(file_path, 'r+') as f:
+        with open(file_path, 'r+b') as f:
+            header = f.read(_BINARY_SNIFF_SIZE)
+            # Nothing to do for empty files, and anything with a NUL byte
+            # is treated as binary.
+            if not header or b'\0' in header:
+                return
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                passes = _skip_unmatched_passes(m, passes)
+                if not passes:
+                    return
+                contents = m[:]
+
             try:
-                original = f.read()
+                original = contents.decode()
             except UnicodeDecodeError:
                 # This was probably a binary file. Skip it.
                 return
 
-            replaced = search_pattern.sub(replacement, original)
+            replaced = original
+            for _, search_pattern, replacement, _ in passes:
+                replaced = search_pattern.sub(replacement, replaced)
             if replaced != original:
                 f.seek(0)
                 f.truncate()
-                f.write(replaced)
+                f.write(replaced.encode())
     except PermissionError as e:
-        logger.warning('Unable to open {path} for writing: {error}'.format(
-            path=file_path, error=e))
+        # Logged by the caller, as this may run in another process.
+        return 'Unable to open {path} for writing: {error}'.format(
+            path=file_path, error=e)
 
 
 def executable_exists(path):
@@ -73,3 +73,21 @@ def pluralize(container, if_one, if_multiple):
         return if_one
     else:
         return if_multiple
+
+
+def humanize_bytes(size):
+    """Format a size in bytes into a human-readable string.
+
+    :param int size: Number of bytes to humanize.
+    """
+
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(size) < 1024:
+            break
+        size /= 1024
+    else:
+        unit = 'TiB'
+
+    if unit == 'B':
+        return '{:.0f} {}'.format(size, unit)
+    return '{:.1f} {}'.format(size, unit)
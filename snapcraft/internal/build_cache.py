@@ -0,0 +1,132 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache the compilation of C and C++ sources between builds with ccache.
+
+Parts are built with ccache's compiler symlinks first in PATH, so every
+plugin calling cc, gcc, g++ or a cross compiler by name goes through the
+cache. Caches are kept per target architecture, so cross compiled objects
+never mix with native ones.
+"""
+
+import contextlib
+import logging
+import os
+import re
+import subprocess
+
+from xdg import BaseDirectory
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = '5G'
+
+# The compiler symlinks installed by the ccache package.
+_MASQUERADE_DIR = '/usr/lib/ccache'
+_SHOW_STATS_PATTERN = re.compile(
+    r'^cache (hit \((?:direct|preprocessed)\)|miss)\s+(\d+)$', re.MULTILINE)
+
+
+def get_cache_dir(project_name, deb_arch, *, shared=False):
+    """Return the ccache directory of project_name when building for deb_arch.
+
+    A shared cache is used by all the projects instead.
+    """
+    cache_root = os.path.join(BaseDirectory.xdg_cache_home, 'snapcraft')
+    if not shared:
+        cache_root = os.path.join(cache_root, project_name)
+    return os.path.join(cache_root, 'ccache', deb_arch)
+
+
+def get_env(cache_dir, *, base_dir, max_size=DEFAULT_MAX_SIZE):
+    """Return the build environment compiling through ccache."""
+    return [
+        'PATH="{}:$PATH"'.format(_MASQUERADE_DIR),
+        'CCACHE_DIR="{}"'.format(cache_dir),
+        'CCACHE_MAXSIZE={}'.format(max_size),
+        # Paths below base_dir are hashed relative to it, so projects
+        # sharing a cache hit the same entries.
+        'CCACHE_BASEDIR="{}"'.format(base_dir),
+        'CCACHE_COMPILERCHECK=content',
+    ]
+
+
+def get_stats(cache_dir):
+    """Return the hits and misses recorded in cache_dir.
+
+    :returns: a (hits, misses) tuple, or None if ccache is not available.
+    """
+    env = os.environ.copy()
+    env['CCACHE_DIR'] = cache_dir
+    try:
+        output = _run_ccache(['--print-stats'], env)
+    except FileNotFoundError:
+        return None
+    except subprocess.CalledProcessError:
+        # ccache older than 3.7 can only show human readable stats.
+        try:
+            output = _run_ccache(['--show-stats'], env)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return _parse_show_stats(output)
+    return _parse_print_stats(output)
+
+
+def _run_ccache(args, env):
+    return subprocess.check_output(
+        ['ccache'] + args, env=env, stderr=subprocess.DEVNULL,
+        universal_newlines=True)
+
+
+def _parse_print_stats(output):
+    counters = {}
+    for line in output.splitlines():
+        key, _, value = line.partition('\t')
+        with contextlib.suppress(ValueError):
+            counters[key] = int(value)
+    hits = (counters.get('direct_cache_hit', 0) +
+            counters.get('preprocessed_cache_hit', 0))
+    return hits, counters.get('cache_miss', 0)
+
+
+def _parse_show_stats(output):
+    hits = misses = 0
+    for counter, value in _SHOW_STATS_PATTERN.findall(output):
+        if counter == 'miss':
+            misses += int(value)
+        else:
+            hits += int(value)
+    return hits, misses
+
+
+@contextlib.contextmanager
+def report_hit_rate(cache_dir):
+    """Log the hit rate of the compilations done within the context."""
+    before = get_stats(cache_dir) if cache_dir else None
+    yield
+    if before is None:
+        return
+    after = get_stats(cache_dir)
+    if after is None:
+        return
+
+    hits = after[0] - before[0]
+    compilations = hits + after[1] - before[1]
+    if compilations:
+        logger.info(
+            'Build cache: {} of {} compilations were cached ({:.0%}).'.format(
+                hits, compilations, hits / compilations))
@@ -14,4 +14,5 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from ._delta import DeltaCache  # noqa
 from ._snap import SnapCache  # noqa
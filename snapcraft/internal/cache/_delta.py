@@ -0,0 +1,80 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2017 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import shutil
+
+from snapcraft.file_utils import link_or_copy
+from ._cache import SnapcraftProjectCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaCache(SnapcraftProjectCache):
+    """Cache for deltas between snap revisions.
+
+    Deltas are keyed by the digests of their source and target snaps.
+    """
+    def __init__(self, *, project_name):
+        super().__init__(project_name=project_name)
+        self.delta_cache_dir = os.path.join(self.project_cache_root, 'deltas')
+        os.makedirs(self.delta_cache_dir, exist_ok=True)
+
+    def _get_delta_path(self, source_digest, target_digest, delta_format):
+        return os.path.join(self.delta_cache_dir, source_digest,
+                            '{}.{}'.format(target_digest, delta_format))
+
+    def get(self, source_digest, target_digest, delta_format):
+        """Return the path to a cached delta, or None if there is none."""
+        delta_path = self._get_delta_path(
+            source_digest, target_digest, delta_format)
+        if os.path.isfile(delta_path):
+            return delta_path
+        return None
+
+    def cache(self, delta_filename, source_digest, target_digest,
+              delta_format):
+        """Cache a delta in XDG cache.
+
+        :returns: path to cached delta.
+        """
+        cached_delta_path = self._get_delta_path(
+            source_digest, target_digest, delta_format)
+        try:
+            os.makedirs(os.path.dirname(cached_delta_path), exist_ok=True)
+            link_or_copy(delta_filename, cached_delta_path)
+        except OSError:
+            logger.warning(
+                'Unable to cache delta {}.'.format(delta_filename))
+        return cached_delta_path
+
+    def prune(self):
+        """Prune all the deltas in XDG cache.
+
+        :returns: pruned directories paths list, one per source.
+        """
+        pruned_files_list = []
+        for source_digest in os.listdir(self.delta_cache_dir):
+            source_dir = os.path.join(self.delta_cache_dir, source_digest)
+            try:
+                shutil.rmtree(source_dir)
+                pruned_files_list.append(source_dir)
+            except OSError:
+                logger.warning(
+                    'Unable to purge deltas in {}.'.format(source_dir))
+        return pruned_files_list
@@ -51,6 +51,25 @@ class SnapCache(SnapcraftProjectCache):
                 'Unable to cache snap {}.'.format(cached_snap))
         return cached_snap_path
 
+    def get(self, *, deb_arch):
+        """Get the latest cached revision of the snap for deb_arch.
+
+        :returns: path to the cached revision, or None if there is none.
+        """
+        latest_revision = None
+        cached_snap_path = None
+        for snap_filename in os.listdir(self.snap_cache_dir):
+            revision = _get_revision_from_snap_filename(snap_filename)
+            if revision is None:
+                continue
+            if snap_filename.split('_')[2] != deb_arch:
+                continue
+            if latest_revision is None or revision > latest_revision:
+                latest_revision = revision
+                cached_snap_path = os.path.join(
+                    self.snap_cache_dir, snap_filename)
+        return cached_snap_path
+
     def prune(self, *, keep_revision):
         """Prune the snap revisions beside the keep_revision in XDG cache.
 
@@ -92,16 +92,21 @@ def run_output(cmd, **kwargs):
 def format_snap_name(snap):
     if 'arch' not in snap:
         snap['arch'] = snap.get('architectures', None)
-    if not snap['arch']:
-        snap['arch'] = 'all'
-    elif len(snap['arch']) == 1:
-        snap['arch'] = snap['arch'][0]
-    else:
-        snap['arch'] = 'multi'
+    snap['arch'] = format_snap_arch(snap['arch'])
 
     return '{name}_{version}_{arch}.snap'.format(**snap)
 
 
+def format_snap_arch(architectures):
+    """Return the arch part of the file name of a snap for architectures."""
+    if not architectures:
+        return 'all'
+    elif len(architectures) == 1:
+        return architectures[0]
+    else:
+        return 'multi'
+
+
 def set_plugindir(plugindir):
     global _plugindir
     _plugindir = plugindir
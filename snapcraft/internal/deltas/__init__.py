@@ -19,3 +19,9 @@
 from . import errors # noqa
 from ._deltas import BaseDeltasGenerator # noqa
 from ._xdelta3 import XDelta3Generator # noqa
+from ._manager import (  # noqa
+    calculate_digest,
+    Delta,
+    DeltaManager,
+    estimate_delta_ratio,
+)
@@ -18,6 +18,7 @@
 import logging
 import os
 import subprocess
+import threading
 import time
 
 from snapcraft import file_utils
@@ -53,6 +54,10 @@ class BaseDeltasGenerator:
         self.delta_file_extname = delta_file_extname
         self.delta_tool_path = delta_tool_path
 
+        self._proc = None
+        self._cancelled = False
+        self._proc_lock = threading.Lock()
+
         # some pre-checks
         self._check_properties()
         self._check_file_existence()
@@ -162,12 +167,23 @@ class BaseDeltasGenerator:
         workdir, stdout_path, stdout_file, \
             stderr_path, stderr_file = self._setup_std_output(delta_file)
 
-        proc = subprocess.Popen(
-            delta_cmd,
-            stdout=stdout_file,
-            stderr=stderr_file,
-            cwd=workdir
-        )
+        with self._proc_lock:
+            if not self._cancelled:
+                self._proc = subprocess.Popen(
+                    delta_cmd,
+                    stdout=stdout_file,
+                    stderr=stderr_file,
+                    cwd=workdir
+                )
+        proc = self._proc
+        if proc is None:
+            stdout_file.close()
+            stderr_file.close()
+            os.remove(stdout_path)
+            os.remove(stderr_path)
+            raise DeltaGenerationError(
+                'The {} delta generation was cancelled.'.format(
+                    self.delta_format))
 
         if progress_indicator:
             self._update_progress_indicator(proc, progress_indicator)
@@ -214,6 +230,17 @@ class BaseDeltasGenerator:
 
         return delta_file
 
+    def cancel(self):
+        """Kill the delta generation tool, if it is running.
+
+        A make_delta call in progress, or made later, raises
+        DeltaGenerationError.
+        """
+        with self._proc_lock:
+            self._cancelled = True
+            if self._proc is not None and self._proc.poll() is None:
+                self._proc.kill()
+
     # ------------------------------------------------------
     # the methods need to be implemented in subclass
     # ------------------------------------------------------
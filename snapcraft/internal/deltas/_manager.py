@@ -0,0 +1,212 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2017 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+from snapcraft.internal import cache
+from snapcraft.internal.errors import SnapcraftError
+from snapcraft.internal.deltas.errors import DeltaGenerationError
+from snapcraft.internal.deltas._xdelta3 import XDelta3Generator
+
+
+logger = logging.getLogger(__name__)
+
+# A delta bigger than this fraction of its target is not worth the work
+# the store needs to rebuild the snap from it.
+MAX_DELTA_RATIO = 0.6
+# The seconds a push is willing to wait for its delta to be generated.
+DELTA_TIME_BUDGET = 60
+
+# Chunks used to estimate deltas end where this marker is found past their
+# minimum size, so that data moved between two snaps still splits into the
+# same chunks. In compressed data that makes chunks of about 4KiB.
+_CHUNK_MARKER = b'\xa5'
+_MIN_CHUNK_SIZE = 4096
+
+Delta = namedtuple('Delta', [
+    'path', 'delta_format', 'source_hash', 'target_hash', 'delta_hash',
+    'cached'])
+
+
+class DeltaManager:
+    """Decide between pushing a delta or a full snap.
+
+    The delta from the last pushed revision is estimated and generated in
+    the background once start is called, typically while the push is
+    prechecked, and kept in a DeltaCache keyed by the digests of its source
+    and target so that pushing the same snap again reuses it.
+    """
+
+    def __init__(self, *, project_name, source_path, target_path,
+                 generator_class=XDelta3Generator,
+                 max_ratio=MAX_DELTA_RATIO, time_budget=DELTA_TIME_BUDGET):
+        self.source_path = source_path
+        self.target_path = target_path
+        self.max_ratio = max_ratio
+        self.time_budget = time_budget
+        self.metrics = {}
+
+        self._delta_cache = cache.DeltaCache(project_name=project_name)
+        self._generator_class = generator_class
+        self._generator = None
+        self._cancelled = threading.Event()
+        self._executor = None
+        self._future = None
+        self._start_time = None
+
+    def start(self):
+        """Start getting the delta, unless it is estimated too big."""
+        self._start_time = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._future = self._executor.submit(self._get_delta)
+
+    def cancel(self):
+        """Stop getting the delta, killing its generator if running."""
+        self._cancelled.set()
+        # The worker checks for the cancellation after setting the
+        # generator, so one of both sides always stops it.
+        if self._generator is not None:
+            self._generator.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _get_delta(self):
+        ratio = estimate_delta_ratio(self.source_path, self.target_path)
+        self.metrics['estimated_ratio'] = round(ratio, 3)
+        self.metrics['estimate_time'] = round(
+            time.monotonic() - self._start_time, 3)
+        if ratio > self.max_ratio:
+            logger.info(
+                'About {:.0%} of {!r} changed since the last push, '
+                'skipping the delta.'.format(ratio, self.target_path))
+            return None
+
+        self._generator = generator = self._generator_class(
+            source_path=self.source_path, target_path=self.target_path)
+        source_hash = calculate_digest(self.source_path)
+        target_hash = calculate_digest(self.target_path)
+        delta_path = self._delta_cache.get(
+            source_hash, target_hash, generator.delta_format)
+        cached = delta_path is not None
+        if not cached:
+            if self._cancelled.is_set():
+                raise DeltaGenerationError('The delta was cancelled.')
+            with tempfile.TemporaryDirectory() as temp_dir:
+                delta_path = self._delta_cache.cache(
+                    generator.make_delta(output_dir=temp_dir),
+                    source_hash, target_hash, generator.delta_format)
+        return Delta(delta_path, generator.delta_format, source_hash,
+                     target_hash, calculate_digest(delta_path), cached)
+
+    def result(self):
+        """Wait for the delta within the time budget and judge its size.
+
+        :returns: the Delta to push, or None to push the full snap.
+        """
+        if self._future is None:
+            return None
+
+        timeout = self.time_budget - (time.monotonic() - self._start_time)
+        try:
+            delta = self._future.result(timeout=max(timeout, 0))
+        except TimeoutError:
+            logger.info(
+                'The delta for {!r} is taking longer than {} seconds, '
+                'pushing the full snap.'.format(
+                    self.target_path, self.time_budget))
+            return None
+        except (DeltaGenerationError, SnapcraftError, OSError) as e:
+            logger.warning(
+                'Unable to get a delta for {!r}: {}'.format(
+                    self.target_path, e))
+            return None
+        finally:
+            # A late delta is not waited for, nor left running to hold up
+            # the exit once the full snap is pushed.
+            self.cancel()
+            self.metrics['time'] = round(
+                time.monotonic() - self._start_time, 3)
+
+        if delta is None:
+            self._log_metrics()
+            return None
+
+        ratio = (os.path.getsize(delta.path) /
+                 max(os.path.getsize(self.target_path), 1))
+        self.metrics.update(ratio=round(ratio, 3), cached=delta.cached)
+        self._log_metrics()
+        if ratio > self.max_ratio:
+            logger.info(
+                'The delta for {!r} is {:.0%} of its size, pushing the '
+                'full snap.'.format(self.target_path, ratio))
+            return None
+        logger.info('Pushing a {} delta for {!r}, {:.0%} of its size.'.format(
+            delta.delta_format, self.target_path, ratio))
+        return delta
+
+    def _log_metrics(self):
+        logger.debug('Delta metrics for {!r}: {}'.format(
+            self.target_path, self.metrics))
+
+
+def calculate_digest(path):
+    """Return the hex sha512 digest of the file at path."""
+    file_sum = hashlib.sha512()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(1024 * 1024), b''):
+            file_sum.update(data)
+    return file_sum.hexdigest()
+
+
+def estimate_delta_ratio(source_path, target_path):
+    """Estimate the size of a delta as a fraction of its target size.
+
+    The target data found in the source, chunk by chunk, is expected to be
+    left out of the delta.
+    """
+    source_chunks = {digest for digest, _ in _iter_chunks(source_path)}
+    target_size = changed_size = 0
+    for digest, size in _iter_chunks(target_path):
+        target_size += size
+        if digest not in source_chunks:
+            changed_size += size
+    if not target_size:
+        return 0.0
+    return changed_size / target_size
+
+
+def _iter_chunks(path):
+    size = os.path.getsize(path)
+    if not size:
+        return
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while start < size:
+                end = data.find(_CHUNK_MARKER, start + _MIN_CHUNK_SIZE)
+                if end < 0:
+                    end = size
+                yield hashlib.sha1(data[start:end]).digest(), end - start
+                start = end
@@ -135,3 +135,30 @@ class RequiredCommandNotFound(SnapcraftError):
 class RequiredPathDoesNotExist(SnapcraftError):
 
     fmt = 'Required path does not exist: {path!r}'
+
+
+class InvalidSquashfsError(SnapcraftError):
+
+    fmt = '{path!r} is not a valid squashfs file: {message}'
+
+
+class StoreIncompatiblePackError(SnapcraftError):
+
+    fmt = (
+        '{path!r} was packed with the {profile!r} profile and cannot be '
+        'pushed to the store.\n'
+        'Run `snapcraft snap --pack-profile store` to repack it.'
+    )
+
+
+class NothingPrimedError(SnapcraftError):
+
+    fmt = (
+        'Nothing has been primed yet.\n'
+        'Run `snapcraft prime` before generating a size report.'
+    )
+
+
+class UnsupportedSquashfsCompressionError(SnapcraftError):
+
+    fmt = 'Cannot read {path!r}: {compression} compression is not supported.'
@@ -51,21 +51,39 @@ def _init_progress_bar(total_length, destination, message=None):
     return ProgressBar(widgets=widgets, maxval=maxval)
 
 
-def download_requests_stream(request_stream, destination, message=None):
-    """This is a facility to download a request with nice progress bars."""
+# Large chunks keep both the write calls and the progress bar updates
+# infrequent on big downloads.
+_DOWNLOAD_CHUNK_SIZE = 128 * 1024
+_DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+
+
+def download_requests_stream(request_stream, destination, message=None,
+                             total_read=0, file_sum=None):
+    """This is a facility to download a request with nice progress bars.
+
+    :param int total_read: bytes of destination already downloaded, the
+                           stream is appended to them when not 0.
+    :param file_sum: a hashlib object updated with the data as it is
+                     written.
+    """
 
     # Doing len(request_stream.content) may defeat the purpose of a
     # progress bar
     total_length = 0
     if not request_stream.headers.get('Content-Encoding', ''):
         total_length = int(request_stream.headers.get('Content-Length', '0'))
+        if total_length:
+            total_length += total_read
 
-    total_read = 0
     progress_bar = _init_progress_bar(total_length, destination, message)
     progress_bar.start()
-    with open(destination, 'wb') as destination_file:
-        for buf in request_stream.iter_content(1024):
+    mode = 'ab' if total_read else 'wb'
+    with open(destination, mode,
+              buffering=_DOWNLOAD_BUFFER_SIZE) as destination_file:
+        for buf in request_stream.iter_content(_DOWNLOAD_CHUNK_SIZE):
             destination_file.write(buf)
+            if file_sum:
+                file_sum.update(buf)
             total_read += len(buf)
             progress_bar.update(total_read)
     progress_bar.finish()
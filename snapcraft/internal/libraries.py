@@ -14,11 +14,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import contextlib
 import re
 import glob
 import logging
 import os
 import platform
+import shutil
 import subprocess
 
 from snapcraft.internal import common
@@ -26,6 +28,8 @@ from snapcraft.internal import common
 
 logger = logging.getLogger(__name__)
 
+_SHARED_OBJECT_RE = re.compile(r'\.so(\.[0-9.]+)?$')
+
 
 def determine_ld_library_path(root):
     # If more ld.so.conf files need to be supported, add them here.
@@ -59,6 +63,44 @@ def _extract_ld_library_paths(ld_conf_file):
     return paths
 
 
+def get_consolidated_library_dir(root):
+    """Return the directory consolidate_library_paths links into."""
+    return os.path.join(root, 'snap', 'lib')
+
+
+def consolidate_library_paths(root, library_paths):
+    """Link the shared objects found in library_paths into a single directory.
+
+    library_paths are taken in search order, so the first shared object
+    found for a name is the one linked, as the dynamic linker would have
+    picked it. The links are relative so they keep working from the
+    snap mount.
+
+    :returns: the path to the directory with the links.
+    """
+    library_dir = get_consolidated_library_dir(root)
+    with contextlib.suppress(FileNotFoundError):
+        shutil.rmtree(library_dir)
+    os.makedirs(library_dir)
+
+    linked = set()
+    for library_path in library_paths:
+        if not os.path.isdir(library_path):
+            continue
+        for name in sorted(os.listdir(library_path)):
+            path = os.path.join(library_path, name)
+            if (name in linked or not _SHARED_OBJECT_RE.search(name) or
+                    not os.path.isfile(path)):
+                continue
+            os.symlink(os.path.relpath(path, library_dir),
+                       os.path.join(library_dir, name))
+            linked.add(name)
+
+    logger.debug('Linked {} libraries from {} library paths'.format(
+        len(linked), len(library_paths)))
+    return library_dir
+
+
 _libraries = None
 
 
@@ -15,10 +15,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import contextlib
+import hashlib
 import logging
 import os
 import shutil
 import tarfile
+import tempfile
 import time
 from subprocess import Popen, PIPE, STDOUT
 
@@ -29,11 +31,14 @@ import snapcraft
 from snapcraft import formatting_utils
 import snapcraft.internal
 from snapcraft.internal import (
+    build_cache,
     common,
     lxd,
     meta,
     pluginhandler,
     repo,
+    size_report,
+    squashfs,
 )
 from snapcraft.internal.indicators import is_dumb_terminal
 from snapcraft.internal.project_loader import replace_attr
@@ -41,6 +46,9 @@ from snapcraft.internal.project_loader import replace_attr
 
 logger = logging.getLogger(__name__)
 
+# Directories of the primed tree written by meta on every run.
+_GENERATED_DIRS = ('meta', 'snap')
+
 
 _TEMPLATE_YAML = """name: my-snap-name # you probably want to 'snapcraft register <name>'
 version: '0.1' # just for humans, typically '1.2+git' or '1.3.2'
@@ -104,7 +112,8 @@ def execute(step, project_options, part_names=None):
     config = snapcraft.internal.load_config(project_options)
     repo.install_build_packages(config.build_tools)
 
-    _Executor(config, project_options).run(step, part_names)
+    with build_cache.report_hit_rate(config.build_cache_dir):
+        _Executor(config, project_options).run(step, part_names)
 
     return {'name': config.data['name'],
             'version': config.data['version'],
@@ -197,12 +206,14 @@ class _Executor:
 
         common.env = self.parts_config.build_env_for_part(part)
         common.env.extend(self.config.project_env())
+        common.env.extend(self.config.build_cache_env())
 
         part = _replace_in_part(part)
         getattr(part, step)()
 
     def _create_meta(self, step, part_names):
         if step == 'prime' and part_names == self.config.part_names:
+            self.config.consolidate_library_paths()
             common.env = self.config.snap_env()
             meta.create_snap_packaging(self.config.data,
                                        self.project_options)
@@ -299,6 +310,20 @@ def cleanbuild(project_options):
     lxd.Cleanbuilder(snap_filename, tar_filename, project_options).execute()
 
 
+def report_size(project_options, json_path=None):
+    """Print what makes up the size of the primed snap.
+
+    :param str json_path: if set, also write the report as JSON to this path.
+    """
+    config = snapcraft.internal.load_config(project_options)
+    report = size_report.get_report(config, project_options)
+    size_report.print_report(report)
+
+    if json_path:
+        size_report.write_report(report, json_path)
+        logger.info('Size report written to {!r}'.format(json_path))
+
+
 def _snap_data_from_dir(directory):
     with open(os.path.join(directory, 'meta', 'snap.yaml')) as f:
         snap = yaml.load(f)
@@ -309,7 +334,12 @@ def _snap_data_from_dir(directory):
             'type': snap.get('type', '')}
 
 
-def snap(project_options, directory=None, output=None):
+def snap(project_options, directory=None, output=None,
+         pack_profile=squashfs.DEFAULT_PACK_PROFILE, sort_trace=None):
+    # Validate the profile before going through the lifecycle.
+    pack_args = squashfs.get_mksquashfs_args(
+        pack_profile, processors=project_options.parallel_build_count)
+
     if directory:
         snap_dir = os.path.abspath(directory)
         snap = _snap_data_from_dir(snap_dir)
@@ -320,6 +350,23 @@ def snap(project_options, directory=None, output=None):
 
     snap_name = output or common.format_snap_name(snap)
 
+    mksquashfs_args = ['-noappend', '-no-xattrs'] + pack_args
+    if snap['type'] != 'os':
+        mksquashfs_args.append('-all-root')
+
+    sort_entries = []
+    if sort_trace:
+        sort_entries = squashfs.get_sort_entries(sort_trace, snap_dir)
+
+    # The snap (and its build assertion) can be reused as long as neither
+    # the primed tree nor the way it gets packed has changed.
+    prime_digest = _get_prime_digest(
+        snap_dir, [pack_profile, snap['type']] + sort_entries)
+    if _read_prime_digest(snap_name) == prime_digest:
+        logger.info('Skipping snap {} (unchanged since last snapped)'.format(
+            snap_name))
+        return
+
     # If a .snap-build exists at this point, when we are about to override
     # the snap blob, it is stale. We rename it so user have a chance to
     # recover accidentally lost assertions.
@@ -329,12 +376,26 @@ def snap(project_options, directory=None, output=None):
         logger.warning('Renaming stale build assertion to {}'.format(_new))
         os.rename(snap_build, _new)
 
-    # These options need to match the review tools:
-    # http://bazaar.launchpad.net/~click-reviewers/click-reviewers-tools/trunk/view/head:/clickreviews/common.py#L38
-    mksquashfs_args = ['-noappend', '-comp', 'xz', '-no-xattrs']
-    if snap['type'] != 'os':
-        mksquashfs_args.append('-all-root')
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(snap_name + '.digest')
+
+    start_time = time.monotonic()
+    with tempfile.TemporaryDirectory() as sort_dir:
+        if sort_entries:
+            logger.info('Placing {} startup files first'.format(
+                len(sort_entries)))
+            sort_path = os.path.join(sort_dir, 'snap.sort')
+            squashfs.write_sort_file(sort_path, snap_dir, sort_entries)
+            mksquashfs_args.extend(['-sort', sort_path])
+        _run_mksquashfs(snap, snap_dir, snap_name, mksquashfs_args)
+
+    _report_packing(snap_dir, snap_name, pack_profile,
+                    time.monotonic() - start_time)
+    _write_prime_digest(snap_name, prime_digest)
+    logger.info('Snapped {}'.format(snap_name))
+
 
+def _run_mksquashfs(snap, snap_dir, snap_name, mksquashfs_args):
     with Popen(['mksquashfs', snap_dir, snap_name] + mksquashfs_args,
                stdout=PIPE, stderr=STDOUT) as proc:
         ret = None
@@ -366,7 +427,82 @@ def snap(project_options, directory=None, output=None):
 
         logger.debug(proc.stdout.read().decode('utf-8'))
 
-    logger.info('Snapped {}'.format(snap_name))
+
+def _get_prime_digest(snap_dir, pack_options):
+    """Return a digest of what would go into a snap packed from snap_dir.
+
+    The snap metadata and wrappers are regenerated on every run, so those
+    are hashed by content. The rest of the tree is only hashed by its stat
+    data, which is enough to notice files being added, removed or
+    rewritten without reading them.
+    """
+    digest = hashlib.sha256()
+    digest.update('\0'.join(pack_options).encode())
+    for root, directories, files in os.walk(snap_dir):
+        directories.sort()
+        for name in sorted(files) + directories:
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, snap_dir)
+            stat = os.lstat(path)
+            digest.update('\0{}\0{:o}'.format(relpath, stat.st_mode).encode())
+            if os.path.islink(path):
+                digest.update(os.readlink(path).encode())
+            elif os.path.isdir(path):
+                continue
+            elif (os.sep not in relpath or
+                    relpath.split(os.sep)[0] in _GENERATED_DIRS):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+            else:
+                digest.update('\0{}\0{}'.format(
+                    stat.st_size, stat.st_mtime_ns).encode())
+    return digest.hexdigest()
+
+
+def _read_prime_digest(snap_name):
+    """Return the prime digest recorded for snap_name, if still valid.
+
+    The .digest file is only trusted if it was written after the snap was
+    last modified.
+    """
+    digest_path = snap_name + '.digest'
+    try:
+        if os.stat(digest_path).st_mtime_ns < os.stat(snap_name).st_mtime_ns:
+            return None
+        with open(digest_path) as digest_file:
+            return digest_file.read().strip()
+    except OSError:
+        return None
+
+
+def _write_prime_digest(snap_name, prime_digest):
+    try:
+        with open(snap_name + '.digest', 'w') as digest_file:
+            digest_file.write(prime_digest + '\n')
+    except OSError as e:
+        logger.debug('Unable to record the prime digest of {}: {}'.format(
+            snap_name, e))
+
+
+def _get_tree_size(path):
+    size = 0
+    for root, directories, files in os.walk(path):
+        for name in directories + files:
+            size += os.lstat(os.path.join(root, name)).st_size
+    return size
+
+
+def _report_packing(snap_dir, snap_name, pack_profile, elapsed):
+    input_size = _get_tree_size(snap_dir)
+    output_size = os.path.getsize(snap_name)
+    ratio = output_size / input_size * 100 if input_size else 100
+    throughput = input_size / elapsed if elapsed > 0 else input_size
+    logger.info(
+        'Packed {} into {} with the {!r} profile ({:.0f}%, {}/s)'.format(
+            formatting_utils.humanize_bytes(input_size),
+            formatting_utils.humanize_bytes(output_size),
+            pack_profile, ratio,
+            formatting_utils.humanize_bytes(throughput)))
 
 
 def _reverse_dependency_tree(config, part_name):
@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
 import contextlib
 import os
 import configparser
@@ -56,6 +57,16 @@ _OPTIONAL_PACKAGE_KEYS = [
 ]
 
 
+# Shared by all the wrappers when using optimized wrappers.
+_WRAPPER_ENV_PATH = os.path.join('snap', 'command-env')
+
+_EXPORT_RE = re.compile(
+    r'^export (?P<name>[A-Za-z_][A-Za-z0-9_]*)=(?P<value>.*)$')
+_VARIABLE_RE = re.compile(r'\$([A-Za-z_][A-Za-z0-9_]*)')
+# Arguments made of anything else need a shell to be passed on as intended.
+_UNSAFE_ARG_RE = re.compile(r'[^\w@%+=:,./-]')
+
+
 class CommandError(Exception):
     pass
 
@@ -92,8 +103,15 @@ class _SnapPackaging:
 
         self._meta_dir = os.path.join(self._snap_dir, 'meta')
         self._config_data = config_data.copy()
+        self._optimized_wrappers = (
+            self._config_data.get('wrappers') == 'optimized')
+        self._assembled_env = None
+        self._minimized_env = None
+        self._wrapper_env = None
 
         os.makedirs(self._meta_dir, exist_ok=True)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(self._snap_dir, _WRAPPER_ENV_PATH))
 
     def write_snap_yaml(self):
         package_snap_path = os.path.join(self.meta_dir, 'snap.yaml')
@@ -247,11 +265,7 @@ class _SnapPackaging:
 
         return snap_yaml
 
-    def _write_wrap_exe(self, wrapexec, wrappath,
-                        shebang=None, args=None, cwd=None):
-        args = ' '.join(args) + ' "$@"' if args else '"$@"'
-        cwd = 'cd {}'.format(cwd) if cwd else ''
-
+    def _get_assembled_env(self):
         # If we are dealing with classic confinement it means all our
         # binaries are linked with `nodefaultlib` so this is harmless.
         # We do however want to be on the safe side and make sure no
@@ -261,28 +275,108 @@ class _SnapPackaging:
         assembled_env = common.assemble_env(classic_library_paths,
                                             self._arch_triplet)
         assembled_env = assembled_env.replace(self._snap_dir, '$SNAP')
-        replace_path = r'{}/[a-z0-9][a-z0-9+-]*/install'.format(
-            self._parts_dir)
-        assembled_env = re.sub(replace_path, '$SNAP', assembled_env)
+        return re.sub(self._replace_path, '$SNAP', assembled_env)
+
+    @property
+    def _replace_path(self):
+        return r'{}/[a-z0-9][a-z0-9+-]*/install'.format(self._parts_dir)
+
+    def _get_minimized_env(self):
+        """Return the environment minimized once per snap.
+
+        :returns: an OrderedDict of the variables to set, or None if the
+                  environment could not be minimized.
+        """
+        if self._assembled_env is None:
+            self._assembled_env = self._get_assembled_env()
+            self._minimized_env = _minimize_env(
+                self._assembled_env, self._snap_dir)
+        return self._minimized_env
+
+    def _get_app_environment(self):
+        """Return the environment to set for apps in snap.yaml.
+
+        snapd expands the variables in it, so apps using it need no
+        wrapper. It always puts $SNAP_LIBRARY_PATH, where the host GL
+        libraries are, in front of LD_LIBRARY_PATH.
+
+        :returns: the environment, or None if it could not be minimized.
+        """
+        env = self._get_minimized_env()
+        if env is None:
+            return None
+        env = env.copy()
+        env['LD_LIBRARY_PATH'] = '$SNAP_LIBRARY_PATH:{}'.format(
+            env.get('LD_LIBRARY_PATH', '$LD_LIBRARY_PATH'))
+        return env
+
+    def _get_wrapper_env(self):
+        """Return the environment shared by the optimized wrappers.
+
+        It is only computed once per snap and written to its own file, which
+        the wrappers source. It always puts $SNAP_LIBRARY_PATH, where the
+        host GL libraries are, in front of LD_LIBRARY_PATH.
+        """
+        if self._wrapper_env is not None:
+            return self._wrapper_env
+
+        env = self._get_minimized_env()
+        if env is None:
+            # Not something we know how to minimize, keep it as is.
+            self._wrapper_env = self._assembled_env.splitlines()
+        else:
+            self._wrapper_env = [
+                'export {}="{}"'.format(name, value)
+                for name, value in env.items()]
+        self._wrapper_env.append(
+            'export LD_LIBRARY_PATH="$SNAP_LIBRARY_PATH:$LD_LIBRARY_PATH"')
+        env_path = os.path.join(self._snap_dir, _WRAPPER_ENV_PATH)
+        os.makedirs(os.path.dirname(env_path), exist_ok=True)
+        with open(env_path, 'w') as f:
+            f.write('\n'.join(self._wrapper_env) + '\n')
+        return self._wrapper_env
+
+    def _write_wrap_exe(self, wrapexec, wrappath,
+                        shebang=None, args=None, cwd=None):
+        args = ' '.join(args) + ' "$@"' if args else '"$@"'
+        cwd = 'cd {}'.format(cwd) if cwd else ''
+
         executable = '"{}"'.format(wrapexec)
         if shebang is not None:
-            new_shebang = re.sub(replace_path, '$SNAP', shebang)
+            new_shebang = re.sub(self._replace_path, '$SNAP', shebang)
             if new_shebang != shebang:
                 # If the shebang was pointing to and executable within the
                 # local 'parts' dir, have the wrapper script execute it
                 # directly, since we can't use $SNAP in the shebang itself.
                 executable = '"{}" "{}"'.format(new_shebang, wrapexec)
-        script = ('#!/bin/sh\n' +
-                  '{}\n'.format(assembled_env) +
-                  '{}\n'.format(cwd) +
-                  'LD_LIBRARY_PATH=$SNAP_LIBRARY_PATH:$LD_LIBRARY_PATH\n'
-                  'exec {} {}\n'.format(executable, args))
+
+        if self._optimized_wrappers:
+            self._get_wrapper_env()
+            script = '#!/bin/sh\n. "$SNAP/{}"\n'.format(_WRAPPER_ENV_PATH)
+            if cwd:
+                script += '{}\n'.format(cwd)
+            script += 'exec {} {}\n'.format(executable, args)
+        else:
+            script = ('#!/bin/sh\n' +
+                      '{}\n'.format(self._get_assembled_env()) +
+                      '{}\n'.format(cwd) +
+                      'LD_LIBRARY_PATH=$SNAP_LIBRARY_PATH:$LD_LIBRARY_PATH\n'
+                      'exec {} {}\n'.format(executable, args))
 
         with open(wrappath, 'w+') as f:
             f.write(script)
 
         os.chmod(wrappath, 0o755)
 
+    def _get_shebang(self, exepath):
+        with open(exepath, 'rb') as exefile:
+            # If the file has a she-bang, the path might be pointing to
+            # the local 'parts' dir. Extract it so that _write_wrap_exe
+            # will have a chance to rewrite it.
+            if exefile.read(2) == b'#!':
+                return exefile.readline().strip().decode('utf-8')
+        return None
+
     def _wrap_exe(self, command, basename=None):
         execparts = shlex.split(command)
         exepath = os.path.join(self._snap_dir, execparts[0])
@@ -300,18 +394,29 @@ class _SnapPackaging:
             _find_bin(execparts[0], self._snap_dir)
             wrapexec = execparts[0]
         else:
-            with open(exepath, 'rb') as exefile:
-                # If the file has a she-bang, the path might be pointing to
-                # the local 'parts' dir. Extract it so that _write_wrap_exe
-                # will have a chance to rewrite it.
-                if exefile.read(2) == b'#!':
-                    shebang = exefile.readline().strip().decode('utf-8')
+            shebang = self._get_shebang(exepath)
 
         self._write_wrap_exe(wrapexec, wrappath,
                              shebang=shebang, args=execparts[1:])
 
         return os.path.relpath(wrappath, self._snap_dir)
 
+    def _can_run_directly(self, command):
+        """Return whether snapd can run command without a shell.
+
+        The executable must be in the snap, without a shebang pointing to
+        the parts directory, and the arguments must need no expansion.
+        """
+        execparts = shlex.split(command)
+        exepath = os.path.join(self._snap_dir, execparts[0])
+        if not os.path.isfile(exepath):
+            return False
+        if any(_UNSAFE_ARG_RE.search(arg) for arg in execparts[1:]):
+            return False
+        shebang = self._get_shebang(exepath)
+        return (shebang is None or
+                re.sub(self._replace_path, '$SNAP', shebang) == shebang)
+
     def _wrap_apps(self, apps):
         gui_dir = os.path.join(self.meta_dir, 'gui')
         if not os.path.exists(gui_dir):
@@ -323,8 +428,27 @@ class _SnapPackaging:
             self._wrap_app(app, apps[app])
         return apps
 
+    def _run_directly(self, name, app, cmds):
+        """Have snapd set up the environment and run the app commands.
+
+        :returns: whether the app needs no wrappers.
+        """
+        environment = self._get_app_environment()
+        if environment is None or not all(
+                self._can_run_directly(app[k]) for k in cmds):
+            return False
+        for k in cmds:
+            # Do not leave the wrappers of a previous run behind.
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(
+                    self._snap_dir, '{}-{}.wrapper'.format(k, name)))
+        app['environment'] = dict(environment)
+        return True
+
     def _wrap_app(self, name, app):
-        cmds = (k for k in ('command', 'stop-command') if k in app)
+        cmds = [k for k in ('command', 'stop-command') if k in app]
+        if self._optimized_wrappers and self._run_directly(name, app, cmds):
+            cmds = []
         for k in cmds:
             try:
                 app[k] = self._wrap_exe(app[k], '{}-{}'.format(k, name))
@@ -413,6 +537,87 @@ def _find_bin(binary, basedir):
             raise CommandError(binary)
 
 
+def _minimize_env(assembled_env, prime_dir):
+    """Collapse assembled_env into a single export per variable.
+
+    Path like variables, which are extended by many parts, are resolved
+    into one deduplicated list without the $SNAP directories missing from
+    prime_dir. Variables left to what they were are dropped.
+
+    :returns: an OrderedDict of the values to set, or None if
+              assembled_env uses constructs that cannot be safely
+              evaluated here.
+    """
+    assignments = collections.OrderedDict()
+    path_variables = set()
+    for line in assembled_env.splitlines():
+        if not line.strip():
+            continue
+        export = _parse_export(line)
+        if not export:
+            return None
+        name, value = export
+
+        # Values can only refer to themselves, which is what allows
+        # rewriting them in any order.
+        references = set(_VARIABLE_RE.findall(value)) - {name}
+        if references & set(assignments):
+            return None
+
+        components = value.split(':')
+        if '$' + name in components:
+            path_variables.add(name)
+            previous = assignments.get(name, ['$' + name])
+            components = _expand_self_reference(name, components, previous)
+        assignments[name] = components
+
+    env = collections.OrderedDict()
+    for name, components in assignments.items():
+        if name in path_variables:
+            components = _minimize_path(name, components, prime_dir)
+            if not components:
+                continue
+        env[name] = ':'.join(components)
+    return env
+
+
+def _parse_export(line):
+    match = _EXPORT_RE.match(line)
+    if not match or any(c in line for c in ('`', '${', '$(', "'")):
+        return None
+    name, value = match.group('name'), match.group('value')
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+    if '"' in value or ' ' in value:
+        return None
+    return name, value
+
+
+def _expand_self_reference(name, components, previous):
+    expanded = []
+    for component in components:
+        if component == '$' + name:
+            expanded.extend(previous)
+        else:
+            expanded.append(component)
+    return expanded
+
+
+def _minimize_path(name, components, prime_dir):
+    minimized = []
+    for component in components:
+        if not component or component in minimized:
+            continue
+        if component.startswith('$SNAP/') and not os.path.exists(
+                os.path.join(prime_dir, component[len('$SNAP/'):])):
+            continue
+        minimized.append(component)
+
+    if minimized == ['$' + name]:
+        return []
+    return minimized
+
+
 def _validate_hook(hook_path):
     if not os.stat(hook_path).st_mode & stat.S_IEXEC:
         asset = os.path.basename(hook_path)
@@ -45,6 +45,7 @@ from snapcraft.internal import (
 )
 from ._scriptlets import ScriptRunner
 from ._build_attributes import BuildAttributes
+from ._strip import strip_files
 
 logger = logging.getLogger(__name__)
 
@@ -99,6 +100,8 @@ class PluginHandler:
         self.ubuntudir = os.path.join(parts_dir, part_name, 'ubuntu')
         self.statedir = os.path.join(parts_dir, part_name, 'state')
         self.sourcedir = os.path.join(parts_dir, part_name, 'src')
+        self.stripdir = os.path.join(parts_dir, part_name, 'strip')
+        self.debugdir = os.path.join(parts_dir, part_name, 'debug')
 
         self.source_handler = self._get_source_handler(self._part_properties)
 
@@ -506,6 +509,7 @@ class PluginHandler:
         self.notify_part_progress('Priming')
         snap_files, snap_dirs = self.migratable_fileset_for('prime')
         _migrate_files(snap_files, snap_dirs, self.stagedir, self.snapdir)
+        stripped_files = self._strip(snap_files)
 
         dependencies = _find_dependencies(self.snapdir, snap_files)
 
@@ -533,12 +537,34 @@ class PluginHandler:
                 _migrate_files(system, system_dependency_paths, '/',
                                self.snapdir, follow_symlinks=True)
 
-        self.mark_prime_done(snap_files, snap_dirs, dependency_paths)
+        self.mark_prime_done(snap_files, snap_dirs, dependency_paths,
+                             stripped_files)
+
+    def _strip(self, snap_files):
+        with contextlib.suppress(FileNotFoundError):
+            shutil.rmtree(self.debugdir)
+        if not self._part_properties.get('strip'):
+            with contextlib.suppress(FileNotFoundError):
+                shutil.rmtree(self.stripdir)
+            return {}
+
+        debug_dir = None
+        if self._part_properties.get('debug-symbols') == 'split':
+            debug_dir = self.debugdir
+        tool_prefix = ''
+        if self._project_options.is_cross_compiling:
+            tool_prefix = '{}-'.format(self._project_options.arch_triplet)
+
+        return strip_files(
+            self.snapdir, snap_files, self.stripdir, debug_dir=debug_dir,
+            jobs=self._project_options.parallel_build_count,
+            tool_prefix=tool_prefix)
 
-    def mark_prime_done(self, snap_files, snap_dirs, dependency_paths):
+    def mark_prime_done(self, snap_files, snap_dirs, dependency_paths,
+                        stripped_files=None):
         self.mark_done('prime', states.PrimeState(
             snap_files, snap_dirs, dependency_paths, self._part_properties,
-            self._project_options))
+            self._project_options, stripped_files=stripped_files))
 
     def clean_prime(self, project_primed_state, hint=''):
         if self.is_clean('prime'):
@@ -1038,6 +1064,11 @@ def _validate_relative_paths(files):
 
 
 def _file_collides(file_this, file_other):
+    if (file_this.endswith(('.pyc', '.pyo')) and
+            _python_sources_match(file_this, file_other)):
+        # Bytecode is not reproducible byte for byte, but compiled from the
+        # same source it is equivalent.
+        return False
     if not file_this.endswith('.pc'):
         return not filecmp.cmp(file_this, file_other, shallow=False)
 
@@ -1059,6 +1090,22 @@ def _file_collides(file_this, file_other):
     return False
 
 
+def _python_sources_match(bytecode_this, bytecode_other):
+    source_this = _get_python_source(bytecode_this)
+    source_other = _get_python_source(bytecode_other)
+    return (os.path.isfile(source_this) and os.path.isfile(source_other) and
+            filecmp.cmp(source_this, source_other, shallow=False))
+
+
+def _get_python_source(bytecode_path):
+    # Bytecode is either next to its source, or in __pycache__ with the
+    # interpreter tag in its name (e.g. __pycache__/foo.cpython-35.pyc).
+    directory, file_name = os.path.split(bytecode_path)
+    if os.path.basename(directory) == '__pycache__':
+        directory = os.path.dirname(directory)
+    return os.path.join(directory, '{}.py'.format(file_name.split('.')[0]))
+
+
 def check_for_collisions(parts):
     """Raises an EnvironmentError if conflicts are found between two parts."""
     parts_files = {}
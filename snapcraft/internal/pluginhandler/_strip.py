@@ -0,0 +1,157 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2017 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import magic
+
+from snapcraft import file_utils
+
+
+logger = logging.getLogger(__name__)
+
+
+def strip_files(root, files, cache_dir, *, debug_dir=None, jobs=1,
+                tool_prefix=''):
+    """Strip the ELF executables and shared objects among files in root.
+
+    Files hard linked to each other are stripped once and stay linked. The
+    stripped files are kept in cache_dir, keyed by the path, size and
+    modification time of the file they come from, so that priming the same
+    files again reuses them instead of stripping again.
+
+    :param str debug_dir: if set, the debug information is split into
+                          <debug_dir>/<file>.debug, and the stripped file
+                          gets a debug link to it. Hard linked files share
+                          the debug file name of the first of them.
+    :param int jobs: the number of files to strip at the same time.
+    :param str tool_prefix: the prefix for strip and objcopy, to use the
+                            tools for the target architecture.
+    :returns: a dict mapping the stripped files to their cache key.
+    """
+    split_debug = debug_dir is not None
+    groups = _get_strippable_groups(root, files)
+    keys = {}
+    for group in groups:
+        keys[group[0]] = _get_cache_key(root, group[0], split_debug)
+
+    missing = [relpath for relpath in keys if not os.path.exists(
+        os.path.join(cache_dir, keys[relpath]))]
+    os.makedirs(cache_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # list() so that the first failure raises here.
+        list(executor.map(
+            lambda relpath: _strip(os.path.join(root, relpath),
+                                   os.path.join(cache_dir, keys[relpath]),
+                                   split_debug, tool_prefix), missing))
+    logger.info('Stripped {} files, {} unchanged since last stripped'.format(
+        len(missing), len(keys) - len(missing)))
+
+    stripped_files = {}
+    for group in groups:
+        key = keys[group[0]]
+        stripped_path = os.path.join(cache_dir, key,
+                                     os.path.basename(group[0]))
+        for relpath in group:
+            path = os.path.join(root, relpath)
+            os.remove(path)
+            file_utils.link_or_copy(stripped_path, path)
+            if split_debug:
+                # The debug link in the stripped file is to the debug file
+                # of the first file of the group.
+                debug_path = os.path.join(debug_dir, os.path.dirname(relpath),
+                                          os.path.basename(stripped_path) +
+                                          '.debug')
+                os.makedirs(os.path.dirname(debug_path), exist_ok=True)
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(debug_path)
+                file_utils.link_or_copy(stripped_path + '.debug', debug_path)
+            stripped_files[relpath] = key
+
+    _prune_cache(cache_dir, set(keys.values()))
+    return stripped_files
+
+
+def _get_strippable_groups(root, files):
+    """Return the unstripped ELF files in files, grouped by inode."""
+    inodes = collections.OrderedDict()
+    for relpath in sorted(files):
+        path = os.path.join(root, relpath)
+        if os.path.islink(path) or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        inodes.setdefault((stat.st_dev, stat.st_ino), []).append(relpath)
+
+    ms = magic.open(magic.NONE)
+    if ms.load() != 0:
+        raise RuntimeError('Cannot load magic header detection')
+
+    fs_encoding = sys.getfilesystemencoding()
+    groups = []
+    for group in inodes.values():
+        file_m = ms.file(os.path.join(root, group[0]).encode(
+            fs_encoding, errors='surrogateescape'))
+        # Relocatable objects, such as kernel modules, and core dumps are
+        # left alone.
+        if (file_m.startswith('ELF') and 'not stripped' in file_m and
+                ('executable' in file_m or 'shared object' in file_m)):
+            groups.append(group)
+
+    return groups
+
+
+def _get_cache_key(root, relpath, split_debug):
+    stat = os.stat(os.path.join(root, relpath))
+    key = '\0'.join([relpath, str(stat.st_size), str(stat.st_mtime_ns),
+                     str(split_debug)])
+    return hashlib.sha1(key.encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+def _strip(path, cache_path, split_debug, tool_prefix):
+    partial_path = cache_path + '.partial'
+    with contextlib.suppress(FileNotFoundError):
+        shutil.rmtree(partial_path)
+    os.makedirs(partial_path)
+
+    stripped_path = os.path.join(partial_path, os.path.basename(path))
+    debug_path = stripped_path + '.debug'
+    if split_debug:
+        subprocess.check_call([tool_prefix + 'objcopy', '--only-keep-debug',
+                               path, debug_path])
+    subprocess.check_call([tool_prefix + 'strip', '--strip-unneeded',
+                           '-o', stripped_path, path])
+    if split_debug:
+        subprocess.check_call(
+            [tool_prefix + 'objcopy',
+             '--add-gnu-debuglink={}'.format(debug_path), stripped_path])
+    shutil.copymode(path, stripped_path)
+
+    os.rename(partial_path, cache_path)
+
+
+def _prune_cache(cache_dir, keys):
+    for entry in os.listdir(cache_dir):
+        if entry not in keys:
+            shutil.rmtree(os.path.join(cache_dir, entry))
@@ -27,6 +27,7 @@ import yaml
 import snapcraft
 from snapcraft import formatting_utils
 from snapcraft.internal import (
+    build_cache,
     common,
     errors,
     libraries,
@@ -141,6 +142,13 @@ class Config:
         self.build_tools = self.data.get('build-packages', [])
         self.build_tools.extend(project_options.additional_build_packages)
 
+        self.build_cache_dir = None
+        if 'build-cache' in self.data:
+            self.build_cache_dir = build_cache.get_cache_dir(
+                self.data['name'], project_options.deb_arch,
+                shared=self.data['build-cache'].get('scope') == 'shared')
+            self.build_tools.append('ccache')
+
         self.parts = parts.PartsConfig(self.data,
                                        self._project_options,
                                        self._validator,
@@ -193,25 +201,55 @@ class Config:
 
     def snap_env(self):
         snap_dir = self._project_options.snap_dir
+        consolidate = self.data.get('consolidate-library-paths', False)
         env = []
 
-        env += _runtime_env(snap_dir, self._project_options.arch_triplet)
-        dependency_paths = set()
+        env += _runtime_env(snap_dir, self._project_options.arch_triplet,
+                            include_library_paths=not consolidate)
         for part in self.parts.all_parts:
             env += part.env(snap_dir)
+
+        if consolidate:
+            # The links themselves are made by consolidate_library_paths
+            # when priming.
+            env.append('LD_LIBRARY_PATH="{}:$LD_LIBRARY_PATH"'.format(
+                libraries.get_consolidated_library_dir(snap_dir)))
+        else:
+            dependency_paths = self._get_primed_dependency_paths()
+            if dependency_paths:
+                # Add more specific LD_LIBRARY_PATH from the dependencies.
+                env.append('LD_LIBRARY_PATH="' + ':'.join(dependency_paths) +
+                           ':$LD_LIBRARY_PATH"')
+
+        return env
+
+    def consolidate_library_paths(self):
+        """Link the primed libraries into a single directory, if enabled."""
+        if not self.data.get('consolidate-library-paths', False):
+            return
+        snap_dir = self._project_options.snap_dir
+        libraries.consolidate_library_paths(
+            snap_dir,
+            self._get_primed_dependency_paths() + _runtime_library_paths(
+                snap_dir, self._project_options.arch_triplet))
+
+    def _get_primed_dependency_paths(self):
+        dependency_paths = set()
+        for part in self.parts.all_parts:
             dependency_paths |= part.get_primed_dependency_paths()
 
         # Dependency paths are only valid if they actually exist. Sorting them
         # here as well so the LD_LIBRARY_PATH is consistent between runs.
-        dependency_paths = sorted({
+        return sorted({
             path for path in dependency_paths if os.path.isdir(path)})
 
-        if dependency_paths:
-            # Add more specific LD_LIBRARY_PATH from the dependencies.
-            env.append('LD_LIBRARY_PATH="' + ':'.join(dependency_paths) +
-                       ':$LD_LIBRARY_PATH"')
-
-        return env
+    def build_cache_env(self):
+        if not self.build_cache_dir:
+            return []
+        return build_cache.get_env(
+            self.build_cache_dir, base_dir=os.getcwd(),
+            max_size=self.data['build-cache'].get(
+                'max-size', build_cache.DEFAULT_MAX_SIZE))
 
     def project_env(self):
         return [
@@ -283,7 +321,7 @@ def replace_attr(attr, replacements):
     return attr
 
 
-def _runtime_env(root, arch_triplet):
+def _runtime_env(root, arch_triplet, *, include_library_paths=True):
     """Set the environment variables required for running binaries."""
     env = []
 
@@ -295,6 +333,9 @@ def _runtime_env(root, arch_triplet):
         '$PATH'
     ]).format(root) + '"')
 
+    if not include_library_paths:
+        return env
+
     # Add the default LD_LIBRARY_PATH
     paths = common.get_library_paths(root, arch_triplet)
     if paths:
@@ -310,6 +351,12 @@ def _runtime_env(root, arch_triplet):
     return env
 
 
+def _runtime_library_paths(root, arch_triplet):
+    """Return the library paths set by _runtime_env in search order."""
+    return (libraries.determine_ld_library_path(root) +
+            common.get_library_paths(root, arch_triplet))
+
+
 def _build_env(root, snap_name, confinement, arch_triplet,
                core_dynamic_linker=None):
     """Set the environment variables required for building.
@@ -0,0 +1,223 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Report what makes up the size of a primed snap.
+
+Every primed file is accounted for under the part that primed it, its top
+level directory, the stage-package it was unpacked from, if any, and
+whether it is an ELF file. The compressed sizes are estimated compressing
+each file on its own the way the store pack profile does, in 128 KiB xz
+blocks, so they are an upper bound of what mksquashfs achieves when it
+packs small files together.
+"""
+
+import collections
+import contextlib
+import glob
+import json
+import logging
+import lzma
+import os
+import subprocess
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+from snapcraft import formatting_utils
+from snapcraft.internal import errors
+
+
+logger = logging.getLogger(__name__)
+
+# Files not primed from a part, such as meta/ or the libraries primed from
+# the host.
+UNATTRIBUTED = '(none)'
+
+_BLOCK_SIZE = 131072
+_ELF_MAGIC = b'\x7fELF'
+_CATEGORIES = ('parts', 'directories', 'stage_packages', 'file_types')
+
+
+def get_report(config, project_options):
+    """Return the size report of the snap primed for config.
+
+    :raises errors.NothingPrimedError: if no part has been primed.
+    """
+    snap_dir = project_options.snap_dir
+    primed_state = config.get_project_state('prime')
+    if not any(primed_state.values()):
+        raise errors.NothingPrimedError()
+
+    owners = _get_file_owners(config.all_parts, primed_state)
+    packages = _get_package_files(config.all_parts, primed_state)
+    paths = _get_primed_files(snap_dir)
+    with ThreadPoolExecutor(
+            max_workers=project_options.parallel_build_count) as executor:
+        compressed_sizes = dict(zip(paths, executor.map(
+            _estimate_compressed_size, _unique_inodes(snap_dir, paths))))
+
+    report = collections.OrderedDict()
+    report['name'] = config.data['name']
+    report['version'] = config.data['version']
+    report['total'] = _new_entry()
+    for category in _CATEGORIES:
+        report[category] = collections.defaultdict(_new_entry)
+
+    for relpath in paths:
+        path = os.path.join(snap_dir, relpath)
+        size = os.lstat(path).st_size
+        compressed_size = compressed_sizes[relpath]
+        entries = [
+            report['total'],
+            report['parts'][owners.get(relpath, UNATTRIBUTED)],
+            report['directories'][_get_top_level_directory(relpath)],
+            report['file_types']['elf' if _is_elf(path) else 'other'],
+        ]
+        if relpath in packages:
+            entries.append(report['stage_packages'][packages[relpath]])
+        for entry in entries:
+            entry['files'] += 1
+            entry['bytes'] += size
+            entry['compressed_bytes'] += compressed_size
+
+    for category in _CATEGORIES:
+        report[category] = collections.OrderedDict(sorted(
+            report[category].items(), key=lambda i: -i[1]['bytes']))
+    return report
+
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+
+
+def print_report(report):
+    total = report['total']
+    print('{} {}: {} in {} files, about {} compressed'.format(
+        report['name'], report['version'],
+        formatting_utils.humanize_bytes(total['bytes']), total['files'],
+        formatting_utils.humanize_bytes(total['compressed_bytes'])))
+    for category in _CATEGORIES:
+        if not report[category]:
+            continue
+        print()
+        print('{:<40} {:>8} {:>11} {:>11}'.format(
+            category.replace('_', '-'), 'files', 'size', 'compressed'))
+        for name, entry in report[category].items():
+            print('{:<40} {:>8} {:>11} {:>11}'.format(
+                name, entry['files'],
+                formatting_utils.humanize_bytes(entry['bytes']),
+                formatting_utils.humanize_bytes(entry['compressed_bytes'])))
+
+
+def _new_entry():
+    return collections.OrderedDict(
+        [('files', 0), ('bytes', 0), ('compressed_bytes', 0)])
+
+
+def _get_primed_files(snap_dir):
+    paths = []
+    for root, directories, files in os.walk(snap_dir):
+        directories.sort()
+        for name in sorted(files):
+            paths.append(os.path.relpath(os.path.join(root, name), snap_dir))
+    return paths
+
+
+def _get_file_owners(parts, primed_state):
+    # A file primed by several parts is accounted to the first of them.
+    owners = {}
+    for part in parts:
+        state = primed_state.get(part.name)
+        if state:
+            for relpath in state.files:
+                owners.setdefault(relpath, part.name)
+    return owners
+
+
+def _get_package_files(parts, primed_state):
+    packages = {}
+    for part in parts:
+        if not primed_state.get(part.name):
+            continue
+        state_files = primed_state[part.name].files
+        debs = glob.glob(os.path.join(part.ubuntudir, 'download', '*.deb'))
+        for deb in sorted(debs):
+            package = os.path.basename(deb).split('_')[0]
+            for relpath in _list_deb(deb):
+                if relpath in state_files:
+                    packages.setdefault(relpath, package)
+    return packages
+
+
+def _list_deb(deb):
+    relpaths = None
+    # OSError is raised when dpkg-deb is not installed.
+    with contextlib.suppress(tarfile.TarError, OSError):
+        with subprocess.Popen(['dpkg-deb', '--fsys-tarfile', deb],
+                              stdout=subprocess.PIPE) as proc:
+            with tarfile.open(fileobj=proc.stdout, mode='r|') as tar:
+                relpaths = [os.path.normpath(member.name) for member in tar
+                            if not member.isdir()]
+    if relpaths is None or proc.returncode != 0:
+        logger.warning('Unable to list the contents of {!r}'.format(deb))
+        return []
+    return relpaths
+
+
+def _unique_inodes(snap_dir, paths):
+    # mksquashfs stores hard links once, so only the first of them counts.
+    seen = set()
+    for relpath in paths:
+        path = os.path.join(snap_dir, relpath)
+        stat = os.lstat(path)
+        inode = (stat.st_dev, stat.st_ino)
+        if inode in seen:
+            yield None
+        else:
+            seen.add(inode)
+            yield path
+
+
+def _estimate_compressed_size(path):
+    if path is None:
+        return 0
+    if os.path.islink(path):
+        return len(os.readlink(path))
+
+    size = 0
+    with contextlib.suppress(OSError), open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_BLOCK_SIZE), b''):
+            # Incompressible blocks are stored as they are.
+            size += min(len(block), len(lzma.compress(
+                block, format=lzma.FORMAT_RAW,
+                filters=[{'id': lzma.FILTER_LZMA2}])))
+    return size
+
+
+def _get_top_level_directory(relpath):
+    if os.sep in relpath:
+        return relpath.split(os.sep)[0]
+    return '.'
+
+
+def _is_elf(path):
+    if os.path.islink(path):
+        return False
+    with contextlib.suppress(OSError), open(path, 'rb') as f:
+        return f.read(len(_ELF_MAGIC)) == _ELF_MAGIC
+    return False
@@ -50,9 +50,12 @@ class FileBase(Base):
 
         self.provision(self.source_dir)
 
-    def download(self):
-        self.file = os.path.join(
+    def download(self, filepath=None):
+        if filepath is None:
+            self.file = os.path.join(
                 self.source_dir, os.path.basename(self.source))
+        else:
+            self.file = filepath
 
         if snapcraft.internal.common.get_url_scheme(self.source) == 'ftp':
             download_urllib_source(self.source, self.file)
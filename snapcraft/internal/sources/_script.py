@@ -27,7 +27,7 @@ class Script(FileBase):
         super().__init__(source, source_dir, source_tag, source_commit,
                          source_branch, source_depth)
 
-    def download(self):
-        super().download()
+    def download(self, filepath=None):
+        super().download(filepath=filepath)
         st = os.stat(self.file)
         os.chmod(self.file, st.st_mode | stat.S_IEXEC)
@@ -0,0 +1,490 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Helpers to produce and inspect the squashfs images backing snaps."""
+
+import collections
+import errno
+import logging
+import lzma
+import os
+import re
+import stat
+import struct
+import zlib
+
+from snapcraft.internal import errors
+
+
+logger = logging.getLogger(__name__)
+
+_SQUASHFS_MAGIC = b'hsqs'
+# magic, inode_count, modification_time, block_size, fragment_entry_count,
+# compression_id, block_log, flags, ...
+_SUPERBLOCK_FORMAT = '<4sIIIIHHH'
+
+_COMPRESSORS = {
+    1: 'gzip',
+    2: 'lzma',
+    3: 'lzo',
+    4: 'xz',
+    5: 'lz4',
+    6: 'zstd',
+}
+
+_FLAG_UNCOMPRESSED_INODES = 0x0001
+_FLAG_UNCOMPRESSED_DATA = 0x0002
+_FLAG_UNCOMPRESSED_FRAGMENTS = 0x0008
+
+# The store profile needs to match the review tools:
+# http://bazaar.launchpad.net/~click-reviewers/click-reviewers-tools/trunk/view/head:/clickreviews/common.py#L38
+# The others trade size for packing speed and are meant for local testing.
+PACK_PROFILES = collections.OrderedDict([
+    ('store', ['-comp', 'xz', '-b', '131072']),
+    ('fast', ['-comp', 'gzip', '-Xcompression-level', '1', '-b', '1048576']),
+    ('uncompressed', ['-noI', '-noD', '-noF', '-noX', '-b', '1048576']),
+])
+
+DEFAULT_PACK_PROFILE = 'store'
+
+
+# mksquashfs places files with a higher priority first, 0 is the default.
+_SORT_MAX_PRIORITY = 32767
+
+# Matches successful open calls as logged by strace, e.g.
+# openat(AT_FDCWD, "/snap/foo/x1/lib/libfoo.so", O_RDONLY|O_CLOEXEC) = 3
+_STRACE_OPEN_RE = re.compile(
+    r'\bopen(?:at)?\((?:[^,]+, )?"(?P<path>[^"]+)".*\)\s+=\s+\d+')
+# Locations the snap is seen under at runtime.
+_SNAP_MOUNT_RE = re.compile(r'^/snap/[^/]+/[^/]+/')
+
+Superblock = collections.namedtuple(
+    'Superblock', ['compression', 'block_size', 'flags'])
+
+
+def get_mksquashfs_args(profile, *, processors):
+    """Return the mksquashfs arguments used to pack with profile."""
+    try:
+        args = PACK_PROFILES[profile]
+    except KeyError:
+        raise ValueError(
+            'Unknown pack profile {!r}, valid profiles are: {}'.format(
+                profile, ', '.join(PACK_PROFILES)))
+    return args + ['-processors', str(processors)]
+
+
+def read_superblock(path):
+    with open(path, 'rb') as f:
+        data = f.read(struct.calcsize(_SUPERBLOCK_FORMAT))
+    if len(data) < struct.calcsize(_SUPERBLOCK_FORMAT):
+        raise errors.InvalidSquashfsError(
+            path=path, message='the superblock is truncated')
+    (magic, _, _, block_size, _, compression_id, _,
+     flags) = struct.unpack(_SUPERBLOCK_FORMAT, data)
+    if magic != _SQUASHFS_MAGIC:
+        raise errors.InvalidSquashfsError(
+            path=path, message='bad magic {!r}'.format(magic))
+
+    compression = _COMPRESSORS.get(
+        compression_id, 'unknown ({})'.format(compression_id))
+    return Superblock(compression, block_size, flags)
+
+
+def get_pack_profile(path):
+    """Return the pack profile a snap was built with.
+
+    The squashfs superblock records the compressor and whether the tables
+    and data were left uncompressed, which is enough to tell the profiles
+    apart without unpacking the snap.
+    """
+    superblock = read_superblock(path)
+    uncompressed = (_FLAG_UNCOMPRESSED_INODES | _FLAG_UNCOMPRESSED_DATA |
+                    _FLAG_UNCOMPRESSED_FRAGMENTS)
+    if superblock.flags & uncompressed == uncompressed:
+        return 'uncompressed'
+    elif superblock.compression == 'xz' and not (
+            superblock.flags & uncompressed):
+        return 'store'
+    else:
+        return 'fast'
+
+
+def get_sort_entries(trace_path, snap_dir):
+    """Return the files in snap_dir opened in trace_path, in access order.
+
+    The trace can either list one path per line or be the output of
+    `strace -f -e trace=open,openat`. Paths can be absolute, relative to
+    the snap or under the snap mount point ($SNAP or /snap/<name>/<rev>).
+    """
+    entries = []
+    seen = set()
+    with open(trace_path) as trace:
+        for line in trace:
+            path = _get_traced_path(line.strip(), snap_dir)
+            if not path or path in seen:
+                continue
+            seen.add(path)
+            if not os.path.isfile(os.path.join(snap_dir, path)):
+                continue
+            if any(c.isspace() for c in path):
+                logger.debug('Not sorting {!r}: mksquashfs sort files do not '
+                             'support whitespace'.format(path))
+                continue
+            entries.append(path)
+    return entries
+
+
+def _get_traced_path(line, snap_dir):
+    match = _STRACE_OPEN_RE.search(line)
+    if match:
+        path = match.group('path')
+    elif '(' in line or not line or line.startswith('#'):
+        # Other syscalls, failed opens and comments.
+        return None
+    else:
+        path = line
+
+    if path.startswith('$SNAP/'):
+        path = path[len('$SNAP/'):]
+    elif path.startswith(snap_dir + os.sep):
+        path = os.path.relpath(path, snap_dir)
+    elif _SNAP_MOUNT_RE.match(path):
+        path = _SNAP_MOUNT_RE.sub('', path)
+    elif os.path.isabs(path):
+        return None
+    return os.path.normpath(path)
+
+
+def write_sort_file(sort_path, snap_dir, entries):
+    """Write a mksquashfs -sort file placing entries first, in order."""
+    with open(sort_path, 'w') as sort_file:
+        for index, path in enumerate(entries):
+            priority = max(_SORT_MAX_PRIORITY - index, 1)
+            sort_file.write('{} {}\n'.format(
+                os.path.join(snap_dir, path), priority))
+
+
+# The complete squashfs 4.0 superblock, see
+# https://dr-emann.github.io/squashfs/ for the on disk format.
+_FULL_SUPERBLOCK_FORMAT = '<4sIIIIHHHHHHQQQQQQQQ'
+_FullSuperblock = collections.namedtuple('_FullSuperblock', [
+    'magic', 'inode_count', 'modification_time', 'block_size',
+    'fragment_entry_count', 'compression_id', 'block_log', 'flags',
+    'id_count', 'version_major', 'version_minor', 'root_inode_ref',
+    'bytes_used', 'id_table_start', 'xattr_id_table_start',
+    'inode_table_start', 'directory_table_start', 'fragment_table_start',
+    'export_table_start'])
+
+_METADATA_SIZE = 8192
+_METADATA_UNCOMPRESSED = 0x8000
+_DATA_UNCOMPRESSED = 0x1000000
+_NO_FRAGMENT = 0xffffffff
+
+_INODE_HEADER_FORMAT = '<HHHHII'
+_BASIC_DIRECTORY, _BASIC_FILE, _BASIC_SYMLINK = 1, 2, 3
+_EXTENDED_DIRECTORY, _EXTENDED_FILE, _EXTENDED_SYMLINK = 8, 9, 10
+_DIRECTORY_TYPES = (_BASIC_DIRECTORY, _EXTENDED_DIRECTORY)
+_FILE_TYPES = (_BASIC_FILE, _EXTENDED_FILE)
+_SYMLINK_TYPES = (_BASIC_SYMLINK, _EXTENDED_SYMLINK)
+
+# How many symlinks are followed before giving up, as the kernel does.
+_MAX_SYMLINKS = 40
+
+_Inode = collections.namedtuple('_Inode', [
+    'type', 'mode', 'size', 'start', 'fragment', 'fragment_offset',
+    'block_sizes', 'directory_offset', 'target'])
+
+
+def _get_decompressor(path, compression):
+    if compression == 'gzip':
+        return zlib.decompress
+    elif compression == 'xz':
+        return lambda data: lzma.decompress(data, format=lzma.FORMAT_XZ)
+    elif compression == 'lzma':
+        return lambda data: lzma.decompress(data, format=lzma.FORMAT_ALONE)
+    elif compression == 'lzo':
+        try:
+            import lzo
+        except ImportError:
+            raise errors.UnsupportedSquashfsCompressionError(
+                path=path, compression='lzo (python3-lzo is not installed)')
+        return lambda data: lzo.decompress(data, False, _METADATA_SIZE * 128)
+    raise errors.UnsupportedSquashfsCompressionError(
+        path=path, compression=compression)
+
+
+class SquashfsImage:
+    """Read only access to the files in a squashfs image, such as a snap.
+
+    Files are read straight from the image, without extracting or mounting
+    it. Paths are relative to the root of the image.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._file = open(path, 'rb')
+        try:
+            self._superblock = self._read_superblock()
+            self._decompress = _get_decompressor(
+                path, _COMPRESSORS.get(self._superblock.compression_id,
+                                       'unknown'))
+        except Exception:
+            self._file.close()
+            raise
+        self._metadata_cache = {}
+        self._fragment_table = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def listdir(self, path=''):
+        """Return the names of the entries of the directory at path."""
+        inode = self._lookup(path)
+        if inode.type not in _DIRECTORY_TYPES:
+            raise NotADirectoryError(errno.ENOTDIR, 'Not a directory', path)
+        return [name for name, _ in self._read_directory(inode)]
+
+    def read(self, path):
+        """Return the contents of the file at path, following symlinks."""
+        return b''.join(self._read_blocks(self._lookup_file(path)))
+
+    def extract(self, path, destination):
+        """Write the file at path to destination, following symlinks.
+
+        The data is written block by block, so large files are not held in
+        memory, and the permissions of the file are kept.
+        """
+        inode = self._lookup_file(path)
+        with open(destination, 'wb') as f:
+            for block in self._read_blocks(inode):
+                f.write(block)
+        os.chmod(destination, stat.S_IMODE(inode.mode))
+
+    def _read_superblock(self):
+        data = self._file.read(struct.calcsize(_FULL_SUPERBLOCK_FORMAT))
+        if len(data) < struct.calcsize(_FULL_SUPERBLOCK_FORMAT):
+            raise errors.InvalidSquashfsError(
+                path=self._path, message='the superblock is truncated')
+        superblock = _FullSuperblock._make(
+            struct.unpack(_FULL_SUPERBLOCK_FORMAT, data))
+        if superblock.magic != _SQUASHFS_MAGIC:
+            raise errors.InvalidSquashfsError(
+                path=self._path,
+                message='bad magic {!r}'.format(superblock.magic))
+        if superblock.version_major != 4:
+            raise errors.InvalidSquashfsError(
+                path=self._path, message='unsupported version {}.{}'.format(
+                    superblock.version_major, superblock.version_minor))
+        return superblock
+
+    def _read_at(self, position, size):
+        self._file.seek(position)
+        data = self._file.read(size)
+        if len(data) < size:
+            raise errors.InvalidSquashfsError(
+                path=self._path, message='unexpected end of file')
+        return data
+
+    def _read_metadata_block(self, position):
+        """Return a metadata block and the position of the next one."""
+        if position not in self._metadata_cache:
+            header, = struct.unpack('<H', self._read_at(position, 2))
+            size = header & ~_METADATA_UNCOMPRESSED
+            data = self._read_at(position + 2, size)
+            if not header & _METADATA_UNCOMPRESSED:
+                data = self._decompress(data)
+            self._metadata_cache[position] = data, position + 2 + size
+        return self._metadata_cache[position]
+
+    def _read_metadata(self, position, offset, size):
+        """Read size bytes of metadata starting at offset in a block.
+
+        :returns: the data, and the block and offset right after it.
+        """
+        chunks = []
+        while size > 0:
+            block, next_position = self._read_metadata_block(position)
+            chunk = block[offset:offset + size]
+            chunks.append(chunk)
+            size -= len(chunk)
+            offset += len(chunk)
+            if offset >= len(block):
+                position, offset = next_position, 0
+        return b''.join(chunks), position, offset
+
+    def _read_inode(self, reference):
+        position = self._superblock.inode_table_start + (reference >> 16)
+        offset = reference & 0xffff
+        header, position, offset = self._read_metadata(
+            position, offset, struct.calcsize(_INODE_HEADER_FORMAT))
+        inode_type, permissions = struct.unpack(
+            _INODE_HEADER_FORMAT, header)[:2]
+
+        def read(fmt):
+            nonlocal position, offset
+            data, position, offset = self._read_metadata(
+                position, offset, struct.calcsize(fmt))
+            return struct.unpack(fmt, data)
+
+        inode = _Inode(inode_type, permissions, 0, 0, _NO_FRAGMENT, 0, (),
+                       0, None)
+        if inode_type == _BASIC_DIRECTORY:
+            start, _, size, directory_offset, _ = read('<IIHHI')
+            return inode._replace(
+                mode=stat.S_IFDIR | permissions, size=size, start=start,
+                directory_offset=directory_offset)
+        elif inode_type == _EXTENDED_DIRECTORY:
+            _, size, start, _, _, directory_offset, _ = read('<IIIIHHI')
+            return inode._replace(
+                mode=stat.S_IFDIR | permissions, size=size, start=start,
+                directory_offset=directory_offset)
+        elif inode_type in _FILE_TYPES:
+            if inode_type == _BASIC_FILE:
+                start, fragment, fragment_offset, size = read('<IIII')
+            else:
+                start, size, _, _, fragment, fragment_offset, _ = read(
+                    '<QQQIIII')
+            block_count = size // self._superblock.block_size
+            if fragment == _NO_FRAGMENT and size % self._superblock.block_size:
+                block_count += 1
+            block_sizes = read('<{}I'.format(block_count))
+            return inode._replace(
+                mode=stat.S_IFREG | permissions, size=size, start=start,
+                fragment=fragment, fragment_offset=fragment_offset,
+                block_sizes=block_sizes)
+        elif inode_type in _SYMLINK_TYPES:
+            _, target_size = read('<II')
+            target = read('<{}s'.format(target_size))[0]
+            return inode._replace(
+                mode=stat.S_IFLNK | permissions, size=target_size,
+                target=os.fsdecode(target))
+        # Devices, fifos and sockets have no content to read.
+        return inode._replace(mode=permissions)
+
+    def _read_directory(self, inode):
+        """Yield the name and inode reference of each directory entry."""
+        position = self._superblock.directory_table_start + inode.start
+        offset = inode.directory_offset
+        # The size accounts for the implicit . and .. entries.
+        remaining = inode.size - 3
+        while remaining > 0:
+            header, position, offset = self._read_metadata(
+                position, offset, 12)
+            count, inode_block, _ = struct.unpack('<IIi', header)
+            remaining -= 12
+            for _ in range(count + 1):
+                entry, position, offset = self._read_metadata(
+                    position, offset, 8)
+                inode_offset, _, _, name_size = struct.unpack('<HhHH', entry)
+                name, position, offset = self._read_metadata(
+                    position, offset, name_size + 1)
+                remaining -= 8 + name_size + 1
+                yield os.fsdecode(name), (inode_block << 16) | inode_offset
+
+    def _lookup(self, path, follow_symlinks=False):
+        return self._resolve(path, follow_symlinks, [0])
+
+    def _resolve(self, path, follow_symlinks, symlink_count):
+        inode = self._read_inode(self._superblock.root_inode_ref)
+        parents = []
+        components = [c for c in path.split('/') if c not in ('', '.')]
+        for index, component in enumerate(components):
+            if component == '..':
+                inode = parents.pop() if parents else inode
+                continue
+            if inode.type not in _DIRECTORY_TYPES:
+                raise NotADirectoryError(
+                    errno.ENOTDIR, 'Not a directory', path)
+            references = dict(self._read_directory(inode))
+            if component not in references:
+                raise FileNotFoundError(
+                    errno.ENOENT, 'No such file or directory', path)
+            parents.append(inode)
+            inode = self._read_inode(references[component])
+
+            last = index == len(components) - 1
+            if inode.type in _SYMLINK_TYPES and (follow_symlinks or not last):
+                symlink_count[0] += 1
+                if symlink_count[0] > _MAX_SYMLINKS:
+                    raise OSError(errno.ELOOP, 'Too many levels of symbolic '
+                                  'links', path)
+                # Absolute targets are taken as relative to the root of the
+                # image, which is where they point to when the snap is used.
+                target = inode.target
+                if not target.startswith('/'):
+                    target = '/'.join(components[:index] + [target])
+                rest = components[index + 1:]
+                return self._resolve('/'.join([target] + rest),
+                                     follow_symlinks, symlink_count)
+        return inode
+
+    def _lookup_file(self, path):
+        inode = self._lookup(path, follow_symlinks=True)
+        if inode.type in _DIRECTORY_TYPES:
+            raise IsADirectoryError(errno.EISDIR, 'Is a directory', path)
+        if inode.type not in _FILE_TYPES:
+            raise errors.InvalidSquashfsError(
+                path=self._path,
+                message='{!r} is not a regular file'.format(path))
+        return inode
+
+    def _read_blocks(self, inode):
+        block_size = self._superblock.block_size
+        position = inode.start
+        remaining = inode.size
+        for block_size_entry in inode.block_sizes:
+            size = block_size_entry & ~_DATA_UNCOMPRESSED
+            if size == 0:
+                # Sparse block.
+                data = bytes(min(block_size, remaining))
+            else:
+                data = self._read_at(position, size)
+                if not block_size_entry & _DATA_UNCOMPRESSED:
+                    data = self._decompress(data)
+            position += size
+            remaining -= len(data)
+            yield data
+
+        if inode.fragment != _NO_FRAGMENT and remaining > 0:
+            fragment = self._read_fragment(inode.fragment)
+            yield fragment[inode.fragment_offset:
+                           inode.fragment_offset + remaining]
+
+    def _read_fragment(self, index):
+        if self._fragment_table is None:
+            count = self._superblock.fragment_entry_count
+            # Fragment entries are 16 bytes, in metadata blocks listed by a
+            # table of block positions.
+            block_count = -(-count * 16 // _METADATA_SIZE)
+            self._fragment_table = struct.unpack(
+                '<{}Q'.format(block_count), self._read_at(
+                    self._superblock.fragment_table_start, block_count * 8))
+        entries_per_block = _METADATA_SIZE // 16
+        entry, _, _ = self._read_metadata(
+            self._fragment_table[index // entries_per_block],
+            (index % entries_per_block) * 16, 16)
+        start, size, _ = struct.unpack('<QII', entry)
+        data = self._read_at(start, size & ~_DATA_UNCOMPRESSED)
+        if not size & _DATA_UNCOMPRESSED:
+            data = self._decompress(data)
+        return data
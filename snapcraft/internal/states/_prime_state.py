@@ -30,24 +30,33 @@ class PrimeState(State):
     yaml_tag = u'!PrimeState'
 
     def __init__(self, files, directories, dependency_paths=None,
-                 part_properties=None, project=None):
+                 part_properties=None, project=None, stripped_files=None):
         super().__init__(part_properties, project)
 
         self.files = files
         self.directories = directories
         self.dependency_paths = set()
+        self.stripped_files = {}
 
         if dependency_paths:
             self.dependency_paths = dependency_paths
 
+        if stripped_files:
+            self.stripped_files = stripped_files
+
     def properties_of_interest(self, part_properties):
         """Extract the properties concerning this step from part_properties.
 
-        The only property of interest to the prime step is the `prime` keyword
-        used to filter out files with a white or blacklist.
+        The properties of interest to the prime step are the `prime` keyword
+        used to filter out files with a white or blacklist, and the `strip`
+        and `debug-symbols` keywords.
         """
 
-        return {'prime': part_properties.get('prime', ['*']) or ['*']}
+        return {
+            'prime': part_properties.get('prime', ['*']) or ['*'],
+            'strip': part_properties.get('strip', False),
+            'debug-symbols': part_properties.get('debug-symbols', 'discard'),
+        }
 
     def project_options_of_interest(self, project):
         """Extract the options concerning this step from the project.
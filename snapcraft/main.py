@@ -27,8 +27,9 @@ Usage:
   snapcraft [options] prime [<part> ...]
   snapcraft [options] strip [<part> ...]
   snapcraft [options] clean [<part> ...] [--step <step>]
-  snapcraft [options] snap [<directory> --output <snap-file>]
+  snapcraft [options] snap [<directory> --output <snap-file>] [--pack-profile <profile>] [--sort-trace <trace-file>]
   snapcraft [options] cleanbuild
+  snapcraft [options] size-report [--json <report-file>]
   snapcraft [options] login
   snapcraft [options] logout
   snapcraft [options] list-registered
@@ -41,6 +42,7 @@ Usage:
   snapcraft [options] sign-build <snap-file> [--key-name=<key-name>] [--local]
   snapcraft [options] upload <snap-file>
   snapcraft [options] push <snap-file> [--release <channels>]
+  snapcraft [options] push-many <snap-files>... [--release <channels>] [--jobs <jobs>] [--summary <summary-file>]
   snapcraft [options] release <snap-name> <revision> <channel>
   snapcraft [options] status <snap-name> [--series=<series>] [--arch=<arch>]
   snapcraft [options] history <snap-name> [--series=<series>] [--arch=<arch>]
@@ -86,10 +88,26 @@ Options specific to cleaning:
 Options specific to snapping:
   -o <snap-file>, --output <snap-file>  used in case you want to rename the
                                         snap.
+  --pack-profile <profile>              how to compress the snap, one of
+                                        store, fast or uncompressed. Only
+                                        store snaps can be pushed
+                                        [default: store].
+  --sort-trace <trace-file>             place the files listed in this
+                                        trace first in the snap, in order,
+                                        to speed up app startup. The trace
+                                        can be a list of paths or the
+                                        output of strace -e open,openat.
+
+Options specific to size reports:
+  --json <report-file>                  also write the report as JSON to
+                                        this file, to track it over time.
 
 Options specific to store interaction:
   --release <channels>  Comma separated list of channels to release to.
   --series <series>     Snap series [default: {DEFAULT_SERIES}].
+  --jobs <jobs>         Maximum number of snaps pushed at the same time.
+  --summary <summary-file>  Write the per snap push-many summary as JSON
+                            to this file instead of printing it.
 
 The available commands are:
   help         Obtain help for a certain plugin or topic
@@ -109,6 +127,7 @@ The available commands are:
                or ./snapcraft-tour/.
   sign-build   Sign a built snap file and assert it using the developer's key.
   push         Pushes and optionally releases a snap to the Ubuntu Store.
+  push-many    Pushes and optionally releases several snaps concurrently.
   upload       DEPRECATED Upload a snap to the Ubuntu Store. The push command
                supersedes this command.
   release      Release a revision of a snap to a specific channel.
@@ -128,6 +147,8 @@ The available lifecycle commands are:
   stage        Stage the part's built artifacts into the common staging area.
   prime        Final copy and preparation for the snap.
   snap         Create a snap.
+  size-report  Show what parts, directories, stage-packages and file
+               types make up the size of the primed snap.
 
 Parts ecosystem commands:
   update       Updates the parts listing from the cloud.
@@ -146,6 +167,7 @@ For more help, visit the documentation:
 http://snapcraft.io/docs/build-snaps
 """  # NOQA
 
+import json
 import logging
 import os
 import pkgutil
@@ -276,6 +298,8 @@ def run(args, project_options):  # noqa
         _run_clean(args, project_options)
     elif args['cleanbuild']:
         lifecycle.cleanbuild(project_options),
+    elif args['size-report']:
+        lifecycle.report_size(project_options, args['--json'])
     elif _is_store_command(args):
         _run_store_command(args)
     elif args['tour']:
@@ -292,7 +316,8 @@ def run(args, project_options):  # noqa
     elif args['search']:
         parts.search(' '.join(args['<query>']))
     else:  # snap by default:
-        lifecycle.snap(project_options, args['<directory>'], args['--output'])
+        lifecycle.snap(project_options, args['<directory>'], args['--output'],
+                       args['--pack-profile'], args['--sort-trace'])
 
     return project_options
 
@@ -310,7 +335,8 @@ def _is_store_command(args):
     commands = (
         'list-registered', 'registered', 'list-keys', 'keys', 'create-key',
         'register-key', 'register', 'sign-build', 'upload', 'release',
-        'push', 'validate', 'gated', 'history', 'status', 'close')
+        'push', 'push-many', 'validate', 'gated', 'history', 'status',
+        'close')
     return any(args.get(command) for command in commands)
 
 
@@ -334,11 +360,9 @@ def _run_store_command(args):  # noqa: C901
         logger.warning('DEPRECATED: Use `push` instead of `upload`')
         snapcraft.push(args['<snap-file>'])
     elif args['push']:
-        if args['--release']:
-            release_channels = args['--release'].split(',')
-        else:
-            release_channels = []
-        snapcraft.push(args['<snap-file>'], release_channels)
+        snapcraft.push(args['<snap-file>'], _get_release_channels(args))
+    elif args['push-many']:
+        _run_push_many(args)
     elif args['release']:
         snapcraft.release(
             args['<snap-name>'], args['<revision>'], [args['<channel>']])
@@ -357,5 +381,39 @@ def _run_store_command(args):  # noqa: C901
         snapcraft.close(args['<snap-name>'], args['<channel_names>'])
 
 
+def _get_release_channels(args):
+    if args['--release']:
+        return args['--release'].split(',')
+    return []
+
+
+def _run_push_many(args):
+    jobs = args['--jobs']
+    if jobs is not None:
+        try:
+            jobs = int(jobs)
+        except ValueError:
+            jobs = 0
+        if jobs < 1:
+            raise ValueError(
+                '--jobs must be a positive number, not {!r}'.format(
+                    args['--jobs']))
+
+    summaries = snapcraft.push_many(
+        args['<snap-files>'], _get_release_channels(args), jobs)
+
+    summary = json.dumps(summaries, indent=2, sort_keys=True)
+    if args['--summary']:
+        with open(args['--summary'], 'w') as summary_file:
+            print(summary, file=summary_file)
+    else:
+        print(summary)
+
+    failed = [s['snap'] for s in summaries if 'error' in s]
+    if failed:
+        raise RuntimeError('Failed to push {}.'.format(
+            ', '.join(repr(f) for f in failed)))
+
+
 if __name__ == '__main__':  # pragma: no cover
     main()                  # pragma: no cover
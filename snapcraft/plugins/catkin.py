@@ -34,17 +34,25 @@ Additionally, this plugin uses the following plugin-specific keywords:
     - include-roscore:
       (boolean)
       Whether or not to include roscore with the part. Defaults to true.
+
+rosdep and its database are kept in the snapcraft cache for each rosdistro,
+along with the system dependencies keys resolved to, and shared by every
+part. The database is updated once a day.
 """
 
 import contextlib
 import glob
+import json
 import os
 import tempfile
+import time
 import logging
 import shutil
 import re
 import subprocess
 
+from xdg import BaseDirectory
+
 import snapcraft
 from snapcraft import (
     common,
@@ -62,6 +70,8 @@ _ROS_RELEASE_MAP = {
     'kinetic': 'xenial'
 }
 
+_ROSDEP_DATABASE_MAX_AGE = 24 * 60 * 60
+
 
 class CatkinPlugin(snapcraft.BasePlugin):
 
@@ -122,7 +132,6 @@ deb http://${{security}}.ubuntu.com/${{suffix}} {0}-security main universe
 
         # Get a unique set of packages
         self.catkin_packages = set(options.catkin_packages)
-        self._rosdep_path = os.path.join(self.partdir, 'rosdep')
         self._compilers_path = os.path.join(self.partdir, 'compilers')
 
         # The path created via the `source` key (or a combination of `source`
@@ -154,6 +163,13 @@ deb http://${{security}}.ubuntu.com/${{suffix}} {0}-security main universe
                     formatting_utils.humanize_list(
                         _ROS_RELEASE_MAP.keys(), 'and')))
 
+    @property
+    def _rosdep_path(self):
+        return os.path.join(
+            BaseDirectory.xdg_cache_home, 'snapcraft', 'rosdep',
+            '{}-{}'.format(self.options.rosdistro,
+                           _ROS_RELEASE_MAP[self.options.rosdistro]))
+
     def env(self, root):
         """Runtime environment for ROS binaries and services."""
 
@@ -274,10 +290,6 @@ deb http://${{security}}.ubuntu.com/${{suffix}} {0}-security main universe
     def clean_pull(self):
         super().clean_pull()
 
-        # Remove the rosdep path, if any
-        with contextlib.suppress(FileNotFoundError):
-            shutil.rmtree(self._rosdep_path)
-
         # Remove the compilers path, if any
         with contextlib.suppress(FileNotFoundError):
             shutil.rmtree(self._compilers_path)
@@ -316,8 +328,6 @@ deb http://${{security}}.ubuntu.com/${{suffix}} {0}-security main universe
         self._finish_build()
 
     def _prepare_build(self):
-        self._use_in_snap_python()
-
         # Each Catkin package distributes .cmake files so they can be found via
         # find_package(). However, the Ubuntu packages pulled down as
         # dependencies contain .cmake files pointing to system paths (e.g.
@@ -334,10 +344,11 @@ deb http://${{security}}.ubuntu.com/${{suffix}} {0}-security main universe
 
             return '"' + ';'.join(paths) + '"'
 
-        # Looking for any path-like string
-        file_utils.replace_in_file(self.rosdir, re.compile(r'.*Config.cmake$'),
-                                   re.compile(r'"(.*?/.*?)"'),
-                                   rewrite_paths)
+        # Looking for any path-like string. This is done in the same walk of
+        # the ROS tree as the shebang rewriting.
+        self._use_in_snap_python(replacements=[
+            (re.compile(r'.*Config.cmake$'), re.compile(r'"(.*?/.*?)"'),
+             rewrite_paths)])
 
     def _finish_build(self):
         self._use_in_snap_python()
@@ -353,11 +364,12 @@ deb http://${{security}}.ubuntu.com/${{suffix}} {0}-security main universe
                 f.truncate()
                 f.write(replaced)
 
-    def _use_in_snap_python(self):
-        # Fix all shebangs to use the in-snap python.
-        file_utils.replace_in_file(self.rosdir, re.compile(r''),
-                                   re.compile(r'^#!.*python'),
-                                   r'#!/usr/bin/env python')
+    def _use_in_snap_python(self, replacements=None):
+        # Fix all shebangs to use the in-snap python, along with any other
+        # replacements requested.
+        file_utils.replace_in_files(self.rosdir, [
+            (re.compile(r''), re.compile(r'^#!.*python'),
+             r'#!/usr/bin/env python')] + (replacements or []))
 
         # Also replace the python usage in 10.ros.sh to use the in-snap python.
         ros10_file = os.path.join(self.rosdir,
@@ -421,35 +433,24 @@ deb http://${{security}}.ubuntu.com/${{suffix}} {0}-security main universe
 def _find_system_dependencies(catkin_packages, rosdep):
     """Find system dependencies for a given set of Catkin packages."""
 
-    system_dependencies = {}
-
     logger.info('Determining system dependencies for Catkin packages...')
-    for package in catkin_packages:
-        # Query rosdep for the list of dependencies for this package
-        dependencies = rosdep.get_dependencies(package)
-
-        for dependency in dependencies:
-            # No need to resolve this dependency if we know it's local, or if
-            # we've already resolved it into a system dependency
-            if (dependency in catkin_packages or
-                    dependency in system_dependencies):
-                continue
-
-            # In this situation, the package depends on something that we
-            # weren't instructed to build. It's probably a system dependency,
-            # but the developer could have also forgotten to tell us to build
-            # it.
-            try:
-                these_dependencies = rosdep.resolve_dependency(dependency)
-            except SystemDependencyNotFound:
-                raise RuntimeError(
-                    "Package {!r} isn't a valid system dependency. "
-                    "Did you forget to add it to catkin-packages? If "
-                    "not, add the Ubuntu package containing it to "
-                    "stage-packages until you can get it into the "
-                    "rosdep database.".format(dependency))
-
-            system_dependencies[dependency] = these_dependencies
+    # Query rosdep for the dependencies of all the packages at once, no need
+    # to resolve the ones we know are local.
+    dependencies = (set(rosdep.get_all_dependencies(catkin_packages)) -
+                    set(catkin_packages))
+
+    # In this situation, the packages depend on something that we weren't
+    # instructed to build. It's probably a system dependency, but the
+    # developer could have also forgotten to tell us to build it.
+    try:
+        system_dependencies = rosdep.resolve_dependencies(dependencies)
+    except SystemDependencyNotFound as e:
+        raise RuntimeError(
+            "Package {!r} isn't a valid system dependency. "
+            "Did you forget to add it to catkin-packages? If "
+            "not, add the Ubuntu package containing it to "
+            "stage-packages until you can get it into the "
+            "rosdep database.".format(e.dependency_name))
 
     # Finally, return a list of all system dependencies
     return set(item for sublist in system_dependencies.values()
@@ -457,7 +458,12 @@ def _find_system_dependencies(catkin_packages, rosdep):
 
 
 class SystemDependencyNotFound(Exception):
-    pass
+
+    def __init__(self, dependency_name):
+        super().__init__(
+            '{!r} does not resolve to a system dependency'.format(
+                dependency_name))
+        self.dependency_name = dependency_name
 
 
 class _Rosdep:
@@ -471,17 +477,25 @@ class _Rosdep:
         self._rosdep_sources_path = os.path.join(self._rosdep_path,
                                                  'sources.list.d')
         self._rosdep_cache_path = os.path.join(self._rosdep_path, 'cache')
+        self._installed_stamp = os.path.join(self._rosdep_path, 'installed')
+        self._updated_stamp = os.path.join(self._rosdep_path, 'updated')
+        self._resolutions_path = os.path.join(
+            self._rosdep_path, 'resolutions.json')
         self._project = project
 
     def setup(self):
-        # Make sure we can run multiple times without error, while leaving the
-        # capability to re-initialize, by making sure we clear the sources.
-        if os.path.exists(self._rosdep_sources_path):
-            shutil.rmtree(self._rosdep_sources_path)
+        """Install rosdep and update its database, unless done recently."""
+        if not os.path.exists(self._installed_stamp):
+            self._install()
+        with contextlib.suppress(FileNotFoundError):
+            updated = os.stat(self._updated_stamp).st_mtime
+            if time.time() - updated < _ROSDEP_DATABASE_MAX_AGE:
+                logger.info('Using cached rosdep database')
+                return
+        self._update()
 
-        os.makedirs(self._rosdep_sources_path)
+    def _install(self):
         os.makedirs(self._rosdep_install_path, exist_ok=True)
-        os.makedirs(self._rosdep_cache_path, exist_ok=True)
 
         # rosdep isn't necessarily a dependency of the project, and we don't
         # want to bloat the .snap more than necessary. So we'll unpack it
@@ -495,6 +509,20 @@ class _Rosdep:
 
         logger.info('Installing rosdep...')
         ubuntu.unpack(self._rosdep_install_path)
+        open(self._installed_stamp, 'w').close()
+
+    def _update(self):
+        # Make sure we can run multiple times without error, while leaving the
+        # capability to re-initialize, by making sure we clear the sources.
+        if os.path.exists(self._rosdep_sources_path):
+            shutil.rmtree(self._rosdep_sources_path)
+
+        os.makedirs(self._rosdep_sources_path)
+        os.makedirs(self._rosdep_cache_path, exist_ok=True)
+
+        # Resolutions from the previous database may no longer hold.
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._resolutions_path)
 
         logger.info('Initializing rosdep database...')
         try:
@@ -511,6 +539,26 @@ class _Rosdep:
             output = e.output.decode('utf8').strip()
             raise RuntimeError(
                 'Error updating rosdep database:\n{}'.format(output))
+        open(self._updated_stamp, 'w').close()
+
+    def get_all_dependencies(self, package_names):
+        """Return the dependencies of all the packages in one query."""
+        # rosdep refuses to list the keys of no packages at all, which is
+        # the case for parts only including roscore.
+        if not package_names:
+            return []
+        package_names = sorted(package_names)
+        try:
+            output = self._run(['keys'] + package_names).strip()
+        except subprocess.CalledProcessError:
+            # Find out which package is missing.
+            for package_name in package_names:
+                self.get_dependencies(package_name)
+            raise
+        if output:
+            return output.split('\n')
+        else:
+            return []
 
     def get_dependencies(self, package_name):
         try:
@@ -524,29 +572,82 @@ class _Rosdep:
                 'Unable to find Catkin package "{}"'.format(package_name))
 
     def resolve_dependency(self, dependency_name):
+        return self.resolve_dependencies([dependency_name])[dependency_name]
+
+    def resolve_dependencies(self, dependency_names):
+        """Return the system dependencies of each of dependency_names.
+
+        Resolutions are cached until the next database update, the ones
+        missing are resolved in a single query.
+        """
+        resolutions = self._load_resolutions()
+        missing = sorted(set(dependency_names) - set(resolutions))
+        if missing:
+            try:
+                resolved = self._resolve(missing)
+            except (subprocess.CalledProcessError, ValueError):
+                if len(missing) == 1:
+                    raise SystemDependencyNotFound(missing[0])
+                # Find out which dependency does not resolve.
+                resolved = {}
+                for dependency_name in missing:
+                    resolved.update(self._resolve([dependency_name]))
+            resolutions.update(resolved)
+            os.makedirs(self._rosdep_path, exist_ok=True)
+            with open(self._resolutions_path, 'w') as f:
+                json.dump(resolutions, f)
+        return {dependency_name: resolutions[dependency_name]
+                for dependency_name in dependency_names}
+
+    def _resolve(self, dependency_names):
         try:
             # rosdep needs three pieces of information here:
             #
-            # 1) The dependency we're trying to lookup.
+            # 1) The dependencies we're trying to lookup.
             # 2) The rosdistro being used.
             # 3) The version of Ubuntu being used. We're telling rosdep to
             #    resolve dependencies using the version of Ubuntu that
             #    corresponds to the ROS release (even if we're running on
             #    something else).
-            output = self._run(['resolve', dependency_name, '--rosdistro',
-                                self._ros_distro, '--os',
-                                'ubuntu:{}'.format(
-                                    _ROS_RELEASE_MAP[self._ros_distro])])
+            output = self._run(['resolve'] + dependency_names + [
+                '--rosdistro', self._ros_distro, '--os',
+                'ubuntu:{}'.format(_ROS_RELEASE_MAP[self._ros_distro])])
         except subprocess.CalledProcessError:
-            raise SystemDependencyNotFound(
-                '{!r} does not resolve to a system dependency'.format(
-                    dependency_name))
-
-        # Everything that isn't a package name is prepended with the pound
-        # sign, so we'll ignore everything with that.
-        delimiters = re.compile(r'\n|\s')
-        lines = delimiters.split(output)
-        return [line for line in lines if not line.startswith('#')]
+            if len(dependency_names) == 1:
+                raise SystemDependencyNotFound(dependency_names[0])
+            raise
+
+        # Each dependency resolves to a line with the installer prepended
+        # with the pound sign, followed by the packages if there are any.
+        # When resolving more than one dependency, each one is introduced by
+        # a #ROSDEP[<dependency>] line.
+        resolutions = {}
+        packages = None
+        if len(dependency_names) == 1:
+            packages = resolutions.setdefault(dependency_names[0], [])
+        for line in output.split('\n'):
+            match = re.match(r'#ROSDEP\[(.*)\]$', line.strip())
+            if match:
+                packages = resolutions.setdefault(match.group(1), [])
+            elif line.startswith('#') or not line.strip():
+                continue
+            elif packages is None:
+                raise ValueError(
+                    'Unexpected output from rosdep resolve:\n{}'.format(
+                        output))
+            else:
+                packages.extend(line.split())
+        if set(resolutions) != set(dependency_names):
+            raise ValueError(
+                'Unexpected output from rosdep resolve:\n{}'.format(output))
+        return resolutions
+
+    def _load_resolutions(self):
+        try:
+            with open(self._resolutions_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
 
     def _run(self, arguments):
         env = os.environ.copy()
@@ -23,17 +23,40 @@ This plugin uses the common plugin keywords as well as those for "sources".
 For more information check the 'plugins' topic for the former and the
 'sources' topic for the latter.
 
+The build tree is kept in parts/<part>/cmake-build between builds, so only
+what changed in the sources is rebuilt, and is linked into the part's build
+directory afterwards. It is started over when the configure flags, the
+generator or the compilers change.
+
 Additionally, this plugin uses the following plugin-specific keywords:
 
     - configflags:
       (list of strings)
       configure flags to pass to the build using the common cmake semantics.
+
+    - cmake-generator:
+      (string; default: Unix Makefiles)
+      the CMake generator to build with, 'Unix Makefiles' or 'Ninja'.
+
+The make-parameters of the make plugin are only used with 'Unix Makefiles'.
+So is a make-install-var other than DESTDIR, Ninja only redirects the
+installation with DESTDIR.
 """
 
+import json
 import os
 import shutil
 
 import snapcraft.plugins.make
+from snapcraft import file_utils
+from snapcraft.internal import common
+
+
+# Holds what the build tree was configured with.
+_CONFIGURATION_FILE = '.snapcraft-configuration.json'
+# Changing these after the first configure has no effect on the build tree.
+_CACHED_ENVIRONMENT = ('CC', 'CXX', 'CFLAGS', 'CXXFLAGS', 'CPPFLAGS',
+                       'LDFLAGS')
 
 
 class CMakePlugin(snapcraft.plugins.make.MakePlugin):
@@ -50,6 +73,11 @@ class CMakePlugin(snapcraft.plugins.make.MakePlugin):
             },
             'default': [],
         }
+        schema['properties']['cmake-generator'] = {
+            'type': 'string',
+            'enum': ['Unix Makefiles', 'Ninja'],
+            'default': 'Unix Makefiles',
+        }
 
         return schema
 
@@ -57,17 +85,22 @@ class CMakePlugin(snapcraft.plugins.make.MakePlugin):
     def get_build_properties(cls):
         # Inform Snapcraft of the properties associated with building. If these
         # change in the YAML Snapcraft will consider the build step dirty.
-        return super().get_build_properties() + ['configflags']
+        return super().get_build_properties() + ['configflags',
+                                                 'cmake-generator']
 
     def __init__(self, name, options, project):
         super().__init__(name, options, project)
         self.build_packages.append('cmake')
+        if self.options.cmake_generator == 'Ninja':
+            if self.options.make_install_var not in ('', 'DESTDIR'):
+                raise EnvironmentError(
+                    'make-install-var {!r} cannot be used with the Ninja '
+                    'generator, only DESTDIR is supported.'.format(
+                        self.options.make_install_var))
+            self.build_packages.append('ninja-build')
+        self.cmake_builddir = os.path.join(self.partdir, 'cmake-build')
 
     def build(self):
-        if os.path.exists(self.builddir):
-            shutil.rmtree(self.builddir)
-        os.mkdir(self.builddir)
-
         source_subdir = getattr(self.options, 'source_subdir', None)
         if source_subdir:
             sourcedir = os.path.join(self.sourcedir, source_subdir)
@@ -75,11 +108,56 @@ class CMakePlugin(snapcraft.plugins.make.MakePlugin):
             sourcedir = self.sourcedir
 
         env = self._build_environment()
+        install_var = self.options.make_install_var
+        install_args = []
+        if install_var == 'DESTDIR':
+            # Honoured by the install target of every generator.
+            env['DESTDIR'] = self.installdir
+        elif install_var and not self.options.artifacts:
+            # Only make knows about other variables.
+            install_args.append('{}={}'.format(install_var, self.installdir))
+
+        self._configure(sourcedir, env)
+
+        command = ['cmake', '--build', '.']
+        if not self.options.artifacts:
+            command.extend(['--target', 'install'])
+        command.extend(['--', '-j{}'.format(self.parallel_build_count)])
+        if self.options.cmake_generator == 'Unix Makefiles':
+            command.extend(self.options.make_parameters + install_args)
+        self.run(command, cwd=self.cmake_builddir, env=env)
+
+        if self.options.artifacts:
+            self.install_artifacts(self.cmake_builddir)
+        # Scriptlets expect the build results in the build directory.
+        file_utils.link_or_copy_tree(self.cmake_builddir, self.builddir)
+
+    def _configure(self, sourcedir, env):
+        command = ['cmake', sourcedir, '-G', self.options.cmake_generator,
+                   '-DCMAKE_INSTALL_PREFIX='] + self.options.configflags
+        configuration = {
+            'command': command,
+            'environment': {k: env.get(k) for k in _CACHED_ENVIRONMENT},
+            'build-environment': common.assemble_env(),
+        }
+        configuration_path = os.path.join(
+            self.cmake_builddir, _CONFIGURATION_FILE)
+
+        # Flags dropped from the command would otherwise linger in the
+        # CMake cache.
+        if _load_configuration(configuration_path) != configuration:
+            if os.path.exists(self.cmake_builddir):
+                shutil.rmtree(self.cmake_builddir)
+        os.makedirs(self.cmake_builddir, exist_ok=True)
 
-        self.run(['cmake', sourcedir, '-DCMAKE_INSTALL_PREFIX='] +
-                 self.options.configflags, env=env)
+        self.run(command, cwd=self.cmake_builddir, env=env)
+        with open(configuration_path, 'w') as f:
+            json.dump(configuration, f)
 
-        self.make(env=env)
+    def clean_pull(self):
+        super().clean_pull()
+        if os.path.exists(self.cmake_builddir):
+            shutil.rmtree(self.cmake_builddir)
 
     def _build_environment(self):
         env = os.environ.copy()
@@ -95,3 +173,11 @@ class CMakePlugin(snapcraft.plugins.make.MakePlugin):
                  self.project.stage_dir, self.project.arch_triplet)
 
         return env
+
+
+def _load_configuration(configuration_path):
+    try:
+        with open(configuration_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
@@ -40,19 +40,37 @@ Additionally, this plugin uses the following plugin-specific keywords:
     - go-buildtags:
       (list of strings)
       Tags to use during the go build. Default is not to use any build tags.
+
+Repositories fetched by `go get` are mirrored into the snapcraft cache and
+linked into the GOPATH of every part using them, instead of being fetched
+again. Cached repositories are evicted 30 days after they were fetched, so
+that the next pull gets them from upstream again. To pick up upstream
+changes sooner, remove $XDG_CACHE_HOME/snapcraft/go. With go 1.10 and newer,
+compiled packages are also shared through the go build cache.
 """
 
+import contextlib
 import logging
 import os
 import shutil
+import tempfile
+import time
 from glob import iglob
 
+from xdg import BaseDirectory
+
 import snapcraft
-from snapcraft import common
+from snapcraft import common, file_utils
 
 
 logger = logging.getLogger(__name__)
 
+_VCS_DIRS = ('.git', '.hg', '.bzr', '.svn')
+_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+# Everything a package needs to build, as well as its tests.
+_GO_LIST_DEPS = ('{{.ImportPath}} {{join .Deps " "}} '
+                 '{{join .TestImports " "}} {{join .XTestImports " "}}')
+
 
 class GoPlugin(snapcraft.BasePlugin):
 
@@ -115,6 +133,13 @@ class GoPlugin(snapcraft.BasePlugin):
         super().pull()
         os.makedirs(self._gopath_src, exist_ok=True)
 
+        # Whatever is in the cache is found there instead of being fetched,
+        # so drop what is too old first.
+        cache = GoCache()
+        cache.prune()
+        gopath = [self._gopath, cache.gopath]
+        go_packages = []
+
         if any(iglob('{}/**/*.go'.format(self.sourcedir), recursive=True)):
             go_package = self._get_local_go_package()
             go_package_path = os.path.join(self._gopath_src, go_package)
@@ -122,10 +147,22 @@ class GoPlugin(snapcraft.BasePlugin):
                 os.unlink(go_package_path)
             os.makedirs(os.path.dirname(go_package_path), exist_ok=True)
             os.symlink(self.sourcedir, go_package_path)
-            self._run(['go', 'get', '-t', '-d', './{}/...'.format(go_package)])
+            go_packages.append('./{}/...'.format(go_package))
+            self._run(['go', 'get', '-t', '-d', go_packages[-1]],
+                      gopath=gopath)
 
         for go_package in self.options.go_packages:
-            self._run(['go', 'get', '-t', '-d', go_package])
+            go_packages.append(go_package)
+            self._run(['go', 'get', '-t', '-d', go_package], gopath=gopath)
+
+        if go_packages:
+            dependencies = self.run_output(
+                ['go', 'list', '-e', '-f', _GO_LIST_DEPS] + go_packages,
+                cwd=self._gopath_src,
+                env=self._build_environment(gopath=gopath))
+            cache.link_repositories(self._gopath_src, dependencies.split())
+            cache.add_repositories(self._gopath_src)
+            cache.report()
 
     def clean_pull(self):
         super().clean_pull()
@@ -173,14 +210,15 @@ class GoPlugin(snapcraft.BasePlugin):
         if os.path.isdir(self._gopath_pkg):
             shutil.rmtree(self._gopath_pkg)
 
-    def _run(self, cmd, **kwargs):
-        env = self._build_environment()
+    def _run(self, cmd, gopath=None, **kwargs):
+        env = self._build_environment(gopath=gopath)
         return self.run(cmd, cwd=self._gopath_src, env=env, **kwargs)
 
-    def _build_environment(self):
+    def _build_environment(self, gopath=None):
         env = os.environ.copy()
-        env['GOPATH'] = self._gopath
+        env['GOPATH'] = os.pathsep.join(gopath) if gopath else self._gopath
         env['GOBIN'] = self._gopath_bin
+        env['GOCACHE'] = GoCache().build_cache_dir
 
         include_paths = []
         for root in [self.installdir, self.project.stage_dir]:
@@ -192,3 +230,106 @@ class GoPlugin(snapcraft.BasePlugin):
             env.get('CGO_LDFLAGS', ''), flags, env.get('LDFLAGS', ''))
 
         return env
+
+
+class GoCache:
+    """A GOPATH mirroring the repositories fetched by every part.
+
+    Parts look packages up in it while fetching and then get the
+    repositories they use linked into their own GOPATH, so that their
+    sources never change under them. Repositories are never updated in the
+    mirror, prune evicts them max_age after they were fetched so that they
+    are fetched from upstream again.
+    """
+
+    def __init__(self, max_age=_CACHE_MAX_AGE):
+        cache_dir = os.path.join(BaseDirectory.xdg_cache_home, 'snapcraft')
+        self.gopath = os.path.join(cache_dir, 'go')
+        self.build_cache_dir = os.path.join(cache_dir, 'go-build')
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._src = os.path.join(self.gopath, 'src')
+
+    def link_repositories(self, gopath_src, import_paths):
+        """Link the cached repositories providing import_paths."""
+        cached = set(_find_repositories(self._src))
+        linked = set()
+        for import_path in import_paths:
+            repository = _get_repository(import_path, cached)
+            if not repository or repository in linked:
+                continue
+            linked.add(repository)
+            destination = os.path.join(gopath_src, repository)
+            if os.path.exists(destination):
+                continue
+            _link_repository(os.path.join(self._src, repository), destination)
+            self.hits += 1
+
+    def add_repositories(self, gopath_src):
+        """Cache the repositories in gopath_src that are not cached yet."""
+        for repository in _find_repositories(gopath_src):
+            destination = os.path.join(self._src, repository)
+            if os.path.exists(destination):
+                continue
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            # Stage the copy so other parts never see a partial repository.
+            with tempfile.TemporaryDirectory(dir=self.gopath) as temp_dir:
+                staged = os.path.join(temp_dir, 'repository')
+                _link_repository(os.path.join(gopath_src, repository), staged)
+                # The mtime of the repository records when it was fetched.
+                os.utime(staged)
+                # Another part may have cached it in the meantime.
+                with contextlib.suppress(OSError):
+                    os.rename(staged, destination)
+            self.misses += 1
+
+    def prune(self):
+        """Remove the repositories fetched more than max_age ago."""
+        expiry = time.time() - self.max_age
+        for repository in _find_repositories(self._src):
+            path = os.path.join(self._src, repository)
+            if os.stat(path).st_mtime < expiry:
+                shutil.rmtree(path)
+
+    def report(self):
+        logger.info(
+            'Go repository cache: {} reused, {} fetched'.format(
+                self.hits, self.misses))
+
+
+def _link_repository(source, destination):
+    """Link the repository in source into destination.
+
+    VCS metadata, parts of which are rewritten in place (e.g.
+    .git/FETCH_HEAD), is copied instead so it is never shared.
+    """
+    def link_or_copy(source_file, destination_file):
+        relative_path = os.path.relpath(source_file, source)
+        if relative_path.split(os.sep)[0] in _VCS_DIRS:
+            shutil.copy2(source_file, destination_file, follow_symlinks=False)
+        else:
+            file_utils.link_or_copy(source_file, destination_file)
+
+    file_utils.link_or_copy_tree(source, destination,
+                                 copy_function=link_or_copy)
+
+
+def _find_repositories(gopath_src):
+    """Yield the paths of the repositories in gopath_src, relative to it."""
+    # Symlinks, such as the one to the part's own sources, are not followed.
+    for root, directories, files in os.walk(gopath_src):
+        if any(vcs_dir in directories or vcs_dir in files
+               for vcs_dir in _VCS_DIRS):
+            directories.clear()
+            yield os.path.relpath(root, gopath_src)
+
+
+def _get_repository(import_path, repositories):
+    """Return the repository in repositories providing import_path."""
+    path = ''
+    for element in import_path.split('/'):
+        path = os.path.join(path, element)
+        if path in repositories:
+            return path
+    return None
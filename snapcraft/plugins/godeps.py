@@ -44,6 +44,10 @@ Additionally, this plugin uses the following plugin-specific keywords:
       This entry tells the checked out `source` to live within a certain path
       within `GOPATH`. This is required in order to work with absolute imports
       and import path checking.
+
+Like with the go plugin, the repositories listed in the godeps file and
+godeps itself are fetched once into the snapcraft cache and shared by
+every part.
 """
 
 import logging
@@ -52,6 +56,7 @@ import shutil
 
 import snapcraft
 from snapcraft import common
+from snapcraft.plugins import go
 
 
 logger = logging.getLogger(__name__)
@@ -115,12 +120,21 @@ class GodepsPlugin(snapcraft.BasePlugin):
         os.symlink(self.sourcedir, path_in_gopath)
 
         # Fetch and run godeps
+        cache = go.GoCache()
+        cache.prune()
         logger.info('Fetching godeps...')
-        self._run(['go', 'get', 'github.com/rogpeppe/godeps'])
+        self._run(['go', 'get', 'github.com/rogpeppe/godeps'],
+                  gopath=[self._gopath, cache.gopath])
 
+        # godeps updates the repositories to the listed revisions, start
+        # from the cached ones so only new revisions have to be fetched.
         logger.info('Obtaining project dependencies...')
-        self._run(['godeps', '-t', '-u', os.path.join(
-            self.sourcedir, self.options.godeps_file)])
+        godeps_file = os.path.join(self.sourcedir, self.options.godeps_file)
+        cache.link_repositories(
+            self._gopath_src, _read_godeps_repositories(godeps_file))
+        self._run(['godeps', '-t', '-u', godeps_file])
+        cache.add_repositories(self._gopath_src)
+        cache.report()
 
     def clean_pull(self):
         super().clean_pull()
@@ -158,14 +172,15 @@ class GodepsPlugin(snapcraft.BasePlugin):
         if os.path.isdir(self._gopath_pkg):
             shutil.rmtree(self._gopath_pkg)
 
-    def _run(self, cmd, **kwargs):
-        env = self._build_environment()
+    def _run(self, cmd, gopath=None, **kwargs):
+        env = self._build_environment(gopath=gopath)
         return self.run(cmd, cwd=self._gopath_src, env=env, **kwargs)
 
-    def _build_environment(self):
+    def _build_environment(self, gopath=None):
         env = os.environ.copy()
-        env['GOPATH'] = self._gopath
+        env['GOPATH'] = os.pathsep.join(gopath) if gopath else self._gopath
         env['GOBIN'] = self._gopath_bin
+        env['GOCACHE'] = go.GoCache().build_cache_dir
 
         # Add $GOPATH/bin so godeps is actually callable.
         env['PATH'] = '{}:{}'.format(
@@ -181,3 +196,11 @@ class GodepsPlugin(snapcraft.BasePlugin):
             env.get('CGO_LDFLAGS', ''), flags, env.get('LDFLAGS', ''))
 
         return env
+
+
+def _read_godeps_repositories(godeps_file):
+    """Return the repositories listed in a godeps dependencies file."""
+    if not os.path.exists(godeps_file):
+        return []
+    with open(godeps_file) as f:
+        return [line.split()[0] for line in f if line.strip()]
@@ -34,11 +34,32 @@ Additionally, this plugin uses the following plugin-specific keywords:
       (string; default: 'build/libs')
       The output directory where the resulting jar or war files from gradle[w]
       are generated.
+
+    - gradle-offline:
+      (boolean)
+      Build offline once a build with the same gradle files and options
+      fetched all the dependencies.
+
+    - gradle-daemon:
+      (boolean)
+      Keep a gradle daemon running for a while after the build, for the
+      next gradle parts to reuse.
+
+    - gradle-build-cache:
+      (boolean)
+      Reuse task outputs from previous builds of any part through the gradle
+      build cache (requires gradle 3.5 or newer).
+
+Dependencies, gradle distributions downloaded by gradlew and the build cache
+live in a gradle user home in the snapcraft cache, shared by every part.
+The gradle.properties and init scripts of the user's own gradle user home
+($GRADLE_USER_HOME or ~/.gradle) are mirrored into it before each build.
 """
 
 import glob
 import logging
 import os
+import shutil
 import urllib.parse
 import snapcraft
 import snapcraft.common
@@ -47,6 +68,15 @@ import snapcraft.plugins.jdk
 
 logger = logging.getLogger(__name__)
 
+_GRADLE_BUILD_FILES = ['*.gradle', '*.gradle.kts', 'gradle.properties',
+                       'gradle-wrapper.properties']
+# What gradle reads from the user home besides its caches, such as
+# repository credentials, proxy and JVM settings.
+_GRADLE_USER_CONFIG = ['gradle.properties', 'init.gradle', 'init.gradle.kts',
+                       'init.d']
+# In milliseconds
+_DAEMON_IDLE_TIMEOUT = 10 * 60 * 1000
+
 
 class GradlePlugin(snapcraft.plugins.jdk.JdkPlugin):
 
@@ -66,6 +96,12 @@ class GradlePlugin(snapcraft.plugins.jdk.JdkPlugin):
             'type': 'string',
             'default': 'build/libs',
         }
+        for option in ('gradle-offline', 'gradle-daemon',
+                       'gradle-build-cache'):
+            schema['properties'][option] = {
+                'type': 'boolean',
+                'default': False,
+            }
 
         return schema
 
@@ -81,7 +117,10 @@ class GradlePlugin(snapcraft.plugins.jdk.JdkPlugin):
         # Inform Snapcraft of the properties associated with building. If these
         # change in the YAML Snapcraft will consider the build step dirty.
         return super().get_build_properties() + ['gradle-options',
-                                                 'gradle-output-dir']
+                                                 'gradle-output-dir',
+                                                 'gradle-offline',
+                                                 'gradle-daemon',
+                                                 'gradle-build-cache']
 
     def build(self):
         super().build()
@@ -90,9 +129,26 @@ class GradlePlugin(snapcraft.plugins.jdk.JdkPlugin):
             gradle_cmd = ['./gradlew']
         else:
             gradle_cmd = ['gradle']
-        self.run(gradle_cmd +
-                 self._get_proxy_options() +
-                 self.options.gradle_options + ['jar'])
+
+        cache = snapcraft.plugins.jdk.DependencyCache('gradle', 'caches')
+        _mirror_user_config(cache.path)
+        gradle_cmd += ['--gradle-user-home', cache.path]
+        gradle_cmd += self._get_cache_options()
+
+        build_files_hash = None
+        if self.options.gradle_offline:
+            build_files_hash = snapcraft.plugins.jdk.hash_build_files(
+                self.builddir, _GRADLE_BUILD_FILES,
+                self.options.gradle_options)
+            if cache.is_resolved(build_files_hash):
+                gradle_cmd.append('--offline')
+
+        with cache.report():
+            self.run(gradle_cmd +
+                     self._get_proxy_options() +
+                     self.options.gradle_options + ['jar'])
+        if build_files_hash:
+            cache.mark_resolved(build_files_hash)
 
         src = os.path.join(self.builddir, self.options.gradle_output_dir)
         jarfiles = glob.glob(os.path.join(src, '*.jar'))
@@ -111,6 +167,17 @@ class GradlePlugin(snapcraft.plugins.jdk.JdkPlugin):
             copy_function=lambda src, dst:
                 snapcraft.file_utils.link_or_copy(src, dst, self.installdir))
 
+    def _get_cache_options(self):
+        cache_options = []
+        if self.options.gradle_daemon:
+            # Long enough for the following parts, without outliving the
+            # snapcraft run by much.
+            cache_options += ['--daemon', '-Dorg.gradle.daemon.idletimeout={}'
+                              .format(_DAEMON_IDLE_TIMEOUT)]
+        if self.options.gradle_build_cache:
+            cache_options.append('--build-cache')
+        return cache_options
+
     def _get_proxy_options(self):
         # XXX This doesn't yet support username and password.
         # -- elopio - 2016-11-17
@@ -125,3 +192,21 @@ class GradlePlugin(snapcraft.plugins.jdk.JdkPlugin):
                     proxy_options.append(
                         '-D{}.proxyPort={}'.format(var, parsed_url.port))
         return proxy_options
+
+
+def _mirror_user_config(gradle_user_home):
+    """Replace the configuration in gradle_user_home with the user's own."""
+    user_gradle_home = os.environ.get(
+        'GRADLE_USER_HOME', os.path.join(os.path.expanduser('~'), '.gradle'))
+    os.makedirs(gradle_user_home, exist_ok=True)
+    for name in _GRADLE_USER_CONFIG:
+        source = os.path.join(user_gradle_home, name)
+        destination = os.path.join(gradle_user_home, name)
+        if os.path.isdir(destination):
+            shutil.rmtree(destination)
+        elif os.path.exists(destination):
+            os.remove(destination)
+        if os.path.isdir(source):
+            shutil.copytree(source, destination)
+        elif os.path.exists(source):
+            shutil.copy2(source, destination)
@@ -38,7 +38,6 @@ import os
 import shutil
 
 import snapcraft
-from snapcraft import sources
 from snapcraft.plugins import nodejs
 
 logger = logging.getLogger(__name__)
@@ -80,13 +79,13 @@ class GulpPlugin(snapcraft.BasePlugin):
     def __init__(self, name, options, project):
         super().__init__(name, options, project)
         self._npm_dir = os.path.join(self.partdir, 'npm')
-        self._nodejs_tar = sources.Tar(nodejs.get_nodejs_release(
-            self.options.node_engine, self.project.deb_arch), self._npm_dir)
+        self._nodejs_tar = nodejs.get_nodejs_tar(
+            self.options.node_engine, self.project.deb_arch)
 
     def pull(self):
         super().pull()
         os.makedirs(self._npm_dir, exist_ok=True)
-        self._nodejs_tar.download()
+        nodejs.download_nodejs(self._nodejs_tar)
 
     def clean_pull(self):
         super().clean_pull()
@@ -105,6 +104,7 @@ class GulpPlugin(snapcraft.BasePlugin):
         env['PATH'] = '{}:{}'.format(
             os.path.join(self._npm_dir, 'bin'), env['PATH'])
         env['NPM_CONFIG_PREFIX'] = self._npm_dir
+        env['NPM_CONFIG_CACHE'] = nodejs.get_npm_cache_dir()
         self.run(['npm', 'install', '-g', 'gulp-cli'], env=env)
         if os.path.exists(os.path.join(self.builddir, 'package.json')):
             self.run(['npm', 'install', '--only-development'], env=env)
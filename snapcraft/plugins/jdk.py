@@ -14,9 +14,20 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import contextlib
+import glob
+import hashlib
+import logging
+import os
+
+from xdg import BaseDirectory
+
 import snapcraft
 
 
+logger = logging.getLogger(__name__)
+
+
 class JdkPlugin(snapcraft.BasePlugin):
 
     def __init__(self, name, options, project):
@@ -35,3 +46,54 @@ class JdkPlugin(snapcraft.BasePlugin):
                  '-usr/lib/jvm/default-java/lib',
                  '-usr/share/doc',
                  ])
+
+
+class DependencyCache:
+    """A java dependency repository shared by the parts of every project.
+
+    It also remembers the build files whose dependencies were all fetched
+    into it, so builds from those same files can run offline.
+    """
+
+    def __init__(self, name, artifacts_dir):
+        self.path = os.path.join(
+            BaseDirectory.xdg_cache_home, 'snapcraft', name)
+        self.artifacts_dir = os.path.join(self.path, artifacts_dir)
+        self._resolved_dir = os.path.join(self.path, 'snapcraft-resolved')
+
+    def is_resolved(self, build_files_hash):
+        return os.path.exists(
+            os.path.join(self._resolved_dir, build_files_hash))
+
+    def mark_resolved(self, build_files_hash):
+        os.makedirs(self._resolved_dir, exist_ok=True)
+        open(os.path.join(self._resolved_dir, build_files_hash), 'w').close()
+
+    @contextlib.contextmanager
+    def report(self):
+        """Log how many of the artifacts used were already cached."""
+        cached = _count_files(self.artifacts_dir)
+        yield
+        fetched = _count_files(self.artifacts_dir) - cached
+        logger.info('Dependency cache: {} files cached, {} fetched'.format(
+            cached, fetched))
+
+
+def hash_build_files(root, patterns, options):
+    """Return a hash of the build files matching patterns and options."""
+    build_files_hash = hashlib.sha256()
+    for option in options:
+        build_files_hash.update(option.encode() + b'\0')
+    build_files = set()
+    for pattern in patterns:
+        build_files.update(glob.glob(os.path.join(root, '**', pattern),
+                                     recursive=True))
+    for build_file in sorted(build_files):
+        build_files_hash.update(os.path.relpath(build_file, root).encode())
+        with open(build_file, 'rb') as f:
+            build_files_hash.update(f.read())
+    return build_files_hash.hexdigest()
+
+
+def _count_files(path):
+    return sum(len(files) for _, _, files in os.walk(path))
@@ -50,29 +50,40 @@ The following kernel specific options are provided by this plugin:
     - kernel-initrd-compression:
       (string; default: gz)
       initrd compression to use; the only supported value now is 'gz'.
+      pigz is used to compress in parallel when it is available.
 
     - kernel-device-trees:
       (array of string)
       list of device trees to build, the format is <device-tree-name>.dts.
 """
 
+import contextlib
 import glob
+import hashlib
 import logging
 import magic
 import os
 import shutil
 import subprocess
 import tempfile
+import time
+
+from xdg import BaseDirectory
 
 import snapcraft
+from snapcraft import file_utils
+from snapcraft.internal import squashfs
 from snapcraft.plugins import kbuild
 
 logger = logging.getLogger(__name__)
 
 
-_compression_command = {
-    'gz': 'gzip',
+# The first available command is used, so parallel compressors come first.
+_compression_commands = {
+    'gz': ['pigz', 'gzip'],
 }
+# Generic initrds not used for this long are removed from the cache.
+_INITRD_CACHE_MAX_AGE = 30 * 24 * 60 * 60
 
 
 class KernelPlugin(kbuild.KBuildPlugin):
@@ -143,7 +154,12 @@ class KernelPlugin(kbuild.KBuildPlugin):
 
     @property
     def compression_cmd(self):
-        return _compression_command[self.options.kernel_initrd_compression]
+        commands = _compression_commands[
+            self.options.kernel_initrd_compression]
+        for command in commands:
+            if shutil.which(command):
+                return command
+        return commands[-1]
 
     def __init__(self, name, options, project):
         super().__init__(name, options, project)
@@ -152,6 +168,11 @@ class KernelPlugin(kbuild.KBuildPlugin):
 
         self.os_snap = os.path.join(self.sourcedir, 'os.snap')
         self.kernel_release = ''
+        self._os_snap_digest = None
+
+        # Generated initrds are kept here, outside of the build and install
+        # directories, so they can be reused when rebuilding.
+        self._initrd_cache_dir = os.path.join(self.partdir, 'initrd')
 
     def enable_cross_compilation(self):
         logger.info('Cross compiling kernel target {!r}'.format(
@@ -190,28 +211,60 @@ class KernelPlugin(kbuild.KBuildPlugin):
             'INSTALL_FW_PATH={}'.format(
                 os.path.join(self.installdir, 'lib', 'firmware'))]
 
+    def _get_os_snap_digest(self):
+        if not self._os_snap_digest:
+            self._os_snap_digest = _sha256(self.os_snap)
+        return self._os_snap_digest
+
     def _unpack_generic_initrd(self):
-        initrd_path = os.path.join(
-            'usr', 'lib', 'ubuntu-core-generic-initrd', 'initrd.img-core')
         initrd_unpacked_path = os.path.join(self.builddir, 'initrd-staging')
         if os.path.exists(initrd_unpacked_path):
             shutil.rmtree(initrd_unpacked_path)
         os.makedirs(initrd_unpacked_path)
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            subprocess.check_call([
-                'unsquashfs', self.os_snap, os.path.dirname(initrd_path)],
-                cwd=temp_dir)
+        # The generic initrd only changes with the os snap, so it is unpacked
+        # once per os snap and shared between builds.
+        cache_dir = os.path.join(
+            BaseDirectory.xdg_cache_home, 'snapcraft', 'kernel', 'initrd')
+        generic_initrd_path = os.path.join(
+            cache_dir, self._get_os_snap_digest())
+        try:
+            # The mtime records when it was last used, for
+            # _prune_initrd_cache.
+            os.utime(generic_initrd_path)
+            logger.debug('Using cached generic initrd from {!r}'.format(
+                generic_initrd_path))
+        except FileNotFoundError:
+            self._extract_generic_initrd(generic_initrd_path)
+        _prune_initrd_cache(cache_dir)
+
+        file_utils.link_or_copy_tree(generic_initrd_path, initrd_unpacked_path)
+
+        return initrd_unpacked_path
 
+    def _extract_generic_initrd(self, generic_initrd_path):
+        initrd_path = os.path.join(
+            'usr', 'lib', 'ubuntu-core-generic-initrd', 'initrd.img-core')
+        # Unpack next to the final location and move it into place once done
+        # so an interrupted unpack is never used. Other processes may be
+        # unpacking the same initrd, each uses its own partial directory.
+        partial_path = '{}.{}.partial'.format(
+            generic_initrd_path, os.getpid())
+        if os.path.exists(partial_path):
+            shutil.rmtree(partial_path)
+        os.makedirs(partial_path)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
             tmp_initrd_path = os.path.join(
-                temp_dir, 'squashfs-root', initrd_path)
+                temp_dir, os.path.basename(initrd_path))
+            # Only the initrd is needed, read it straight from the os snap.
+            with squashfs.SquashfsImage(self.os_snap) as os_snap:
+                os_snap.extract(initrd_path, tmp_initrd_path)
 
             mime_detector = magic.open(
                 magic.MAGIC_MIME_TYPE | magic.MAGIC_ERROR)
             mime_detector.load()
-            # Make sure we're getting the mime type of the actual initrd, not
-            # a symbolic link.
-            mime_type = mime_detector.file(os.path.realpath(tmp_initrd_path))
+            mime_type = mime_detector.file(tmp_initrd_path)
             if not mime_type:
                 raise RuntimeError(
                     'Unable to determine mime type for {!r}: {}'.format(
@@ -231,38 +284,112 @@ class KernelPlugin(kbuild.KBuildPlugin):
                     'initrd file type is unsupported: {!r}'.format(mime_type))
 
             subprocess.check_call(
-                'cat {0} | {1} -dc | cpio -i'.format(
-                    tmp_initrd_path, decompressor),
-                shell=True, cwd=initrd_unpacked_path)
+                '{0} -dc {1} | cpio -i'.format(
+                    decompressor, os.path.abspath(tmp_initrd_path)),
+                shell=True, cwd=partial_path)
+
+        try:
+            os.rename(partial_path, generic_initrd_path)
+        except OSError:
+            # Another process unpacked the same initrd in the meantime.
+            if not os.path.isdir(generic_initrd_path):
+                raise
+            shutil.rmtree(partial_path)
+
+    def _get_initrd_modules(self):
+        """Return the paths to the initrd modules and their dependencies.
+
+        Modules are looked up in modules.dep, which already lists every
+        dependency of a module. modprobe is only asked about the modules
+        missing from it, such as aliases.
+        """
+        if not self.options.kernel_initrd_modules:
+            return set()
+
+        modules_path = os.path.join(
+            self.installdir, 'lib', 'modules', self.kernel_release)
+        dependencies = _read_modules_dep(
+            os.path.join(modules_path, 'modules.dep'))
+
+        modules = set()
+        unresolved = []
+        for module in self.options.kernel_initrd_modules:
+            module_files = dependencies.get(_get_module_name(module))
+            if module_files is None:
+                unresolved.append(module)
+            else:
+                modules.update(
+                    os.path.join(modules_path, f) for f in module_files)
 
-        return initrd_unpacked_path
+        if unresolved:
+            modprobe_out = self.run_output([
+                'modprobe', '-n', '--show-depends', '-a', '-d',
+                self.installdir, '-S', self.kernel_release] + unresolved)
+            for line in modprobe_out.splitlines():
+                fields = line.split()
+                # Builtin modules need nothing copied.
+                if len(fields) > 1 and fields[0] == 'insmod':
+                    modules.add(fields[1])
+
+        return modules
+
+    def _get_initrd_key(self, modules):
+        """Return a digest of everything the initrd is generated from."""
+        key = hashlib.sha256()
+        key.update(self.kernel_release.encode())
+        key.update(self._get_os_snap_digest().encode())
+        key.update(self.options.kernel_initrd_compression.encode())
+
+        files = set(modules)
+        for firmware in self.options.kernel_initrd_firmware:
+            src = os.path.join(self.installdir, firmware)
+            if os.path.isdir(src):
+                for root, directories, file_names in os.walk(src):
+                    files.update(os.path.join(root, f) for f in file_names)
+            else:
+                files.add(src)
+
+        for path in sorted(files):
+            key.update(os.path.relpath(path, self.installdir).encode())
+            key.update(_sha256(path).encode())
+
+        return key.hexdigest()
 
     def _make_initrd(self):
         logger.info('Generating driver initrd for kernel release: {}'.format(
             self.kernel_release))
 
-        initrd_unpacked_path = self._unpack_generic_initrd()
+        modules = self._get_initrd_modules()
 
-        modprobe_outs = []
-        for module in self.options.kernel_initrd_modules:
-            modprobe_out = self.run_output([
-                'modprobe', '-n', '--show-depends', '-d', self.installdir,
-                '-S', self.kernel_release, module])
-            modprobe_outs.extend(modprobe_out.split(os.linesep))
+        initrd = 'initrd-{}.img'.format(self.kernel_release)
+        initrd_path = os.path.join(self.installdir, initrd)
+        unversioned_initrd_path = os.path.join(self.installdir, 'initrd.img')
+        cached_initrd_path = os.path.join(self._initrd_cache_dir, initrd)
+        key_path = os.path.join(self._initrd_cache_dir, 'key')
+
+        key = self._get_initrd_key(modules)
+        if os.path.exists(cached_initrd_path) and _read_file(key_path) == key:
+            logger.info('Reusing driver initrd, its modules, firmware and '
+                        'generic initrd are unchanged')
+            file_utils.link_or_copy(cached_initrd_path, initrd_path)
+            os.link(initrd_path, unversioned_initrd_path)
+            return
+
+        initrd_unpacked_path = self._unpack_generic_initrd()
 
         modules_path = os.path.join('lib', 'modules', self.kernel_release)
-        for src in set(modprobe_outs):
-            src = src.split()[-1:][0]
+        for src in modules:
             dst = os.path.join(initrd_unpacked_path,
                                os.path.relpath(src, self.installdir))
             os.makedirs(os.path.dirname(dst), exist_ok=True)
             os.link(src, dst)
 
-        if modprobe_outs:
+        if modules:
             for module_info in ['modules.dep', 'modules.dep.bin']:
                 module_info_path = os.path.join(modules_path, module_info)
                 src = os.path.join(self.installdir, module_info_path)
                 dst = os.path.join(initrd_unpacked_path, module_info_path)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
                 os.link(src, dst)
 
         # TODO pickup required firmware from modules.
@@ -275,15 +402,19 @@ class KernelPlugin(kbuild.KBuildPlugin):
             else:
                 os.link(src, dst)
 
-        initrd = 'initrd-{}.img'.format(self.kernel_release)
-        initrd_path = os.path.join(self.installdir, initrd)
         subprocess.check_call(
             'find . | cpio --create --format=newc | '
             '{} > {}'.format(self.compression_cmd, initrd_path), shell=True,
             cwd=initrd_unpacked_path)
-        unversioned_initrd_path = os.path.join(self.installdir, 'initrd.img')
         os.link(initrd_path, unversioned_initrd_path)
 
+        if os.path.exists(self._initrd_cache_dir):
+            shutil.rmtree(self._initrd_cache_dir)
+        os.makedirs(self._initrd_cache_dir)
+        file_utils.link_or_copy(initrd_path, cached_initrd_path)
+        with open(key_path, 'w') as f:
+            f.write(key)
+
     def _parse_kernel_release(self):
         kernel_release_path = os.path.join(
             self.builddir, 'include', 'config', 'kernel.release')
@@ -351,3 +482,55 @@ class KernelPlugin(kbuild.KBuildPlugin):
         self._copy_vmlinuz()
         self._copy_system_map()
         self._copy_dtbs()
+
+
+def _read_modules_dep(modules_dep_path):
+    """Return a mapping of module names to the files they need loaded."""
+    dependencies = {}
+    if not os.path.exists(modules_dep_path):
+        return dependencies
+
+    with open(modules_dep_path) as f:
+        for line in f:
+            module, separator, module_dependencies = line.partition(':')
+            if separator:
+                dependencies[_get_module_name(module)] = (
+                    [module.strip()] + module_dependencies.split())
+    return dependencies
+
+
+def _get_module_name(module):
+    # modprobe considers dashes and underscores equivalent in module names,
+    # and module files may be compressed (e.g. foo.ko.xz).
+    return os.path.basename(module.strip()).split('.')[0].replace('-', '_')
+
+
+def _read_file(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read()
+
+
+def _sha256(path):
+    file_sum = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(1024 * 1024), b''):
+            file_sum.update(data)
+    return file_sum.hexdigest()
+
+
+def _prune_initrd_cache(cache_dir):
+    """Remove the generic initrds last used more than max age ago.
+
+    They are shared by every project and architecture. Partial unpacks
+    belong to the processes making them, and are left alone.
+    """
+    expiry = time.time() - _INITRD_CACHE_MAX_AGE
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith('.partial'):
+            continue
+        with contextlib.suppress(FileNotFoundError):
+            if os.stat(path).st_mtime < expiry:
+                shutil.rmtree(path)
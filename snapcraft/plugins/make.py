@@ -106,15 +106,7 @@ class MakePlugin(snapcraft.BasePlugin):
 
         self.run(command + ['-j{}'.format(self.parallel_build_count)], env=env)
         if self.options.artifacts:
-            for artifact in self.options.artifacts:
-                source_path = os.path.join(self.builddir, artifact)
-                destination_path = os.path.join(self.installdir, artifact)
-                if os.path.isdir(source_path):
-                    snapcraft.file_utils.link_or_copy_tree(
-                        source_path, destination_path)
-                else:
-                    snapcraft.file_utils.link_or_copy(
-                        source_path, destination_path)
+            self.install_artifacts(self.builddir)
         else:
             command.append('install')
             if self.options.make_install_var:
@@ -123,6 +115,18 @@ class MakePlugin(snapcraft.BasePlugin):
 
             self.run(command, env=env)
 
+    def install_artifacts(self, builddir):
+        """Link/copy the artifacts built in builddir into the installdir."""
+        for artifact in self.options.artifacts:
+            source_path = os.path.join(builddir, artifact)
+            destination_path = os.path.join(self.installdir, artifact)
+            if os.path.isdir(source_path):
+                snapcraft.file_utils.link_or_copy_tree(
+                    source_path, destination_path)
+            else:
+                snapcraft.file_utils.link_or_copy(
+                    source_path, destination_path)
+
     def build(self):
         super().build()
         self.make()
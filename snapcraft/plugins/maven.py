@@ -28,6 +28,13 @@ Additionally, this plugin uses the following plugin-specific keywords:
     - maven-options:
       (list of strings)
       flags to pass to the build using the maven semantics for parameters.
+    - maven-offline:
+      (boolean)
+      Build offline once a build with the same pom.xml files and options
+      fetched all the dependencies.
+
+Dependencies are kept in a local repository in the snapcraft cache, shared
+by every part.
 """
 
 import glob
@@ -69,6 +76,11 @@ class MavenPlugin(snapcraft.plugins.jdk.JdkPlugin):
             'default': [''],
         }
 
+        schema['properties']['maven-offline'] = {
+            'type': 'boolean',
+            'default': False,
+        }
+
         return schema
 
     def __init__(self, name, options, project):
@@ -82,18 +94,31 @@ class MavenPlugin(snapcraft.plugins.jdk.JdkPlugin):
     def get_build_properties(cls):
         # Inform Snapcraft of the properties associated with building. If these
         # change in the YAML Snapcraft will consider the build step dirty.
-        return ['maven-options', 'maven-targets']
+        return ['maven-options', 'maven-targets', 'maven-offline']
 
     def build(self):
         super().build()
 
-        mvn_cmd = ['mvn', 'package']
+        cache = snapcraft.plugins.jdk.DependencyCache('maven', 'repository')
+        mvn_cmd = ['mvn', 'package',
+                   '-Dmaven.repo.local={}'.format(cache.artifacts_dir)]
+
+        build_files_hash = None
+        if self.options.maven_offline:
+            build_files_hash = snapcraft.plugins.jdk.hash_build_files(
+                self.builddir, ['pom.xml'], self.options.maven_options)
+            if cache.is_resolved(build_files_hash):
+                mvn_cmd.append('--offline')
+
         if self._use_proxy():
             settings_path = os.path.join(self.partdir, 'm2', 'settings.xml')
             _create_settings(settings_path)
             mvn_cmd += ['-s', settings_path]
 
-        self.run(mvn_cmd + self.options.maven_options)
+        with cache.report():
+            self.run(mvn_cmd + self.options.maven_options)
+        if build_files_hash:
+            cache.mark_resolved(build_files_hash)
 
         for f in self.options.maven_targets:
             src = os.path.join(self.builddir, f, 'target')
@@ -35,12 +35,20 @@ Additionally, this plugin uses the following plugin-specific keywords:
       (list)
       A list of targets to `npm run`.
       These targets will be run in order, after `npm install`
+
+Node releases and npm packages are downloaded once into the snapcraft cache
+and shared by every part. The build step reuses the `node_modules` installed
+during pull as long as `package.json` and its lockfile are unchanged, and
+uses `npm ci` instead of `npm install` when there is a lockfile.
 """
 
+import hashlib
 import logging
 import os
 import shutil
 
+from xdg import BaseDirectory
+
 import snapcraft
 from snapcraft import sources
 
@@ -55,6 +63,8 @@ _NODEJS_ARCHES = {
     'armhf': 'armv7l',
     'arm64': 'arm64',
 }
+_NPM_LOCKFILES = ('npm-shrinkwrap.json', 'package-lock.json')
+_NPM_INSTALL_STAMP = '.snapcraft-npm-install'
 
 
 class NodePlugin(snapcraft.BasePlugin):
@@ -106,13 +116,13 @@ class NodePlugin(snapcraft.BasePlugin):
     def __init__(self, name, options, project):
         super().__init__(name, options, project)
         self._npm_dir = os.path.join(self.partdir, 'npm')
-        self._nodejs_tar = sources.Tar(get_nodejs_release(
-            self.options.node_engine, self.project.deb_arch), self._npm_dir)
+        self._nodejs_tar = get_nodejs_tar(
+            self.options.node_engine, self.project.deb_arch)
 
     def pull(self):
         super().pull()
         os.makedirs(self._npm_dir, exist_ok=True)
-        self._nodejs_tar.download()
+        download_nodejs(self._nodejs_tar)
         # do the install in the pull phase to download all dependencies.
         self._npm_install(rootdir=self.sourcedir)
 
@@ -130,12 +140,24 @@ class NodePlugin(snapcraft.BasePlugin):
     def _npm_install(self, rootdir):
         self._nodejs_tar.provision(
             self.installdir, clean_target=False, keep_tarball=True)
-        npm_install = ['npm', '--cache-min=Infinity', 'install']
-        for pkg in self.options.node_packages:
-            self.run(npm_install + ['--global'] + [pkg], cwd=rootdir)
+        npm = ['npm', '--cache={}'.format(get_npm_cache_dir())]
+        global_packages = list(self.options.node_packages)
         if os.path.exists(os.path.join(rootdir, 'package.json')):
-            self.run(npm_install, cwd=rootdir)
-            self.run(npm_install + ['--global'], cwd=rootdir)
+            # node_modules is carried over from the pull step with the
+            # sources, only install again if the dependencies changed.
+            stamp = os.path.join(rootdir, 'node_modules', _NPM_INSTALL_STAMP)
+            dependencies_hash = _get_dependencies_hash(rootdir)
+            if _read_stamp(stamp) != dependencies_hash:
+                self.run(npm + [_get_npm_install_command(rootdir)],
+                         cwd=rootdir)
+                os.makedirs(os.path.dirname(stamp), exist_ok=True)
+                with open(stamp, 'w') as f:
+                    f.write(dependencies_hash)
+            global_packages.insert(0, '.')
+        # A single global install for the part and its node-packages.
+        if global_packages:
+            self.run(npm + ['install', '--global'] + global_packages,
+                     cwd=rootdir)
         for target in self.options.npm_run:
             self.run(['npm', 'run', target], cwd=rootdir)
 
@@ -151,3 +173,56 @@ def _get_nodejs_base(node_engine, machine):
 def get_nodejs_release(node_engine, arch):
     return _NODEJS_TMPL.format(version=node_engine,
                                base=_get_nodejs_base(node_engine, arch))
+
+
+def get_nodejs_tar(node_engine, arch):
+    """Return the nodejs release source, kept in the shared cache."""
+    return sources.Tar(get_nodejs_release(node_engine, arch),
+                       os.path.join(BaseDirectory.xdg_cache_home,
+                                    'snapcraft', 'nodejs'))
+
+
+def download_nodejs(nodejs_tar):
+    """Download the nodejs release unless a previous part already did."""
+    tarball = os.path.join(
+        nodejs_tar.source_dir, os.path.basename(nodejs_tar.source))
+    if os.path.exists(tarball):
+        return
+    os.makedirs(nodejs_tar.source_dir, exist_ok=True)
+    # Only move the tarball into place once it is complete, an interrupted
+    # download must never be picked up as cached.
+    partial_tarball = tarball + '.partial'
+    nodejs_tar.download(filepath=partial_tarball)
+    os.rename(partial_tarball, tarball)
+
+
+def get_npm_cache_dir():
+    return os.path.join(BaseDirectory.xdg_cache_home, 'snapcraft', 'npm')
+
+
+def _get_dependencies_hash(rootdir):
+    dependencies_hash = hashlib.sha256()
+    for file_name in ('package.json',) + _NPM_LOCKFILES:
+        file_path = os.path.join(rootdir, file_name)
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                dependencies_hash.update(file_name.encode())
+                dependencies_hash.update(f.read())
+    return dependencies_hash.hexdigest()
+
+
+def _get_npm_install_command(rootdir):
+    # npm ci installs exactly what the lockfile pins without resolving the
+    # dependency tree again.
+    for file_name in _NPM_LOCKFILES:
+        if os.path.exists(os.path.join(rootdir, file_name)):
+            return 'ci'
+    return 'install'
+
+
+def _read_stamp(stamp):
+    try:
+        with open(stamp) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
@@ -43,8 +43,23 @@ Additionally, this plugin uses the following plugin-specific keywords:
     - python-version:
       (string; default: python3)
       The python version to use. Valid options are: python2 and python3
+    - compile-bytecode:
+      (bool; default: true)
+      Compile all the python modules in the part with the part's python.
+      Snaps are read-only so modules without bytecode would be compiled
+      again every time they are imported.
+    - bytecode-optimization:
+      (int; default: 0)
+      The optimization level to compile for, this needs to match how the
+      apps run python: 0 for no flags, 1 for -O and 2 for -OO.
+
+Wheels built from the downloaded sdists are kept in the snapcraft cache and
+shared by the parts of every project, so the same sdist is only built once
+per python ABI and architecture.
 """
 
+import contextlib
+import hashlib
 import os
 import re
 import shutil
@@ -56,11 +71,36 @@ from glob import glob
 from shutil import which
 from textwrap import dedent
 
+from xdg import BaseDirectory
+
 import snapcraft
 from snapcraft import file_utils
 from snapcraft.common import isurl
 
 
+# Run by the part's python so the bytecode matches the interpreter that
+# will load it. Python >= 3.7 can write unchecked hash based pycs which do
+# not depend on the source mtimes, snaps are immutable so there is no need
+# to check them. Paths are kept relative to the install dir so the
+# resulting files do not depend on where the part was built.
+_COMPILE_BYTECODE_SCRIPT = dedent('''\
+    import compileall
+    import sys
+
+    kwargs = {}
+    try:
+        from py_compile import PycInvalidationMode
+        kwargs['invalidation_mode'] = PycInvalidationMode.UNCHECKED_HASH
+    except ImportError:
+        pass
+    if sys.version_info >= (3, 5):
+        kwargs['workers'] = int(sys.argv[1])
+    # Modules that fail to compile, e.g. python 2 only test files, are
+    # reported but are not fatal.
+    compileall.compile_dir('.', maxlevels=sys.maxsize, quiet=1, **kwargs)
+''')
+
+
 class PythonPlugin(snapcraft.BasePlugin):
 
     @classmethod
@@ -90,6 +130,15 @@ class PythonPlugin(snapcraft.BasePlugin):
             'default': 'python3',
             'enum': ['python2', 'python3']
         }
+        schema['properties']['compile-bytecode'] = {
+            'type': 'boolean',
+            'default': True,
+        }
+        schema['properties']['bytecode-optimization'] = {
+            'type': 'integer',
+            'default': 0,
+            'enum': [0, 1, 2],
+        }
         schema.pop('required')
 
         return schema
@@ -105,6 +154,12 @@ class PythonPlugin(snapcraft.BasePlugin):
             'python-version',
         ]
 
+    @classmethod
+    def get_build_properties(cls):
+        # Inform Snapcraft of the properties associated with building. If these
+        # change in the YAML Snapcraft will consider the build step dirty.
+        return ['compile-bytecode', 'bytecode-optimization']
+
     @property
     def plugin_build_packages(self):
         if self.options.python_version == 'python3':
@@ -141,6 +196,9 @@ class PythonPlugin(snapcraft.BasePlugin):
         self.build_packages.extend(self.plugin_build_packages)
         self.stage_packages.extend(self.plugin_stage_packages)
         self._python_package_dir = os.path.join(self.partdir, 'packages')
+        self._wheel_cache_dir = os.path.join(
+            BaseDirectory.xdg_cache_home, 'snapcraft', 'python-wheels',
+            self.project.deb_arch)
 
     def env(self, root):
         return [
@@ -228,23 +286,25 @@ class PythonPlugin(snapcraft.BasePlugin):
         pip = _Pip(exec_func=self.run, runnable='pip',
                    package_dir=self._python_package_dir, env=env,
                    constraints=constraints,
-                   dependency_links=self.options.process_dependency_links)
+                   dependency_links=self.options.process_dependency_links,
+                   wheel_cache=_WheelCache(self._wheel_cache_dir))
 
         commands = self._get_commands(setup)
 
         if download:
             for command in commands:
                 pip.download(**command)
-        else:
+        elif commands:
+            wheels = []
             for command in commands:
-                wheels = pip.wheel(**command)
-                installed = pip.list(self.run_output)
-                wheel_names = [os.path.basename(w).split('-')[0]
-                               for w in wheels]
-                # we want to avoid installing what is already provided in
-                # stage-packages
-                need_install = [k for k in wheel_names if k not in installed]
-                pip.install(need_install + ['--no-deps', '--upgrade'])
+                wheels.extend(pip.wheel(**command))
+            installed = pip.list(self.run_output)
+            wheel_names = [os.path.basename(w).split('-')[0]
+                           for w in wheels]
+            # we want to avoid installing what is already provided in
+            # stage-packages
+            need_install = [k for k in wheel_names if k not in installed]
+            pip.install(need_install + ['--no-deps', '--upgrade'])
 
     def _fix_permissions(self):
         for root, dirs, files in os.walk(self.installdir):
@@ -267,15 +327,29 @@ class PythonPlugin(snapcraft.BasePlugin):
                                    re.compile(r'^#!.*python'),
                                    r'#!/usr/bin/env python')
 
+        # This needs to happen last, after all the sources are in their
+        # final form.
+        if self.options.compile_bytecode:
+            self._compile_bytecode()
+
+    def _compile_bytecode(self):
+        cmd = [self.options.python_version]
+        if self.options.bytecode_optimization:
+            cmd.append('-' + 'O' * self.options.bytecode_optimization)
+        cmd.extend(['-c', _COMPILE_BYTECODE_SCRIPT,
+                    str(self.parallel_build_count)])
+        self.run(cmd, cwd=self.installdir)
+
     def snap_fileset(self):
         fileset = super().snap_fileset()
         fileset.append('-bin/pip*')
         fileset.append('-bin/easy_install*')
         fileset.append('-bin/wheel')
-        # Holds all the .pyc files. It is a major cause of inter part
-        # conflict.
-        fileset.append('-**/__pycache__')
-        fileset.append('-**/*.pyc')
+        if not self.options.compile_bytecode:
+            # Holds all the .pyc files. It is a major cause of inter part
+            # conflict.
+            fileset.append('-**/__pycache__')
+            fileset.append('-**/*.pyc')
         return fileset
 
 
@@ -283,11 +357,12 @@ class _Pip:
 
     def __init__(self, *, exec_func, runnable, package_dir, env,
                  constraints=None, dependency_links=None,
-                 extra_install_args=None):
+                 extra_install_args=None, wheel_cache=None):
         self._exec_func = exec_func
         self._runnable = runnable
         self._package_dir = package_dir
         self._env = env
+        self._wheel_cache = wheel_cache
 
         self._extra_install_args = extra_install_args or []
 
@@ -320,12 +395,21 @@ class _Pip:
             '--disable-pip-version-check', '--no-index',
             '--find-links', self._package_dir,
         ]
-        cmd.extend(self._extra_pip_args)
 
         os.makedirs(self._package_dir, exist_ok=True)
 
         wheels = []
-        with tempfile.TemporaryDirectory() as temp_dir:
+        with contextlib.ExitStack() as stack:
+            if self._wheel_cache:
+                # pip takes the wheels found here over building the sdists.
+                cached_wheels_dir = stack.enter_context(
+                    tempfile.TemporaryDirectory())
+                self._wheel_cache.link_wheels(
+                    self._package_dir, cached_wheels_dir)
+                cmd.extend(['--find-links', cached_wheels_dir])
+            cmd.extend(self._extra_pip_args)
+
+            temp_dir = stack.enter_context(tempfile.TemporaryDirectory())
             cmd.extend(['--wheel-dir', temp_dir])
             cmd.extend(args)
             self._exec_func(cmd, env=self._env, **kwargs)
@@ -335,7 +419,10 @@ class _Pip:
                     os.path.join(temp_dir, wheel),
                     os.path.join(self._package_dir, wheel))
 
-        return [os.path.join(self._package_dir, wheel) for wheel in wheels]
+        wheels = [os.path.join(self._package_dir, wheel) for wheel in wheels]
+        if self._wheel_cache:
+            self._wheel_cache.add_wheels(self._package_dir, wheels)
+        return wheels
 
     def download(self, args, **kwargs):
         cmd = [
@@ -362,6 +449,84 @@ class _Pip:
         self._exec_func(cmd, env=self._env, **kwargs)
 
 
+class _WheelCache:
+    """Wheels built from sdists, shared by the parts of every project.
+
+    Wheels are kept under the sha256 of the sdist they were built from, and
+    their file names hold the package version, python ABI and platform, so
+    pip only picks the ones matching the part's interpreter.
+    """
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+
+    def link_wheels(self, package_dir, destination):
+        """Link the wheels of the sdists in package_dir into destination."""
+        for sdist in _find_sdists(package_dir).values():
+            wheel_dir = os.path.join(self._cache_dir, _sha256(sdist))
+            if not os.path.isdir(wheel_dir):
+                continue
+            for wheel in os.listdir(wheel_dir):
+                file_utils.link_or_copy(os.path.join(wheel_dir, wheel),
+                                        os.path.join(destination, wheel))
+
+    def add_wheels(self, package_dir, wheels):
+        """Cache the wheels built from the sdists in package_dir."""
+        sdists = _find_sdists(package_dir)
+        for wheel in wheels:
+            # The part's own project and wheels from the index have no sdist.
+            sdist = sdists.get(_get_distribution(os.path.basename(wheel)))
+            if not sdist:
+                continue
+            wheel_dir = os.path.join(self._cache_dir, _sha256(sdist))
+            cached_wheel = os.path.join(wheel_dir, os.path.basename(wheel))
+            if not os.path.exists(cached_wheel):
+                os.makedirs(wheel_dir, exist_ok=True)
+                file_utils.link_or_copy(wheel, cached_wheel)
+
+
+_SDIST_EXTENSIONS = ('.tar.gz', '.tar.bz2', '.tgz', '.zip')
+
+
+def _get_distribution(file_name):
+    """Return the normalized name and version of a wheel or sdist, or None."""
+    if file_name.endswith('.whl'):
+        # name-version[-build]-python-abi-platform.whl
+        fields = file_name[:-len('.whl')].split('-')
+        if len(fields) < 5:
+            return None
+        name, version = fields[:2]
+    else:
+        for extension in _SDIST_EXTENSIONS:
+            if file_name.endswith(extension):
+                name, _, version = file_name[:-len(extension)].rpartition('-')
+                break
+        else:
+            return None
+        if not name:
+            return None
+    return re.sub(r'[-_.]+', '-', name).lower(), version
+
+
+def _find_sdists(package_dir):
+    sdists = {}
+    for file_name in os.listdir(package_dir):
+        if file_name.endswith('.whl'):
+            continue
+        distribution = _get_distribution(file_name)
+        if distribution:
+            sdists[distribution] = os.path.join(package_dir, file_name)
+    return sdists
+
+
+def _sha256(path):
+    file_sum = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(1024 * 1024), b''):
+            file_sum.update(data)
+    return file_sum.hexdigest()
+
+
 def _replicate_owner_mode(path):
     if not os.path.exists(path):
         return
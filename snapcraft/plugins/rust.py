@@ -31,15 +31,27 @@ Additionally, this plugin uses the following plugin-specific keywords:
     - rust-features
       (list of strings)
       Features used to build optional dependencies
+    - rust-incremental
+      (boolean)
+      Keep cargo's target directory between builds of the part so that
+      rebuilds only compile what changed.
+
+Toolchains are installed once per channel or revision into the snapcraft
+cache and shared by every part, as are the crates fetched by cargo. Remove
+`$XDG_CACHE_HOME/snapcraft/rust` to pick up a newer release of a channel.
 """
 
 import os
+import platform
 import shutil
 
+from xdg import BaseDirectory
+
 import snapcraft
 from snapcraft import sources
 
 _RUSTUP = 'https://static.rust-lang.org/rustup.sh'
+_TOOLCHAIN_INSTALLED_STAMP = '.snapcraft-installed'
 
 
 class RustPlugin(snapcraft.BasePlugin):
@@ -61,6 +73,10 @@ class RustPlugin(snapcraft.BasePlugin):
             },
             'default': []
         }
+        schema['properties']['rust-incremental'] = {
+            'type': 'boolean',
+            'default': False,
+        }
 
         return schema
 
@@ -70,7 +86,7 @@ class RustPlugin(snapcraft.BasePlugin):
 
     @classmethod
     def get_build_properties(cls):
-        return ['rust-features']
+        return ['rust-features', 'rust-incremental']
 
     def __init__(self, name, options, project):
         super().__init__(name, options, project)
@@ -87,8 +103,9 @@ class RustPlugin(snapcraft.BasePlugin):
         self._rustdoc = os.path.join(self._rustpath, "bin", "rustdoc")
         self._cargo = os.path.join(self._rustpath, "bin", "cargo")
         self._rustlib = os.path.join(self._rustpath, "lib")
-        self._rustup_get = sources.Script(_RUSTUP, self._rustpath)
-        self._rustup = os.path.join(self._rustpath, "rustup.sh")
+        self._cargo_home = os.path.join(
+            BaseDirectory.xdg_cache_home, 'snapcraft', 'cargo')
+        self._cargo_target_dir = os.path.join(self.partdir, 'cargo-target')
 
     def build(self):
         super().build()
@@ -105,7 +122,10 @@ class RustPlugin(snapcraft.BasePlugin):
         env = os.environ.copy()
         env.update({"RUSTC": self._rustc,
                     "RUSTDOC": self._rustdoc,
-                    "RUST_PATH": self._rustlib})
+                    "RUST_PATH": self._rustlib,
+                    "CARGO_HOME": self._cargo_home})
+        if self.options.rust_incremental:
+            env['CARGO_TARGET_DIR'] = self._cargo_target_dir
         return env
 
     def pull(self):
@@ -116,9 +136,10 @@ class RustPlugin(snapcraft.BasePlugin):
     def clean_pull(self):
         super().clean_pull()
 
-        # Remove the rust path (if any)
-        if os.path.exists(self._rustpath):
-            shutil.rmtree(self._rustpath)
+        self._remove_rustpath()
+
+        if os.path.exists(self._cargo_target_dir):
+            shutil.rmtree(self._cargo_target_dir)
 
     def _fetch_rust(self):
         options = []
@@ -134,14 +155,43 @@ class RustPlugin(snapcraft.BasePlugin):
                 raise EnvironmentError(
                     '{} is not a valid rust channel'.format(
                         self.options.rust_channel))
-        if not os.path.exists(self._rustpath):
-            os.makedirs(self._rustpath)
-        self._rustup_get.download()
-        self.run([self._rustup,
-                  '--prefix={}'.format(self._rustpath),
-                  '--disable-sudo', '--save'] + options)
+
+        toolchain_dir = self._get_toolchain_dir()
+        installed_stamp = os.path.join(
+            toolchain_dir, _TOOLCHAIN_INSTALLED_STAMP)
+        if not os.path.exists(installed_stamp):
+            # Start over from anything an interrupted install left behind.
+            if os.path.exists(toolchain_dir):
+                shutil.rmtree(toolchain_dir)
+            os.makedirs(toolchain_dir)
+            sources.Script(_RUSTUP, toolchain_dir).download()
+            self.run([os.path.join(toolchain_dir, 'rustup.sh'),
+                      '--prefix={}'.format(toolchain_dir),
+                      '--disable-sudo', '--save'] + options)
+            open(installed_stamp, 'w').close()
+
+        self._remove_rustpath()
+        os.makedirs(self.partdir, exist_ok=True)
+        os.symlink(toolchain_dir, self._rustpath)
+
+    def _remove_rustpath(self):
+        # Older parts have the toolchain installed right in the part.
+        if os.path.islink(self._rustpath):
+            os.remove(self._rustpath)
+        elif os.path.exists(self._rustpath):
+            shutil.rmtree(self._rustpath)
+
+    def _get_toolchain_dir(self):
+        if self.options.rust_revision:
+            toolchain = 'revision-{}'.format(self.options.rust_revision)
+        else:
+            toolchain = 'channel-{}'.format(
+                self.options.rust_channel or 'stable')
+        return os.path.join(BaseDirectory.xdg_cache_home, 'snapcraft',
+                            'rust', platform.machine(), toolchain)
 
     def _fetch_deps(self):
         self.run([self._cargo, 'fetch',
                   '--manifest-path',
-                  os.path.join(self.sourcedir, 'Cargo.toml')])
+                  os.path.join(self.sourcedir, 'Cargo.toml')],
+                 env=self._build_env())
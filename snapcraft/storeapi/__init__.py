@@ -16,6 +16,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import contextlib
+import datetime
+import email.utils
 import hashlib
 import itertools
 import json
@@ -24,7 +26,7 @@ import os
 import urllib.parse
 from time import sleep
 from threading import Thread
-from queue import Queue
+from queue import Empty, Queue
 
 from progressbar import (
     AnimatedMarker,
@@ -39,10 +41,12 @@ import snapcraft
 from snapcraft import config
 from snapcraft.internal.indicators import download_requests_stream
 from snapcraft.storeapi import (
+    _transport,
     _upload,
     constants,
     errors,
 )
+from snapcraft.storeapi._transport import Transport  # noqa
 
 
 logger = logging.getLogger(__name__)
@@ -82,15 +86,17 @@ def _deserialize_macaroon(value):
 class Client():
     """A base class to define clients for the ols servers.
 
-    This is a simple wrapper around requests.Session so we inherit all good
+    This is a simple wrapper around a shared Transport so we inherit all good
     bits while providing a simple point for tests to override when needed.
 
     """
 
-    def __init__(self, conf, root_url):
+    def __init__(self, conf, root_url, transport=None):
         self.conf = conf
         self.root_url = root_url
-        self.session = requests.Session()
+        if transport is None:
+            transport = _transport.get_default_transport()
+        self.transport = transport
         self._snapcraft_headers = {
             'X-SNAPCRAFT-VERSION': snapcraft.__version__
         }
@@ -106,7 +112,7 @@ class Client():
             headers = self._snapcraft_headers
 
         final_url = urllib.parse.urljoin(self.root_url, url)
-        response = self.session.request(
+        response = self.transport.request(
             method, final_url, headers=headers,
             params=params, **kwargs)
         return response
@@ -122,15 +128,22 @@ class Client():
 
 
 class StoreClient():
-    """High-level client for the V2.0 API SCA resources."""
+    """High-level client for the V2.0 API SCA resources.
 
-    def __init__(self):
+    All the clients share one Transport, by default the process wide one, so
+    connections are pooled and kept alive across the different servers.
+    """
+
+    def __init__(self, transport=None):
         super().__init__()
         self.conf = config.Config()
-        self.sso = SSOClient(self.conf)
-        self.cpi = SnapIndexClient(self.conf)
-        self.updown = UpDownClient(self.conf)
-        self.sca = SCAClient(self.conf)
+        if transport is None:
+            transport = _transport.get_default_transport()
+        self.transport = transport
+        self.sso = SSOClient(self.conf, transport)
+        self.cpi = SnapIndexClient(self.conf, transport)
+        self.updown = UpDownClient(self.conf, transport)
+        self.sca = SCAClient(self.conf, transport)
 
     def login(self, email, password, one_time_password=None, acls=None,
               packages=None, channels=None, save=True):
@@ -193,14 +206,26 @@ class StoreClient():
         return self._refresh_if_necessary(
             self.sca.push_snap_build, snap_id, snap_build)
 
-    def upload(self, snap_name, snap_filename):
+    def upload(self, snap_name, snap_filename, show_progress=True,
+               delta_format=None, source_hash=None, target_hash=None,
+               delta_hash=None):
+        """Upload snap_filename and push it as a new revision of snap_name.
+
+        When delta_format is set, snap_filename is a delta from the snap
+        with source_hash to the one with target_hash, both sha512 digests.
+        """
         # FIXME This should be raised by the function that uses the
         # discharge. --elopio -2016-06-20
         if self.conf.get('unbound_discharge') is None:
             raise errors.InvalidCredentialsError(
                 'Unbound discharge not in the config file')
 
-        updown_data = _upload.upload_files(snap_filename, self.updown)
+        updown_data = _upload.upload_files(
+            snap_filename, self.updown, show_progress=show_progress)
+        if delta_format:
+            updown_data.update(
+                delta_format=delta_format, source_hash=source_hash,
+                target_hash=target_hash, delta_hash=delta_hash)
 
         return self._refresh_if_necessary(
             self.sca.snap_push_metadata, snap_name, updown_data)
@@ -265,26 +290,50 @@ class StoreClient():
                 name, download_path))
             return
         logger.info('Downloading {}'.format(name, download_path))
-        request = self.cpi.get(download_url, stream=True)
-        request.raise_for_status()
-        download_requests_stream(request, download_path)
 
-        if self._is_downloaded(download_path, expected_sha512):
-            logger.info('Successfully downloaded {} at {}'.format(
-                name, download_path))
-        else:
+        # Downloads land in a partial file first, so an interrupted one
+        # can be resumed from where it stopped.
+        partial_path = download_path + '.partial'
+        file_sum = hashlib.sha512()
+        total_read = 0
+        headers = self.cpi.get_default_headers()
+        if os.path.exists(partial_path):
+            total_read = _update_sum(file_sum, partial_path)
+            headers['Range'] = 'bytes={}-'.format(total_read)
+        request = self.cpi.get(download_url, headers=headers, stream=True)
+        if (request.status_code ==
+                requests.codes.requested_range_not_satisfiable):
+            # The partial download is as long as, or longer than, the
+            # snap; start over.
+            request.close()
+            del headers['Range']
+            request = self.cpi.get(download_url, headers=headers, stream=True)
+        request.raise_for_status()
+        if request.status_code != requests.codes.partial_content:
+            file_sum = hashlib.sha512()
+            total_read = 0
+        download_requests_stream(request, partial_path, total_read=total_read,
+                                 file_sum=file_sum)
+
+        if file_sum.hexdigest() != expected_sha512:
+            os.remove(partial_path)
             raise errors.SHAMismatchError(download_path, expected_sha512)
+        os.replace(partial_path, download_path)
+        _write_sha512_sidecar(download_path, expected_sha512)
+        logger.info('Successfully downloaded {} at {}'.format(
+            name, download_path))
 
     def _is_downloaded(self, path, expected_sha512):
         if not os.path.exists(path):
             return False
 
-        file_sum = hashlib.sha512()
-        with open(path, 'rb') as f:
-            for file_chunk in iter(
-                    lambda: f.read(file_sum.block_size * 128), b''):
-                file_sum.update(file_chunk)
-        return expected_sha512 == file_sum.hexdigest()
+        sha512 = _read_sha512_sidecar(path)
+        if sha512 is None:
+            file_sum = hashlib.sha512()
+            _update_sum(file_sum, path)
+            sha512 = file_sum.hexdigest()
+            _write_sha512_sidecar(path, sha512)
+        return expected_sha512 == sha512
 
     def push_validation(self, snap_id, assertion):
         return self.sca.push_validation(snap_id, assertion)
@@ -296,16 +345,54 @@ class StoreClient():
         return self.sca.sign_developer_agreement(latest_tos_accepted)
 
 
+def _update_sum(file_sum, path):
+    """Feed the contents of path to file_sum.
+
+    :returns: the number of bytes read.
+    """
+    size = 0
+    with open(path, 'rb') as f:
+        for file_chunk in iter(
+                lambda: f.read(file_sum.block_size * 1024), b''):
+            file_sum.update(file_chunk)
+            size += len(file_chunk)
+    return size
+
+
+def _read_sha512_sidecar(path):
+    """Return the SHA512 recorded for path, if it is still up to date.
+
+    The .sha512 file uses the sha512sum format and is only trusted if it was
+    written after path was last modified.
+    """
+    sidecar_path = path + '.sha512'
+    try:
+        if os.stat(sidecar_path).st_mtime_ns < os.stat(path).st_mtime_ns:
+            return None
+        with open(sidecar_path) as sidecar:
+            return sidecar.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def _write_sha512_sidecar(path, sha512):
+    try:
+        with open(path + '.sha512', 'w') as sidecar:
+            sidecar.write('{}  {}\n'.format(sha512, os.path.basename(path)))
+    except OSError as e:
+        logger.debug('Unable to cache the SHA512 of {}: {}'.format(path, e))
+
+
 class SSOClient(Client):
     """The Single Sign On server deals with authentication.
 
     It is used directly or indirectly by other servers.
 
     """
-    def __init__(self, conf):
+    def __init__(self, conf, transport=None):
         super().__init__(conf, os.environ.get(
             'UBUNTU_SSO_API_ROOT_URL',
-            constants.UBUNTU_SSO_API_ROOT_URL))
+            constants.UBUNTU_SSO_API_ROOT_URL), transport)
 
     def get_unbound_discharge(self, email, password, one_time_password,
                               caveat_id):
@@ -354,10 +441,10 @@ class SnapIndexClient(Client):
     canonical reference.
     """
 
-    def __init__(self, conf):
+    def __init__(self, conf, transport=None):
         super().__init__(conf, os.environ.get(
             'UBUNTU_STORE_SEARCH_ROOT_URL',
-            constants.UBUNTU_STORE_SEARCH_ROOT_URL))
+            constants.UBUNTU_STORE_SEARCH_ROOT_URL), transport)
 
     def get_default_headers(self):
         """Return default headers for CPI requests.
@@ -410,10 +497,12 @@ class SnapIndexClient(Client):
 class UpDownClient(Client):
     """The Up/Down server provide upload/download snap capabilities."""
 
-    def __init__(self, conf):
+    def __init__(self, conf, transport=None):
         super().__init__(conf, os.environ.get(
             'UBUNTU_STORE_UPLOAD_ROOT_URL',
-            constants.UBUNTU_STORE_UPLOAD_ROOT_URL))
+            constants.UBUNTU_STORE_UPLOAD_ROOT_URL), transport)
+        # Uploads retry on their own, resuming from the received chunks.
+        self.transport.disable_retries(self.root_url)
 
     def upload(self, monitor):
         return self.post(
@@ -421,14 +510,45 @@ class UpDownClient(Client):
             data=monitor, headers={'Content-Type': monitor.content_type,
                                    'Accept': 'application/json'})
 
+    def start_chunked_upload(self, binary_filesize, chunk_size):
+        data = {
+            'binary_filesize': binary_filesize,
+            'chunk_size': chunk_size,
+        }
+        return self.post(
+            'unscanned-upload/chunked/', data=json.dumps(data),
+            headers={'Content-Type': 'application/json',
+                     'Accept': 'application/json'})
+
+    def get_received_chunks(self, upload_id):
+        return self.get(
+            'unscanned-upload/chunked/{}/'.format(upload_id),
+            headers={'Accept': 'application/json'})
+
+    def upload_chunk(self, upload_id, index, offset, data, binary_filesize):
+        content_range = 'bytes {}-{}/{}'.format(
+            offset, offset + len(data) - 1, binary_filesize)
+        return self.put(
+            'unscanned-upload/chunked/{}/{}'.format(upload_id, index),
+            data=data, headers={'Content-Type': 'application/octet-stream',
+                                'Content-Range': content_range})
+
+    def finish_chunked_upload(self, upload_id, sha512):
+        data = {'sha512': sha512}
+        return self.post(
+            'unscanned-upload/chunked/{}/finish'.format(upload_id),
+            data=json.dumps(data),
+            headers={'Content-Type': 'application/json',
+                     'Accept': 'application/json'})
+
 
 class SCAClient(Client):
     """The software center agent deals with managing snaps."""
 
-    def __init__(self, conf):
+    def __init__(self, conf, transport=None):
         super().__init__(conf, os.environ.get(
             'UBUNTU_STORE_API_ROOT_URL',
-            constants.UBUNTU_STORE_API_ROOT_URL))
+            constants.UBUNTU_STORE_API_ROOT_URL), transport)
 
     def get_macaroon(self, acls, packages=None, channels=None):
         data = {
@@ -520,6 +640,10 @@ class SCAClient(Client):
             'binary_filesize': updown_data['binary_filesize'],
             'source_uploaded': updown_data['source_uploaded'],
         }
+        if 'delta_format' in updown_data:
+            for key in ('delta_format', 'source_hash', 'target_hash',
+                        'delta_hash'):
+                data[key] = updown_data[key]
         auth = _macaroon_auth(self.conf)
         response = self.post(
             'snap-push/', data=json.dumps(data),
@@ -529,7 +653,8 @@ class SCAClient(Client):
         if not response.ok:
             raise errors.StorePushError(data['name'], response)
 
-        return StatusTracker(response.json()['status_details_url'])
+        return StatusTracker(
+            response.json()['status_details_url'], self.transport)
 
     def snap_release(self, snap_name, revision, channels):
         data = {
@@ -686,7 +811,44 @@ class SCAClient(Client):
         return response.json()
 
 
+def _get_retry_after(response):
+    """Return the delay in seconds requested by a Retry-After header."""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        logger.debug('Ignoring invalid Retry-After {!r}'.format(value))
+        return None
+    now = datetime.datetime.now(retry_date.tzinfo)
+    return max((retry_date - now).total_seconds(), 0)
+
+
+def _iter_events(response):
+    """Yield the JSON data of each server-sent event in response."""
+    data = []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith('data:'):
+            data.append(line[len('data:'):].strip())
+        elif not line and data:
+            yield json.loads('\n'.join(data))
+            data = []
+
+
 class StatusTracker:
+    """Follow the Store processing of an upload.
+
+    The status is fetched in a background thread, which waits on
+    Retry-After when the Store asks for it and otherwise polls at growing
+    intervals, up to SCAN_STATUS_POLL_DELAY. When the Store answers with
+    server-sent events, updates are read from that stream as they are
+    pushed instead.
+    """
 
     __messages = {
         'being_processed': 'Processing...',
@@ -700,34 +862,57 @@ class StatusTracker:
         'need_manual_review',
     )
 
-    def __init__(self, status_details_url):
+    # How often the progress indicator is animated while nothing happens.
+    __indicator_interval = 0.25
+
+    def __init__(self, status_details_url, transport=None):
         self.__status_details_url = status_details_url
+        if transport is None:
+            transport = _transport.get_default_transport()
+        self.__transport = transport
+        self.__queue = Queue()
+        self.__thread = None
+        self.__content = {}
+
+    def start(self):
+        """Start following the status in the background.
+
+        Calling it more than once has no further effect.
+        """
+        if self.__thread is None:
+            self.__thread = Thread(
+                target=self._update_status, args=(self.__queue,),
+                daemon=True)
+            self.__thread.start()
+        return self
+
+    def wait(self):
+        """Block until the Store has processed the upload.
+
+        :returns: the final status content.
+        """
+        self.start()
+        while not self.__content.get('processed'):
+            self._get_update()
+        return self.__content
 
     def track(self):
-        queue = Queue()
-        thread = Thread(target=self._update_status, args=(queue,))
-        thread.start()
+        self.start()
 
         widgets = ['Processing...', AnimatedMarker()]
         progress_indicator = ProgressBar(widgets=widgets, maxval=UnknownLength)
         progress_indicator.start()
 
-        content = {}
         for indicator_count in itertools.count():
-            if not queue.empty():
-                content = queue.get()
-                if isinstance(content, Exception):
-                    raise content
+            content = self._get_update(timeout=self.__indicator_interval)
+            if content:
                 widgets[0] = self._get_message(content)
             progress_indicator.update(indicator_count)
-            if content.get('processed'):
+            if self.__content.get('processed'):
                 break
-            sleep(0.1)
         progress_indicator.finish()
 
-        self.__content = content
-
-        return content
+        return self.__content
 
     def raise_for_code(self):
         if any(self.__content['code'] == k for k in self.__error_codes):
@@ -736,21 +921,70 @@ class StatusTracker:
     def _get_message(self, content):
         return self.__messages.get(content['code'], content['code'])
 
+    def _get_update(self, timeout=None):
+        try:
+            content = self.__queue.get(timeout=timeout)
+        except Empty:
+            return None
+        if isinstance(content, Exception):
+            raise content
+        self.__content = content
+        return content
+
     def _update_status(self, queue):
-        for content in self._get_status():
-            queue.put(content)
-            if content['processed']:
-                break
-            sleep(constants.SCAN_STATUS_POLL_DELAY)
+        try:
+            for content in self._get_status():
+                queue.put(content)
+                if isinstance(content, Exception) or content['processed']:
+                    break
+        except Exception as e:
+            # Whatever goes wrong has to reach the waiting thread, which
+            # would otherwise block forever.
+            queue.put(e)
 
     def _get_status(self):
         connection_errors_allowed = 10
+        delay = constants.SCAN_STATUS_POLL_MIN_DELAY
         while True:
+            retry_after = None
             try:
-                content = requests.get(self.__status_details_url).json()
-            except (requests.ConnectionError, requests.HTTPError) as e:
+                response = self.__transport.get(
+                    self.__status_details_url, stream=True,
+                    headers={'Accept': 'text/event-stream, application/json'})
+                try:
+                    if response.headers.get('Content-Type', '').startswith(
+                            'text/event-stream'):
+                        # Updates are pushed, there is nothing to wait for
+                        # between them.
+                        for content in _iter_events(response):
+                            yield content
+                        content = None
+                    else:
+                        content = response.json()
+                        retry_after = _get_retry_after(response)
+                finally:
+                    response.close()
+            except (requests.RequestException, ValueError) as e:
                 if not connection_errors_allowed:
                     yield e
                 content = {'processed': False, 'code': 'being_processed'}
                 connection_errors_allowed -= 1
-            yield content
+            if content is not None:
+                yield content
+            if retry_after is not None:
+                sleep(retry_after)
+            else:
+                sleep(delay)
+                delay = min(delay * constants.SCAN_STATUS_POLL_BACKOFF,
+                            constants.SCAN_STATUS_POLL_DELAY)
+
+
+def track_all(trackers):
+    """Wait for the Store to process several uploads at the same time.
+
+    :param list trackers: the StatusTrackers returned by uploads.
+    :returns: the final status content of each tracker, in the same order.
+    """
+    for tracker in trackers:
+        tracker.start()
+    return [tracker.wait() for tracker in trackers]
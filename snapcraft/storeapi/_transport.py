@@ -0,0 +1,156 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import inspect
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from snapcraft.storeapi import constants
+
+
+logger = logging.getLogger(__name__)
+
+# Only requests that are safe to repeat are retried by the transport,
+# anything else is left to the caller to decide upon.
+_RETRY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport():
+    """Return the transport shared by all the store clients."""
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = Transport()
+        return _default_transport
+
+
+def _make_retry(retries, backoff_factor):
+    kwargs = {
+        'total': retries,
+        'backoff_factor': backoff_factor,
+        'status_forcelist': constants.HTTP_RETRY_STATUSES,
+    }
+    parameters = inspect.signature(Retry).parameters
+    # urllib3 renamed method_whitelist and only learnt raise_on_status
+    # in later releases.
+    if 'allowed_methods' in parameters:
+        kwargs['allowed_methods'] = _RETRY_METHODS
+    else:
+        kwargs['method_whitelist'] = _RETRY_METHODS
+    if 'raise_on_status' in parameters:
+        kwargs['raise_on_status'] = False
+    return Retry(**kwargs)
+
+
+def _make_adapter(retries, backoff_factor):
+    return HTTPAdapter(
+        pool_connections=constants.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=constants.HTTP_POOL_MAXSIZE,
+        max_retries=_make_retry(retries, backoff_factor))
+
+
+class HTTPMetrics:
+    """Accumulate latency, retry and transfer figures for HTTP requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.latency = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def record(self, response, latency):
+        retries = getattr(response.raw, 'retries', None)
+        history = getattr(retries, 'history', ())
+        bytes_sent = _get_body_size(response.request.body)
+        bytes_received = int(response.headers.get('Content-Length', 0))
+        with self._lock:
+            self.requests += 1
+            self.retries += len(history)
+            self.latency += latency
+            self.bytes_sent += bytes_sent
+            self.bytes_received += bytes_received
+        logger.debug('{} {} {} in {:.3f}s ({} retries, {} bytes sent, '
+                     '{} bytes received)'.format(
+                         response.request.method, response.url,
+                         response.status_code, latency, len(history),
+                         bytes_sent, bytes_received))
+
+    def __str__(self):
+        with self._lock:
+            return ('{} requests in {:.3f}s, {} retries, {} bytes sent, '
+                    '{} bytes received'.format(
+                        self.requests, self.latency, self.retries,
+                        self.bytes_sent, self.bytes_received))
+
+
+def _get_body_size(body):
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    # Streamed bodies such as a MultipartEncoder expose their length.
+    return getattr(body, 'len', 0)
+
+
+class Transport:
+    """A pooled, keep-alive HTTP session with retries and timeouts.
+
+    :param int retries: how many times idempotent requests are retried on
+                        connection errors and on HTTP_RETRY_STATUSES.
+    :param float backoff_factor: base of the exponential delay between
+                                 retries.
+    :param timeout: default (connect, read) timeout for every request.
+    """
+
+    def __init__(self, *, retries=constants.HTTP_RETRIES,
+                 backoff_factor=constants.HTTP_RETRY_BACKOFF_FACTOR,
+                 timeout=constants.HTTP_TIMEOUT):
+        self.timeout = timeout
+        self.metrics = HTTPMetrics()
+        self.session = requests.Session()
+        self.session.mount('http://', _make_adapter(retries, backoff_factor))
+        self.session.mount('https://', _make_adapter(retries, backoff_factor))
+        self._no_retry_prefixes = set()
+        self._lock = threading.Lock()
+
+    def disable_retries(self, prefix):
+        """Leave retrying the requests to urls under prefix to the caller.
+
+        For callers with their own retries, which would otherwise be
+        multiplied by the transport ones.
+        """
+        with self._lock:
+            if prefix not in self._no_retry_prefixes:
+                self.session.mount(prefix, _make_adapter(0, 0))
+                self._no_retry_prefixes.add(prefix)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.monotonic()
+        response = self.session.request(method, url, **kwargs)
+        self.metrics.record(response, time.monotonic() - start)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
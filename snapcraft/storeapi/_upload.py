@@ -14,17 +14,23 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import logging
+import contextlib
 import functools
+import hashlib
+import itertools
+import logging
 import os
+from time import sleep
 
 from progressbar import (
     Bar,
     Percentage,
     ProgressBar,
 )
+import requests
 from requests_toolbelt import (MultipartEncoder, MultipartEncoderMonitor)
 
+from snapcraft.storeapi import constants
 from snapcraft.storeapi.errors import StoreUploadError
 
 
@@ -36,14 +42,76 @@ def _update_progress_bar(progress_bar, maximum_value, monitor):
         progress_bar.update(monitor.bytes_read)
 
 
-def upload_files(binary_filename, updown_client):
+class _SilentProgressBar:
+
+    def start(self):
+        pass
+
+    def update(self, value):
+        pass
+
+    def finish(self):
+        pass
+
+
+def _init_progress_bar(binary_filename, binary_file_size, show_progress):
+    if not show_progress:
+        return _SilentProgressBar()
+    # Create a progress bar that looks like: Uploading foo [==  ] 50%
+    progress_bar = ProgressBar(
+        widgets=['Uploading {} '.format(binary_filename),
+                 Bar(marker='=', left='[', right=']'), ' ', Percentage()],
+        maxval=binary_file_size)
+    progress_bar.start()
+    # Print a newline so the progress bar has some breathing room.
+    logger.info('')
+    return progress_bar
+
+
+def upload_files(binary_filename, updown_client, show_progress=True):
     """Upload a binary file to the Store.
 
     Submit a file to the Store upload service and return the
     corresponding upload_id.
+
+    The file is sent in chunks of UPLOAD_CHUNK_SIZE bytes when the
+    upload service supports it, so a failed chunk can be retried on its
+    own instead of restarting the whole upload. Services without chunked
+    upload support get a single multipart request.
     """
+    binary_file_size = os.path.getsize(binary_filename)
+    try:
+        response = updown_client.start_chunked_upload(
+            binary_file_size, constants.UPLOAD_CHUNK_SIZE)
+    except requests.exceptions.RequestException as err:
+        raise RuntimeError(
+            'An unexpected error was found while uploading '
+            'files: {!r}.'.format(err))
+
+    if response.status_code in (requests.codes.not_found,
+                                requests.codes.method_not_allowed):
+        logger.debug(
+            'The upload service does not support chunked uploads, '
+            'falling back to a single request.')
+        upload_id = _upload_multipart(
+            binary_filename, binary_file_size, updown_client, show_progress)
+    elif response.ok:
+        upload_id = _upload_chunked(
+            binary_filename, binary_file_size, updown_client,
+            response.json()['upload_id'], show_progress)
+    else:
+        raise StoreUploadError(response)
+
+    return {
+        'upload_id': upload_id,
+        'binary_filesize': binary_file_size,
+        'source_uploaded': False,
+    }
+
+
+def _upload_multipart(binary_filename, binary_file_size, updown_client,
+                      show_progress):
     try:
-        binary_file_size = os.path.getsize(binary_filename)
         binary_file = open(binary_filename, 'rb')
         encoder = MultipartEncoder(
             fields={
@@ -51,14 +119,8 @@ def upload_files(binary_filename, updown_client):
             }
         )
 
-        # Create a progress bar that looks like: Uploading foo [==  ] 50%
-        progress_bar = ProgressBar(
-            widgets=['Uploading {} '.format(binary_filename),
-                     Bar(marker='=', left='[', right=']'), ' ', Percentage()],
-            maxval=os.path.getsize(binary_filename))
-        progress_bar.start()
-        # Print a newline so the progress bar has some breathing room.
-        logger.info('')
+        progress_bar = _init_progress_bar(
+            binary_filename, binary_file_size, show_progress)
 
         # Create a monitor for this upload, so that progress can be displayed
         monitor = MultipartEncoderMonitor(
@@ -82,9 +144,113 @@ def upload_files(binary_filename, updown_client):
     if not response.ok:
         raise StoreUploadError(response)
 
-    response_data = response.json()
-    return {
-        'upload_id': response_data['upload_id'],
-        'binary_filesize': binary_file_size,
-        'source_uploaded': False,
-    }
+    return response.json()['upload_id']
+
+
+def _upload_chunked(binary_filename, binary_file_size, updown_client,
+                    upload_id, show_progress):
+    chunk_size = constants.UPLOAD_CHUNK_SIZE
+    received = _get_received_chunks(updown_client, upload_id)
+    file_sum = hashlib.sha512()
+
+    progress_bar = _init_progress_bar(
+        binary_filename, binary_file_size, show_progress)
+    with open(binary_filename, 'rb') as binary_file:
+        for index in itertools.count():
+            data = binary_file.read(chunk_size)
+            if not data:
+                break
+            file_sum.update(data)
+            if index not in received:
+                received = _upload_chunk(
+                    updown_client, upload_id, index, index * chunk_size,
+                    data, binary_file_size, received)
+            progress_bar.update(
+                min((index + 1) * chunk_size, binary_file_size))
+    progress_bar.finish()
+
+    response = _retry(
+        functools.partial(updown_client.finish_chunked_upload, upload_id,
+                          file_sum.hexdigest()),
+        'the upload finish')
+
+    return response.json()['upload_id']
+
+
+def _get_received_chunks(updown_client, upload_id, retries=None):
+    """Get the chunks received by the service.
+
+    :returns: the set of chunks known to be received by the service.
+    """
+    response = _retry(
+        functools.partial(updown_client.get_received_chunks, upload_id),
+        'the received chunks query', retries=retries)
+    return set(response.json()['received_chunks'])
+
+
+def _upload_chunk(updown_client, upload_id, index, offset, data,
+                  binary_file_size, received):
+    """Upload a single chunk.
+
+    :returns: the set of chunks known to be received by the service.
+    """
+    def chunk_received():
+        nonlocal received
+        # The chunk may have made it even if the response did not,
+        # resume from what the service has already received. The chunk
+        # is already being retried, so the query is tried once.
+        with contextlib.suppress(RuntimeError, StoreUploadError):
+            received = _get_received_chunks(
+                updown_client, upload_id, retries=0)
+        return index in received
+
+    response = _retry(
+        functools.partial(updown_client.upload_chunk, upload_id, index,
+                          offset, data, binary_file_size),
+        'chunk {}'.format(index), skip_retry=chunk_received)
+    if response is None:
+        return received
+    return received | {index}
+
+
+def _retry(call, describe, retries=None, skip_retry=None):
+    """Make a request with call, retrying with exponential backoff.
+
+    Request exceptions and server errors are retried, client errors will
+    not go away by retrying.
+
+    :param call: makes the request, returning its response.
+    :param str describe: what the request is, for the logs.
+    :param int retries: the attempts after the first one, by default
+                        UPLOAD_CHUNK_RETRIES.
+    :param skip_retry: called before each retry, the retry is skipped if
+                       it returns true.
+    :returns: the successful response, or None if a retry was skipped.
+    :raises RuntimeError: if the last attempt raised a request exception.
+    :raises StoreUploadError: if the last attempt got an error response.
+    """
+    if retries is None:
+        retries = constants.UPLOAD_CHUNK_RETRIES
+    delay = constants.UPLOAD_RETRY_DELAY
+    for attempt in range(retries + 1):
+        if attempt:
+            logger.debug('Retrying {} in {} seconds ({}/{}).'.format(
+                describe, delay, attempt, retries))
+            sleep(delay)
+            delay *= 2
+            if skip_retry and skip_retry():
+                return None
+        try:
+            response = call()
+        except requests.exceptions.RequestException as err:
+            error = RuntimeError(
+                'An unexpected error was found while uploading '
+                'files: {!r}.'.format(err))
+            continue
+        if response.ok:
+            return response
+        error = StoreUploadError(response)
+        if response.status_code < 500:
+            break
+
+    raise error
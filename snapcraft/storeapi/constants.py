@@ -20,7 +20,19 @@ from __future__ import absolute_import, unicode_literals
 # become available server side -- vila 2016-04-22
 DEFAULT_SERIES = '16'
 SCAN_STATUS_POLL_DELAY = 5
+SCAN_STATUS_POLL_MIN_DELAY = 0.5
+SCAN_STATUS_POLL_BACKOFF = 2
 SCAN_STATUS_POLL_RETRIES = 5
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_CHUNK_RETRIES = 5
+UPLOAD_RETRY_DELAY = 1
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 10
+HTTP_RETRIES = 3
+HTTP_RETRY_BACKOFF_FACTOR = 0.5
+HTTP_RETRY_STATUSES = (502, 503, 504)
+# (connect, read) timeouts in seconds.
+HTTP_TIMEOUT = (10, 120)
 UBUNTU_SSO_API_ROOT_URL = 'https://login.ubuntu.com/api/v2/'
 UBUNTU_STORE_API_ROOT_URL = 'https://myapps.developer.ubuntu.com/dev/api/'
 UBUNTU_STORE_SEARCH_ROOT_URL = 'https://search.apps.ubuntu.com/'
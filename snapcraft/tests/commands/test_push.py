@@ -18,6 +18,8 @@ import glob
 import logging
 import os
 import os.path
+import shutil
+import struct
 from unittest import mock
 
 import docopt
@@ -28,6 +30,7 @@ from snapcraft import (
     storeapi,
     tests
 )
+from snapcraft.internal import deltas
 from snapcraft.internal.cache._snap import _rewrite_snap_filename_with_revision
 from snapcraft.main import main
 from snapcraft.storeapi.errors import (
@@ -108,6 +111,20 @@ class PushCommandTestCase(tests.TestCase):
             SystemExit,
             main, ['push', 'test-unexisting-snap'])
 
+    def test_push_snap_packed_for_development_must_raise_exception(self):
+        # A squashfs superblock using gzip, as packed by the fast profile.
+        with open('dev.snap', 'wb') as f:
+            f.write(struct.pack(
+                '<4sIIIIHHH', b'hsqs', 1, 0, 1048576, 0, 1, 20, 0))
+
+        self.assertRaises(
+            SystemExit,
+            main, ['push', 'dev.snap'])
+        self.assertIn(
+            "'dev.snap' was packed with the 'fast' profile and cannot be "
+            "pushed to the store.",
+            self.fake_logger.output)
+
     def test_push_unregistered_snap_must_raise_exception(self):
         self.useFixture(fixture_setup.FakeTerminal())
 
@@ -418,3 +435,109 @@ class PushCommandDeltasWithPruneTestCase(tests.TestCase):
             self.assertFalse(
                 os.path.isfile(os.path.join(revision_cache, snap)))
         self.assertEqual(1, len(os.listdir(revision_cache)))
+
+
+class PushCommandDeltaUploadTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(self.fake_logger)
+        self.useFixture(fixture_setup.DeltaUploads())
+
+        patcher = mock.patch('snapcraft.storeapi.StoreClient.push_precheck')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        mock_tracker = mock.Mock(storeapi.StatusTracker)
+        mock_tracker.track.return_value = {
+            'code': 'ready_to_release',
+            'processed': True,
+            'can_release': True,
+            'url': '/fake/url',
+            'revision': 9,
+        }
+        patcher = mock.patch.object(storeapi.StoreClient, 'upload')
+        self.mock_upload = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_upload.return_value = mock_tracker
+
+        patcher = mock.patch('snapcraft.internal.deltas.DeltaManager')
+        self.mock_delta_manager = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.delta = deltas.Delta(
+            'basic.xdelta3', 'xdelta3', 'source-hash', 'target-hash',
+            'delta-hash', False)
+        self.mock_delta_manager().result.return_value = self.delta
+
+        self.snap_file = 'basic_0.1_amd64.snap'
+        shutil.copyfile(
+            os.path.join(os.path.dirname(tests.__file__), 'data',
+                         'test-snap.snap'),
+            self.snap_file)
+        self.revision_cache = os.path.join(
+            BaseDirectory.xdg_cache_home, 'snapcraft', 'basic', 'revisions')
+        os.makedirs(self.revision_cache)
+        self.cached_snap = os.path.join(
+            self.revision_cache, 'basic_0.1_amd64_8.snap')
+        shutil.copyfile(self.snap_file, self.cached_snap)
+
+    def test_push_delta(self):
+        main(['push', self.snap_file])
+
+        self.mock_delta_manager.assert_called_with(
+            project_name='basic', source_path=self.cached_snap,
+            target_path=self.snap_file)
+        self.mock_delta_manager().start.assert_called_once_with()
+        self.mock_upload.assert_called_once_with(
+            'basic', 'basic.xdelta3', delta_format='xdelta3',
+            source_hash='source-hash', target_hash='target-hash',
+            delta_hash='delta-hash')
+
+    def test_push_full_snap_without_cached_revision(self):
+        os.remove(self.cached_snap)
+
+        main(['push', self.snap_file])
+
+        self.mock_delta_manager().start.assert_not_called()
+        self.mock_upload.assert_called_once_with('basic', self.snap_file)
+
+    def test_push_full_snap_when_delta_not_worth_it(self):
+        self.mock_delta_manager().result.return_value = None
+
+        main(['push', self.snap_file])
+
+        self.mock_upload.assert_called_once_with('basic', self.snap_file)
+
+    def test_push_cancels_delta_when_precheck_fails(self):
+        class MockResponse:
+            status_code = 404
+            error_list = [{'code': 'resource-not-found',
+                           'message': 'Snap not found for name=basic'}]
+
+        patcher = mock.patch.object(storeapi.StoreClient, 'push_precheck')
+        mock_precheck = patcher.start()
+        self.addCleanup(patcher.stop)
+        mock_precheck.side_effect = StorePushError('basic', MockResponse())
+
+        self.assertRaises(SystemExit, main, ['push', self.snap_file])
+
+        self.mock_delta_manager().cancel.assert_called_once_with()
+        self.mock_upload.assert_not_called()
+
+    def test_push_full_snap_when_delta_rejected(self):
+        class MockResponse:
+            text = 'delta rejected'
+            reason = 'stub reason'
+
+        self.mock_upload.side_effect = [
+            StoreUploadError(MockResponse()),
+            self.mock_upload.return_value]
+
+        main(['push', self.snap_file])
+
+        self.assertEqual(2, self.mock_upload.call_count)
+        self.mock_upload.assert_called_with('basic', self.snap_file)
+        self.assertIn(
+            "Unable to push the delta for 'basic_0.1_amd64.snap', pushing "
+            "the full snap", self.fake_logger.output)
@@ -0,0 +1,161 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+import os
+import shutil
+from unittest import mock
+
+import docopt
+import fixtures
+
+import snapcraft
+from snapcraft import (
+    storeapi,
+    tests
+)
+from snapcraft.main import main
+from snapcraft.tests import fixture_setup
+
+
+class PushManyCommandTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(self.fake_logger)
+        self.useFixture(fixture_setup.FakeStore())
+
+        patcher = mock.patch('snapcraft.storeapi.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # The name is all that is read from the snap, map it from the file
+        # name so one test snap can stand in for many.
+        patcher = mock.patch(
+            'snapcraft._store._get_data_from_snap_file',
+            side_effect=lambda path: {
+                'name': os.path.basename(path).split('_')[0]})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        test_snap = os.path.join(
+            os.path.dirname(tests.__file__), 'data', 'test-snap.snap')
+        self.snap_files = []
+        for name, arch in (('test-snap', 'amd64'), ('test-snap', 'armhf'),
+                           ('test-review-snap', 'amd64')):
+            snap_file = '{}_0.1_{}.snap'.format(name, arch)
+            shutil.copy(test_snap, snap_file)
+            self.snap_files.append(snap_file)
+
+    def test_push_many_without_snaps_must_raise_exception(self):
+        raised = self.assertRaises(
+            docopt.DocoptExit,
+            main, ['push-many'])
+
+        self.assertTrue('Usage:' in str(raised))
+
+    def test_push_many_without_login_must_raise_exception(self):
+        self.assertRaises(
+            SystemExit,
+            main, ['push-many'] + self.snap_files)
+        self.assertIn(
+            'No valid credentials found. Have you run "snapcraft login"?\n',
+            self.fake_logger.output)
+
+    def test_push_many_nonexisting_snap_must_raise_exception(self):
+        storeapi.StoreClient().login('dummy', 'test correct password')
+
+        self.assertRaises(
+            SystemExit,
+            main, ['push-many', self.snap_files[0], 'test-unexisting-snap'])
+        self.assertIn(
+            "The file 'test-unexisting-snap' does not exist.",
+            self.fake_logger.output)
+
+    def test_push_many_writes_summary(self):
+        storeapi.StoreClient().login('dummy', 'test correct password')
+
+        self.assertRaises(
+            SystemExit,
+            main, ['push-many', '--release', 'beta', '--jobs', '2',
+                   '--summary', 'summary.json'] + self.snap_files)
+
+        with open('summary.json') as summary_file:
+            summaries = json.load(summary_file)
+        self.assertEqual(
+            [s['snap'] for s in summaries], self.snap_files)
+        for summary in summaries[:2]:
+            self.assertEqual(summary['name'], 'test-snap')
+            self.assertEqual(summary['status'], 'ready_to_release')
+            self.assertEqual(summary['revision'], '1')
+            self.assertEqual(summary['released'], ['beta'])
+            self.assertNotIn('error', summary)
+            self.assertEqual(
+                sorted(summary['timings']),
+                ['metadata', 'precheck', 'processing', 'release', 'total',
+                 'upload'])
+        self.assertEqual(summaries[2]['status'], 'need_manual_review')
+        self.assertNotIn('released', summaries[2])
+        self.assertIn('Publishing checks failed', summaries[2]['error'])
+        self.assertIn(
+            "Failed to push 'test-review-snap_0.1_amd64.snap'.",
+            self.fake_logger.output)
+
+    def test_push_many_shares_one_client(self):
+        storeapi.StoreClient().login('dummy', 'test correct password')
+
+        with mock.patch('snapcraft.storeapi.StoreClient',
+                        wraps=storeapi.StoreClient) as mock_client:
+            main(['push-many', '--summary', 'summary.json'] +
+                 self.snap_files[:2])
+
+        mock_client.assert_called_once_with()
+
+    def test_push_many_with_invalid_jobs(self):
+        self.assertRaises(
+            SystemExit,
+            main, ['push-many', '--jobs', '0'] + self.snap_files)
+        self.assertIn(
+            "--jobs must be a positive number, not '0'",
+            self.fake_logger.output)
+
+    def test_push_many_caches_once_all_pushes_are_done(self):
+        storeapi.StoreClient().login('dummy', 'test correct password')
+        pushed = []
+
+        def push_one(store, snap_filename, release_channels, pushed_snaps):
+            # Nothing may be cached while snaps are still being pushed.
+            self.assertFalse(cache_mock.called)
+            pushed.append(snap_filename)
+            pushed_snaps.append(('test-snap', snap_filename, '1'))
+            return {'snap': snap_filename}
+
+        with mock.patch('snapcraft._store._cache_pushed_snap') as cache_mock:
+            with mock.patch('snapcraft._store._push_one',
+                            side_effect=push_one):
+                snapcraft.push_many(self.snap_files[:2], jobs=2)
+
+        self.assertEqual(
+            sorted(cache_mock.call_args_list),
+            sorted(mock.call('test-snap', f, '1') for f in pushed))
+        self.assertEqual(sorted(pushed), sorted(self.snap_files[:2]))
+
+    def test_push_many_without_snap_files(self):
+        raised = self.assertRaises(ValueError, snapcraft.push_many, [])
+
+        self.assertEqual('No snap files to push.', str(raised))
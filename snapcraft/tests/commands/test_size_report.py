@@ -0,0 +1,121 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import logging
+import os
+from unittest import mock
+
+import fixtures
+
+from snapcraft.main import main
+from snapcraft import tests
+
+
+class SizeReportCommandTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.make_snapcraft_yaml("""name: size-report-test
+version: 1.0
+summary: test size-report
+description: the size report of the primed snap
+confinement: strict
+grade: stable
+
+parts:
+  binaries:
+    plugin: dump
+    source: binaries
+  data:
+    plugin: dump
+    source: data
+""")
+        os.makedirs(os.path.join('binaries', 'bin'))
+        with open(os.path.join('binaries', 'bin', 'app'), 'wb') as f:
+            f.write(b'\x7fELF' + b'\0' * 1020)
+        os.makedirs(os.path.join('data', 'share'))
+        with open(os.path.join('data', 'share', 'data.txt'), 'w') as f:
+            f.write('data' * 64)
+        with open(os.path.join('data', 'README'), 'w') as f:
+            f.write('README')
+
+    def test_size_report_without_prime(self):
+        fake_logger = fixtures.FakeLogger(level=logging.ERROR)
+        self.useFixture(fake_logger)
+
+        raised = self.assertRaises(SystemExit, main, ['size-report'])
+
+        self.assertEqual(1, raised.code)
+        self.assertEqual(
+            'Nothing has been primed yet.\n'
+            'Run `snapcraft prime` before generating a size report.\n',
+            fake_logger.output)
+
+    @mock.patch('snapcraft.internal.size_report._list_deb')
+    def test_size_report(self, mock_list_deb):
+        mock_list_deb.return_value = ['share/data.txt', 'usr/share/other']
+        download_dir = os.path.join(
+            self.parts_dir, 'data', 'ubuntu', 'download')
+        os.makedirs(download_dir)
+        open(os.path.join(download_dir, 'data-pkg_1.0_amd64.deb'),
+             'w').close()
+        main(['prime'])
+
+        main(['size-report', '--json', 'report.json'])
+
+        with open('report.json') as f:
+            report = json.load(f)
+        self.assertEqual('size-report-test', report['name'])
+        self.assertEqual(4, report['total']['files'])
+        self.assertEqual(['binaries', 'data', '(none)'],
+                         list(report['parts']))
+        self.assertEqual(
+            {'files': 1, 'bytes': 1024},
+            {k: report['parts']['binaries'][k] for k in ('files', 'bytes')})
+        self.assertEqual(
+            {'bin', 'share', 'meta', '.'}, set(report['directories']))
+        self.assertEqual(['data-pkg'], list(report['stage_packages']))
+        self.assertEqual(256, report['stage_packages']['data-pkg']['bytes'])
+        self.assertEqual(1, report['file_types']['elf']['files'])
+        self.assertLess(report['parts']['data']['compressed_bytes'],
+                        report['parts']['data']['bytes'])
+
+        output = self.fake_terminal.getvalue()
+        self.assertIn('size-report-test 1.0: ', output)
+        self.assertIn('stage-packages', output)
+
+    def test_size_report_without_dpkg_deb(self):
+        fake_logger = fixtures.FakeLogger(level=logging.WARNING)
+        self.useFixture(fake_logger)
+        download_dir = os.path.join(
+            self.parts_dir, 'data', 'ubuntu', 'download')
+        os.makedirs(download_dir)
+        deb = os.path.join(download_dir, 'data-pkg_1.0_amd64.deb')
+        open(deb, 'w').close()
+        main(['prime'])
+
+        with mock.patch('subprocess.Popen',
+                        side_effect=FileNotFoundError('dpkg-deb')):
+            main(['size-report', '--json', 'report.json'])
+
+        self.assertIn('Unable to list the contents of {!r}'.format(deb),
+                      fake_logger.output)
+        with open('report.json') as f:
+            report = json.load(f)
+        self.assertEqual({}, report['stage_packages'])
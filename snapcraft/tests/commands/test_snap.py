@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import logging
 import os
 import os.path
@@ -22,6 +23,8 @@ from unittest import mock
 
 import fixtures
 from testtools.matchers import (
+    Contains,
+    Equals,
     FileContains,
     FileExists,
     Not,
@@ -66,6 +69,12 @@ parts:
         self.isatty_mock.return_value = False
         self.addCleanup(patcher.stop)
 
+        # The packing report depends on the mksquashfs output size and
+        # timing, it is tested on its own.
+        patcher = mock.patch('snapcraft.internal.lifecycle._report_packing')
+        self.report_packing_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
     def make_snapcraft_yaml(self, n=1, snap_type='app'):
         snapcraft_yaml = self.yaml_template.format(snap_type)
         super().make_snapcraft_yaml(snapcraft_yaml)
@@ -96,7 +105,8 @@ parts:
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', self.prime_dir, 'snap-test_1.0_amd64.snap',
-            '-noappend', '-comp', 'xz', '-no-xattrs', '-all-root'],
+            '-noappend', '-no-xattrs', '-comp', 'xz', '-b', '131072',
+            '-processors', '2', '-all-root'],
             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
 
     @mock.patch('snapcraft.internal.lifecycle.ProgressBar')
@@ -125,7 +135,8 @@ parts:
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', self.prime_dir, 'snap-test_1.0_amd64.snap',
-            '-noappend', '-comp', 'xz', '-no-xattrs', '-all-root'],
+            '-noappend', '-no-xattrs', '-comp', 'xz', '-b', '131072',
+            '-processors', '2', '-all-root'],
             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
 
         self.assertThat('snap-test_1.0_amd64.snap', FileExists())
@@ -155,7 +166,8 @@ parts:
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', self.prime_dir, 'snap-test_1.0_amd64.snap',
-            '-noappend', '-comp', 'xz', '-no-xattrs'],
+            '-noappend', '-no-xattrs', '-comp', 'xz', '-b', '131072',
+            '-processors', '2'],
             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
 
         self.assertThat('snap-test_1.0_amd64.snap', FileExists())
@@ -182,7 +194,8 @@ parts:
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', self.prime_dir, 'snap-test_1.0_amd64.snap',
-            '-noappend', '-comp', 'xz', '-no-xattrs', '-all-root'],
+            '-noappend', '-no-xattrs', '-comp', 'xz', '-b', '131072',
+            '-processors', '2', '-all-root'],
             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
 
         self.assertThat('snap-test_1.0_amd64.snap', FileExists())
@@ -208,7 +221,8 @@ architectures: [amd64, armhf]
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', os.path.abspath('mysnap'), 'my_snap_99_multi.snap',
-            '-noappend', '-comp', 'xz', '-no-xattrs', '-all-root'],
+            '-noappend', '-no-xattrs', '-comp', 'xz', '-b', '131072',
+            '-processors', '2', '-all-root'],
             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
 
         self.assertThat('my_snap_99_multi.snap', FileExists())
@@ -233,7 +247,8 @@ version: 99
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', os.path.abspath('mysnap'), 'my_snap_99_all.snap',
-            '-noappend', '-comp', 'xz', '-no-xattrs', '-all-root'],
+            '-noappend', '-no-xattrs', '-comp', 'xz', '-b', '131072',
+            '-processors', '2', '-all-root'],
             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
 
         self.assertThat('my_snap_99_all.snap', FileExists())
@@ -260,7 +275,8 @@ type: os
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', os.path.abspath('mysnap'), 'my_snap_99_multi.snap',
-            '-noappend', '-comp', 'xz', '-no-xattrs'],
+            '-noappend', '-no-xattrs', '-comp', 'xz', '-b', '131072',
+            '-processors', '2'],
             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
 
         self.assertThat('my_snap_99_multi.snap', FileExists())
@@ -290,7 +306,8 @@ type: os
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', self.prime_dir, 'mysnap.snap',
-            '-noappend', '-comp', 'xz', '-no-xattrs', '-all-root'],
+            '-noappend', '-no-xattrs', '-comp', 'xz', '-b', '131072',
+            '-processors', '2', '-all-root'],
             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
 
         self.assertThat('mysnap.snap', FileExists())
@@ -327,3 +344,191 @@ type: os
         self.assertThat(snap_build_renamed, FileExists())
         self.assertThat(
             snap_build_renamed, FileContains('signed assertion?'))
+
+    def test_snap_with_fast_pack_profile(self):
+        self.make_snapcraft_yaml()
+
+        main(['snap', '--pack-profile', 'fast'])
+
+        self.popen_spy.assert_called_once_with([
+            'mksquashfs', self.prime_dir, 'snap-test_1.0_amd64.snap',
+            '-noappend', '-no-xattrs', '-comp', 'gzip',
+            '-Xcompression-level', '1', '-b', '1048576',
+            '-processors', '2', '-all-root'],
+            stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+        self.report_packing_mock.assert_called_once_with(
+            self.prime_dir, 'snap-test_1.0_amd64.snap', 'fast', mock.ANY)
+
+    def test_snap_uncompressed_without_parallel_builds(self):
+        self.make_snapcraft_yaml()
+
+        main(['snap', '--pack-profile', 'uncompressed',
+              '--no-parallel-build'])
+
+        self.popen_spy.assert_called_once_with([
+            'mksquashfs', self.prime_dir, 'snap-test_1.0_amd64.snap',
+            '-noappend', '-no-xattrs', '-noI', '-noD', '-noF', '-noX',
+            '-b', '1048576', '-processors', '1', '-all-root'],
+            stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+
+    def test_snap_with_unknown_pack_profile(self):
+        fake_logger = fixtures.FakeLogger(level=logging.ERROR)
+        self.useFixture(fake_logger)
+        self.make_snapcraft_yaml()
+
+        self.assertRaises(
+            SystemExit,
+            main, ['snap', '--pack-profile', 'tiny'])
+
+        self.assertEqual(
+            "Unknown pack profile 'tiny', valid profiles are: "
+            "store, fast, uncompressed\n",
+            fake_logger.output)
+        self.popen_spy.assert_not_called()
+
+
+class _FakeMksquashfs:
+    """A mksquashfs stand-in writing the prime tree listing as the snap."""
+
+    sort_file = None
+
+    def __init__(self, args, **kwargs):
+        self.stdout = io.BytesIO()
+        with open(args[2], 'w') as snap_file:
+            snap_file.write('\n'.join(sorted(os.listdir(args[1]))))
+        if '-sort' in args:
+            with open(args[args.index('-sort') + 1]) as sort_file:
+                _FakeMksquashfs.sort_file = sort_file.read()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def wait(self):
+        return 0
+
+
+class SnapReuseTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.make_snapcraft_yaml(SnapCommandTestCase.yaml_template.format(
+            'app'))
+
+        patcher = mock.patch('snapcraft.internal.lifecycle.Popen',
+                             new=mock.Mock(wraps=_FakeMksquashfs))
+        self.popen_spy = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('os.isatty')
+        patcher.start().return_value = False
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('snapcraft.internal.lifecycle._report_packing')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(self.fake_logger)
+
+        main(['snap'])
+        self.assertThat('snap-test_1.0_amd64.snap.digest', FileExists())
+        self.popen_spy.reset_mock()
+
+    def test_unchanged_prime_reuses_snap(self):
+        main(['snap'])
+
+        self.popen_spy.assert_not_called()
+        self.assertThat(
+            self.fake_logger.output,
+            Contains('Skipping snap snap-test_1.0_amd64.snap '
+                     '(unchanged since last snapped)'))
+
+    def test_unchanged_prime_keeps_snap_build(self):
+        with open('snap-test_1.0_amd64.snap-build', 'w') as fd:
+            fd.write('signed assertion?')
+
+        main(['snap'])
+
+        self.assertThat(
+            'snap-test_1.0_amd64.snap-build',
+            FileContains('signed assertion?'))
+
+    def test_new_file_in_prime_repacks(self):
+        open(os.path.join(self.prime_dir, 'new-file'), 'w').close()
+
+        main(['snap'])
+
+        self.assertThat(self.popen_spy.call_count, Equals(1))
+        self.assertThat(
+            'snap-test_1.0_amd64.snap', FileContains(matcher=Contains(
+                'new-file')))
+
+    def test_modified_file_in_prime_repacks(self):
+        data_file = os.path.join(self.prime_dir, 'usr', 'data')
+        os.makedirs(os.path.dirname(data_file))
+        open(data_file, 'w').close()
+        main(['snap'])
+        self.popen_spy.reset_mock()
+
+        stat = os.stat(data_file)
+        os.utime(data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        main(['snap'])
+
+        self.assertThat(self.popen_spy.call_count, Equals(1))
+
+    def test_other_pack_profile_repacks(self):
+        main(['snap', '--pack-profile', 'fast'])
+
+        self.assertThat(self.popen_spy.call_count, Equals(1))
+
+    def test_modified_snap_repacks(self):
+        snap = 'snap-test_1.0_amd64.snap'
+        stat = os.stat(snap)
+        os.utime(snap, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        main(['snap'])
+
+        self.assertThat(self.popen_spy.call_count, Equals(1))
+
+    def test_failed_pack_forgets_digest(self):
+        self.popen_spy.side_effect = FileNotFoundError('mksquashfs')
+        open(os.path.join(self.prime_dir, 'new-file'), 'w').close()
+
+        self.assertRaises(SystemExit, main, ['snap'])
+
+        self.assertThat(
+            'snap-test_1.0_amd64.snap.digest', Not(FileExists()))
+
+    def test_sort_trace(self):
+        self.addCleanup(setattr, _FakeMksquashfs, 'sort_file', None)
+        os.makedirs(os.path.join(self.prime_dir, 'bin'))
+        open(os.path.join(self.prime_dir, 'bin', 'app'), 'w').close()
+        with open('startup.trace', 'w') as f:
+            f.write('$SNAP/bin/app\nmeta/snap.yaml\n')
+
+        main(['snap', '--sort-trace', 'startup.trace'])
+
+        self.assertThat(self.popen_spy.call_count, Equals(1))
+        self.assertThat(self.popen_spy.call_args[0][0], Contains('-sort'))
+        self.assertEqual(
+            '{} 32767\n{} 32766\n'.format(
+                os.path.join(self.prime_dir, 'bin', 'app'),
+                os.path.join(self.prime_dir, 'meta', 'snap.yaml')),
+            _FakeMksquashfs.sort_file)
+        self.assertThat(
+            self.fake_logger.output, Contains('Placing 2 startup files first'))
+
+    def test_changed_sort_trace_repacks(self):
+        with open('startup.trace', 'w') as f:
+            f.write('meta/snap.yaml\n')
+        main(['snap', '--sort-trace', 'startup.trace'])
+        self.popen_spy.reset_mock()
+
+        main(['snap', '--sort-trace', 'startup.trace'])
+        self.popen_spy.assert_not_called()
+
+        main(['snap'])
+        self.assertThat(self.popen_spy.call_count, Equals(1))
@@ -16,6 +16,7 @@
 
 from collections import OrderedDict
 from datetime import datetime
+import hashlib
 import json
 import logging
 import http.server
@@ -289,13 +290,20 @@ class FakeStoreUploadServer(http.server.HTTPServer):
     def __init__(self, server_address):
         super().__init__(
             server_address, FakeStoreUploadRequestHandler)
+        self.chunked_uploads = {}
+        self.failed_chunks = set()
 
 
 class FakeStoreUploadRequestHandler(BaseHTTPRequestHandler):
 
+    _CHUNKED_PATH = '/unscanned-upload/chunked/'
+
     def do_POST(self):
         parsed_path = urllib.parse.urlparse(self.path)
-        if parsed_path.path.startswith('/unscanned-upload/'):
+        if parsed_path.path.startswith(self._CHUNKED_PATH):
+            self._handle_chunked_post_request(
+                parsed_path.path[len(self._CHUNKED_PATH):])
+        elif parsed_path.path.startswith('/unscanned-upload/'):
             self._handle_upload_request()
         else:
             logger.error(
@@ -303,6 +311,29 @@ class FakeStoreUploadRequestHandler(BaseHTTPRequestHandler):
                     self.path))
             raise NotImplementedError(self.path)
 
+    def do_GET(self):
+        parsed_path = urllib.parse.urlparse(self.path)
+        if parsed_path.path.startswith(self._CHUNKED_PATH):
+            self._handle_received_chunks_request(
+                parsed_path.path[len(self._CHUNKED_PATH):].strip('/'))
+        else:
+            logger.error(
+                'Not implemented path in fake Store Upload server: {}'.format(
+                    self.path))
+            raise NotImplementedError(self.path)
+
+    def do_PUT(self):
+        parsed_path = urllib.parse.urlparse(self.path)
+        if parsed_path.path.startswith(self._CHUNKED_PATH):
+            upload_id, index = parsed_path.path[
+                len(self._CHUNKED_PATH):].split('/')
+            self._handle_chunk_request(upload_id, int(index))
+        else:
+            logger.error(
+                'Not implemented path in fake Store Upload server: {}'.format(
+                    self.path))
+            raise NotImplementedError(self.path)
+
     def _handle_upload_request(self):
         logger.info('Handling upload request')
         if 'UPDOWN_BROKEN' in os.environ:
@@ -318,6 +349,84 @@ class FakeStoreUploadRequestHandler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(response)
 
+    def _send_json(self, code, data):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode())
+
+    def _handle_chunked_post_request(self, path):
+        if 'UPDOWN_BROKEN' in os.environ:
+            self.send_response(500)
+            self.send_header('Content-Type', 'text/plain')
+            self.end_headers()
+            self.wfile.write(b'Broken')
+        elif 'UPDOWN_NO_CHUNKED' in os.environ:
+            self.send_response(404)
+            self.end_headers()
+        elif not path:
+            self._handle_start_chunked_request()
+        else:
+            upload_id, action = path.split('/')
+            if action != 'finish':
+                raise NotImplementedError(self.path)
+            self._handle_finish_chunked_request(upload_id)
+
+    def _handle_start_chunked_request(self):
+        string_data = self.rfile.read(
+            int(self.headers['Content-Length'])).decode('utf8')
+        data = json.loads(string_data)
+        logger.debug(
+            'Handling chunked upload request with content {}'.format(data))
+        upload_id = 'test-chunked-upload-id-{}'.format(
+            len(self.server.chunked_uploads))
+        self.server.chunked_uploads[upload_id] = {
+            'binary_filesize': data['binary_filesize'],
+            'chunk_size': data['chunk_size'],
+            'chunks': {},
+            'requests': [],
+        }
+        self._send_json(201, {'upload_id': upload_id})
+
+    def _handle_received_chunks_request(self, upload_id):
+        upload = self.server.chunked_uploads[upload_id]
+        self._send_json(200, {'received_chunks': sorted(upload['chunks'])})
+
+    def _handle_chunk_request(self, upload_id, index):
+        upload = self.server.chunked_uploads[upload_id]
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        upload['requests'].append(index)
+        # Fail the first attempt of every chunk to exercise retries.
+        if ('UPDOWN_FLAKY_CHUNKS' in os.environ and
+                (upload_id, index) not in self.server.failed_chunks):
+            self.server.failed_chunks.add((upload_id, index))
+            self.send_response(503)
+            self.send_header('Content-Type', 'text/plain')
+            self.end_headers()
+            self.wfile.write(b'Unavailable')
+            return
+        if 'UPDOWN_CORRUPT_CHUNKS' in os.environ:
+            data = data[::-1]
+        upload['chunks'][index] = data
+        self.send_response(200)
+        self.end_headers()
+
+    def _handle_finish_chunked_request(self, upload_id):
+        string_data = self.rfile.read(
+            int(self.headers['Content-Length'])).decode('utf8')
+        upload = self.server.chunked_uploads[upload_id]
+        content = b''.join(
+            upload['chunks'][index] for index in sorted(upload['chunks']))
+        if (len(content) != upload['binary_filesize'] or
+                json.loads(string_data)['sha512'] !=
+                hashlib.sha512(content).hexdigest()):
+            self.send_response(409)
+            self.send_header('Content-Type', 'text/plain')
+            self.end_headers()
+            self.wfile.write(b'Checksum mismatch')
+            return
+        self._send_json(200, {'upload_id': upload_id})
+
 
 class FakeStoreAPIServer(http.server.HTTPServer):
 
@@ -327,6 +436,7 @@ class FakeStoreAPIServer(http.server.HTTPServer):
         self.fake_store = fake_store
         self.account_keys = []
         self.registered_names = []
+        self.slow_scan_requests = 0
 
 
 class FakeStoreAPIRequestHandler(BaseHTTPRequestHandler):
@@ -630,6 +740,10 @@ class FakeStoreAPIRequestHandler(BaseHTTPRequestHandler):
         details_path = 'details/upload-id/good-snap'
         if data['name'] == 'test-review-snap':
             details_path = 'details/upload-id/review-snap'
+        elif data['name'] == 'test-slow-snap':
+            details_path = 'details/upload-id/slow-snap'
+        elif data['name'] == 'test-events-snap':
+            details_path = 'details/upload-id/events-snap'
         elif data['name'] == 'test-snap-unregistered':
             response_code = 404
 
@@ -739,6 +853,10 @@ class FakeStoreAPIRequestHandler(BaseHTTPRequestHandler):
             self._DEV_API_PATH, '/details/upload-id/good-snap')
         details_review = urllib.parse.urljoin(
             self._DEV_API_PATH, '/details/upload-id/review-snap')
+        details_slow = urllib.parse.urljoin(
+            self._DEV_API_PATH, '/details/upload-id/slow-snap')
+        details_events = urllib.parse.urljoin(
+            self._DEV_API_PATH, '/details/upload-id/events-snap')
         account_path = urllib.parse.urljoin(self._DEV_API_PATH, 'account')
         snap_path = urllib.parse.urljoin(self._DEV_API_PATH, 'snaps')
         good_validations_path = urllib.parse.urljoin(
@@ -754,6 +872,10 @@ class FakeStoreAPIRequestHandler(BaseHTTPRequestHandler):
             self._handle_scan_complete_request('ready_to_release', True)
         elif parsed_path.path.startswith(details_review):
             self._handle_scan_complete_request('need_manual_review', False)
+        elif parsed_path.path.startswith(details_slow):
+            self._handle_slow_scan_request()
+        elif parsed_path.path.startswith(details_events):
+            self._handle_scan_events_request()
         elif parsed_path.path == account_path:
             self._handle_account_request()
         elif parsed_path.path.startswith(good_validations_path):
@@ -846,6 +968,34 @@ class FakeStoreAPIRequestHandler(BaseHTTPRequestHandler):
         }
         self.wfile.write(json.dumps(response).encode())
 
+    def _handle_slow_scan_request(self):
+        logger.debug('Handling slow scan request')
+        self.server.slow_scan_requests += 1
+        if self.server.slow_scan_requests < 3:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Retry-After', '3')
+            self.end_headers()
+            response = {'code': 'being_processed', 'processed': False}
+            self.wfile.write(json.dumps(response).encode())
+        else:
+            self._handle_scan_complete_request('ready_to_release', True)
+
+    def _handle_scan_events_request(self):
+        logger.debug('Handling scan events request')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        events = [
+            {'code': 'being_processed', 'processed': False},
+            {'code': 'ready_to_release', 'url': '/dev/click-apps/5349/rev/1',
+             'can_release': True, 'revision': '1', 'processed': True},
+        ]
+        self.wfile.write(b': keep-alive\n\n')
+        for event in events:
+            self.wfile.write(
+                'data: {}\n\n'.format(json.dumps(event)).encode())
+
     def _handle_account_request(self):
         logger.debug('Handling account request')
         self.send_response(200)
@@ -1004,6 +1154,7 @@ class FakeStoreSearchServer(http.server.HTTPServer):
     def __init__(self, server_address):
         super().__init__(
             server_address, FakeStoreSearchRequestHandler)
+        self.download_ranges = []
 
 
 class FakeStoreSearchRequestHandler(BaseHTTPRequestHandler):
@@ -1078,13 +1229,30 @@ class FakeStoreSearchRequestHandler(BaseHTTPRequestHandler):
 
     def _handle_download_request(self, snap):
         logger.debug('Handling download request for snap {}'.format(snap))
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/octet-stream')
-        self.end_headers()
         # TODO create a test snap during the test instead of hardcoding it.
         # --elopio - 2016-05-01
         snap_path = os.path.join(
             os.path.dirname(snapcraft.tests.__file__), 'data',
             'test-snap.snap')
         with open(snap_path, 'rb') as snap_file:
-            self.wfile.write(snap_file.read())
+            data = snap_file.read()
+        byte_range = self.headers.get('Range')
+        self.server.download_ranges.append(byte_range)
+        if byte_range:
+            start = int(re.match(r'bytes=(\d+)-$', byte_range).group(1))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header(
+                    'Content-Range', 'bytes */{}'.format(len(data)))
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, len(data) - 1, len(data)))
+            data = data[start:]
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', len(data))
+        self.end_headers()
+        self.wfile.write(data)
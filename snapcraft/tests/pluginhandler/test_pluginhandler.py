@@ -1284,6 +1284,35 @@ class StateTestCase(StateBaseTestCase):
         self.assertTrue(type(state.project_options) is OrderedDict)
         self.assertEqual(0, len(state.project_options))
 
+    @patch('snapcraft.internal.pluginhandler._find_dependencies')
+    @patch('snapcraft.internal.pluginhandler.strip_files')
+    def test_prime_state_with_strip(self, mock_strip_files,
+                                    mock_find_dependencies):
+        mock_find_dependencies.return_value = set()
+        mock_strip_files.return_value = {'bin/1': 'key'}
+        self.handler = mocks.loadplugin(
+            'test_part',
+            part_properties={'strip': True, 'debug-symbols': 'split'})
+        self.handler.makedirs()
+
+        bindir = os.path.join(self.handler.code.installdir, 'bin')
+        os.makedirs(bindir)
+        open(os.path.join(bindir, '1'), 'w').close()
+
+        self.handler.mark_done('build')
+        self.handler.stage()
+        self.handler.prime()
+
+        mock_strip_files.assert_called_once_with(
+            self.handler.snapdir, {'bin/1'}, self.handler.stripdir,
+            debug_dir=self.handler.debugdir, jobs=2, tool_prefix='')
+
+        state = self.handler.get_state('prime')
+
+        self.assertEqual({'bin/1': 'key'}, state.stripped_files)
+        self.assertTrue(state.properties['strip'])
+        self.assertEqual('split', state.properties['debug-symbols'])
+
     @patch('snapcraft.internal.pluginhandler._find_dependencies')
     @patch('snapcraft.internal.pluginhandler._migrate_files')
     def test_prime_state_with_dependencies(self, mock_migrate_files,
@@ -2249,6 +2278,42 @@ class CollisionTestCase(tests.TestCase):
             "common which have different contents:\n    file.pc",
             raised.__str__())
 
+    def _make_bytecode(self, sources):
+        for part, source in zip((self.part1, self.part2), sources):
+            pycache = os.path.join(part.installdir, 'a', '__pycache__')
+            os.makedirs(pycache)
+            with open(os.path.join(pycache, 'm.cpython-35.pyc'), 'wb') as f:
+                f.write(part.name.encode())
+            if source is not None:
+                with open(os.path.join(part.installdir, 'a', 'm.py'),
+                          'w') as f:
+                    f.write(source)
+
+    def test_no_collisions_between_bytecode_of_same_source(self):
+        self._make_bytecode(['import os\n', 'import os\n'])
+
+        pluginhandler.check_for_collisions([self.part1, self.part2])
+
+    def test_collisions_between_bytecode_of_different_sources(self):
+        self._make_bytecode(['import os\n', 'import sys\n'])
+
+        raised = self.assertRaises(
+            SnapcraftPartConflictError,
+            pluginhandler.check_for_collisions,
+            [self.part1, self.part2])
+
+        self.assertIn('a/__pycache__/m.cpython-35.pyc', str(raised))
+
+    def test_collisions_between_bytecode_without_source(self):
+        self._make_bytecode([None, None])
+
+        raised = self.assertRaises(
+            SnapcraftPartConflictError,
+            pluginhandler.check_for_collisions,
+            [self.part1, self.part2])
+
+        self.assertIn('a/__pycache__/m.cpython-35.pyc', str(raised))
+
 
 class StagePackagesTestCase(tests.TestCase):
 
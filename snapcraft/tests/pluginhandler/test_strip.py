@@ -0,0 +1,134 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2017 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+from unittest import mock
+
+from testtools.matchers import FileContains, FileExists, Not
+
+from snapcraft.internal.pluginhandler._strip import strip_files
+from snapcraft import tests
+
+
+class _FakeMagic:
+
+    def load(self):
+        return 0
+
+    def file(self, path):
+        if b'/bin/' in path:
+            return 'ELF 64-bit LSB executable, x86-64, not stripped'
+        return 'ASCII text'
+
+
+def _fake_check_call(args):
+    # Enough of strip and objcopy to follow what was done to a file.
+    if args[1] == '--only-keep-debug':
+        with open(args[3], 'w') as f:
+            f.write('debug info')
+    elif args[1] == '--strip-unneeded':
+        shutil.copy(args[4], args[3])
+        with open(args[3], 'a') as f:
+            f.write(' stripped')
+
+
+class StripFilesTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        patcher = mock.patch('magic.open', return_value=_FakeMagic())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('subprocess.check_call',
+                             side_effect=_fake_check_call)
+        self.check_call_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        os.makedirs(os.path.join('root', 'bin'))
+        for path, content in (('bin/app', 'app'), ('README', 'README')):
+            with open(os.path.join('root', path), 'w') as f:
+                f.write(content)
+        os.chmod(os.path.join('root', 'bin', 'app'), 0o755)
+        os.link(os.path.join('root', 'bin', 'app'),
+                os.path.join('root', 'bin', 'app-alias'))
+        os.symlink('app', os.path.join('root', 'bin', 'app-link'))
+        self.files = {'bin/app', 'bin/app-alias', 'bin/app-link', 'README'}
+
+    def test_strip_files(self):
+        stripped_files = strip_files('root', self.files, 'cache', jobs=2)
+
+        self.assertEqual({'bin/app', 'bin/app-alias'}, set(stripped_files))
+        self.assertEqual(1, self.check_call_mock.call_count)
+        app = os.path.join('root', 'bin', 'app')
+        self.assertThat(app, FileContains('app stripped'))
+        self.assertThat(app, tests.IsExecutable())
+        self.assertTrue(os.path.samefile(
+            app, os.path.join('root', 'bin', 'app-alias')))
+        self.assertThat(os.path.join('root', 'README'),
+                        FileContains('README'))
+
+    def test_strip_files_does_not_change_the_source(self):
+        os.link(os.path.join('root', 'bin', 'app'), 'staged-app')
+
+        strip_files('root', self.files, 'cache')
+
+        self.assertThat('staged-app', FileContains('app'))
+
+    def test_unchanged_files_are_not_stripped_again(self):
+        os.link(os.path.join('root', 'bin', 'app'), 'staged-app')
+        stripped_files = strip_files('root', self.files, 'cache')
+
+        # Prime again from the same source file.
+        for name in ('app', 'app-alias'):
+            path = os.path.join('root', 'bin', name)
+            os.remove(path)
+            os.link('staged-app', path)
+        self.check_call_mock.reset_mock()
+
+        self.assertEqual(stripped_files,
+                         strip_files('root', self.files, 'cache'))
+        self.assertFalse(self.check_call_mock.called)
+        self.assertThat(os.path.join('root', 'bin', 'app'),
+                        FileContains('app stripped'))
+
+    def test_stale_cache_entries_are_removed(self):
+        old_key = strip_files('root', self.files, 'cache')['bin/app']
+
+        for name in ('app', 'app-alias'):
+            os.remove(os.path.join('root', 'bin', name))
+        with open(os.path.join('root', 'bin', 'app'), 'w') as f:
+            f.write('new app')
+        new_key = strip_files('root', self.files, 'cache')['bin/app']
+
+        self.assertNotEqual(old_key, new_key)
+        self.assertEqual([new_key], os.listdir('cache'))
+
+    def test_split_debug(self):
+        strip_files('root', self.files, 'cache', debug_dir='debug',
+                    tool_prefix='arm-linux-gnueabihf-')
+
+        self.assertThat(os.path.join('debug', 'bin', 'app.debug'),
+                        FileContains('debug info'))
+        self.assertThat(os.path.join('debug', 'README.debug'),
+                        Not(FileExists()))
+        tools = [c[0][0][0] for c in self.check_call_mock.call_args_list]
+        self.assertEqual(['arm-linux-gnueabihf-objcopy',
+                          'arm-linux-gnueabihf-strip',
+                          'arm-linux-gnueabihf-objcopy'], tools)
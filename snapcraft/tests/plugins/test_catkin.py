@@ -14,11 +14,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import builtins
 import os
 import os.path
 import subprocess
 import shutil
+import time
 
 from unittest import mock
 import testtools
@@ -262,7 +262,8 @@ class CatkinPluginTestCase(tests.TestCase):
         self.verify_rosdep_setup(
             self.properties.rosdistro,
             os.path.join(plugin.sourcedir, 'src'),
-            os.path.join(plugin.partdir, 'rosdep'),
+            os.path.join(self.path, '.cache', 'snapcraft', 'rosdep',
+                         'indigo-trusty'),
             plugin.PLUGIN_STAGE_SOURCES)
 
         # Verify that dependencies were found as expected. TODO: Would really
@@ -293,7 +294,8 @@ class CatkinPluginTestCase(tests.TestCase):
         self.verify_rosdep_setup(
             self.properties.rosdistro,
             os.path.join(plugin.sourcedir, 'src'),
-            os.path.join(plugin.partdir, 'rosdep'),
+            os.path.join(self.path, '.cache', 'snapcraft', 'rosdep',
+                         'indigo-trusty'),
             plugin.PLUGIN_STAGE_SOURCES)
 
         # Verify that dependencies were found as expected. TODO: Would really
@@ -346,7 +348,8 @@ class CatkinPluginTestCase(tests.TestCase):
         self.verify_rosdep_setup(
             self.properties.rosdistro,
             os.path.join(plugin.sourcedir, 'src'),
-            os.path.join(plugin.partdir, 'rosdep'),
+            os.path.join(self.path, '.cache', 'snapcraft', 'rosdep',
+                         'indigo-trusty'),
             plugin.PLUGIN_STAGE_SOURCES)
 
         # Verify that roscore was installed
@@ -382,7 +385,8 @@ class CatkinPluginTestCase(tests.TestCase):
         os.makedirs(plugin._rosdep_path)
 
         plugin.clean_pull()
-        self.assertFalse(os.path.exists(plugin._rosdep_path))
+        # rosdep is shared by every part.
+        self.assertTrue(os.path.exists(plugin._rosdep_path))
 
     def test_valid_catkin_workspace_src(self):
         # sourcedir is expected to be the root of the Catkin workspace. Since
@@ -584,18 +588,17 @@ class CatkinPluginTestCase(tests.TestCase):
                                      self.project_options)
         os.makedirs(plugin.rosdir)
 
-        # Place a file to be discovered by _use_in_snap_python().
-        open(os.path.join(plugin.rosdir, 'foo'), 'w').close()
+        # Place binary files to be discovered by _use_in_snap_python().
+        contents = [b'#!/usr/bin/python\0foo', b'#!/usr/bin/python\xff']
+        for i, content in enumerate(contents):
+            with open(os.path.join(plugin.rosdir, str(i)), 'wb') as f:
+                f.write(content)
 
-        file_mock = mock.mock_open()
-        with mock.patch.object(builtins, 'open', file_mock):
-            # Reading a binary file may throw a UnicodeDecodeError. Make sure
-            # that's handled.
-            file_mock.return_value.read.side_effect = UnicodeDecodeError(
-                'foo', b'bar', 1, 2, 'baz')
-            # An exception will be raised if the function can't handle the
-            # binary file.
-            plugin._use_in_snap_python()
+        plugin._use_in_snap_python()
+
+        for i, content in enumerate(contents):
+            with open(os.path.join(plugin.rosdir, str(i)), 'rb') as f:
+                self.assertEqual(f.read(), content)
 
     def test_use_in_snap_python_rewrites_10_ros_sh(self):
         plugin = catkin.CatkinPlugin('test-part', self.properties,
@@ -617,8 +620,7 @@ class CatkinPluginTestCase(tests.TestCase):
                              'The absolute path to python was not replaced as '
                              'expected')
 
-    @mock.patch.object(catkin.CatkinPlugin, '_use_in_snap_python')
-    def test_prepare_build(self, use_in_snap_python_mock):
+    def test_prepare_build(self):
         plugin = catkin.CatkinPlugin('test-part', self.properties,
                                      self.project_options)
         os.makedirs(os.path.join(plugin.rosdir, 'test'))
@@ -651,6 +653,11 @@ class CatkinPluginTestCase(tests.TestCase):
                 'path': 'test/installedConfig.cmake',
                 'contents': '"{}/foo"'.format(plugin.installdir),
                 'expected': '"{}/foo"'.format(plugin.installdir),
+            },
+            {
+                'path': 'test/script',
+                'contents': '#!/usr/bin/python\n"/usr/lib/foo"',
+                'expected': '#!/usr/bin/env python\n"/usr/lib/foo"',
             }
         ]
 
@@ -661,8 +668,6 @@ class CatkinPluginTestCase(tests.TestCase):
 
         plugin._prepare_build()
 
-        self.assertTrue(use_in_snap_python_mock.called)
-
         for file_info in files:
             path = os.path.join(plugin.rosdir, file_info['path'])
             with open(path, 'r') as f:
@@ -744,48 +749,45 @@ class FindSystemDependenciesTestCase(tests.TestCase):
 
     def test_find_system_dependencies_system_only(self):
         rosdep_mock = mock.MagicMock()
-        rosdep_mock.get_dependencies.return_value = ['bar']
-        rosdep_mock.resolve_dependency.return_value = ['baz']
+        rosdep_mock.get_all_dependencies.return_value = ['bar']
+        rosdep_mock.resolve_dependencies.return_value = {'bar': ['baz']}
 
         self.assertEqual({'baz'}, catkin._find_system_dependencies(
             {'foo'}, rosdep_mock))
 
-        rosdep_mock.get_dependencies.assert_called_once_with('foo')
-        rosdep_mock.resolve_dependency.assert_called_once_with('bar')
+        rosdep_mock.get_all_dependencies.assert_called_once_with({'foo'})
+        rosdep_mock.resolve_dependencies.assert_called_once_with({'bar'})
 
     def test_find_system_dependencies_local_only(self):
         rosdep_mock = mock.MagicMock()
-        rosdep_mock.get_dependencies.return_value = ['bar']
+        rosdep_mock.get_all_dependencies.return_value = ['bar']
+        rosdep_mock.resolve_dependencies.return_value = {}
 
         self.assertEqual(set(), catkin._find_system_dependencies(
             {'foo', 'bar'}, rosdep_mock))
 
-        rosdep_mock.get_dependencies.assert_has_calls([mock.call('foo'),
-                                                       mock.call('bar')],
-                                                      any_order=True)
-        rosdep_mock.resolve_dependency.assert_not_called()
+        rosdep_mock.get_all_dependencies.assert_called_once_with(
+            {'foo', 'bar'})
+        rosdep_mock.resolve_dependencies.assert_called_once_with(set())
 
     def test_find_system_dependencies_mixed(self):
         rosdep_mock = mock.MagicMock()
-        rosdep_mock.get_dependencies.return_value = ['bar', 'baz']
-        rosdep_mock.resolve_dependency.return_value = ['qux']
+        rosdep_mock.get_all_dependencies.return_value = ['bar', 'baz']
+        rosdep_mock.resolve_dependencies.return_value = {'baz': ['qux']}
 
         self.assertEqual({'qux'}, catkin._find_system_dependencies(
             {'foo', 'bar'}, rosdep_mock))
 
-        rosdep_mock.get_dependencies.assert_has_calls([mock.call('foo'),
-                                                       mock.call('bar')],
-                                                      any_order=True)
-        rosdep_mock.resolve_dependency.assert_called_once_with('baz')
+        rosdep_mock.resolve_dependencies.assert_called_once_with({'baz'})
 
     def test_find_system_dependencies_missing_local_dependency(self):
         rosdep_mock = mock.MagicMock()
 
         # Setup a dependency on a non-existing package, and it doesn't resolve
         # to a system dependency.'
-        rosdep_mock.get_dependencies.return_value = ['bar']
-        exception = catkin.SystemDependencyNotFound('foo')
-        rosdep_mock.resolve_dependency.side_effect = exception
+        rosdep_mock.get_all_dependencies.return_value = ['bar']
+        exception = catkin.SystemDependencyNotFound('bar')
+        rosdep_mock.resolve_dependencies.side_effect = exception
 
         raised = self.assertRaises(
             RuntimeError,
@@ -931,6 +933,128 @@ class RosdepTestCase(tests.TestCase):
         self.assertEqual(self.rosdep.resolve_dependency('foo'),
                          ['lib1', 'lib2'])
 
+    def test_setup_uses_recent_database(self):
+        self.check_output_mock.return_value = b''
+        self.rosdep.setup()
+        self.ubuntu_mock.reset_mock()
+        self.check_output_mock.reset_mock()
+
+        self.rosdep.setup()
+
+        self.assertFalse(self.ubuntu_mock.called)
+        self.assertFalse(self.check_output_mock.called)
+
+    def test_setup_updates_old_database(self):
+        self.check_output_mock.return_value = b''
+        self.rosdep.setup()
+        expired = time.time() - catkin._ROSDEP_DATABASE_MAX_AGE - 1
+        os.utime(self.rosdep._updated_stamp, (expired, expired))
+        self.ubuntu_mock.reset_mock()
+        self.check_output_mock.reset_mock()
+
+        self.rosdep.setup()
+
+        # rosdep itself is still installed.
+        self.assertFalse(self.ubuntu_mock.called)
+        self.check_output_mock.assert_has_calls([
+            mock.call(['rosdep', 'init'], env=mock.ANY),
+            mock.call(['rosdep', 'update'], env=mock.ANY)
+        ])
+
+    def test_get_all_dependencies(self):
+        self.check_output_mock.return_value = b'foo\nbar\nbaz'
+
+        self.assertEqual(
+            self.rosdep.get_all_dependencies({'package2', 'package1'}),
+            ['foo', 'bar', 'baz'])
+
+        self.check_output_mock.assert_called_once_with(
+            ['rosdep', 'keys', 'package1', 'package2'], env=mock.ANY)
+
+    def test_get_all_dependencies_without_packages(self):
+        self.check_output_mock.side_effect = subprocess.CalledProcessError(
+            1, 'rosdep')
+
+        self.assertEqual([], self.rosdep.get_all_dependencies(set()))
+        # A part only including roscore has no system dependencies.
+        self.assertEqual(
+            set(), catkin._find_system_dependencies(set(), self.rosdep))
+
+        self.assertFalse(self.check_output_mock.called)
+
+    def test_get_all_dependencies_invalid_package(self):
+        def run(args, **kwargs):
+            if 'bar' in args:
+                raise subprocess.CalledProcessError(1, 'foo')
+            return b''
+
+        self.check_output_mock.side_effect = run
+
+        raised = self.assertRaises(
+            FileNotFoundError,
+            self.rosdep.get_all_dependencies, ['foo', 'bar'])
+
+        self.assertEqual(str(raised),
+                         'Unable to find Catkin package "bar"')
+
+    def test_resolve_dependencies_in_one_query(self):
+        self.check_output_mock.return_value = (
+            b'#ROSDEP[foo]\n#apt\nlib3\n'
+            b'#ROSDEP[bar]\n#apt\nlib1 lib2\n'
+            b'#ROSDEP[baz]\n#apt\n\n')
+
+        self.assertEqual(
+            self.rosdep.resolve_dependencies(['foo', 'bar', 'baz']),
+            {'foo': ['lib3'], 'bar': ['lib1', 'lib2'], 'baz': []})
+
+        self.check_output_mock.assert_called_once_with(
+            ['rosdep', 'resolve', 'bar', 'baz', 'foo', '--rosdistro',
+             'kinetic', '--os', 'ubuntu:xenial'],
+            env=mock.ANY)
+
+    def test_resolve_dependencies_cached(self):
+        self.check_output_mock.return_value = (
+            b'#ROSDEP[bar]\n#apt\nlib1\n#ROSDEP[foo]\n#apt\nlib2\n')
+        self.rosdep.resolve_dependencies(['foo', 'bar'])
+        self.check_output_mock.reset_mock()
+        self.check_output_mock.return_value = b'#apt\nlib3'
+
+        rosdep = catkin._Rosdep('kinetic', 'package_path', 'rosdep_path',
+                                'sources', self.project)
+        self.assertEqual(rosdep.resolve_dependencies(['foo', 'baz']),
+                         {'foo': ['lib2'], 'baz': ['lib3']})
+
+        self.check_output_mock.assert_called_once_with(
+            ['rosdep', 'resolve', 'baz', '--rosdistro', 'kinetic', '--os',
+             'ubuntu:xenial'],
+            env=mock.ANY)
+
+    def test_resolve_dependencies_unexpected_output(self):
+        def run(args, **kwargs):
+            if 'foo' in args and 'bar' in args:
+                return b'#ROSDEP[foo]\n#apt\nlib1\n'
+            return b'#apt\nlib2'
+
+        self.check_output_mock.side_effect = run
+
+        self.assertEqual(self.rosdep.resolve_dependencies(['foo', 'bar']),
+                         {'foo': ['lib2'], 'bar': ['lib2']})
+        self.assertEqual(self.check_output_mock.call_count, 3)
+
+    def test_resolve_dependencies_invalid_dependency(self):
+        def run(args, **kwargs):
+            if 'bar' in args:
+                raise subprocess.CalledProcessError(1, 'foo')
+            return b'#apt\nlib1'
+
+        self.check_output_mock.side_effect = run
+
+        raised = self.assertRaises(
+            catkin.SystemDependencyNotFound,
+            self.rosdep.resolve_dependencies, ['foo', 'bar'])
+
+        self.assertEqual(raised.dependency_name, 'bar')
+
     def test_run(self):
         rosdep = self.rosdep
         rosdep._run(['qux'])
@@ -16,6 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import shutil
 
 from unittest import mock
 from testtools.matchers import HasLength
@@ -33,6 +34,7 @@ class CMakeTestCase(tests.TestCase):
         class Options:
             configflags = []
             source_subdir = None
+            cmake_generator = 'Unix Makefiles'
 
             # inherited from MakePlugin
             makefile = None
@@ -54,7 +56,7 @@ class CMakeTestCase(tests.TestCase):
         self.addCleanup(patcher.stop)
 
     def test_get_build_properties(self):
-        expected_build_properties = ['configflags']
+        expected_build_properties = ['configflags', 'cmake-generator']
         resulting_build_properties = cmake.CMakePlugin.get_build_properties()
         expected_build_properties.extend(
             snapcraft.plugins.make.MakePlugin.get_build_properties())
@@ -71,12 +73,12 @@ class CMakeTestCase(tests.TestCase):
         plugin.build()
 
         self.run_mock.assert_has_calls([
-            mock.call(['cmake', plugin.sourcedir, '-DCMAKE_INSTALL_PREFIX='],
-                      cwd=plugin.builddir, env=mock.ANY),
-            mock.call(['make', '-j2'], cwd=plugin.builddir, env=mock.ANY),
-            mock.call(['make', 'install',
-                       'DESTDIR={}'.format(plugin.installdir)],
-                      cwd=plugin.builddir, env=mock.ANY)])
+            mock.call(['cmake', plugin.sourcedir, '-G', 'Unix Makefiles',
+                       '-DCMAKE_INSTALL_PREFIX='],
+                      cwd=plugin.cmake_builddir, env=mock.ANY),
+            mock.call(['cmake', '--build', '.', '--target', 'install', '--',
+                       '-j2'],
+                      cwd=plugin.cmake_builddir, env=mock.ANY)])
 
     def test_build_referencing_sourcedir_with_subdir(self):
         self.options.source_subdir = 'subdir'
@@ -89,12 +91,122 @@ class CMakeTestCase(tests.TestCase):
         sourcedir = os.path.join(
             plugin.sourcedir, plugin.options.source_subdir)
         self.run_mock.assert_has_calls([
-            mock.call(['cmake', sourcedir, '-DCMAKE_INSTALL_PREFIX='],
-                      cwd=plugin.builddir, env=mock.ANY),
-            mock.call(['make', '-j2'], cwd=plugin.builddir, env=mock.ANY),
-            mock.call(['make', 'install',
-                       'DESTDIR={}'.format(plugin.installdir)],
-                      cwd=plugin.builddir, env=mock.ANY)])
+            mock.call(['cmake', sourcedir, '-G', 'Unix Makefiles',
+                       '-DCMAKE_INSTALL_PREFIX='],
+                      cwd=plugin.cmake_builddir, env=mock.ANY),
+            mock.call(['cmake', '--build', '.', '--target', 'install', '--',
+                       '-j2'],
+                      cwd=plugin.cmake_builddir, env=mock.ANY)])
+
+    def test_build_with_ninja(self):
+        self.options.cmake_generator = 'Ninja'
+        self.options.make_parameters = ['V=1']
+
+        plugin = cmake.CMakePlugin('test-part', self.options,
+                                   self.project_options)
+        os.makedirs(plugin.builddir)
+        plugin.build()
+
+        self.assertIn('ninja-build', plugin.build_packages)
+        self.run_mock.assert_has_calls([
+            mock.call(['cmake', plugin.sourcedir, '-G', 'Ninja',
+                       '-DCMAKE_INSTALL_PREFIX='],
+                      cwd=plugin.cmake_builddir, env=mock.ANY),
+            mock.call(['cmake', '--build', '.', '--target', 'install', '--',
+                       '-j2'],
+                      cwd=plugin.cmake_builddir, env=mock.ANY)])
+
+    def test_build_with_make_install_var(self):
+        self.options.make_install_var = 'PREFIX'
+
+        plugin = cmake.CMakePlugin('test-part', self.options,
+                                   self.project_options)
+        os.makedirs(plugin.builddir)
+        plugin.build()
+
+        self.run_mock.assert_called_with(
+            ['cmake', '--build', '.', '--target', 'install', '--', '-j2',
+             'PREFIX={}'.format(plugin.installdir)],
+            cwd=plugin.cmake_builddir, env=mock.ANY)
+        self.assertNotIn('DESTDIR', self.run_mock.call_args[1]['env'])
+
+    def test_make_install_var_unsupported_with_ninja(self):
+        self.options.cmake_generator = 'Ninja'
+        self.options.make_install_var = 'PREFIX'
+
+        raised = self.assertRaises(
+            EnvironmentError, cmake.CMakePlugin, 'test-part', self.options,
+            self.project_options)
+
+        self.assertEqual(
+            "make-install-var 'PREFIX' cannot be used with the Ninja "
+            "generator, only DESTDIR is supported.", str(raised))
+
+    def test_build_with_artifacts(self):
+        self.options.artifacts = ['bin/hello']
+        self.options.make_parameters = ['V=1']
+
+        def build(command, cwd, env):
+            if command[1] == '--build':
+                os.makedirs(os.path.join(cwd, 'bin'))
+                open(os.path.join(cwd, 'bin', 'hello'), 'w').close()
+        self.run_mock.side_effect = build
+
+        plugin = cmake.CMakePlugin('test-part', self.options,
+                                   self.project_options)
+        os.makedirs(plugin.builddir)
+        plugin.build()
+
+        self.run_mock.assert_called_with(
+            ['cmake', '--build', '.', '--', '-j2', 'V=1'],
+            cwd=plugin.cmake_builddir, env=mock.ANY)
+        self.assertTrue(os.path.isfile(
+            os.path.join(plugin.installdir, 'bin', 'hello')))
+        self.assertTrue(os.path.isfile(
+            os.path.join(plugin.builddir, 'bin', 'hello')))
+
+    def test_build_keeps_build_tree(self):
+        plugin = cmake.CMakePlugin('test-part', self.options,
+                                   self.project_options)
+        os.makedirs(plugin.builddir)
+        plugin.build()
+        object_path = os.path.join(plugin.cmake_builddir, 'hello.o')
+        open(object_path, 'w').close()
+        # The build directory is recreated for every build.
+        shutil.rmtree(plugin.builddir)
+        os.makedirs(plugin.builddir)
+
+        plugin.build()
+
+        self.assertTrue(os.path.exists(object_path))
+        self.assertTrue(os.path.exists(
+            os.path.join(plugin.builddir, 'hello.o')))
+
+    def test_build_starts_over_when_configuration_changes(self):
+        plugin = cmake.CMakePlugin('test-part', self.options,
+                                   self.project_options)
+        os.makedirs(plugin.builddir)
+        plugin.build()
+        object_path = os.path.join(plugin.cmake_builddir, 'hello.o')
+        open(object_path, 'w').close()
+        # The build directory is recreated for every build.
+        shutil.rmtree(plugin.builddir)
+        os.makedirs(plugin.builddir)
+
+        self.options.configflags = ['-DDEBUG=ON']
+        plugin.build()
+
+        self.assertFalse(os.path.exists(object_path))
+
+    def test_clean_pull_removes_build_tree(self):
+        plugin = cmake.CMakePlugin('test-part', self.options,
+                                   self.project_options)
+        os.makedirs(plugin.builddir)
+        plugin.build()
+
+        plugin.clean_pull()
+
+        self.assertFalse(os.path.exists(plugin.cmake_builddir))
 
     def test_build_environment(self):
         plugin = cmake.CMakePlugin('test-part', self.options,
@@ -117,7 +229,9 @@ class CMakeTestCase(tests.TestCase):
                  self.stage_dir,
                  plugin.project.arch_triplet)
 
-        self.assertEqual(3, self.run_mock.call_count)
+        expected['DESTDIR'] = plugin.installdir
+
+        self.assertEqual(2, self.run_mock.call_count)
         for call_args in self.run_mock.call_args_list:
             environment = call_args[1]['env']
             for variable, value in expected.items():
@@ -15,6 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import time
 
 from unittest import mock
 from testtools.matchers import HasLength
@@ -35,6 +36,11 @@ class GoPluginTestCase(tests.TestCase):
         self.run_mock = patcher.start()
         self.addCleanup(patcher.stop)
 
+        patcher = mock.patch('snapcraft.internal.common.run_output')
+        self.run_output_mock = patcher.start()
+        self.run_output_mock.return_value = ''
+        self.addCleanup(patcher.stop)
+
         patcher = mock.patch('sys.stdout')
         patcher.start()
         self.addCleanup(patcher.stop)
@@ -186,6 +192,36 @@ class GoPluginTestCase(tests.TestCase):
         self.assertTrue(os.path.exists(plugin._gopath_src))
         self.assertFalse(os.path.exists(plugin._gopath_bin))
 
+    def test_pull_shares_repositories_through_the_cache(self):
+        class Options:
+            source = None
+            go_packages = ['github.com/foo/cmd']
+            go_importpath = ''
+
+        cache = go.GoCache()
+        _make_repository(os.path.join(cache.gopath, 'src'),
+                         'github.com/foo/cached')
+
+        plugin = go.GoPlugin('test-part', Options(), self.project_options)
+        os.makedirs(plugin.sourcedir)
+
+        def fake_go_get(cmd, cwd, env):
+            _make_repository(plugin._gopath_src, 'github.com/foo/cmd')
+
+        self.run_mock.side_effect = fake_go_get
+        self.run_output_mock.return_value = (
+            'github.com/foo/cmd github.com/foo/cached/sub fmt')
+
+        plugin.pull()
+
+        self.run_output_mock.assert_called_once_with(
+            ['go', 'list', '-e', '-f', mock.ANY, 'github.com/foo/cmd'],
+            cwd=plugin._gopath_src, env=mock.ANY)
+        self.assertTrue(os.path.exists(os.path.join(
+            plugin._gopath_src, 'github.com', 'foo', 'cached', 'main.go')))
+        self.assertTrue(os.path.exists(os.path.join(
+            cache.gopath, 'src', 'github.com', 'foo', 'cmd', 'main.go')))
+
     def test_no_local_source_with_go_packages(self):
         class Options:
             source = None
@@ -404,7 +440,9 @@ class GoPluginTestCase(tests.TestCase):
             env = call_args[1]['env']
             self.assertTrue(
                 'GOPATH' in env, 'Expected environment to include GOPATH')
-            self.assertEqual(env['GOPATH'], plugin._gopath)
+            self.assertEqual(
+                env['GOPATH'], '{}:{}'.format(plugin._gopath,
+                                              go.GoCache().gopath))
 
             self.assertTrue(
                 'CGO_LDFLAGS' in env,
@@ -445,3 +483,97 @@ class GoPluginTestCase(tests.TestCase):
             ['go', 'install',
              '-tags=testbuildtag1,testbuildtag2', './dir/...'],
             cwd=plugin._gopath_src, env=mock.ANY)
+
+
+class GoCacheTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('sys.stdout')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.cache = go.GoCache()
+        self.cache_src = os.path.join(self.cache.gopath, 'src')
+        self.gopath_src = os.path.join(self.path, 'go', 'src')
+
+    def test_link_repositories(self):
+        _make_repository(self.cache_src, 'golang.org/x/net')
+        _make_repository(self.cache_src, 'golang.org/x/text')
+
+        self.cache.link_repositories(
+            self.gopath_src, ['golang.org/x/net/context',
+                              'golang.org/x/net/http2', 'os'])
+
+        self.assertTrue(os.path.exists(os.path.join(
+            self.gopath_src, 'golang.org', 'x', 'net', 'main.go')))
+        self.assertFalse(os.path.exists(os.path.join(
+            self.gopath_src, 'golang.org', 'x', 'text')))
+        self.assertEqual(1, self.cache.hits)
+
+    def test_add_repositories_skips_cached_and_linked(self):
+        _make_repository(self.cache_src, 'github.com/foo/cached')
+        _make_repository(self.gopath_src, 'github.com/foo/cached')
+        _make_repository(self.gopath_src, 'github.com/foo/new')
+        os.makedirs(os.path.join(self.path, 'local'))
+        os.symlink(os.path.join(self.path, 'local'),
+                   os.path.join(self.gopath_src, 'local'))
+        _make_repository(self.path, 'local')
+
+        self.cache.add_repositories(self.gopath_src)
+
+        self.assertEqual(1, self.cache.misses)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.cache_src, 'github.com', 'foo', 'new', 'main.go')))
+        self.assertFalse(os.path.exists(os.path.join(
+            self.cache_src, 'local')))
+
+    def test_link_repositories_copies_vcs_metadata(self):
+        _make_repository(self.cache_src, 'golang.org/x/net')
+        cached = os.path.join(self.cache_src, 'golang.org', 'x', 'net')
+        open(os.path.join(cached, '.git', 'FETCH_HEAD'), 'w').close()
+        fetched = time.time() - self.cache.max_age + 60
+        os.utime(cached, (fetched, fetched))
+
+        self.cache.link_repositories(self.gopath_src, ['golang.org/x/net'])
+
+        linked = os.path.join(self.gopath_src, 'golang.org', 'x', 'net')
+        self.assertTrue(os.path.samefile(
+            os.path.join(cached, 'main.go'),
+            os.path.join(linked, 'main.go')))
+        self.assertFalse(os.path.samefile(
+            os.path.join(cached, '.git', 'FETCH_HEAD'),
+            os.path.join(linked, '.git', 'FETCH_HEAD')))
+        # Using a repository does not delay its refresh.
+        self.assertEqual(fetched, os.stat(cached).st_mtime)
+
+    def test_add_repositories_records_fetch_time(self):
+        _make_repository(self.gopath_src, 'github.com/foo/new')
+        repository = os.path.join(self.gopath_src, 'github.com', 'foo', 'new')
+        expired = time.time() - self.cache.max_age - 1
+        os.utime(repository, (expired, expired))
+
+        self.cache.add_repositories(self.gopath_src)
+        self.cache.prune()
+
+        self.assertTrue(os.path.exists(os.path.join(
+            self.cache_src, 'github.com', 'foo', 'new')))
+
+    def test_prune_evicts_old_repositories(self):
+        _make_repository(self.cache_src, 'github.com/foo/old')
+        _make_repository(self.cache_src, 'github.com/foo/recent')
+        old_repository = os.path.join(self.cache_src, 'github.com/foo/old')
+        expired = time.time() - self.cache.max_age - 1
+        os.utime(old_repository, (expired, expired))
+
+        self.cache.prune()
+
+        self.assertFalse(os.path.exists(old_repository))
+        self.assertTrue(os.path.exists(os.path.join(
+            self.cache_src, 'github.com', 'foo', 'recent')))
+
+
+def _make_repository(gopath_src, repository):
+    path = os.path.join(gopath_src, repository)
+    os.makedirs(os.path.join(path, '.git'), exist_ok=True)
+    open(os.path.join(path, 'main.go'), 'w').close()
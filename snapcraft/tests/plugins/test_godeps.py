@@ -143,11 +143,17 @@ class GodepsPluginTestCase(tests.TestCase):
         plugin.pull()
 
         self.assertEqual(2, self.run_mock.call_count)
-        for call_args in self.run_mock.call_args_list:
+        # godeps itself is looked up in the cache too.
+        expected_gopaths = [
+            '{}:{}'.format(plugin._gopath, godeps.go.GoCache().gopath),
+            plugin._gopath,
+        ]
+        for call_args, expected_gopath in zip(
+                self.run_mock.call_args_list, expected_gopaths):
             env = call_args[1]['env']
             self.assertTrue(
                 'GOPATH' in env, 'Expected environment to include GOPATH')
-            self.assertEqual(env['GOPATH'], plugin._gopath)
+            self.assertEqual(env['GOPATH'], expected_gopath)
 
             self.assertTrue(
                 'PATH' in env, 'Expected environment to include PATH')
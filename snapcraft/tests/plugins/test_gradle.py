@@ -15,6 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import shutil
 from unittest import mock
 
 import fixtures
@@ -33,7 +34,16 @@ class BaseGradlePluginTestCase(tests.TestCase):
         class Options:
             gradle_options = []
             gradle_output_dir = 'build/libs'
+            gradle_offline = False
+            gradle_daemon = False
+            gradle_build_cache = False
         self.options = Options()
+        self.gradle_user_home = os.path.join(
+            self.path, '.cache', 'snapcraft', 'gradle')
+        # Keep the user's own gradle configuration out of the tests.
+        self.useFixture(fixtures.EnvironmentVariable(
+            'HOME', os.path.join(self.path, 'home')))
+        self.useFixture(fixtures.EnvironmentVariable('GRADLE_USER_HOME'))
 
         self.project_options = snapcraft.ProjectOptions()
 
@@ -88,7 +98,9 @@ class GradlePluginTestCase(BaseGradlePluginTestCase):
                          'but it was "{}"'.format(output_dir['type']))
 
     def test_get_build_properties(self):
-        expected_build_properties = ['gradle-options', 'gradle-output-dir']
+        expected_build_properties = ['gradle-options', 'gradle-output-dir',
+                                     'gradle-offline', 'gradle-daemon',
+                                     'gradle-build-cache']
         resulting_build_properties = gradle.GradlePlugin.get_build_properties()
 
         self.assertThat(resulting_build_properties,
@@ -117,9 +129,91 @@ class GradlePluginTestCase(BaseGradlePluginTestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['./gradlew', 'jar']),
+            mock.call(['./gradlew',
+                       '--gradle-user-home', self.gradle_user_home, 'jar']),
         ])
 
+    @mock.patch.object(gradle.GradlePlugin, 'run')
+    def test_build_mirrors_user_configuration(self, run_mock):
+        user_gradle_home = os.path.join(self.path, 'home', '.gradle')
+        os.makedirs(os.path.join(user_gradle_home, 'init.d'))
+        with open(os.path.join(user_gradle_home, 'gradle.properties'),
+                  'w') as f:
+            f.write('repoPassword=secret\n')
+        open(os.path.join(user_gradle_home, 'init.d', 'repos.gradle'),
+             'w').close()
+        # Left over from a previous build, no longer in the user home.
+        os.makedirs(self.gradle_user_home)
+        open(os.path.join(self.gradle_user_home, 'init.gradle'), 'w').close()
+
+        plugin = gradle.GradlePlugin('test-part', self.options,
+                                     self.project_options)
+
+        def side(l):
+            os.makedirs(os.path.join(plugin.builddir, 'build', 'libs'))
+            open(os.path.join(plugin.builddir, 'build', 'libs', 'dummy.jar'),
+                 'w').close()
+
+        run_mock.side_effect = side
+        os.makedirs(plugin.sourcedir)
+
+        plugin.build()
+
+        with open(os.path.join(self.gradle_user_home,
+                               'gradle.properties')) as f:
+            self.assertEqual('repoPassword=secret\n', f.read())
+        self.assertTrue(os.path.exists(os.path.join(
+            self.gradle_user_home, 'init.d', 'repos.gradle')))
+        self.assertFalse(os.path.exists(os.path.join(
+            self.gradle_user_home, 'init.gradle')))
+
+    @mock.patch.object(gradle.GradlePlugin, 'run')
+    def test_build_reusing_daemon_and_build_cache(self, run_mock):
+        self.options.gradle_daemon = True
+        self.options.gradle_build_cache = True
+        plugin = gradle.GradlePlugin('test-part', self.options,
+                                     self.project_options)
+
+        def side(l):
+            os.makedirs(os.path.join(plugin.builddir,
+                        'build', 'libs'))
+            open(os.path.join(plugin.builddir,
+                 'build', 'libs', 'dummy.jar'), 'w').close()
+
+        run_mock.side_effect = side
+        os.makedirs(plugin.sourcedir)
+
+        plugin.build()
+
+        run_mock.assert_has_calls([
+            mock.call(['gradle', '--gradle-user-home', self.gradle_user_home,
+                       '--daemon', '-Dorg.gradle.daemon.idletimeout=600000',
+                       '--build-cache', 'jar']),
+        ])
+
+    @mock.patch.object(gradle.GradlePlugin, 'run')
+    def test_build_offline_once_dependencies_are_cached(self, run_mock):
+        self.options.gradle_offline = True
+        plugin = gradle.GradlePlugin('test-part', self.options,
+                                     self.project_options)
+
+        def side(l):
+            os.makedirs(os.path.join(plugin.builddir,
+                        'build', 'libs'), exist_ok=True)
+            open(os.path.join(plugin.builddir,
+                 'build', 'libs', 'dummy.jar'), 'w').close()
+
+        run_mock.side_effect = side
+        os.makedirs(plugin.builddir)
+        open(os.path.join(plugin.builddir, 'build.gradle'), 'w').close()
+
+        plugin.build()
+        self.assertNotIn('--offline', run_mock.call_args[0][0])
+
+        shutil.rmtree(plugin.installdir)
+        plugin.build()
+        self.assertIn('--offline', run_mock.call_args[0][0])
+
     @mock.patch.object(gradle.GradlePlugin, 'run')
     def test_build_gradle(self, run_mock):
         plugin = gradle.GradlePlugin('test-part', self.options,
@@ -137,7 +231,8 @@ class GradlePluginTestCase(BaseGradlePluginTestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['gradle', 'jar']),
+            mock.call(['gradle', '--gradle-user-home', self.gradle_user_home,
+                       'jar']),
         ])
 
     @mock.patch.object(gradle.GradlePlugin, 'run')
@@ -157,7 +252,8 @@ class GradlePluginTestCase(BaseGradlePluginTestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['gradle', 'jar']),
+            mock.call(['gradle', '--gradle-user-home', self.gradle_user_home,
+                       'jar']),
         ])
 
     @mock.patch.object(gradle.GradlePlugin, 'run')
@@ -180,7 +276,8 @@ class GradlePluginTestCase(BaseGradlePluginTestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['./gradlew', 'jar']),
+            mock.call(['./gradlew',
+                       '--gradle-user-home', self.gradle_user_home, 'jar']),
         ])
 
     @mock.patch.object(gradle.GradlePlugin, 'run')
@@ -195,7 +292,8 @@ class GradlePluginTestCase(BaseGradlePluginTestCase):
         self.assertRaises(RuntimeError, plugin.build)
 
         run_mock.assert_has_calls([
-            mock.call(['./gradlew', 'jar']),
+            mock.call(['./gradlew',
+                       '--gradle-user-home', self.gradle_user_home, 'jar']),
         ])
 
     @mock.patch.object(gradle.GradlePlugin, 'run')
@@ -207,7 +305,8 @@ class GradlePluginTestCase(BaseGradlePluginTestCase):
         self.assertRaises(RuntimeError, plugin.build)
 
         run_mock.assert_has_calls([
-            mock.call(['gradle', 'jar']),
+            mock.call(['gradle', '--gradle-user-home', self.gradle_user_home,
+                       'jar']),
         ])
 
 
@@ -249,7 +348,8 @@ class GradleProxyTestCase(BaseGradlePluginTestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['gradle'] + self.expected_args + ['jar'])
+            mock.call(['gradle', '--gradle-user-home', self.gradle_user_home] +
+                      self.expected_args + ['jar'])
         ])
 
     @mock.patch.object(gradle.GradlePlugin, 'run')
@@ -274,5 +374,7 @@ class GradleProxyTestCase(BaseGradlePluginTestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['./gradlew'] + self.expected_args + ['jar'])
+            mock.call(['./gradlew',
+                       '--gradle-user-home', self.gradle_user_home] +
+                      self.expected_args + ['jar'])
         ])
@@ -16,7 +16,6 @@
 
 import os
 
-from os import path
 from unittest import mock
 
 import fixtures
@@ -41,6 +40,13 @@ class GulpPluginTestCase(tests.TestCase):
         patcher = mock.patch('snapcraft.sources.Tar')
         self.tar_mock = patcher.start()
         self.addCleanup(patcher.stop)
+        self.tar_mock.return_value.source = 'node.tar.gz'
+        self.tar_mock.return_value.source_dir = self.nodejs_cache_dir = (
+            os.path.join(self.path, '.cache', 'snapcraft', 'nodejs'))
+        self.tar_mock.return_value.download.side_effect = (
+            lambda filepath: open(filepath, 'w').close())
+        self.partial_tarball = os.path.join(
+            self.nodejs_cache_dir, 'node.tar.gz.partial')
 
         patcher = mock.patch('sys.stdout')
         patcher.start()
@@ -64,8 +70,8 @@ class GulpPluginTestCase(tests.TestCase):
                 nodejs.get_nodejs_release(
                     plugin.options.node_engine,
                     plugin.project.deb_arch),
-                path.join(self.parts_dir, 'test-part', 'npm')),
-            mock.call().download()])
+                self.nodejs_cache_dir),
+            mock.call().download(filepath=self.partial_tarball)])
 
     @mock.patch('platform.architecture')
     @mock.patch('platform.machine')
@@ -93,11 +99,13 @@ class GulpPluginTestCase(tests.TestCase):
             mock.call(['npm', 'install', '-g', 'gulp-cli'],
                       cwd=plugin.builddir,
                       env={'PATH': path,
-                           'NPM_CONFIG_PREFIX': plugin._npm_dir}),
+                           'NPM_CONFIG_PREFIX': plugin._npm_dir,
+                           'NPM_CONFIG_CACHE': nodejs.get_npm_cache_dir()}),
             mock.call(['npm', 'install', '--only-development'],
                       cwd=plugin.builddir,
                       env={'PATH': path,
-                           'NPM_CONFIG_PREFIX': plugin._npm_dir}),
+                           'NPM_CONFIG_PREFIX': plugin._npm_dir,
+                           'NPM_CONFIG_CACHE': nodejs.get_npm_cache_dir()}),
         ])
 
         self.tar_mock.assert_has_calls([
@@ -105,7 +113,7 @@ class GulpPluginTestCase(tests.TestCase):
                 nodejs.get_nodejs_release(
                     plugin.options.node_engine,
                     plugin.project.deb_arch),
-                os.path.join(plugin._npm_dir)),
+                self.nodejs_cache_dir),
             mock.call().provision(
                 plugin._npm_dir, clean_target=False, keep_tarball=True)])
 
@@ -15,8 +15,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import contextlib
+import hashlib
 import logging
 import os
+import shutil
 from unittest import mock
 
 import fixtures
@@ -74,7 +76,7 @@ class KernelPluginTestCase(tests.TestCase):
         @contextlib.contextmanager
         def tempdir():
             self.tempdir = 'temporary-directory'
-            os.mkdir(self.tempdir)
+            os.makedirs(self.tempdir, exist_ok=True)
             yield self.tempdir
 
         patcher = mock.patch('tempfile.TemporaryDirectory')
@@ -82,6 +84,26 @@ class KernelPluginTestCase(tests.TestCase):
         self.tempdir_mock.side_effect = tempdir
         self.addCleanup(patcher.stop)
 
+        patcher = mock.patch('snapcraft.internal.squashfs.SquashfsImage')
+        self.squashfs_image_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Use the same compressor no matter what is installed.
+        patcher = mock.patch('shutil.which', return_value=None)
+        self.which_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _make_os_snap(self, plugin):
+        os.makedirs(plugin.sourcedir, exist_ok=True)
+        with open(plugin.os_snap, 'wb') as f:
+            f.write(b'os-snap')
+
+    def _get_generic_initrd_partial_path(self):
+        return os.path.join(
+            self.path, '.cache', 'snapcraft', 'kernel', 'initrd',
+            '{}.{}.partial'.format(
+                hashlib.sha256(b'os-snap').hexdigest(), os.getpid()))
+
     def test_schema(self):
         schema = kernel.KernelPlugin.schema()
 
@@ -134,17 +156,14 @@ class KernelPluginTestCase(tests.TestCase):
             self.assertIn(property, resulting_build_properties)
 
     def _assert_generic_check_call(self, builddir, installdir, os_snap_path):
-        self.assertEqual(4, self.check_call_mock.call_count)
+        self.assertEqual(3, self.check_call_mock.call_count)
         self.check_call_mock.assert_has_calls([
             mock.call('yes "" | make -j2 oldconfig', shell=True,
                       cwd=builddir),
-            mock.call(['unsquashfs', os_snap_path,
-                       'usr/lib/ubuntu-core-generic-initrd'],
-                      cwd='temporary-directory'),
-            mock.call('cat temporary-directory/squashfs-root/usr/lib/'
-                      'ubuntu-core-generic-initrd/initrd.img-core | '
-                      'gzip -dc | cpio -i',
-                      cwd=os.path.join(builddir, 'initrd-staging'),
+            mock.call('gzip -dc {} | cpio -i'.format(os.path.join(
+                          self.path, 'temporary-directory',
+                          'initrd.img-core')),
+                      cwd=self._get_generic_initrd_partial_path(),
                       shell=True),
             mock.call('find . | cpio --create --format=newc | '
                       'gzip > {}'.format(os.path.join(
@@ -162,6 +181,8 @@ class KernelPluginTestCase(tests.TestCase):
             self, sourcedir, builddir, installdir, do_dtbs=False,
             do_release=True, do_kernel=True, do_system_map=True):
         os.makedirs(sourcedir)
+        with open(os.path.join(sourcedir, 'os.snap'), 'wb') as f:
+            f.write(b'os-snap')
         kernel_version = '4.4.2'
 
         def create_assets():
@@ -211,14 +232,21 @@ class KernelPluginTestCase(tests.TestCase):
         self.file_mock.return_value = 'application/gzip'
         plugin = kernel.KernelPlugin('test-part', self.options,
                                      self.project_options)
+        self._make_os_snap(plugin)
 
         plugin._unpack_generic_initrd()
 
+        self.squashfs_image_mock.assert_called_once_with(plugin.os_snap)
+        os_snap = self.squashfs_image_mock.return_value.__enter__.return_value
+        os_snap.extract.assert_called_once_with(
+            'usr/lib/ubuntu-core-generic-initrd/initrd.img-core',
+            'temporary-directory/initrd.img-core')
+
         self.check_call_mock.assert_has_calls([
-            mock.call('cat temporary-directory/squashfs-root/usr/lib/'
-                      'ubuntu-core-generic-initrd/initrd.img-core | '
-                      'gzip -dc | cpio -i',
-                      cwd=os.path.join(plugin.builddir, 'initrd-staging'),
+            mock.call('gzip -dc {} | cpio -i'.format(os.path.join(
+                          self.path, 'temporary-directory',
+                          'initrd.img-core')),
+                      cwd=self._get_generic_initrd_partial_path(),
                       shell=True)
         ])
 
@@ -226,14 +254,15 @@ class KernelPluginTestCase(tests.TestCase):
         self.file_mock.return_value = 'application/x-gzip'
         plugin = kernel.KernelPlugin('test-part', self.options,
                                      self.project_options)
+        self._make_os_snap(plugin)
 
         plugin._unpack_generic_initrd()
 
         self.check_call_mock.assert_has_calls([
-            mock.call('cat temporary-directory/squashfs-root/usr/lib/'
-                      'ubuntu-core-generic-initrd/initrd.img-core | '
-                      'gzip -dc | cpio -i',
-                      cwd=os.path.join(plugin.builddir, 'initrd-staging'),
+            mock.call('gzip -dc {} | cpio -i'.format(os.path.join(
+                          self.path, 'temporary-directory',
+                          'initrd.img-core')),
+                      cwd=self._get_generic_initrd_partial_path(),
                       shell=True)
         ])
 
@@ -241,14 +270,15 @@ class KernelPluginTestCase(tests.TestCase):
         self.file_mock.return_value = 'application/x-lzma'
         plugin = kernel.KernelPlugin('test-part', self.options,
                                      self.project_options)
+        self._make_os_snap(plugin)
 
         plugin._unpack_generic_initrd()
 
         self.check_call_mock.assert_has_calls([
-            mock.call('cat temporary-directory/squashfs-root/usr/lib/'
-                      'ubuntu-core-generic-initrd/initrd.img-core | '
-                      'xz -dc | cpio -i',
-                      cwd=os.path.join(plugin.builddir, 'initrd-staging'),
+            mock.call('xz -dc {} | cpio -i'.format(os.path.join(
+                          self.path, 'temporary-directory',
+                          'initrd.img-core')),
+                      cwd=self._get_generic_initrd_partial_path(),
                       shell=True)
         ])
 
@@ -256,14 +286,15 @@ class KernelPluginTestCase(tests.TestCase):
         self.file_mock.return_value = 'application/x-xz'
         plugin = kernel.KernelPlugin('test-part', self.options,
                                      self.project_options)
+        self._make_os_snap(plugin)
 
         plugin._unpack_generic_initrd()
 
         self.check_call_mock.assert_has_calls([
-            mock.call('cat temporary-directory/squashfs-root/usr/lib/'
-                      'ubuntu-core-generic-initrd/initrd.img-core | '
-                      'xz -dc | cpio -i',
-                      cwd=os.path.join(plugin.builddir, 'initrd-staging'),
+            mock.call('xz -dc {} | cpio -i'.format(os.path.join(
+                          self.path, 'temporary-directory',
+                          'initrd.img-core')),
+                      cwd=self._get_generic_initrd_partial_path(),
                       shell=True)
         ])
 
@@ -271,6 +302,7 @@ class KernelPluginTestCase(tests.TestCase):
         self.file_mock.return_value = 'application/foo'
         plugin = kernel.KernelPlugin('test-part', self.options,
                                      self.project_options)
+        self._make_os_snap(plugin)
 
         raised = self.assertRaises(
             RuntimeError,
@@ -298,17 +330,15 @@ class KernelPluginTestCase(tests.TestCase):
         open(os.path.join(modules_path, 'modules.dep.bin'), 'w').close()
         os.makedirs(initrd_modules_staging_path)
         open(os.path.join(plugin.installdir, 'initrd-4.4.img'), 'w').close()
+        self._make_os_snap(plugin)
 
         with mock.patch.object(plugin, '_unpack_generic_initrd') as m_unpack:
             m_unpack.return_value = 'staging'
             plugin._make_initrd()
 
-        modprobe_cmd = ['modprobe', '-n', '--show-depends', '-d',
-                        plugin.installdir, '-S', '4.4', ]
-        self.run_output_mock.assert_has_calls([
-            mock.call(modprobe_cmd + ['squashfs'])])
-        self.run_output_mock.assert_has_calls([
-            mock.call(modprobe_cmd + ['vfat'])])
+        self.run_output_mock.assert_called_once_with([
+            'modprobe', '-n', '--show-depends', '-a', '-d',
+            plugin.installdir, '-S', '4.4', 'squashfs', 'vfat'])
 
     def test_pack_initrd_modules_return_same_deps(self):
         self.options.kernel_initrd_modules = [
@@ -329,6 +359,7 @@ class KernelPluginTestCase(tests.TestCase):
         open(os.path.join(modules_path, 'modules.dep.bin'), 'w').close()
         os.makedirs(initrd_modules_staging_path)
         open(os.path.join(plugin.installdir, 'initrd-4.4.img'), 'w').close()
+        self._make_os_snap(plugin)
         open(os.path.join(plugin.installdir, 'serport.ko'), 'w').close()
 
         self.run_output_mock.return_value = 'insmod {}/serport.ko'.format(
@@ -338,12 +369,154 @@ class KernelPluginTestCase(tests.TestCase):
             m_unpack.return_value = 'staging'
             plugin._make_initrd()
 
-        modprobe_cmd = ['modprobe', '-n', '--show-depends', '-d',
-                        plugin.installdir, '-S', '4.4', ]
-        self.run_output_mock.assert_has_calls([
-            mock.call(modprobe_cmd + ['squashfs'])])
-        self.run_output_mock.assert_has_calls([
-            mock.call(modprobe_cmd + ['vfat'])])
+        self.run_output_mock.assert_called_once_with([
+            'modprobe', '-n', '--show-depends', '-a', '-d',
+            plugin.installdir, '-S', '4.4', 'squashfs', 'vfat'])
+
+    def test_pack_initrd_modules_from_modules_dep(self):
+        self.options.kernel_initrd_modules = ['squashfs', 'fat-module']
+
+        plugin = kernel.KernelPlugin('test-part', self.options,
+                                     self.project_options)
+        self._make_os_snap(plugin)
+
+        plugin.kernel_release = '4.4'
+        modules_path = os.path.join(plugin.installdir, 'lib', 'modules', '4.4')
+        module_files = [
+            'kernel/fs/squashfs/squashfs.ko', 'kernel/lib/xz.ko',
+            'kernel/fs/fat/fat_module.ko', 'kernel/fs/unused.ko']
+        for module_file in module_files:
+            os.makedirs(os.path.join(modules_path,
+                                     os.path.dirname(module_file)),
+                        exist_ok=True)
+            open(os.path.join(modules_path, module_file), 'w').close()
+        with open(os.path.join(modules_path, 'modules.dep'), 'w') as f:
+            f.write('kernel/fs/squashfs/squashfs.ko: kernel/lib/xz.ko\n'
+                    'kernel/lib/xz.ko:\n'
+                    'kernel/fs/fat/fat_module.ko:\n'
+                    'kernel/fs/unused.ko:\n')
+        open(os.path.join(modules_path, 'modules.dep.bin'), 'w').close()
+        open(os.path.join(plugin.installdir, 'initrd-4.4.img'), 'w').close()
+
+        with mock.patch.object(plugin, '_unpack_generic_initrd') as m_unpack:
+            m_unpack.return_value = 'staging'
+            plugin._make_initrd()
+
+        self.assertFalse(self.run_output_mock.called)
+        staging_modules_path = os.path.join('staging', 'lib', 'modules', '4.4')
+        for module_file in module_files[:3]:
+            self.assertTrue(os.path.exists(
+                os.path.join(staging_modules_path, module_file)))
+        self.assertFalse(os.path.exists(
+            os.path.join(staging_modules_path, 'kernel/fs/unused.ko')))
+        self.assertTrue(os.path.exists(
+            os.path.join(staging_modules_path, 'modules.dep')))
+
+    def test_unpack_generic_initrd_is_cached(self):
+        plugin = kernel.KernelPlugin('test-part', self.options,
+                                     self.project_options)
+        self._make_os_snap(plugin)
+
+        def fake_unpack(*args, **kwargs):
+            open(os.path.join(kwargs['cwd'], 'init'), 'w').close()
+
+        self.check_call_mock.side_effect = fake_unpack
+
+        for i in range(2):
+            initrd_unpacked_path = plugin._unpack_generic_initrd()
+            self.assertTrue(os.path.exists(
+                os.path.join(initrd_unpacked_path, 'init')))
+
+        self.assertEqual(1, self.squashfs_image_mock.call_count)
+        self.assertEqual(1, self.check_call_mock.call_count)
+
+        # A different os snap gets its own cached generic initrd.
+        with open(plugin.os_snap, 'wb') as f:
+            f.write(b'new-os-snap')
+        plugin = kernel.KernelPlugin('test-part', self.options,
+                                     self.project_options)
+        plugin._unpack_generic_initrd()
+
+        self.assertEqual(2, self.squashfs_image_mock.call_count)
+        self.assertEqual(
+            sorted([hashlib.sha256(b'os-snap').hexdigest(),
+                    hashlib.sha256(b'new-os-snap').hexdigest()]),
+            sorted(os.listdir(os.path.join(
+                self.path, '.cache', 'snapcraft', 'kernel', 'initrd'))))
+
+    def test_unpack_generic_initrd_prunes_unused_initrds(self):
+        plugin = kernel.KernelPlugin('test-part', self.options,
+                                     self.project_options)
+        self._make_os_snap(plugin)
+
+        def fake_unpack(*args, **kwargs):
+            open(os.path.join(kwargs['cwd'], 'init'), 'w').close()
+
+        self.check_call_mock.side_effect = fake_unpack
+
+        cache_dir = os.path.join(
+            self.path, '.cache', 'snapcraft', 'kernel', 'initrd')
+        old_time = 1
+        for name in ('unused', 'recent', 'other.1.partial'):
+            os.makedirs(os.path.join(cache_dir, name))
+        for name in ('unused', 'other.1.partial'):
+            os.utime(os.path.join(cache_dir, name), (old_time, old_time))
+
+        plugin._unpack_generic_initrd()
+
+        self.assertEqual(
+            sorted([hashlib.sha256(b'os-snap').hexdigest(),
+                    'other.1.partial', 'recent']),
+            sorted(os.listdir(cache_dir)))
+
+    def test_make_initrd_reuses_unchanged_initrd(self):
+        self.options.kernel_initrd_firmware = ['lib/firmware/fake-fw.bin']
+
+        plugin = kernel.KernelPlugin('test-part', self.options,
+                                     self.project_options)
+        self._make_os_snap(plugin)
+        plugin.kernel_release = '4.4'
+        firmware_path = os.path.join(
+            plugin.installdir, 'lib', 'firmware', 'fake-fw.bin')
+        os.makedirs(os.path.dirname(firmware_path))
+        with open(firmware_path, 'w') as f:
+            f.write('firmware')
+        initrd_path = os.path.join(plugin.installdir, 'initrd-4.4.img')
+
+        def make_initrd():
+            for path in [initrd_path,
+                         os.path.join(plugin.installdir, 'initrd.img')]:
+                if os.path.exists(path):
+                    os.remove(path)
+            with mock.patch.object(plugin, '_unpack_generic_initrd') as m:
+                m.return_value = 'staging'
+                if os.path.exists('staging'):
+                    shutil.rmtree('staging')
+                os.makedirs('staging')
+                with open(initrd_path, 'w') as f:
+                    f.write('initrd')
+                plugin._make_initrd()
+            return m.called
+
+        self.assertTrue(make_initrd())
+        self.assertFalse(make_initrd())
+        self.assertTrue(os.path.exists(
+            os.path.join(plugin.installdir, 'initrd.img')))
+        self.assertEqual(1, self.check_call_mock.call_count)
+
+        with open(firmware_path, 'w') as f:
+            f.write('new firmware')
+
+        self.assertTrue(make_initrd())
+        self.assertEqual(2, self.check_call_mock.call_count)
+
+    def test_compression_cmd_prefers_pigz(self):
+        plugin = kernel.KernelPlugin('test-part', self.options,
+                                     self.project_options)
+        self.assertEqual('gzip', plugin.compression_cmd)
+
+        self.which_mock.return_value = '/usr/bin/pigz'
+        self.assertEqual('pigz', plugin.compression_cmd)
 
     def test_build_with_kconfigfile(self):
         self.options.kconfigfile = 'config'
@@ -398,17 +571,14 @@ class KernelPluginTestCase(tests.TestCase):
 
         plugin.build()
 
-        self.assertEqual(4, self.check_call_mock.call_count)
+        self.assertEqual(3, self.check_call_mock.call_count)
         self.check_call_mock.assert_has_calls([
             mock.call('yes "" | make -j2 V=1 oldconfig', shell=True,
                       cwd=plugin.builddir),
-            mock.call(['unsquashfs', plugin.os_snap,
-                       'usr/lib/ubuntu-core-generic-initrd'],
-                      cwd='temporary-directory'),
-            mock.call('cat temporary-directory/squashfs-root/usr/lib/'
-                      'ubuntu-core-generic-initrd/initrd.img-core | '
-                      'gzip -dc | cpio -i',
-                      cwd=os.path.join(plugin.builddir, 'initrd-staging'),
+            mock.call('gzip -dc {} | cpio -i'.format(os.path.join(
+                          self.path, 'temporary-directory',
+                          'initrd.img-core')),
+                      cwd=self._get_generic_initrd_partial_path(),
                       shell=True),
             mock.call('find . | cpio --create --format=newc | '
                       'gzip > {}'.format(os.path.join(
@@ -668,7 +838,7 @@ ACCEPT=n
             module_path = os.path.join(
                 plugin.installdir, 'lib', 'modules', '4.4.2', 'some-module.ko')
             open(module_path, 'w').close()
-            return module_path
+            return 'insmod {}'.format(module_path)
 
         self.run_output_mock.side_effect = fake_modules
 
@@ -693,7 +863,7 @@ ACCEPT=n
         self.assertEqual(1, self.run_output_mock.call_count)
         self.run_output_mock.assert_has_calls([
             mock.call([
-                'modprobe', '-n', '--show-depends', '-d',
+                'modprobe', '-n', '--show-depends', '-a', '-d',
                 plugin.installdir, '-S', '4.4.2', 'my-fake-module'])])
 
         config_file = os.path.join(plugin.builddir, '.config')
@@ -16,6 +16,7 @@
 
 import io
 import os
+import shutil
 from unittest import mock
 from xml.etree import ElementTree
 
@@ -35,8 +36,11 @@ class MavenPluginTestCase(tests.TestCase):
         class Options:
             maven_options = []
             maven_targets = ['']
+            maven_offline = False
 
         self.options = Options()
+        self.maven_repo = '-Dmaven.repo.local={}'.format(os.path.join(
+            self.path, '.cache', 'snapcraft', 'maven', 'repository'))
         self.project_options = snapcraft.ProjectOptions()
 
         patcher = mock.patch('snapcraft.repo.Ubuntu')
@@ -59,7 +63,8 @@ class MavenPluginTestCase(tests.TestCase):
             return f.getvalue() + '\n'
 
     def test_get_build_properties(self):
-        expected_build_properties = ['maven-options', 'maven-targets']
+        expected_build_properties = ['maven-options', 'maven-targets',
+                                     'maven-offline']
         resulting_build_properties = maven.MavenPlugin.get_build_properties()
 
         self.assertThat(resulting_build_properties,
@@ -152,7 +157,7 @@ class MavenPluginTestCase(tests.TestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['mvn', 'package']),
+            mock.call(['mvn', 'package', self.maven_repo]),
         ])
 
     @mock.patch.object(maven.MavenPlugin, 'run')
@@ -172,7 +177,7 @@ class MavenPluginTestCase(tests.TestCase):
         self.assertRaises(RuntimeError, plugin.build)
 
         run_mock.assert_has_calls([
-            mock.call(['mvn', 'package']),
+            mock.call(['mvn', 'package', self.maven_repo]),
         ])
 
     @mock.patch.object(maven.MavenPlugin, 'run')
@@ -198,7 +203,7 @@ class MavenPluginTestCase(tests.TestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['mvn', 'package']),
+            mock.call(['mvn', 'package', self.maven_repo]),
         ])
 
     @mock.patch.object(maven.MavenPlugin, 'run')
@@ -231,7 +236,7 @@ class MavenPluginTestCase(tests.TestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['mvn', 'package']),
+            mock.call(['mvn', 'package', self.maven_repo]),
         ])
 
     @mock.patch.object(maven.MavenPlugin, 'run')
@@ -259,7 +264,8 @@ class MavenPluginTestCase(tests.TestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['mvn', 'package', '-s', settings_path]),
+            mock.call(['mvn', 'package', self.maven_repo,
+                       '-s', settings_path]),
         ])
 
         self.assertTrue(
@@ -313,7 +319,8 @@ class MavenPluginTestCase(tests.TestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['mvn', 'package', '-s', settings_path]),
+            mock.call(['mvn', 'package', self.maven_repo,
+                       '-s', settings_path]),
         ])
 
         self.assertTrue(
@@ -367,7 +374,8 @@ class MavenPluginTestCase(tests.TestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['mvn', 'package', '-s', settings_path]),
+            mock.call(['mvn', 'package', self.maven_repo,
+                       '-s', settings_path]),
         ])
 
         self.assertTrue(
@@ -421,7 +429,8 @@ class MavenPluginTestCase(tests.TestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['mvn', 'package', '-s', settings_path]),
+            mock.call(['mvn', 'package', self.maven_repo,
+                       '-s', settings_path]),
         ])
 
         self.assertTrue(
@@ -483,7 +492,8 @@ class MavenPluginTestCase(tests.TestCase):
         plugin.build()
 
         run_mock.assert_has_calls([
-            mock.call(['mvn', 'package', '-s', settings_path]),
+            mock.call(['mvn', 'package', self.maven_repo,
+                       '-s', settings_path]),
         ])
 
         self.assertTrue(
@@ -523,3 +533,32 @@ class MavenPluginTestCase(tests.TestCase):
             '  </proxies>\n'
             '</settings>\n')
         self.assertSettingsEqual(expected_contents, settings_contents)
+
+    @mock.patch.object(maven.MavenPlugin, 'run')
+    def test_build_offline_once_dependencies_are_cached(self, run_mock):
+        self.useFixture(fixtures.EnvironmentVariable('http_proxy', None))
+        self.useFixture(fixtures.EnvironmentVariable('https_proxy', None))
+        self.options.maven_offline = True
+
+        def build(pom):
+            plugin = maven.MavenPlugin('test-part', self.options,
+                                       self.project_options)
+            shutil.rmtree(plugin.partdir, ignore_errors=True)
+            os.makedirs(plugin.builddir)
+            with open(os.path.join(plugin.builddir, 'pom.xml'), 'w') as f:
+                f.write(pom)
+
+            def side(l):
+                os.makedirs(os.path.join(plugin.builddir, 'target'))
+                open(os.path.join(plugin.builddir,
+                     'target', 'dummy.jar'), 'w').close()
+
+            run_mock.side_effect = side
+            run_mock.reset_mock()
+            plugin.build()
+            return run_mock.call_args[0][0]
+
+        self.assertNotIn('--offline', build('<project/>'))
+        self.assertIn('--offline', build('<project/>'))
+        # New dependencies may be listed in the changed pom.xml.
+        self.assertNotIn('--offline', build('<project></project>'))
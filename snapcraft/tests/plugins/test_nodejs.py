@@ -15,8 +15,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import shutil
 
-from os import path
 from unittest import mock
 from testtools.matchers import HasLength
 
@@ -39,6 +39,13 @@ class NodePluginTestCase(tests.TestCase):
         patcher = mock.patch('snapcraft.sources.Tar')
         self.tar_mock = patcher.start()
         self.addCleanup(patcher.stop)
+        self.tar_mock.return_value.source = 'node.tar.gz'
+        self.tar_mock.return_value.source_dir = self.nodejs_cache_dir = (
+            os.path.join(self.path, '.cache', 'snapcraft', 'nodejs'))
+        self.tar_mock.return_value.download.side_effect = (
+            lambda filepath: open(filepath, 'w').close())
+        self.partial_tarball = os.path.join(
+            self.nodejs_cache_dir, 'node.tar.gz.partial')
 
         patcher = mock.patch('sys.stdout')
         patcher.start()
@@ -63,8 +70,8 @@ class NodePluginTestCase(tests.TestCase):
             mock.call(
                 nodejs.get_nodejs_release(
                     plugin.options.node_engine, plugin.project.deb_arch),
-                path.join(self.parts_dir, 'test-part', 'npm')),
-            mock.call().download()])
+                self.nodejs_cache_dir),
+            mock.call().download(filepath=self.partial_tarball)])
 
     def test_build_local_sources(self):
         class Options:
@@ -81,23 +88,24 @@ class NodePluginTestCase(tests.TestCase):
 
         plugin.build()
 
-        self.run_mock.assert_has_calls([
-            mock.call(['npm', '--cache-min=Infinity', 'install'],
-                      cwd=plugin.builddir),
-            mock.call(['npm', '--cache-min=Infinity', 'install', '--global'],
-                      cwd=plugin.builddir)])
+        npm = ['npm', '--cache={}'.format(nodejs.get_npm_cache_dir())]
+        self.assertEqual(
+            [mock.call(npm + ['install'], cwd=plugin.builddir),
+             mock.call(npm + ['install', '--global', '.'],
+                       cwd=plugin.builddir)],
+            self.run_mock.mock_calls)
         self.tar_mock.assert_has_calls([
             mock.call(
                 nodejs.get_nodejs_release(
                     plugin.options.node_engine, plugin.project.deb_arch),
-                path.join(self.parts_dir, 'test-part', 'npm')),
+                self.nodejs_cache_dir),
             mock.call().provision(
                 plugin.installdir, clean_target=False, keep_tarball=True)])
 
     def test_pull_and_build_node_packages_sources(self):
         class Options:
             source = None
-            node_packages = ['my-pkg']
+            node_packages = ['my-pkg', 'other-pkg']
             node_engine = '4'
             npm_run = []
 
@@ -110,17 +118,126 @@ class NodePluginTestCase(tests.TestCase):
         plugin.build()
 
         self.run_mock.assert_has_calls([
-            mock.call(['npm', '--cache-min=Infinity', 'install', '--global',
-                       'my-pkg'], cwd=plugin.builddir)])
+            mock.call(['npm',
+                       '--cache={}'.format(nodejs.get_npm_cache_dir()),
+                       'install', '--global', 'my-pkg', 'other-pkg'],
+                      cwd=plugin.builddir)])
         self.tar_mock.assert_has_calls([
             mock.call(
                 nodejs.get_nodejs_release(
                     plugin.options.node_engine, plugin.project.deb_arch),
-                path.join(self.parts_dir, 'test-part', 'npm')),
-            mock.call().download(),
+                self.nodejs_cache_dir),
+            mock.call().download(filepath=self.partial_tarball),
             mock.call().provision(
                 plugin.installdir, clean_target=False, keep_tarball=True)])
 
+    def test_build_reuses_node_modules_from_pull(self):
+        class Options:
+            source = '.'
+            node_packages = []
+            node_engine = '4'
+            npm_run = []
+
+        plugin = nodejs.NodePlugin('test-part', Options(),
+                                   self.project_options)
+
+        os.makedirs(plugin.sourcedir)
+        with open(os.path.join(plugin.sourcedir, 'package.json'), 'w') as f:
+            f.write('{"dependencies": {"left-pad": "1.1.3"}}')
+
+        plugin.pull()
+        shutil.copytree(plugin.sourcedir, plugin.builddir)
+        self.run_mock.reset_mock()
+        plugin.build()
+
+        npm = ['npm', '--cache={}'.format(nodejs.get_npm_cache_dir())]
+        self.assertEqual(
+            [mock.call(npm + ['install', '--global', '.'],
+                       cwd=plugin.builddir)],
+            self.run_mock.mock_calls)
+
+        # A new lockfile means the dependencies have to be installed again,
+        # exactly as the lockfile pins them.
+        open(os.path.join(plugin.builddir, 'package-lock.json'), 'w').close()
+        self.run_mock.reset_mock()
+        plugin.build()
+
+        self.assertEqual(
+            [mock.call(npm + ['ci'], cwd=plugin.builddir),
+             mock.call(npm + ['install', '--global', '.'],
+                       cwd=plugin.builddir)],
+            self.run_mock.mock_calls)
+
+    def test_build_node_packages_with_local_sources(self):
+        class Options:
+            source = '.'
+            node_packages = ['my-pkg', 'other-pkg']
+            node_engine = '4'
+            npm_run = []
+
+        plugin = nodejs.NodePlugin('test-part', Options(),
+                                   self.project_options)
+
+        os.makedirs(plugin.builddir)
+        open(os.path.join(plugin.builddir, 'package.json'), 'w').close()
+        open(os.path.join(plugin.builddir, 'package-lock.json'), 'w').close()
+
+        plugin.build()
+
+        npm = ['npm', '--cache={}'.format(nodejs.get_npm_cache_dir())]
+        self.assertEqual(
+            [mock.call(npm + ['ci'], cwd=plugin.builddir),
+             mock.call(npm + ['install', '--global', '.', 'my-pkg',
+                              'other-pkg'],
+                       cwd=plugin.builddir)],
+            self.run_mock.mock_calls)
+
+    def test_pull_reuses_cached_nodejs(self):
+        class Options:
+            source = '.'
+            node_packages = []
+            node_engine = '4'
+            npm_run = []
+
+        plugin = nodejs.NodePlugin('test-part', Options(),
+                                   self.project_options)
+        os.makedirs(plugin.sourcedir)
+        os.makedirs(self.nodejs_cache_dir)
+        open(os.path.join(self.nodejs_cache_dir, 'node.tar.gz'), 'w').close()
+
+        plugin.pull()
+
+        self.assertFalse(self.tar_mock.return_value.download.called)
+
+    def test_pull_does_not_cache_interrupted_nodejs_download(self):
+        class Options:
+            source = '.'
+            node_packages = []
+            node_engine = '4'
+            npm_run = []
+
+        plugin = nodejs.NodePlugin('test-part', Options(),
+                                   self.project_options)
+        os.makedirs(plugin.sourcedir)
+
+        def interrupted_download(filepath):
+            open(filepath, 'w').close()
+            raise KeyboardInterrupt()
+        self.tar_mock.return_value.download.side_effect = interrupted_download
+
+        self.assertRaises(KeyboardInterrupt, plugin.pull)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.nodejs_cache_dir, 'node.tar.gz')))
+
+        self.tar_mock.return_value.download.side_effect = (
+            lambda filepath: open(filepath, 'w').close())
+        plugin.pull()
+
+        self.assertEqual(2, self.tar_mock.return_value.download.call_count)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.nodejs_cache_dir, 'node.tar.gz')))
+        self.assertFalse(os.path.exists(self.partial_tarball))
+
     def test_build_executes_npm_run_commands(self):
         class Options:
             source = '.'
@@ -14,10 +14,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
 import os
+import subprocess
+import sys
 import tempfile
 from unittest import mock
-from testtools.matchers import HasLength
+from testtools.matchers import FileExists, HasLength
 
 import snapcraft
 from snapcraft import tests
@@ -47,6 +50,8 @@ class PythonPluginTestCase(tests.TestCase):
             python_version = 'python3'
             python_packages = []
             process_dependency_links = False
+            compile_bytecode = True
+            bytecode_optimization = 0
 
         self.options = Options()
         self.project_options = snapcraft.ProjectOptions()
@@ -77,6 +82,16 @@ class PythonPluginTestCase(tests.TestCase):
                              schema['properties']['constraints'])
         self.assertDictEqual(expected_python_packages,
                              schema['properties']['python-packages'])
+        self.assertDictEqual({'type': 'boolean', 'default': True},
+                             schema['properties']['compile-bytecode'])
+        self.assertDictEqual({'type': 'integer', 'default': 0,
+                              'enum': [0, 1, 2]},
+                             schema['properties']['bytecode-optimization'])
+
+    def test_get_build_properties(self):
+        self.assertEqual(
+            ['compile-bytecode', 'bytecode-optimization'],
+            python.PythonPlugin.get_build_properties())
 
     def test_get_pull_properties(self):
         expected_pull_properties = [
@@ -236,6 +251,7 @@ class PythonPluginTestCase(tests.TestCase):
         pip_wheel = ['pip', 'wheel',
                      '--disable-pip-version-check', '--no-index',
                      '--find-links', plugin._python_package_dir,
+                     '--find-links', mock.ANY,
                      '--constraint', constraints_path,
                      '--wheel-dir', mock.ANY]
 
@@ -278,6 +294,18 @@ class PythonPluginTestCase(tests.TestCase):
         mock_run.assert_has_calls(calls)
 
     def test_fileset_ignores(self):
+        plugin = python.PythonPlugin('test-part', self.options,
+                                     self.project_options)
+        expected_fileset = [
+            '-bin/pip*',
+            '-bin/easy_install*',
+            '-bin/wheel',
+        ]
+        fileset = plugin.snap_fileset()
+        self.assertListEqual(expected_fileset, fileset)
+
+    def test_fileset_ignores_bytecode_when_not_compiled(self):
+        self.options.compile_bytecode = False
         plugin = python.PythonPlugin('test-part', self.options,
                                      self.project_options)
         expected_fileset = [
@@ -290,6 +318,62 @@ class PythonPluginTestCase(tests.TestCase):
         fileset = plugin.snap_fileset()
         self.assertListEqual(expected_fileset, fileset)
 
+    @mock.patch.object(python.PythonPlugin, 'run')
+    def test_build_compiles_bytecode(self, run_mock):
+        plugin = python.PythonPlugin('test-part', self.options,
+                                     self.project_options)
+        setup_directories(plugin, self.options.python_version)
+
+        plugin.build()
+
+        run_mock.assert_called_with(
+            ['python3', '-c', python._COMPILE_BYTECODE_SCRIPT, '2'],
+            cwd=plugin.installdir)
+
+    @mock.patch.object(python.PythonPlugin, 'run')
+    def test_build_compiles_optimized_bytecode(self, run_mock):
+        self.options.python_version = 'python2'
+        self.options.bytecode_optimization = 2
+        plugin = python.PythonPlugin('test-part', self.options,
+                                     self.project_options)
+        setup_directories(plugin, self.options.python_version)
+
+        plugin.build()
+
+        run_mock.assert_called_with(
+            ['python2', '-OO', '-c', python._COMPILE_BYTECODE_SCRIPT, '2'],
+            cwd=plugin.installdir)
+
+    @mock.patch.object(python.PythonPlugin, 'run')
+    def test_build_without_compiling_bytecode(self, run_mock):
+        self.options.compile_bytecode = False
+        plugin = python.PythonPlugin('test-part', self.options,
+                                     self.project_options)
+        setup_directories(plugin, self.options.python_version)
+
+        plugin.build()
+
+        for call in run_mock.call_args_list:
+            self.assertNotIn(python._COMPILE_BYTECODE_SCRIPT, call[0][0])
+
+    def test_compile_bytecode_script(self):
+        package_dir = os.path.join('install', 'lib', 'package')
+        os.makedirs(package_dir)
+        with open(os.path.join(package_dir, 'module.py'), 'w') as f:
+            f.write('VALUE = 1\n')
+        with open(os.path.join(package_dir, 'broken.py'), 'w') as f:
+            f.write('print "python 2 only"\n')
+
+        # subprocess.check_call is mocked for the plugin.
+        subprocess.run(
+            [sys.executable, '-c', python._COMPILE_BYTECODE_SCRIPT, '1'],
+            cwd='install', stdout=subprocess.DEVNULL, check=True)
+
+        self.assertThat(
+            os.path.join(package_dir, '__pycache__', 'module.{}.pyc'.format(
+                sys.implementation.cache_tag)),
+            FileExists())
+
     @mock.patch.object(python.PythonPlugin, 'run')
     def test_build_fixes_python_shebangs(self, run_mock):
         if self.options.python_version == 'python2':
@@ -360,3 +444,61 @@ class PythonPluginTestCase(tests.TestCase):
                                                mock_os_stat):
         python._replicate_owner_mode('/nonexistant_path')
         self.assertFalse(mock_os_stat.called)
+
+    @mock.patch.object(python.PythonPlugin, 'run_output', return_value='')
+    @mock.patch.object(python.PythonPlugin, 'run')
+    def test_build_shares_wheels_built_from_sdists(self, mock_run,
+                                                   mock_run_output):
+        self.options.python_packages = ['foo']
+        wheel_name = 'foo-1.0-cp35-cp35m-linux_x86_64.whl'
+        found_wheels = []
+
+        def run_side_effect(cmd, **kwargs):
+            if cmd[1] != 'wheel':
+                return
+            find_links = [cmd[i + 1] for i, arg in enumerate(cmd)
+                          if arg == '--find-links']
+            found_wheels.append(os.listdir(find_links[1]))
+            wheel_dir = cmd[cmd.index('--wheel-dir') + 1]
+            open(os.path.join(wheel_dir, wheel_name), 'w').close()
+
+        mock_run.side_effect = run_side_effect
+
+        for part_name in ('part1', 'part2'):
+            plugin = python.PythonPlugin(part_name, self.options,
+                                         self.project_options)
+            setup_directories(plugin, self.options.python_version)
+            os.makedirs(plugin._python_package_dir)
+            with open(os.path.join(plugin._python_package_dir,
+                                   'foo-1.0.tar.gz'), 'w') as f:
+                f.write('sdist')
+            plugin.build()
+
+        # The first part builds the wheel, the second one finds it cached.
+        self.assertEqual([[], [wheel_name]], found_wheels)
+        self.assertThat(
+            os.path.join(plugin._wheel_cache_dir,
+                         hashlib.sha256(b'sdist').hexdigest(), wheel_name),
+            FileExists())
+
+    def test_wheel_cache_skips_wheels_without_sdist(self):
+        package_dir = os.path.join(self.path, 'packages')
+        os.makedirs(package_dir)
+        wheel = os.path.join(package_dir, 'project-0.1-py3-none-any.whl')
+        open(wheel, 'w').close()
+
+        cache_dir = os.path.join(self.path, 'cache')
+        python._WheelCache(cache_dir).add_wheels(package_dir, [wheel])
+
+        self.assertFalse(os.path.exists(cache_dir))
+
+    def test_get_distribution(self):
+        self.assertEqual(
+            ('python-dateutil', '2.6.0'),
+            python._get_distribution('python-dateutil-2.6.0.tar.gz'))
+        self.assertEqual(
+            ('python-dateutil', '2.6.0'),
+            python._get_distribution(
+                'python_dateutil-2.6.0-py2.py3-none-any.whl'))
+        self.assertIsNone(python._get_distribution('project.whl'))
+        self.assertIsNone(python._get_distribution('README'))
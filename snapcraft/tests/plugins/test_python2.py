@@ -32,6 +32,8 @@ class Python2PluginTestCase(tests.TestCase):
             constraints = ''
             python_packages = []
             process_dependency_links = False
+            compile_bytecode = True
+            bytecode_optimization = 0
 
         self.options = Options()
         self.project_options = snapcraft.ProjectOptions()
@@ -29,6 +29,7 @@ class RustPluginTestCase(tests.TestCase):
             makefile = None
             make_parameters = []
             rust_features = []
+            rust_incremental = False
 
         self.options = Options()
         self.project_options = snapcraft.ProjectOptions()
@@ -111,13 +112,14 @@ class RustPluginTestCase(tests.TestCase):
 
         self.assertEqual(2, run_mock.call_count)
 
-        rustdir = os.path.join(plugin.partdir, 'rust')
+        rustdir = plugin._get_toolchain_dir()
         run_mock.assert_has_calls([mock.call([
             os.path.join(rustdir, 'rustup.sh'), '--prefix={}'.format(rustdir),
             '--disable-sudo', '--save']),
             mock.call([plugin._cargo, 'fetch',
                        '--manifest-path',
-                       os.path.join(plugin.sourcedir, 'Cargo.toml')])])
+                       os.path.join(plugin.sourcedir, 'Cargo.toml')],
+                      env=plugin._build_env())])
 
     @mock.patch.object(rust.sources, 'Script')
     @mock.patch.object(rust.RustPlugin, 'run')
@@ -132,14 +134,15 @@ class RustPluginTestCase(tests.TestCase):
 
         self.assertEqual(2, run_mock.call_count)
 
-        rustdir = os.path.join(plugin.partdir, 'rust')
+        rustdir = plugin._get_toolchain_dir()
         run_mock.assert_has_calls([mock.call([
             os.path.join(rustdir, 'rustup.sh'), '--prefix={}'.format(rustdir),
             '--disable-sudo', '--save',
             '--channel=nightly']),
             mock.call([plugin._cargo, 'fetch',
                        '--manifest-path',
-                       os.path.join(plugin.sourcedir, 'Cargo.toml')])])
+                       os.path.join(plugin.sourcedir, 'Cargo.toml')],
+                      env=plugin._build_env())])
 
     @mock.patch.object(rust.sources, 'Script')
     @mock.patch.object(rust.RustPlugin, 'run')
@@ -154,7 +157,7 @@ class RustPluginTestCase(tests.TestCase):
 
         self.assertEqual(2, run_mock.call_count)
 
-        rustdir = os.path.join(plugin.partdir, 'rust')
+        rustdir = plugin._get_toolchain_dir()
         run_mock.assert_has_calls([mock.call([
             os.path.join(rustdir, 'rustup.sh'), '--prefix={}'.format(rustdir),
             '--disable-sudo', '--save',
@@ -162,4 +165,51 @@ class RustPluginTestCase(tests.TestCase):
             mock.call([
                 plugin._cargo, 'fetch',
                 '--manifest-path', os.path.join(plugin.sourcedir, 'Cargo.toml')
-            ])])
+            ], env=plugin._build_env())])
+
+    @mock.patch.object(rust.sources, 'Script')
+    @mock.patch.object(rust.RustPlugin, 'run')
+    def test_pull_shares_toolchain(self, run_mock, script_mock):
+        self.options.rust_revision = '1.13.0'
+        self.options.rust_channel = ''
+
+        for part_name in ('part1', 'part2'):
+            plugin = rust.RustPlugin(part_name, self.options,
+                                     self.project_options)
+            os.makedirs(plugin.sourcedir)
+            plugin.pull()
+            self.assertThat(plugin._rustpath,
+                            tests.LinkExists(plugin._get_toolchain_dir()))
+
+        toolchain_dir = plugin._get_toolchain_dir()
+        self.assertEqual(
+            [mock.call(rust._RUSTUP, toolchain_dir),
+             mock.call().download()],
+            script_mock.mock_calls)
+        self.assertEqual(
+            1, len([c for c in run_mock.mock_calls
+                    if c[1][0][0].endswith('rustup.sh')]))
+
+        plugin.clean_pull()
+
+        self.assertFalse(os.path.lexists(plugin._rustpath))
+        self.assertTrue(os.path.isdir(toolchain_dir))
+
+    def test_build_env_shares_cargo_home(self):
+        plugin = rust.RustPlugin('test-part', self.options,
+                                 self.project_options)
+
+        env = plugin._build_env()
+
+        self.assertEqual(os.path.join(self.path, '.cache', 'snapcraft',
+                                      'cargo'),
+                         env['CARGO_HOME'])
+        self.assertNotIn('CARGO_TARGET_DIR', env)
+
+    def test_build_env_incremental(self):
+        self.options.rust_incremental = True
+        plugin = rust.RustPlugin('test-part', self.options,
+                                 self.project_options)
+
+        self.assertEqual(os.path.join(plugin.partdir, 'cargo-target'),
+                         plugin._build_env()['CARGO_TARGET_DIR'])
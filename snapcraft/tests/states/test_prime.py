@@ -31,11 +31,12 @@ class PrimeStateBaseTestCase(tests.TestCase):
         self.files = {'foo'}
         self.directories = {'bar'}
         self.dependency_paths = {'baz'}
-        self.part_properties = {'prime': ['qux']}
+        self.part_properties = {'prime': ['qux'], 'strip': True}
+        self.stripped_files = {'foo': 'key'}
 
         self.state = snapcraft.internal.states.PrimeState(
             self.files, self.directories, self.dependency_paths,
-            self.part_properties, self.project)
+            self.part_properties, self.project, self.stripped_files)
 
 
 class PrimeStateTestCase(PrimeStateBaseTestCase):
@@ -47,14 +48,16 @@ class PrimeStateTestCase(PrimeStateBaseTestCase):
     def test_comparison(self):
         other = snapcraft.internal.states.PrimeState(
             self.files, self.directories, self.dependency_paths,
-            self.part_properties, self.project)
+            self.part_properties, self.project, self.stripped_files)
 
         self.assertTrue(self.state == other, 'Expected states to be identical')
 
     def test_properties_of_interest(self):
         properties = self.state.properties_of_interest(self.part_properties)
-        self.assertEqual(1, len(properties))
+        self.assertEqual(3, len(properties))
         self.assertEqual(['qux'], properties['prime'])
+        self.assertTrue(properties['strip'])
+        self.assertEqual('discard', properties['debug-symbols'])
 
     def test_project_options_of_interest(self):
         self.assertFalse(self.state.project_options_of_interest(self.project))
@@ -71,13 +74,15 @@ class PrimeStateNotEqualTestCase(PrimeStateBaseTestCase):
             other_property='dependency_paths', other_value=set())),
         ('no part properties', dict(
             other_property='part_properties', other_value=None)),
+        ('no stripped files', dict(
+            other_property='stripped_files', other_value=None)),
     ]
 
     def test_comparison_not_equal(self):
         setattr(self, self.other_property, self.other_value)
         other_state = snapcraft.internal.states.PrimeState(
             self.files, self.directories, self.dependency_paths,
-            self.part_properties, self.project)
+            self.part_properties, self.project, self.stripped_files)
 
         self.assertFalse(self.state == other_state,
                          'Expected states to be different')
@@ -16,12 +16,15 @@
 
 import json
 import logging
+import math
 import os
 from textwrap import dedent
 from unittest import mock
 
 import fixtures
 import pymacaroons
+import requests
+from testtools.matchers import Contains, HasLength
 
 from snapcraft import (
     config,
@@ -130,9 +133,14 @@ class DownloadTestCase(tests.TestCase):
         'd22a956457f14146f7f067b47bd976cf0292f2993ad864ccb498b'
         'fda4128234e4c201f28fe9')
 
+    TEST_SNAP_PATH = os.path.join(
+        os.path.dirname(tests.__file__), 'data', 'test-snap.snap')
+
     def setUp(self):
         super().setUp()
-        self.useFixture(fixture_setup.FakeStore())
+        fake_store = self.useFixture(fixture_setup.FakeStore())
+        self.search_server = (
+            fake_store.fake_store_search_server_fixture.server)
         self.client = storeapi.StoreClient()
 
     def test_download_unexisting_snap_raises_exception(self):
@@ -237,6 +245,84 @@ class DownloadTestCase(tests.TestCase):
             errors.SHAMismatchError,
             self.client.download,
             'test-snap-with-wrong-sha', 'test-channel', download_path)
+        self.assertFalse(os.path.exists(download_path))
+        self.assertFalse(os.path.exists(download_path + '.partial'))
+
+    def test_download_writes_sha512_sidecar(self):
+        self.client.login('dummy', 'test correct password')
+        download_path = os.path.join(self.path, 'test-snap.snap')
+        self.client.download('test-snap', 'test-channel', download_path)
+
+        with open(download_path + '.sha512') as sidecar:
+            self.assertEqual(
+                sidecar.read(),
+                '{}  test-snap.snap\n'.format(self.EXPECTED_SHA512.lower()))
+        self.assertFalse(os.path.exists(download_path + '.partial'))
+
+    def test_download_trusts_up_to_date_sha512_sidecar(self):
+        self.fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(self.fake_logger)
+        self.client.login('dummy', 'test correct password')
+        download_path = os.path.join(self.path, 'test-snap.snap')
+        open(download_path, 'w').close()
+        with open(download_path + '.sha512', 'w') as sidecar:
+            sidecar.write('{}  test-snap.snap\n'.format(
+                self.EXPECTED_SHA512.lower()))
+
+        self.client.download('test-snap', 'test-channel', download_path)
+
+        self.assertIn(
+            'Already downloaded test-snap at {}'.format(download_path),
+            self.fake_logger.output)
+
+    def test_download_ignores_outdated_sha512_sidecar(self):
+        self.fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(self.fake_logger)
+        self.client.login('dummy', 'test correct password')
+        download_path = os.path.join(self.path, 'test-snap.snap')
+        open(download_path, 'w').close()
+        with open(download_path + '.sha512', 'w') as sidecar:
+            sidecar.write('{}  test-snap.snap\n'.format(
+                self.EXPECTED_SHA512.lower()))
+        # The snap changed after its SHA512 was recorded.
+        sidecar_mtime = os.stat(download_path + '.sha512').st_mtime_ns
+        os.utime(download_path, ns=(sidecar_mtime + 1, sidecar_mtime + 1))
+
+        self.client.download('test-snap', 'test-channel', download_path)
+
+        self.assertIn(
+            'Successfully downloaded test-snap at {}'.format(download_path),
+            self.fake_logger.output)
+
+    def test_download_resumes_partial_download(self):
+        self.client.login('dummy', 'test correct password')
+        download_path = os.path.join(self.path, 'test-snap.snap')
+        with open(self.TEST_SNAP_PATH, 'rb') as snap_file:
+            snap_data = snap_file.read()
+        with open(download_path + '.partial', 'wb') as partial_file:
+            partial_file.write(snap_data[:100])
+
+        self.client.download('test-snap', 'test-channel', download_path)
+
+        self.assertEqual(self.search_server.download_ranges, ['bytes=100-'])
+        with open(download_path, 'rb') as downloaded_file:
+            self.assertEqual(downloaded_file.read(), snap_data)
+
+    def test_download_restarts_unresumable_partial_download(self):
+        self.client.login('dummy', 'test correct password')
+        download_path = os.path.join(self.path, 'test-snap.snap')
+        with open(self.TEST_SNAP_PATH, 'rb') as snap_file:
+            snap_data = snap_file.read()
+        with open(download_path + '.partial', 'wb') as partial_file:
+            partial_file.write(snap_data + b'trailing garbage')
+
+        self.client.download('test-snap', 'test-channel', download_path)
+
+        self.assertEqual(
+            self.search_server.download_ranges,
+            ['bytes={}-'.format(len(snap_data) + 16), None])
+        with open(download_path, 'rb') as downloaded_file:
+            self.assertEqual(downloaded_file.read(), snap_data)
 
 
 class PushSnapBuildTestCase(tests.TestCase):
@@ -642,6 +728,22 @@ class UploadTestCase(tests.TestCase):
         # This should not raise
         tracker.raise_for_code()
 
+    def test_upload_delta(self):
+        self.client.login('dummy', 'test correct password')
+        with mock.patch.object(self.client.sca, 'post',
+                               wraps=self.client.sca.post) as mock_post:
+            tracker = self.client.upload(
+                'test-snap', self.snap_path, delta_format='xdelta3',
+                source_hash='source-hash', target_hash='target-hash',
+                delta_hash='delta-hash')
+
+        self.assertEqual('ready_to_release', tracker.track()['code'])
+        data = json.loads(mock_post.call_args[1]['data'])
+        self.assertEqual('xdelta3', data['delta_format'])
+        self.assertEqual('source-hash', data['source_hash'])
+        self.assertEqual('target-hash', data['target_hash'])
+        self.assertEqual('delta-hash', data['delta_hash'])
+
     def test_upload_refreshes_macaroon(self):
         self.client.login('dummy', 'test correct password')
         self.fake_store.needs_refresh = True
@@ -677,6 +779,162 @@ class UploadTestCase(tests.TestCase):
             'Reason: \'Internal Server Error\'\n'
             'Text: \'Broken\'')
 
+    @mock.patch('snapcraft.storeapi.constants.UPLOAD_CHUNK_SIZE', new=1024)
+    def test_upload_snap_in_chunks(self):
+        self.client.login('dummy', 'test correct password')
+        tracker = self.client.upload('test-snap', self.snap_path)
+        self.assertEqual(tracker.track()['code'], 'ready_to_release')
+
+        uploads = self.fake_store.fake_store_upload_server_fixture.server.\
+            chunked_uploads
+        self.assertThat(uploads, HasLength(1))
+        upload, = uploads.values()
+        snap_size = os.path.getsize(self.snap_path)
+        self.assertEqual(upload['binary_filesize'], snap_size)
+        self.assertEqual(
+            upload['requests'], list(range(math.ceil(snap_size / 1024))))
+        with open(self.snap_path, 'rb') as snap_file:
+            self.assertEqual(
+                b''.join(upload['chunks'][i]
+                         for i in sorted(upload['chunks'])),
+                snap_file.read())
+
+    @mock.patch('snapcraft.storeapi._upload.sleep')
+    @mock.patch('snapcraft.storeapi.constants.UPLOAD_CHUNK_SIZE', new=1024)
+    def test_upload_snap_retries_failed_chunks(self, mock_sleep):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'UPDOWN_FLAKY_CHUNKS', '1'))
+        self.client.login('dummy', 'test correct password')
+        tracker = self.client.upload('test-snap', self.snap_path)
+        self.assertEqual(tracker.track()['code'], 'ready_to_release')
+
+        upload, = self.fake_store.fake_store_upload_server_fixture.server.\
+            chunked_uploads.values()
+        chunks = math.ceil(os.path.getsize(self.snap_path) / 1024)
+        # Every chunk is sent twice, as the first attempt always fails.
+        self.assertEqual(
+            upload['requests'],
+            [i for i in range(chunks) for _ in range(2)])
+        self.assertEqual(mock_sleep.call_args_list, [mock.call(1)] * chunks)
+
+    @mock.patch('snapcraft.storeapi.constants.UPLOAD_CHUNK_RETRIES', new=0)
+    def test_upload_snap_gives_up_after_retries(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'UPDOWN_FLAKY_CHUNKS', '1'))
+        self.client.login('dummy', 'test correct password')
+
+        raised = self.assertRaises(
+            errors.StoreUploadError,
+            self.client.upload, 'test-snap', self.snap_path)
+
+        self.assertThat(str(raised), Contains("Text: 'Unavailable'"))
+
+    @mock.patch('snapcraft.storeapi._upload.sleep')
+    @mock.patch.object(storeapi.UpDownClient, 'upload_chunk')
+    def test_upload_snap_backs_off_exponentially(
+            self, mock_upload_chunk, mock_sleep):
+        mock_upload_chunk.side_effect = requests.exceptions.ConnectionError(
+            'test error')
+        self.client.login('dummy', 'test correct password')
+
+        self.assertRaises(
+            RuntimeError,
+            self.client.upload, 'test-snap', self.snap_path)
+
+        self.assertEqual(
+            mock_sleep.call_args_list,
+            [mock.call(1), mock.call(2), mock.call(4), mock.call(8),
+             mock.call(16)])
+
+    def patch_received_chunks_query(self, errors):
+        get_received_chunks = storeapi.UpDownClient.get_received_chunks
+
+        def flaky_get_received_chunks(updown_client, upload_id):
+            if errors:
+                raise errors.pop(0)
+            return get_received_chunks(updown_client, upload_id)
+
+        patcher = mock.patch.object(
+            storeapi.UpDownClient, 'get_received_chunks', autospec=True,
+            side_effect=flaky_get_received_chunks)
+        mock_get_received_chunks = patcher.start()
+        self.addCleanup(patcher.stop)
+        return mock_get_received_chunks
+
+    @mock.patch('snapcraft.storeapi._upload.sleep')
+    def test_upload_snap_retries_received_chunks_query(self, mock_sleep):
+        mock_get_received_chunks = self.patch_received_chunks_query(
+            [requests.exceptions.ConnectionError('test error')])
+        self.client.login('dummy', 'test correct password')
+
+        tracker = self.client.upload('test-snap', self.snap_path)
+
+        self.assertEqual(tracker.track()['code'], 'ready_to_release')
+        self.assertEqual(2, mock_get_received_chunks.call_count)
+        self.assertEqual(mock_sleep.call_args_list, [mock.call(1)])
+
+    @mock.patch('snapcraft.storeapi._upload.sleep')
+    def test_upload_snap_received_chunks_query_errors_are_wrapped(
+            self, mock_sleep):
+        self.patch_received_chunks_query(
+            [requests.exceptions.ConnectionError('test error')] * 6)
+        self.client.login('dummy', 'test correct password')
+
+        raised = self.assertRaises(
+            RuntimeError,
+            self.client.upload, 'test-snap', self.snap_path)
+
+        self.assertThat(str(raised), Contains('test error'))
+        self.assertEqual(
+            mock_sleep.call_args_list,
+            [mock.call(1), mock.call(2), mock.call(4), mock.call(8),
+             mock.call(16)])
+
+    @mock.patch('snapcraft.storeapi._upload.sleep')
+    def test_upload_snap_retries_finish(self, mock_sleep):
+        finish_chunked_upload = storeapi.UpDownClient.finish_chunked_upload
+        errors_to_raise = [requests.exceptions.ConnectionError('test error')]
+
+        def flaky_finish_chunked_upload(updown_client, *args):
+            if errors_to_raise:
+                raise errors_to_raise.pop()
+            return finish_chunked_upload(updown_client, *args)
+
+        patcher = mock.patch.object(
+            storeapi.UpDownClient, 'finish_chunked_upload', autospec=True,
+            side_effect=flaky_finish_chunked_upload)
+        mock_finish_chunked_upload = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.login('dummy', 'test correct password')
+
+        tracker = self.client.upload('test-snap', self.snap_path)
+
+        self.assertEqual(tracker.track()['code'], 'ready_to_release')
+        self.assertEqual(2, mock_finish_chunked_upload.call_count)
+        self.assertEqual(mock_sleep.call_args_list, [mock.call(1)])
+
+    def test_upload_snap_with_checksum_mismatch(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'UPDOWN_CORRUPT_CHUNKS', '1'))
+        self.client.login('dummy', 'test correct password')
+
+        raised = self.assertRaises(
+            errors.StoreUploadError,
+            self.client.upload, 'test-snap', self.snap_path)
+
+        self.assertThat(str(raised), Contains("Text: 'Checksum mismatch'"))
+
+    def test_upload_snap_without_chunked_support(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'UPDOWN_NO_CHUNKED', '1'))
+        self.client.login('dummy', 'test correct password')
+        tracker = self.client.upload('test-snap', self.snap_path)
+        self.assertEqual(tracker.track()['code'], 'ready_to_release')
+
+        self.assertEqual(
+            self.fake_store.fake_store_upload_server_fixture.server.
+            chunked_uploads, {})
+
     def test_upload_snap_requires_review(self):
         self.client.login('dummy', 'test correct password')
         tracker = self.client.upload('test-review-snap', self.snap_path)
@@ -715,6 +973,108 @@ class UploadTestCase(tests.TestCase):
             self.client.upload, 'test-snap', self.snap_path)
 
 
+class StatusTrackerTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.useFixture(fixture_setup.FakeStore())
+        self.client = storeapi.StoreClient()
+        self.snap_path = os.path.join(
+            os.path.dirname(tests.__file__), 'data',
+            'test-snap.snap')
+        pbars = (
+            'snapcraft.storeapi._upload.ProgressBar',
+            'snapcraft.storeapi.ProgressBar',
+        )
+        for pbar in pbars:
+            patcher = mock.patch(pbar, new=tests.SilentProgressBar)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('snapcraft.storeapi.sleep')
+        self.mock_sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_track_honours_retry_after(self):
+        self.client.login('dummy', 'test correct password')
+        tracker = self.client.upload('test-slow-snap', self.snap_path)
+
+        self.assertEqual(tracker.track()['code'], 'ready_to_release')
+        self.assertEqual(
+            self.mock_sleep.call_args_list, [mock.call(3), mock.call(3)])
+
+    def test_track_polls_at_growing_intervals(self):
+        transport = mock.Mock(storeapi.Transport)
+        responses = [mock.Mock(headers={}) for _ in range(6)]
+        for response in responses[:-1]:
+            response.json.return_value = {
+                'code': 'being_processed', 'processed': False}
+        responses[-1].json.return_value = {
+            'code': 'ready_to_release', 'processed': True}
+        transport.get.side_effect = responses
+        tracker = storeapi.StatusTracker('http://example.com', transport)
+
+        self.assertEqual(tracker.wait()['code'], 'ready_to_release')
+        self.assertEqual(
+            self.mock_sleep.call_args_list,
+            [mock.call(0.5), mock.call(1), mock.call(2), mock.call(4),
+             mock.call(5)])
+
+    def test_track_retries_read_timeouts_and_invalid_json(self):
+        transport = mock.Mock(storeapi.Transport)
+        invalid_json = mock.Mock(headers={})
+        invalid_json.json.side_effect = ValueError('invalid json')
+        processed = mock.Mock(headers={})
+        processed.json.return_value = {
+            'code': 'ready_to_release', 'processed': True}
+        transport.get.side_effect = [
+            requests.exceptions.ReadTimeout(), invalid_json, processed]
+        tracker = storeapi.StatusTracker('http://example.com', transport)
+
+        self.assertEqual(tracker.wait()['code'], 'ready_to_release')
+        self.assertTrue(invalid_json.close.called)
+        self.assertTrue(processed.close.called)
+
+    def test_wait_raises_persistent_errors(self):
+        transport = mock.Mock(storeapi.Transport)
+        transport.get.side_effect = requests.exceptions.ReadTimeout()
+        tracker = storeapi.StatusTracker('http://example.com', transport)
+
+        self.assertRaises(requests.exceptions.ReadTimeout, tracker.wait)
+
+    def test_wait_raises_unexpected_errors(self):
+        transport = mock.Mock(storeapi.Transport)
+        transport.get.side_effect = RuntimeError('boom')
+        tracker = storeapi.StatusTracker('http://example.com', transport)
+
+        self.assertRaises(RuntimeError, tracker.wait)
+
+    def test_track_reads_server_sent_events(self):
+        self.client.login('dummy', 'test correct password')
+        tracker = self.client.upload('test-events-snap', self.snap_path)
+
+        self.assertEqual(tracker.track(), {
+            'code': 'ready_to_release',
+            'revision': '1',
+            'url': '/dev/click-apps/5349/rev/1',
+            'can_release': True,
+            'processed': True
+        })
+        self.assertFalse(self.mock_sleep.called)
+
+    def test_track_all(self):
+        self.client.login('dummy', 'test correct password')
+        trackers = [
+            self.client.upload(name, self.snap_path)
+            for name in ('test-snap', 'test-review-snap', 'test-events-snap')
+        ]
+
+        results = storeapi.track_all(trackers)
+
+        self.assertEqual(
+            [result['code'] for result in results],
+            ['ready_to_release', 'need_manual_review', 'ready_to_release'])
+
+
 class ReleaseTestCase(tests.TestCase):
 
     def setUp(self):
@@ -0,0 +1,139 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from unittest import mock
+
+import requests
+
+from snapcraft import (
+    storeapi,
+    tests,
+)
+from snapcraft.storeapi import (
+    _transport,
+    constants,
+)
+from snapcraft.tests import fixture_setup
+
+
+class TransportTestCase(tests.TestCase):
+
+    def test_adapter_is_pooled_with_retries(self):
+        transport = storeapi.Transport(retries=7, backoff_factor=2)
+
+        for prefix in ('http://', 'https://'):
+            adapter = transport.session.get_adapter(prefix + 'example.com')
+            self.assertEqual(
+                adapter._pool_maxsize, constants.HTTP_POOL_MAXSIZE)
+            self.assertEqual(adapter.max_retries.total, 7)
+            self.assertEqual(adapter.max_retries.backoff_factor, 2)
+            self.assertEqual(
+                adapter.max_retries.status_forcelist,
+                constants.HTTP_RETRY_STATUSES)
+
+    def test_posts_are_not_retried(self):
+        retry = storeapi.Transport().session.get_adapter(
+            'https://example.com').max_retries
+
+        self.assertTrue(retry.is_retry('GET', 503))
+        self.assertFalse(retry.is_retry('POST', 503))
+        self.assertFalse(retry.is_retry('GET', 500))
+
+    def test_disable_retries_under_prefix(self):
+        transport = storeapi.Transport()
+
+        transport.disable_retries('https://upload.example.com/')
+        transport.disable_retries('https://upload.example.com/')
+
+        self.assertEqual(0, transport.session.get_adapter(
+            'https://upload.example.com/chunked/').max_retries.total)
+        self.assertEqual(
+            constants.HTTP_RETRIES, transport.session.get_adapter(
+                'https://example.com/').max_retries.total)
+
+    @mock.patch.object(requests.Session, 'request')
+    def test_request_uses_default_timeout(self, mock_request):
+        transport = storeapi.Transport(timeout=(1, 2))
+
+        transport.get('http://example.com')
+        transport.request('POST', 'http://example.com', timeout=5)
+
+        self.assertEqual(mock_request.call_args_list, [
+            mock.call('GET', 'http://example.com', timeout=(1, 2)),
+            mock.call('POST', 'http://example.com', timeout=5),
+        ])
+
+    @mock.patch.object(requests.Session, 'request')
+    def test_request_records_metrics(self, mock_request):
+        response = mock_request.return_value
+        response.request.body = b'test body'
+        response.headers = {'Content-Length': '42'}
+        response.raw.retries.history = ('first', 'second')
+        transport = storeapi.Transport()
+
+        transport.get('http://example.com')
+        transport.get('http://example.com')
+
+        metrics = transport.metrics
+        self.assertEqual(metrics.requests, 2)
+        self.assertEqual(metrics.retries, 4)
+        self.assertEqual(metrics.bytes_sent, 18)
+        self.assertEqual(metrics.bytes_received, 84)
+        self.assertTrue(str(metrics).startswith('2 requests in '))
+
+
+class SharedTransportTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.useFixture(fixture_setup.FakeStore())
+
+    def test_clients_share_the_default_transport(self):
+        client = storeapi.StoreClient()
+
+        transport = _transport.get_default_transport()
+        self.assertIs(client.transport, transport)
+        for subclient in (client.sso, client.cpi, client.updown, client.sca):
+            self.assertIs(subclient.transport, transport)
+        self.assertIs(storeapi.StoreClient().transport, transport)
+
+    def test_uploads_are_not_retried_by_the_transport(self):
+        client = storeapi.StoreClient(storeapi.Transport())
+
+        self.assertEqual(0, client.transport.session.get_adapter(
+            client.updown.root_url).max_retries.total)
+        self.assertEqual(
+            constants.HTTP_RETRIES, client.transport.session.get_adapter(
+                client.sca.root_url).max_retries.total)
+
+    def test_status_tracker_uses_the_client_transport(self):
+        transport = storeapi.Transport()
+        client = storeapi.StoreClient(transport)
+        client.login('dummy', 'test correct password')
+        snap_path = os.path.join(
+            os.path.dirname(tests.__file__), 'data', 'test-snap.snap')
+
+        with mock.patch('snapcraft.storeapi._upload.ProgressBar',
+                        new=tests.SilentProgressBar):
+            tracker = client.upload('test-snap', snap_path)
+        requests_before_tracking = transport.metrics.requests
+        with mock.patch('snapcraft.storeapi.ProgressBar',
+                        new=tests.SilentProgressBar):
+            tracker.track()
+
+        self.assertGreater(
+            transport.metrics.requests, requests_before_tracking)
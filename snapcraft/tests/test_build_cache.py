@@ -0,0 +1,112 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2015 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import subprocess
+from unittest import mock
+
+import fixtures
+
+from snapcraft import tests
+from snapcraft.internal import build_cache
+
+
+class BuildCacheTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(self.fake_logger)
+
+        patcher = mock.patch('subprocess.check_output')
+        self.mock_check_output = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_cache_dir(self):
+        cache_root = os.path.join(self.path, '.cache', 'snapcraft')
+
+        self.assertEqual(
+            os.path.join(cache_root, 'my-snap', 'ccache', 'amd64'),
+            build_cache.get_cache_dir('my-snap', 'amd64'))
+        self.assertEqual(
+            os.path.join(cache_root, 'ccache', 'armhf'),
+            build_cache.get_cache_dir('my-snap', 'armhf', shared=True))
+
+    def test_get_env(self):
+        self.assertEqual([
+            'PATH="/usr/lib/ccache:$PATH"',
+            'CCACHE_DIR="cache"',
+            'CCACHE_MAXSIZE=1G',
+            'CCACHE_BASEDIR="project"',
+            'CCACHE_COMPILERCHECK=content',
+        ], build_cache.get_env('cache', base_dir='project', max_size='1G'))
+
+    def test_get_stats(self):
+        self.mock_check_output.return_value = (
+            'stats_updated_timestamp\t1500000000\n'
+            'direct_cache_hit\t5\n'
+            'preprocessed_cache_hit\t2\n'
+            'cache_miss\t3\n')
+
+        self.assertEqual((7, 3), build_cache.get_stats('cache'))
+        self.mock_check_output.assert_called_once_with(
+            ['ccache', '--print-stats'], env=mock.ANY,
+            stderr=subprocess.DEVNULL, universal_newlines=True)
+        self.assertEqual(
+            'cache', self.mock_check_output.call_args[1]['env']['CCACHE_DIR'])
+
+    def test_get_stats_from_old_ccache(self):
+        self.mock_check_output.side_effect = [
+            subprocess.CalledProcessError(1, ['ccache']),
+            'cache directory                     /cache\n'
+            'cache hit (direct)                     4\n'
+            'cache hit (preprocessed)               1\n'
+            'cache miss                            10\n'
+            'files in cache                        30\n']
+
+        self.assertEqual((5, 10), build_cache.get_stats('cache'))
+
+    def test_get_stats_without_ccache(self):
+        self.mock_check_output.side_effect = FileNotFoundError()
+
+        self.assertIsNone(build_cache.get_stats('cache'))
+
+    def test_report_hit_rate(self):
+        self.mock_check_output.side_effect = [
+            'direct_cache_hit\t10\ncache_miss\t5\n',
+            'direct_cache_hit\t19\ncache_miss\t6\n']
+
+        with build_cache.report_hit_rate('cache'):
+            pass
+
+        self.assertEqual(
+            'Build cache: 9 of 10 compilations were cached (90%).\n',
+            self.fake_logger.output)
+
+    def test_report_hit_rate_without_compilations(self):
+        self.mock_check_output.return_value = 'cache_miss\t5\n'
+
+        with build_cache.report_hit_rate('cache'):
+            pass
+
+        self.assertEqual('', self.fake_logger.output)
+
+    def test_report_hit_rate_without_cache(self):
+        with build_cache.report_hit_rate(None):
+            pass
+
+        self.mock_check_output.assert_not_called()
@@ -90,6 +90,21 @@ class SnapCacheTestCase(tests.TestCase):
                 None,
                 _get_revision_from_snap_filename(invalid_snap_file))
 
+    def test_get_latest_revision_for_arch(self):
+        snap_cache = cache.SnapCache(project_name='my-snap-name')
+        for cached_snap in ['my-snap-name_0.1_amd64_8.snap',
+                            'my-snap-name_0.2_amd64_10.snap',
+                            'my-snap-name_0.3_arm64_12.snap',
+                            'my-snap-name_0.3_amd64.snap']:
+            open(os.path.join(snap_cache.snap_cache_dir, cached_snap),
+                 'a').close()
+
+        self.assertEqual(
+            os.path.join(snap_cache.snap_cache_dir,
+                         'my-snap-name_0.2_amd64_10.snap'),
+            snap_cache.get(deb_arch='amd64'))
+        self.assertIsNone(snap_cache.get(deb_arch='i386'))
+
 
 class SnapCachedFilePruneTestCase(tests.TestCase):
 
@@ -158,3 +173,34 @@ class SnapCachedFilePruneTestCase(tests.TestCase):
             self.assertTrue(
                 os.path.isfile(os.path.join(snap_cache.snap_cache_dir,
                                             real_cached_snap)))
+
+
+class DeltaCacheTestCase(tests.TestCase):
+
+    def test_cache_and_get(self):
+        delta_cache = cache.DeltaCache(project_name='my-snap-name')
+        with open('my-snap-name.xdelta3', 'wb') as f:
+            f.write(b'delta')
+
+        self.assertIsNone(delta_cache.get('source', 'target', 'xdelta3'))
+        cached_delta_path = delta_cache.cache(
+            'my-snap-name.xdelta3', 'source', 'target', 'xdelta3')
+
+        self.assertEqual(
+            cached_delta_path,
+            delta_cache.get('source', 'target', 'xdelta3'))
+        self.assertIsNone(delta_cache.get('target', 'source', 'xdelta3'))
+        with open(cached_delta_path, 'rb') as f:
+            self.assertEqual(b'delta', f.read())
+
+    def test_prune(self):
+        delta_cache = cache.DeltaCache(project_name='my-snap-name')
+        open('my-snap-name.xdelta3', 'a').close()
+        delta_cache.cache(
+            'my-snap-name.xdelta3', 'source', 'target', 'xdelta3')
+
+        self.assertEqual(
+            [os.path.join(delta_cache.delta_cache_dir, 'source')],
+            delta_cache.prune())
+        self.assertEqual([], os.listdir(delta_cache.delta_cache_dir))
+        self.assertIsNone(delta_cache.get('source', 'target', 'xdelta3'))
@@ -40,6 +40,19 @@ class CommonTestCase(tests.TestCase):
         common.set_tourdir(tourdir)
         self.assertEqual(tourdir, common.get_tourdir())
 
+    def test_format_snap_arch(self):
+        self.assertEqual('all', common.format_snap_arch(None))
+        self.assertEqual('all', common.format_snap_arch([]))
+        self.assertEqual('armhf', common.format_snap_arch(['armhf']))
+        self.assertEqual(
+            'multi', common.format_snap_arch(['amd64', 'armhf']))
+
+    def test_format_snap_name(self):
+        self.assertEqual(
+            'foo_1.0_armhf.snap', common.format_snap_name(
+                {'name': 'foo', 'version': '1.0',
+                 'architectures': ['armhf']}))
+
     def test_isurl(self):
         self.assertTrue(common.isurl('git://'))
         self.assertTrue(common.isurl('bzr://'))
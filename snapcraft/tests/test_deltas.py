@@ -16,6 +16,9 @@
 
 import logging
 import os
+import shutil
+import threading
+
 import fixtures
 
 from testtools import TestCase
@@ -143,3 +146,24 @@ for now delta_format='invalid-delta-format'"""
             lambda: tmp_delta.make_delta(is_for_test=True),
             m.raises(NotImplementedError)
         )
+
+    def test_cancel_kills_the_delta_tool(self):
+        class SleepDeltasGenerator(deltas.BaseDeltasGenerator):
+            def get_delta_cmd(self, source_path, target_path, delta_file):
+                return [self.delta_tool_path, '60']
+
+        tmp_delta = SleepDeltasGenerator(
+            source_path=self.source_file,
+            target_path=self.target_file,
+            delta_format='xdelta3',
+            delta_tool_path=shutil.which('sleep'))
+        threading.Timer(0.5, tmp_delta.cancel).start()
+
+        self.assertThat(
+            lambda: tmp_delta.make_delta(is_for_test=True),
+            m.raises(deltas.errors.DeltaGenerationError)
+        )
+        self.assertThat(
+            lambda: tmp_delta.make_delta(is_for_test=True),
+            m.raises(deltas.errors.DeltaGenerationError)
+        )
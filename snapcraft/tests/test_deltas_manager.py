@@ -0,0 +1,204 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2015 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import threading
+from unittest import mock
+
+import fixtures
+
+from snapcraft import tests
+from snapcraft.internal import deltas
+
+
+class FakeGenerator:
+
+    delta_size = 10
+    error = None
+    generated = []
+    release = None
+
+    def __init__(self, *, source_path, target_path):
+        self.delta_format = 'xdelta3'
+        self.target_path = target_path
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        if self.release:
+            self.release.set()
+
+    def make_delta(self, output_dir):
+        if self.release:
+            self.release.wait()
+        if self.cancelled:
+            raise deltas.errors.DeltaGenerationError('cancelled')
+        if self.error:
+            raise self.error
+        delta_path = os.path.join(output_dir, 'target.snap.xdelta3')
+        with open(delta_path, 'wb') as f:
+            f.write(b'd' * self.delta_size)
+        self.generated.append(delta_path)
+        return delta_path
+
+
+class DeltaManagerTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fake_logger = fixtures.FakeLogger(level=logging.DEBUG)
+        self.useFixture(self.fake_logger)
+
+        self.source = os.urandom(100000)
+        with open('source.snap', 'wb') as f:
+            f.write(self.source)
+        with open('target.snap', 'wb') as f:
+            f.write(b'new data' + self.source)
+
+        FakeGenerator.generated = []
+        self.addCleanup(setattr, FakeGenerator, 'generated', [])
+
+    def make_manager(self, generator_class=FakeGenerator, **kwargs):
+        return deltas.DeltaManager(
+            project_name='my-snap-name', source_path='source.snap',
+            target_path='target.snap', generator_class=generator_class,
+            **kwargs)
+
+    def test_estimate_delta_ratio(self):
+        with open('other.snap', 'wb') as f:
+            f.write(os.urandom(100000))
+        open('empty.snap', 'wb').close()
+
+        self.assertEqual(
+            0, deltas.estimate_delta_ratio('source.snap', 'source.snap'))
+        self.assertLess(
+            deltas.estimate_delta_ratio('source.snap', 'target.snap'), 0.3)
+        self.assertEqual(
+            1, deltas.estimate_delta_ratio('source.snap', 'other.snap'))
+        self.assertEqual(
+            0, deltas.estimate_delta_ratio('source.snap', 'empty.snap'))
+
+    def test_delta_is_generated_and_cached(self):
+        manager = self.make_manager()
+        manager.start()
+        delta = manager.result()
+
+        self.assertEqual('xdelta3', delta.delta_format)
+        self.assertFalse(delta.cached)
+        self.assertEqual(deltas.calculate_digest('source.snap'),
+                         delta.source_hash)
+        self.assertEqual(deltas.calculate_digest('target.snap'),
+                         delta.target_hash)
+        self.assertEqual(deltas.calculate_digest(delta.path),
+                         delta.delta_hash)
+        self.assertTrue(os.path.isfile(delta.path))
+        self.assertEqual(1, len(FakeGenerator.generated))
+        self.assertIn('Pushing a xdelta3 delta', self.fake_logger.output)
+        self.assertIn("'cached': False", self.fake_logger.output)
+
+        manager = self.make_manager()
+        manager.start()
+        cached_delta = manager.result()
+
+        self.assertTrue(cached_delta.cached)
+        self.assertEqual(delta.path, cached_delta.path)
+        self.assertEqual(1, len(FakeGenerator.generated))
+
+    def test_delta_skipped_when_estimated_too_big(self):
+        with open('target.snap', 'wb') as f:
+            f.write(os.urandom(100000))
+
+        manager = self.make_manager()
+        manager.start()
+
+        self.assertIsNone(manager.result())
+        self.assertEqual([], FakeGenerator.generated)
+        self.assertEqual(1, manager.metrics['estimated_ratio'])
+        self.assertIn('skipping the delta', self.fake_logger.output)
+
+    def test_full_snap_when_delta_too_big(self):
+        class BigDeltaGenerator(FakeGenerator):
+            delta_size = 90000
+
+        manager = self.make_manager(generator_class=BigDeltaGenerator)
+        manager.start()
+
+        self.assertIsNone(manager.result())
+        self.assertEqual(0.9, manager.metrics['ratio'])
+        self.assertIn('pushing the full snap', self.fake_logger.output)
+
+    def test_full_snap_when_over_time_budget(self):
+        class SlowGenerator(FakeGenerator):
+            release = threading.Event()
+
+        manager = self.make_manager(generator_class=SlowGenerator,
+                                    time_budget=0)
+        manager.start()
+        self.addCleanup(SlowGenerator.release.set)
+
+        self.assertIsNone(manager.result())
+        self.assertIn('is taking longer than 0 seconds',
+                      self.fake_logger.output)
+        # The late delta is cancelled rather than left running.
+        manager._executor.shutdown(wait=True)
+        self.assertEqual([], SlowGenerator.generated)
+
+    def test_cancel_stops_the_delta(self):
+        class SlowGenerator(FakeGenerator):
+            release = threading.Event()
+
+        manager = self.make_manager(generator_class=SlowGenerator)
+        self.addCleanup(SlowGenerator.release.set)
+        manager.start()
+        manager.cancel()
+        manager._executor.shutdown(wait=True)
+
+        self.assertEqual([], SlowGenerator.generated)
+
+    def test_estimate_runs_in_the_background(self):
+        estimating = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow_estimate(source_path, target_path):
+            estimating.set()
+            release.wait()
+            return 0.1
+
+        patcher = mock.patch(
+            'snapcraft.internal.deltas._manager.estimate_delta_ratio',
+            side_effect=slow_estimate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        manager = self.make_manager()
+        manager.start()
+
+        self.assertTrue(estimating.wait(timeout=5))
+        release.set()
+        self.assertIsNotNone(manager.result())
+        self.assertEqual(0.1, manager.metrics['estimated_ratio'])
+
+    def test_full_snap_when_generation_fails(self):
+        class FailingGenerator(FakeGenerator):
+            error = deltas.errors.DeltaGenerationError('boom')
+
+        manager = self.make_manager(generator_class=FailingGenerator)
+        manager.start()
+
+        self.assertIsNone(manager.result())
+        self.assertIn("Unable to get a delta for 'target.snap': boom",
+                      self.fake_logger.output)
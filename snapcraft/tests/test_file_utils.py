@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import logging
 import os
 import re
 import subprocess
@@ -86,6 +87,166 @@ class ReplaceInFileTestCase(tests.TestCase):
             self.assertEqual(f.read(), file_info['expected'])
 
 
+class ReplaceInFilesTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs('bin')
+
+    def _write(self, file_name, contents):
+        with open(os.path.join('bin', file_name), 'wb') as f:
+            f.write(contents)
+
+    def _read(self, file_name):
+        with open(os.path.join('bin', file_name), 'rb') as f:
+            return f.read()
+
+    def test_replace_in_files_applies_passes_in_order(self):
+        self._write('fooConfig.cmake', b'#!/foo/python\n"/usr/lib"')
+        self._write('foo', b'#!/foo/python\n"/usr/lib"')
+
+        file_utils.replace_in_files('bin', [
+            (re.compile(r''), re.compile(r'^#!.*python'),
+             r'#!/usr/bin/env python'),
+            (re.compile(r'.*Config.cmake$'), re.compile(r'/usr/(lib)'),
+             r'/opt/\1'),
+            (re.compile(r'.*Config.cmake$'), re.compile(r'/opt/lib'),
+             r'/snap/lib'),
+        ])
+
+        self.assertEqual(self._read('fooConfig.cmake'),
+                         b'#!/usr/bin/env python\n"/snap/lib"')
+        self.assertEqual(self._read('foo'),
+                         b'#!/usr/bin/env python\n"/usr/lib"')
+
+    def test_replace_in_files_skips_binary_files(self):
+        self._write('nul', b'#!/foo/python\0')
+        self._write('undecodable', b'#!/foo/python\xff')
+        self._write('empty', b'')
+
+        file_utils.replace_in_files('bin', [
+            (re.compile(r''), re.compile(r'#!.*python'),
+             r'#!/usr/bin/env python')])
+
+        self.assertEqual(self._read('nul'), b'#!/foo/python\0')
+        self.assertEqual(self._read('undecodable'), b'#!/foo/python\xff')
+        self.assertEqual(self._read('empty'), b'')
+
+    def test_replace_in_files_keeps_encoding_and_line_endings(self):
+        self._write('foo', '#!/foo/python\r\n\u00e9\r\n'.encode())
+
+        file_utils.replace_in_files('bin', [
+            (re.compile(r''), re.compile(r'#!.*python'),
+             r'#!/usr/bin/env python')])
+
+        self.assertEqual(self._read('foo'),
+                         '#!/usr/bin/env python\r\n\u00e9\r\n'.encode())
+
+    def test_replace_in_files_skips_files_without_literal(self):
+        self._write('foo', b'echo python')
+
+        search_pattern = re.compile(r'#!.*python')
+        search_pattern = mock.Mock(wraps=search_pattern,
+                                   pattern=search_pattern.pattern,
+                                   flags=search_pattern.flags)
+        file_utils.replace_in_files('bin', [
+            (re.compile(r''), search_pattern, r'#!/usr/bin/env python')])
+
+        self.assertFalse(search_pattern.sub.called)
+        self.assertEqual(self._read('foo'), b'echo python')
+
+    def test_replace_in_files_with_closures(self):
+        for file_name in ('foo', 'bar'):
+            self._write(file_name, b'#!/foo/python')
+        prefix = '#!/usr/bin/env '
+
+        def replace(match):
+            return prefix + 'python'
+
+        self.assertFalse(file_utils._can_pickle(replace))
+        with mock.patch('snapcraft.file_utils._PARALLEL_REPLACE_MIN_SIZE', 0):
+            with mock.patch('snapcraft.file_utils.ProcessPoolExecutor') as m:
+                file_utils.replace_in_files('bin', [
+                    (re.compile(r''), re.compile(r'#!.*python'), replace)])
+
+        self.assertFalse(m.called)
+        for file_name in ('foo', 'bar'):
+            self.assertEqual(self._read(file_name), b'#!/usr/bin/env python')
+
+    def test_replace_in_files_inline_when_little_to_do(self):
+        for file_name in ('foo', 'bar'):
+            self._write(file_name, b'#!/foo/python')
+
+        with mock.patch('snapcraft.file_utils.ProcessPoolExecutor') as p:
+            with mock.patch('snapcraft.file_utils.ThreadPoolExecutor') as t:
+                file_utils.replace_in_files('bin', [
+                    (re.compile(r''), re.compile(r'#!.*python'),
+                     r'#!/usr/bin/env python')])
+
+        self.assertFalse(p.called)
+        self.assertFalse(t.called)
+        for file_name in ('foo', 'bar'):
+            self.assertEqual(self._read(file_name), b'#!/usr/bin/env python')
+
+    def test_replace_in_files_rewrites_hard_links_once(self):
+        self._write('foo', b'#!/foo/python\n"/usr/lib"')
+        os.link(os.path.join('bin', 'foo'), os.path.join('bin', 'fooConfig'))
+
+        with mock.patch('snapcraft.file_utils._search_and_replace_contents',
+                        wraps=file_utils._search_and_replace_contents) as m:
+            file_utils.replace_in_files('bin', [
+                (re.compile(r''), re.compile(r'^#!.*python'),
+                 r'#!/usr/bin/env python'),
+                (re.compile(r'.*Config$'), re.compile(r'/usr/lib'),
+                 r'/snap/lib'),
+            ])
+
+        self.assertEqual(1, m.call_count)
+        self.assertEqual(self._read('foo'),
+                         b'#!/usr/bin/env python\n"/snap/lib"')
+
+    def test_replace_in_files_logs_permission_errors(self):
+        self._write('foo', b'#!/foo/python')
+        self._write('bar', b'#!/foo/python')
+        fake_logger = fixtures.FakeLogger(level=logging.WARNING)
+        self.useFixture(fake_logger)
+
+        # Force a PermissionError, even when running with elevated
+        # permissions.
+        with mock.patch('snapcraft.file_utils.open',
+                        side_effect=PermissionError('denied')):
+            file_utils.replace_in_files('bin', [
+                (re.compile(r''), re.compile(r'#!.*python'),
+                 r'#!/usr/bin/env python')])
+
+        self.assertIn('Unable to open bin/foo for writing: denied',
+                      fake_logger.output)
+        self.assertIn('Unable to open bin/bar for writing: denied',
+                      fake_logger.output)
+
+
+class GetRequiredLiteralTestCase(tests.TestCase):
+
+    scenarios = [
+        ('empty', {'pattern': r'', 'expected': None}),
+        ('shebang', {'pattern': r'^#!.*python', 'expected': b'#!'}),
+        ('unicode', {'pattern': '\u00e9t\u00e9 .*', 'expected':
+                     '\u00e9t\u00e9 '.encode()}),
+        ('escaped', {'pattern': r'/usr/bin/python3\.5', 'expected':
+                     b'/usr/bin/python3.5'}),
+        ('escaped class', {'pattern': r'\w+', 'expected': None}),
+        ('quantifier', {'pattern': r'pythons?', 'expected': b'python'}),
+        ('alternation', {'pattern': r'foo|bar', 'expected': None}),
+        ('group', {'pattern': r'"(.*?/.*?)"', 'expected': b'"'}),
+        ('ignorecase', {'pattern': r'(?i)python', 'expected': None}),
+    ]
+
+    def test_get_required_literal(self):
+        self.assertEqual(
+            file_utils._get_required_literal(re.compile(self.pattern)),
+            self.expected)
+
+
 class TestLinkOrCopyTree(tests.TestCase):
 
     def setUp(self):
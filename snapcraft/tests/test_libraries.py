@@ -48,6 +48,41 @@ class TestLdLibraryPathParser(tests.TestCase):
                          libraries._extract_ld_library_paths(file_path))
 
 
+class TestConsolidateLibraryPaths(tests.TestCase):
+
+    def _make_library(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'w').close()
+
+    def test_first_library_in_search_order_is_linked(self):
+        for path in ('root/usr/lib/libfoo.so.1', 'root/lib/libfoo.so.1',
+                     'root/lib/libbar.so', 'root/lib/libbar.a',
+                     'root/lib/subdir/libbaz.so', 'root/lib/README'):
+            self._make_library(path)
+        os.symlink('libfoo.so.1', os.path.join('root', 'lib', 'libfoo.so'))
+
+        library_dir = libraries.consolidate_library_paths(
+            'root', ['root/usr/lib', 'root/missing', 'root/lib'])
+
+        self.assertEqual(os.path.join('root', 'snap', 'lib'), library_dir)
+        self.assertEqual(['libbar.so', 'libfoo.so', 'libfoo.so.1'],
+                         sorted(os.listdir(library_dir)))
+        self.assertThat(os.path.join(library_dir, 'libfoo.so.1'),
+                        tests.LinkExists('../../usr/lib/libfoo.so.1'))
+        self.assertThat(os.path.join(library_dir, 'libfoo.so'),
+                        tests.LinkExists('../../lib/libfoo.so'))
+
+    def test_stale_links_are_removed(self):
+        self._make_library('root/lib/libfoo.so')
+        libraries.consolidate_library_paths('root', ['root/lib'])
+        os.remove('root/lib/libfoo.so')
+
+        library_dir = libraries.consolidate_library_paths(
+            'root', ['root/lib'])
+
+        self.assertEqual([], os.listdir(library_dir))
+
+
 class TestGetLibraries(tests.TestCase):
 
     def setUp(self):
@@ -15,11 +15,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
+import os
 
 import fixtures
 from unittest import mock
 
 import snapcraft
+from snapcraft import formatting_utils
 from snapcraft.internal import (
     pluginhandler,
     lifecycle,
@@ -179,6 +181,21 @@ grade: stable
         }
         self.assertEqual(snap_info, expected_snap_info)
 
+    def test_prime_consolidates_library_paths(self):
+        self.make_snapcraft_yaml("""parts:
+  part1:
+    plugin: nil
+""", 'consolidate-library-paths: true')
+
+        lifecycle.execute('stage', self.project_options)
+
+        library_dir = os.path.join(self.prime_dir, 'snap', 'lib')
+        self.assertFalse(os.path.exists(library_dir))
+
+        lifecycle.execute('prime', self.project_options)
+
+        self.assertTrue(os.path.isdir(library_dir))
+
     def test_dirty_prime_reprimes_single_part(self):
         self.make_snapcraft_yaml("""parts:
   part1:
@@ -604,3 +621,28 @@ grade: stable
             "The 'deb_arch' project option appears to have changed.\n\n"
             "Please clean that part's 'pull' step in order to continue",
             str(raised))
+
+
+class ReportPackingTestCase(tests.TestCase):
+
+    def test_report_packing(self):
+        fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(fake_logger)
+
+        os.makedirs(os.path.join('prime', 'bin'))
+        with open(os.path.join('prime', 'bin', 'app'), 'wb') as f:
+            f.write(b'x' * 4096)
+        with open('test.snap', 'wb') as f:
+            f.write(b'x' * 1024)
+
+        lifecycle._report_packing('prime', 'test.snap', 'fast', 2)
+
+        # The bin directory entry is counted too.
+        input_size = 4096 + os.stat(os.path.join('prime', 'bin')).st_size
+        self.assertEqual(
+            "Packed {} into 1.0 KiB with the 'fast' profile ({:.0f}%, "
+            "{}/s)\n".format(
+                formatting_utils.humanize_bytes(input_size),
+                1024 / input_size * 100,
+                formatting_utils.humanize_bytes(input_size / 2)),
+            fake_logger.output)
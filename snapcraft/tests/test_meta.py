@@ -711,6 +711,197 @@ PATH={0}/part1/install/usr/bin:{0}/part1/install/bin
                          {'app1': {'command': 'command-app1.wrapper'}})
 
 
+class OptimizedWrappersTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.packager = _SnapPackaging(
+            {'confinement': 'devmode', 'wrappers': 'optimized'},
+            ProjectOptions())
+
+        patcher = patch('snapcraft.internal.common.assemble_env')
+        self.mock_assemble_env = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.env_path = os.path.join(self.prime_dir, 'snap', 'command-env')
+        _create_file(os.path.join(self.prime_dir, 'bin', 'app'),
+                     executable=True)
+
+    def test_env_is_minimized_into_snap_yaml(self):
+        os.makedirs(os.path.join(self.prime_dir, 'usr', 'lib'))
+        self.mock_assemble_env.return_value = """\
+export PATH="{0}/bin:{0}/usr/bin:$PATH"
+export LD_LIBRARY_PATH="{0}/usr/lib:{0}/lib:$LD_LIBRARY_PATH"
+export LD_LIBRARY_PATH="{1}/part1/install/usr/lib:$LD_LIBRARY_PATH"
+export LANG=C.UTF-8
+""".format(self.prime_dir, self.parts_dir)
+        stale_wrapper = os.path.join(self.prime_dir, 'command-app1.wrapper')
+        _create_file(stale_wrapper)
+
+        apps = self.packager._wrap_apps({
+            'app1': {'command': 'bin/app'},
+            'app2': {'command': 'bin/app --arg', 'stop-command': 'bin/app'},
+        })
+
+        environment = {
+            'PATH': '$SNAP/bin:$PATH',
+            'LD_LIBRARY_PATH': '$SNAP_LIBRARY_PATH:$SNAP/usr/lib:'
+                               '$LD_LIBRARY_PATH',
+            'LANG': 'C.UTF-8',
+        }
+        self.assertEqual({
+            'app1': {'command': 'bin/app', 'environment': environment},
+            'app2': {'command': 'bin/app --arg', 'stop-command': 'bin/app',
+                     'environment': environment},
+        }, apps)
+        self.assertFalse(os.path.exists(self.env_path))
+        self.assertFalse(os.path.exists(stale_wrapper))
+        self.assertEqual(1, self.mock_assemble_env.call_count)
+
+    def test_env_is_shared_by_wrappers_needing_a_shell(self):
+        os.makedirs(os.path.join(self.prime_dir, 'usr', 'lib'))
+        self.mock_assemble_env.return_value = """\
+export PATH="{0}/bin:{0}/usr/bin:$PATH"
+export LD_LIBRARY_PATH="{0}/usr/lib:{0}/lib:$LD_LIBRARY_PATH"
+export LANG=C.UTF-8
+""".format(self.prime_dir)
+
+        apps = self.packager._wrap_apps({
+            'app1': {'command': 'bin/app $SNAP_DATA'},
+            'app2': {'command': 'bin/app', 'stop-command': 'bin/app "a b"'},
+        })
+
+        self.assertThat(self.env_path, FileContains(
+            'export PATH="$SNAP/bin:$PATH"\n'
+            'export LD_LIBRARY_PATH="$SNAP/usr/lib:$LD_LIBRARY_PATH"\n'
+            'export LANG="C.UTF-8"\n'
+            'export LD_LIBRARY_PATH="$SNAP_LIBRARY_PATH:$LD_LIBRARY_PATH"\n'))
+        self.assertEqual({
+            'app1': {'command': 'command-app1.wrapper'},
+            'app2': {'command': 'command-app2.wrapper',
+                     'stop-command': 'stop-command-app2.wrapper'},
+        }, apps)
+        self.assertThat(
+            os.path.join(self.prime_dir, apps['app1']['command']),
+            FileContains(
+                '#!/bin/sh\n'
+                '. "$SNAP/snap/command-env"\n'
+                'exec "$SNAP/bin/app" $SNAP_DATA "$@"\n'))
+        self.assertThat(
+            os.path.join(self.prime_dir, apps['app2']['command']),
+            FileContains(
+                '#!/bin/sh\n'
+                '. "$SNAP/snap/command-env"\n'
+                'exec "$SNAP/bin/app" "$@"\n'))
+        self.assertEqual(1, self.mock_assemble_env.call_count)
+
+    def test_unknown_constructs_need_wrappers(self):
+        self.mock_assemble_env.return_value = 'export FOO="${BAR:-baz}"\n'
+
+        apps = self.packager._wrap_apps({'app': {'command': 'bin/app'}})
+
+        self.assertEqual({'app': {'command': 'command-app.wrapper'}}, apps)
+
+    def test_shebang_in_parts_needs_wrappers(self):
+        self.mock_assemble_env.return_value = ''
+        _create_file(
+            os.path.join(self.prime_dir, 'bin', 'script'),
+            content='#!{}/part1/install/usr/bin/python3\n'.format(
+                self.parts_dir),
+            executable=True)
+
+        apps = self.packager._wrap_apps({'app': {'command': 'bin/script'}})
+
+        self.assertEqual({'app': {'command': 'command-app.wrapper'}}, apps)
+
+    def test_no_env_runs_directly_with_snap_library_path(self):
+        self.mock_assemble_env.return_value = ''
+        _create_file(os.path.join(self.prime_dir, 'bin', 'script'),
+                     content='#!/bin/sh\n', executable=True)
+
+        apps = self.packager._wrap_apps({'app': {'command': 'bin/script'}})
+
+        self.assertEqual({'app': {
+            'command': 'bin/script',
+            'environment': {
+                'LD_LIBRARY_PATH': '$SNAP_LIBRARY_PATH:$LD_LIBRARY_PATH'},
+        }}, apps)
+
+    def test_unknown_constructs_keep_env_verbatim(self):
+        self.mock_assemble_env.return_value = """\
+export PATH="{0}/bin:$PATH"
+export FOO="${{BAR:-baz}}"
+""".format(self.prime_dir)
+
+        self.packager._wrap_exe('bin/app')
+
+        self.assertThat(self.env_path, FileContains(
+            'export PATH="$SNAP/bin:$PATH"\n'
+            'export FOO="${BAR:-baz}"\n'
+            'export LD_LIBRARY_PATH="$SNAP_LIBRARY_PATH:$LD_LIBRARY_PATH"\n'))
+
+    def test_no_env_keeps_snap_library_path(self):
+        self.mock_assemble_env.return_value = """\
+export PATH="{0}/usr/bin:$PATH"
+export LD_LIBRARY_PATH="{0}/lib:$LD_LIBRARY_PATH"
+""".format(self.prime_dir)
+
+        self.assertEqual('bin/app.wrapper',
+                         self.packager._wrap_exe('bin/app --arg'))
+        self.assertThat(self.env_path, FileContains(
+            'export LD_LIBRARY_PATH="$SNAP_LIBRARY_PATH:$LD_LIBRARY_PATH"\n'))
+        self.assertThat(
+            os.path.join(self.prime_dir, 'bin', 'app.wrapper'),
+            FileContains(
+                '#!/bin/sh\n'
+                '. "$SNAP/snap/command-env"\n'
+                'exec "$SNAP/bin/app" --arg "$@"\n'))
+
+    def test_no_env_wraps_shebang_in_parts(self):
+        self.mock_assemble_env.return_value = ''
+        _create_file(
+            os.path.join(self.prime_dir, 'bin', 'script'),
+            content='#!{}/part1/install/usr/bin/python3\n'.format(
+                self.parts_dir),
+            executable=True)
+
+        relative_wrapper_path = self.packager._wrap_exe('bin/script')
+
+        self.assertThat(
+            os.path.join(self.prime_dir, relative_wrapper_path),
+            FileContains(
+                '#!/bin/sh\n'
+                '. "$SNAP/snap/command-env"\n'
+                'exec "$SNAP/usr/bin/python3" "$SNAP/bin/script" "$@"\n'))
+
+    def test_no_env_wraps_hooks(self):
+        self.mock_assemble_env.return_value = ''
+        hook_path = os.path.join(self.prime_dir, 'snap', 'hooks', 'install')
+        _create_file(hook_path, content='#!/bin/sh\n', executable=True)
+
+        self.packager.generate_hook_wrappers()
+
+        self.assertThat(
+            os.path.join(self.prime_dir, 'meta', 'hooks', 'install'),
+            FileContains(
+                '#!/bin/sh\n'
+                '. "$SNAP/snap/command-env"\n'
+                'exec "$SNAP/snap/hooks/install" "$@"\n'))
+
+    def test_stale_env_is_replaced(self):
+        _create_file(self.env_path, content='export FOO="bar"\n')
+        self.mock_assemble_env.return_value = ''
+
+        packager = _SnapPackaging(
+            {'confinement': 'devmode', 'wrappers': 'optimized'},
+            ProjectOptions())
+        packager._wrap_exe('bin/app')
+
+        self.assertThat(self.env_path, FileContains(
+            'export LD_LIBRARY_PATH="$SNAP_LIBRARY_PATH:$LD_LIBRARY_PATH"\n'))
+
+
 def _create_file(path, *, content='', executable=False):
     os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, 'w') as f:
@@ -1384,6 +1384,87 @@ parts:
                 'LD_LIBRARY_PATH' in variable,
                 'Expected no LD_LIBRARY_PATH (got {!r})'.format(variable))
 
+    @unittest.mock.patch.object(snapcraft.internal.pluginhandler.PluginHandler,
+                                'get_primed_dependency_paths')
+    def test_config_snap_environment_consolidated_library_paths(
+            self, mock_get_dependencies):
+        self.make_snapcraft_yaml("""name: test
+version: "1"
+summary: test
+description: test
+confinement: strict
+grade: stable
+consolidate-library-paths: true
+
+parts:
+  part1:
+    plugin: nil
+""")
+        dependency_path = os.path.join(self.prime_dir, 'lib1')
+        mock_get_dependencies.return_value = {dependency_path}
+        for lib_path in (dependency_path,
+                         os.path.join(self.prime_dir, 'usr', 'lib')):
+            os.makedirs(lib_path)
+            open(os.path.join(lib_path, 'libfoo.so'), 'w').close()
+        config = project_loader.Config()
+
+        environment = config.snap_env()
+
+        library_dir = os.path.join(self.prime_dir, 'snap', 'lib')
+        self.assertEqual(
+            ['LD_LIBRARY_PATH="{}:$LD_LIBRARY_PATH"'.format(library_dir)],
+            [e for e in environment if 'LD_LIBRARY_PATH' in e])
+        # Getting the environment leaves the primed snap alone.
+        self.assertFalse(os.path.exists(library_dir))
+
+        config.consolidate_library_paths()
+
+        self.assertThat(os.path.join(library_dir, 'libfoo.so'),
+                        tests.LinkExists('../../lib1/libfoo.so'))
+
+    def test_config_build_cache(self):
+        self.make_snapcraft_yaml("""name: test
+version: "1"
+summary: test
+description: test
+confinement: strict
+grade: stable
+build-cache:
+  max-size: 500M
+
+parts:
+  part1:
+    plugin: nil
+""")
+        config = project_loader.Config()
+
+        cache_dir = os.path.join(
+            self.path, '.cache', 'snapcraft', 'test', 'ccache', self.arch)
+        self.assertEqual(cache_dir, config.build_cache_dir)
+        self.assertIn('ccache', config.build_tools)
+        environment = config.build_cache_env()
+        self.assertIn('PATH="/usr/lib/ccache:$PATH"', environment)
+        self.assertIn('CCACHE_DIR="{}"'.format(cache_dir), environment)
+        self.assertIn('CCACHE_MAXSIZE=500M', environment)
+
+    def test_config_without_build_cache(self):
+        self.make_snapcraft_yaml("""name: test
+version: "1"
+summary: test
+description: test
+confinement: strict
+grade: stable
+
+parts:
+  part1:
+    plugin: nil
+""")
+        config = project_loader.Config()
+
+        self.assertIsNone(config.build_cache_dir)
+        self.assertNotIn('ccache', config.build_tools)
+        self.assertEqual([], config.build_cache_env())
+
     def test_config_runtime_environment_ld(self):
         # Place a few ld.so.conf files in supported locations. We expect the
         # contents of these to make it into the LD_LIBRARY_PATH.
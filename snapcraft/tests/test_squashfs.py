@@ -0,0 +1,389 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import stat
+import struct
+import zlib
+
+import testtools
+
+from snapcraft import tests
+from snapcraft.internal import errors, squashfs
+
+
+def _write_superblock(path, compression_id=4, flags=0x02c0,
+                      magic=b'hsqs'):
+    with open(path, 'wb') as f:
+        f.write(struct.pack(
+            '<4sIIIIHHH', magic, 1, 0, 131072, 0, compression_id, 17,
+            flags))
+
+
+def _metadata_block(data):
+    compressed = zlib.compress(data)
+    return struct.pack('<H', len(compressed)) + compressed
+
+
+class _ImageBuilder:
+    """Write a gzip squashfs image holding entries.
+
+    entries maps paths to the contents of files, or to ('symlink', target).
+    The image is kept simple: the inode and directory tables each fit in a
+    single metadata block and files have no fragments.
+    """
+
+    block_size = 4096
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.directories = {'': set()}
+        for entry in entries:
+            parts = entry.split('/')
+            for index in range(len(parts)):
+                self.directories.setdefault(
+                    '/'.join(parts[:index]), set()).add(parts[index])
+                self.directories.setdefault('/'.join(parts[:index + 1]),
+                                            set())
+        for entry in entries:
+            del self.directories[entry]
+        self.nodes = sorted(set(entries) | set(self.directories))
+        self.numbers = {node: i + 1 for i, node in enumerate(self.nodes)}
+
+        self.inode_offsets, self.listing_offsets = {}, {}
+        inode_offset = listing_offset = 0
+        for node in self.nodes:
+            self.inode_offsets[node] = inode_offset
+            inode_offset += self._inode_size(node)
+            if node in self.directories:
+                self.listing_offsets[node] = listing_offset
+                listing_offset += self._listing_size(node)
+
+    def _is_symlink(self, node):
+        return isinstance(self.entries.get(node), tuple)
+
+    def _inode_size(self, node):
+        if node in self.directories:
+            return 32
+        if self._is_symlink(node):
+            return 24 + len(self.entries[node][1])
+        return 32 + 4 * -(-len(self.entries[node]) // self.block_size)
+
+    def _listing_size(self, node):
+        children = self.directories[node]
+        return (12 if children else 0) + sum(8 + len(c) for c in children)
+
+    def _inode_header(self, node, inode_type):
+        return struct.pack('<HHHHII', inode_type, 0o755, 0, 0, 0,
+                           self.numbers[node])
+
+    def _directory(self, node):
+        inode = self._inode_header(node, 1) + struct.pack(
+            '<IIHHI', 0, 2, self._listing_size(node) + 3,
+            self.listing_offsets[node], 1)
+        children = sorted(self.directories[node])
+        listing = b''
+        if children:
+            listing += struct.pack('<IIi', len(children) - 1, 0, 0)
+        for child in children:
+            path = '/'.join(filter(None, [node, child]))
+            if path in self.directories:
+                child_type = 1
+            elif self._is_symlink(path):
+                child_type = 3
+            else:
+                child_type = 2
+            listing += struct.pack(
+                '<HhHH', self.inode_offsets[path], self.numbers[path],
+                child_type, len(child) - 1) + child.encode()
+        return inode, listing
+
+    def _file(self, node, start):
+        content = self.entries[node]
+        data = b''
+        sizes = []
+        for index in range(0, len(content), self.block_size):
+            block = content[index:index + self.block_size]
+            compressed = zlib.compress(block)
+            if len(compressed) < len(block):
+                sizes.append(len(compressed))
+                data += compressed
+            else:
+                sizes.append(len(block) | 0x1000000)
+                data += block
+        inode = self._inode_header(node, 2) + struct.pack(
+            '<IIII{}I'.format(len(sizes)), start, 0xffffffff, 0,
+            len(content), *sizes)
+        return inode, data
+
+    def write(self, path):
+        data, inodes, listings = b'', b'', b''
+        for node in self.nodes:
+            if node in self.directories:
+                inode, listing = self._directory(node)
+                listings += listing
+            elif self._is_symlink(node):
+                target = self.entries[node][1].encode()
+                inode = self._inode_header(node, 3) + struct.pack(
+                    '<II', 1, len(target)) + target
+            else:
+                inode, file_data = self._file(node, 96 + len(data))
+                data += file_data
+            inodes += inode
+
+        inode_table = _metadata_block(inodes)
+        directory_table = _metadata_block(listings)
+        inode_table_start = 96 + len(data)
+        directory_table_start = inode_table_start + len(inode_table)
+        end = directory_table_start + len(directory_table)
+        with open(path, 'wb') as f:
+            f.write(struct.pack(
+                '<4sIIIIHHHHHHQQQQQQQQ', b'hsqs', len(self.nodes), 0,
+                self.block_size, 0, 1, 12, 0, 1, 4, 0,
+                self.inode_offsets[''], end, end, 2 ** 64 - 1,
+                inode_table_start, directory_table_start, end, 2 ** 64 - 1))
+            f.write(data + inode_table + directory_table)
+
+
+class MksquashfsArgsTestCase(tests.TestCase):
+
+    scenarios = [
+        ('store', dict(profile='store',
+                       expected=['-comp', 'xz', '-b', '131072'])),
+        ('fast', dict(profile='fast',
+                      expected=['-comp', 'gzip', '-Xcompression-level', '1',
+                                '-b', '1048576'])),
+        ('uncompressed', dict(profile='uncompressed',
+                              expected=['-noI', '-noD', '-noF', '-noX',
+                                        '-b', '1048576'])),
+    ]
+
+    def test_args(self):
+        self.assertEqual(
+            self.expected + ['-processors', '3'],
+            squashfs.get_mksquashfs_args(self.profile, processors=3))
+
+
+class UnknownProfileTestCase(tests.TestCase):
+
+    def test_unknown_profile_raises(self):
+        raised = self.assertRaises(
+            ValueError,
+            squashfs.get_mksquashfs_args, 'tiny', processors=1)
+        self.assertEqual(
+            "Unknown pack profile 'tiny', valid profiles are: "
+            "store, fast, uncompressed",
+            str(raised))
+
+
+class GetPackProfileTestCase(tests.TestCase):
+
+    scenarios = [
+        ('xz', dict(compression_id=4, flags=0x02c0, expected='store')),
+        ('gzip', dict(compression_id=1, flags=0x02c0, expected='fast')),
+        ('lzo', dict(compression_id=3, flags=0x02c0, expected='fast')),
+        ('uncompressed', dict(compression_id=1, flags=0x02cb,
+                              expected='uncompressed')),
+        ('xz without compressed data', dict(compression_id=4, flags=0x02c2,
+                                            expected='fast')),
+    ]
+
+    def test_get_pack_profile(self):
+        _write_superblock('test.snap', self.compression_id, self.flags)
+        self.assertEqual(self.expected, squashfs.get_pack_profile('test.snap'))
+
+
+class ReadSuperblockTestCase(tests.TestCase):
+
+    def test_read_test_snap(self):
+        snap_path = os.path.join(
+            os.path.dirname(tests.__file__), 'data', 'test-snap.snap')
+        superblock = squashfs.read_superblock(snap_path)
+        self.assertEqual('xz', superblock.compression)
+        self.assertEqual(131072, superblock.block_size)
+
+    def test_bad_magic_raises(self):
+        _write_superblock('test.snap', magic=b'PK\x03\x04')
+        raised = self.assertRaises(
+            errors.InvalidSquashfsError,
+            squashfs.read_superblock, 'test.snap')
+        self.assertIn('bad magic', str(raised))
+
+    def test_truncated_superblock_raises(self):
+        with open('test.snap', 'wb') as f:
+            f.write(b'hsqs')
+        raised = self.assertRaises(
+            errors.InvalidSquashfsError,
+            squashfs.read_superblock, 'test.snap')
+        self.assertIn('the superblock is truncated', str(raised))
+
+
+class GetSortEntriesTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.snap_dir = os.path.join(self.path, 'prime')
+        for path in ('bin/app', 'lib/libfoo.so', 'lib/libbar.so',
+                     'share/with space'):
+            path = os.path.join(self.snap_dir, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+
+    def get_sort_entries(self, trace):
+        with open('startup.trace', 'w') as f:
+            f.write(trace)
+        return squashfs.get_sort_entries('startup.trace', self.snap_dir)
+
+    def test_path_list(self):
+        self.assertEqual(
+            ['lib/libfoo.so', 'bin/app', 'lib/libbar.so'],
+            self.get_sort_entries(
+                '# startup files\n'
+                'lib/libfoo.so\n'
+                '$SNAP/bin/app\n'
+                '/snap/test-snap/x1/lib/libbar.so\n'
+                '\n'))
+
+    def test_strace_output(self):
+        self.assertEqual(
+            ['bin/app', 'lib/libbar.so'],
+            self.get_sort_entries(
+                'execve("/snap/test-snap/12/bin/app", ["app"], []) = 0\n'
+                'open("/etc/ld.so.cache", O_RDONLY|O_CLOEXEC) = 3\n'
+                '1234 openat(AT_FDCWD, "/snap/test-snap/12/bin/app", '
+                'O_RDONLY) = 3\n'
+                'openat(AT_FDCWD, "/snap/test-snap/12/lib/libmissing.so", '
+                'O_RDONLY|O_CLOEXEC) = -1 ENOENT (No such file or '
+                'directory)\n'
+                'open("{}/lib/libbar.so", O_RDONLY) = 4\n'.format(
+                    self.snap_dir)))
+
+    def test_duplicates_keep_first_access(self):
+        self.assertEqual(
+            ['lib/libbar.so', 'bin/app'],
+            self.get_sort_entries(
+                'lib/libbar.so\nbin/app\n$SNAP/lib/libbar.so\n'))
+
+    def test_directories_missing_files_and_whitespace_are_skipped(self):
+        self.assertEqual(
+            ['bin/app'],
+            self.get_sort_entries(
+                'lib\nlib/libmissing.so\nshare/with space\n'
+                '/usr/lib/libc.so.6\nbin/app\n'))
+
+
+class WriteSortFileTestCase(tests.TestCase):
+
+    def test_priorities_follow_access_order(self):
+        squashfs.write_sort_file(
+            'snap.sort', '/prime', ['bin/app', 'lib/libfoo.so'])
+
+        with open('snap.sort') as f:
+            self.assertEqual(
+                '/prime/bin/app 32767\n/prime/lib/libfoo.so 32766\n',
+                f.read())
+
+    def test_priorities_stay_above_default(self):
+        squashfs.write_sort_file(
+            'snap.sort', '/prime',
+            ['file{}'.format(i) for i in range(32769)])
+
+        with open('snap.sort') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(
+            ['/prime/file32767 1', '/prime/file32768 1'], lines[-2:])
+
+
+class SquashfsImageTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.large = bytes(range(256)) * 40 + os.urandom(5000)
+        _ImageBuilder({
+            'meta/snap.yaml': b'name: test\n',
+            'usr/lib/initrd.img': self.large,
+            'usr/lib/current': ('symlink', 'initrd.img'),
+            'usr/lib/absolute': ('symlink', '/meta/snap.yaml'),
+            'usr/loop': ('symlink', 'loop'),
+            'bin': ('symlink', 'usr/lib'),
+            'empty/.keep': b'',
+        }).write('test.snap')
+        self.image = squashfs.SquashfsImage('test.snap')
+        self.addCleanup(self.image.close)
+
+    def test_read_test_snap(self):
+        snap_path = os.path.join(
+            os.path.dirname(tests.__file__), 'data', 'test-snap.snap')
+        with squashfs.SquashfsImage(snap_path) as image:
+            self.assertEqual(['meta'], image.listdir())
+            self.assertIn(b'name: basic\n', image.read('meta/snap.yaml'))
+
+    def test_listdir(self):
+        self.assertEqual(['bin', 'empty', 'meta', 'usr'],
+                         self.image.listdir())
+        self.assertEqual(['absolute', 'current', 'initrd.img'],
+                         self.image.listdir('usr/lib'))
+        self.assertEqual(['.keep'], self.image.listdir('empty/'))
+
+    def test_read(self):
+        self.assertEqual(b'name: test\n', self.image.read('meta/snap.yaml'))
+        self.assertEqual(b'', self.image.read('empty/.keep'))
+        self.assertEqual(self.large, self.image.read('usr/lib/initrd.img'))
+
+    def test_read_follows_symlinks(self):
+        self.assertEqual(self.large, self.image.read('usr/lib/current'))
+        self.assertEqual(self.large, self.image.read('bin/current'))
+        self.assertEqual(b'name: test\n', self.image.read('usr/lib/absolute'))
+        self.assertEqual(b'name: test\n',
+                         self.image.read('usr/lib/../../meta/snap.yaml'))
+
+    def test_symlink_loop_raises(self):
+        self.assertRaises(OSError, self.image.read, 'usr/loop')
+
+    def test_extract(self):
+        self.image.extract('bin/current', 'initrd')
+
+        with open('initrd', 'rb') as f:
+            self.assertEqual(self.large, f.read())
+        self.assertEqual(0o755, stat.S_IMODE(os.stat('initrd').st_mode))
+
+    def test_missing_file_raises(self):
+        self.assertRaises(FileNotFoundError, self.image.read, 'meta/missing')
+        self.assertRaises(NotADirectoryError, self.image.read,
+                          'meta/snap.yaml/foo')
+        self.assertRaises(IsADirectoryError, self.image.read, 'meta')
+
+    def test_unsupported_compression_raises(self):
+        _write_superblock('zstd.snap', compression_id=6)
+        with open('zstd.snap', 'ab') as f:
+            f.write(struct.pack('<HHHQ', 1, 4, 0, 0) + bytes(64))
+
+        raised = self.assertRaises(
+            errors.UnsupportedSquashfsCompressionError,
+            squashfs.SquashfsImage, 'zstd.snap')
+        self.assertEqual(
+            "Cannot read 'zstd.snap': zstd compression is not supported.",
+            str(raised))
+
+    def test_invalid_image_raises(self):
+        with open('not-a.snap', 'wb') as f:
+            f.write(b'PK\x03\x04' + bytes(92))
+
+        with testtools.ExpectedException(errors.InvalidSquashfsError,
+                                         '.*bad magic'):
+            squashfs.SquashfsImage('not-a.snap')
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Count the dynamic loader probes of an app with consolidated library paths.
+
+The app is run with LD_LIBRARY_PATH listing every directory of the primed
+tree holding shared objects, which is what many parts with their
+dependency paths amount to, and then with those libraries linked into a
+single directory as done with `consolidate-library-paths`. LD_DEBUG=libs
+reports each file the loader tries:
+
+    PYTHONPATH=. tools/benchmark_library_paths.py prime usr/bin/app --version
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+from snapcraft.internal import libraries
+
+
+def _get_library_paths(snap_dir):
+    library_paths = []
+    for root, directories, files in os.walk(snap_dir):
+        directories.sort()
+        if any(libraries._SHARED_OBJECT_RE.search(f) for f in files):
+            library_paths.append(root)
+    return library_paths
+
+
+def _run(command, library_path, runs):
+    environment = dict(os.environ, LD_LIBRARY_PATH=library_path,
+                       LD_DEBUG='libs')
+    timings = []
+    for _ in range(runs):
+        start = time.monotonic()
+        process = subprocess.run(
+            command, env=environment, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, universal_newlines=True)
+        timings.append(time.monotonic() - start)
+    probes = process.stderr.count('trying file=')
+    return probes, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('snap_dir', help='the primed tree')
+    parser.add_argument('command', nargs=argparse.REMAINDER,
+                        help='the app to run, relative to snap_dir')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    snap_dir = os.path.abspath(args.snap_dir)
+    command = [os.path.join(snap_dir, args.command[0])] + args.command[1:]
+    library_paths = _get_library_paths(snap_dir)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        library_dir = libraries.consolidate_library_paths(
+            work_dir, library_paths)
+        setups = [
+            ('{} paths'.format(len(library_paths)), ':'.join(library_paths)),
+            ('consolidated', library_dir),
+        ]
+        for name, library_path in setups:
+            probes, timings = _run(command, library_path, args.runs)
+            print('{:>14}: {} probes, median {:.2f}ms, min {:.2f}ms'.format(
+                name, probes, statistics.median(timings) * 1000,
+                min(timings) * 1000))
+
+
+if __name__ == '__main__':
+    main()
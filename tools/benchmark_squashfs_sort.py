@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Measure the cold start read time of a snap with and without a sort file.
+
+The primed tree is packed twice with the store profile, once in the default
+mksquashfs order and once with the files in the trace placed first. Each
+image is then loop mounted and the traced files are read in order right
+after dropping the page cache, which is what an app does on a cold start.
+
+This needs root to mount images and drop caches:
+
+    sudo PYTHONPATH=. tools/benchmark_squashfs_sort.py prime startup.trace
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from snapcraft.internal import squashfs
+
+
+def _pack(snap_dir, snap_path, sort_path=None):
+    args = ['mksquashfs', snap_dir, snap_path, '-noappend', '-no-xattrs',
+            '-all-root', '-quiet']
+    args.extend(squashfs.get_mksquashfs_args(
+        'store', processors=os.cpu_count()))
+    if sort_path:
+        args.extend(['-sort', sort_path])
+    subprocess.check_call(args, stdout=subprocess.DEVNULL)
+
+
+def _drop_caches():
+    os.sync()
+    with open('/proc/sys/vm/drop_caches', 'w') as f:
+        f.write('3\n')
+
+
+def _cold_read(snap_path, mount_dir, entries):
+    subprocess.check_call(
+        ['mount', '-t', 'squashfs', '-o', 'loop,ro', snap_path, mount_dir])
+    try:
+        _drop_caches()
+        start = time.monotonic()
+        for path in entries:
+            with open(os.path.join(mount_dir, path), 'rb') as f:
+                while f.read(1024 * 1024):
+                    pass
+        return time.monotonic() - start
+    finally:
+        subprocess.check_call(['umount', mount_dir])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('snap_dir', help='the primed tree to pack')
+    parser.add_argument('trace', help='the startup trace, as given to '
+                                      '`snapcraft snap --sort-trace`')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    snap_dir = os.path.abspath(args.snap_dir)
+    entries = squashfs.get_sort_entries(args.trace, snap_dir)
+    if not entries:
+        sys.exit('No file from {!r} was found in {!r}'.format(
+            args.trace, snap_dir))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        sort_path = os.path.join(work_dir, 'snap.sort')
+        squashfs.write_sort_file(sort_path, snap_dir, entries)
+        images = [
+            ('default order', os.path.join(work_dir, 'default.snap'), None),
+            ('sorted', os.path.join(work_dir, 'sorted.snap'), sort_path),
+        ]
+        mount_dir = os.path.join(work_dir, 'mnt')
+        os.mkdir(mount_dir)
+
+        print('Reading {} startup files, {} cold runs each'.format(
+            len(entries), args.runs))
+        for name, snap_path, image_sort_path in images:
+            _pack(snap_dir, snap_path, image_sort_path)
+            timings = [_cold_read(snap_path, mount_dir, entries)
+                       for _ in range(args.runs)]
+            print('{:>14}: median {:.3f}s, min {:.3f}s, max {:.3f}s'.format(
+                name, statistics.median(timings), min(timings),
+                max(timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the exec time of the wrappers generated for apps.
+
+A prime tree is laid out as if it had been built from a number of parts,
+each adding its directories to PATH and LD_LIBRARY_PATH the way snapcraft
+does, and an app running /bin/true is wrapped with both the shell and the
+optimized wrappers. Each wrapper, or the app itself when the optimized
+environment is set by snapd, is then run repeatedly with $SNAP pointing to
+the tree:
+
+    PYTHONPATH=. tools/benchmark_wrappers.py --parts 20
+"""
+
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+from snapcraft import ProjectOptions
+from snapcraft.internal import common, meta
+
+
+def _setup_tree(project_dir, parts):
+    prime_dir = os.path.join(project_dir, 'prime')
+    os.makedirs(os.path.join(prime_dir, 'bin'))
+    shutil.copy('/bin/true', os.path.join(prime_dir, 'bin', 'app'))
+
+    env = []
+    for part in range(parts):
+        install_dir = os.path.join(project_dir, 'parts', 'part{}'.format(part),
+                                   'install')
+        for subdir in ('usr/lib', 'lib'):
+            os.makedirs(os.path.join(prime_dir, subdir), exist_ok=True)
+        env.append('PATH="{0}/usr/bin:{0}/bin:{1}/bin:$PATH"'.format(
+            install_dir, prime_dir))
+        env.append('LD_LIBRARY_PATH="{0}/usr/lib:{0}/lib:{1}/lib:'
+                   '$LD_LIBRARY_PATH"'.format(install_dir, prime_dir))
+    return prime_dir, env
+
+
+def _wrap(wrappers, prime_dir, environment):
+    # Each mode gets its own packaging, as the optimized one only computes
+    # the shared environment once.
+    packaging = meta._SnapPackaging(
+        {'confinement': 'strict', 'wrappers': wrappers}, ProjectOptions())
+    app = {'command': 'bin/app'}
+    packaging._wrap_app(wrappers, app)
+    environment = dict(environment)
+    # Expand the environment from snap.yaml the way snapd does.
+    for name, value in app.get('environment', {}).items():
+        environment[name] = re.sub(
+            r'\$(\w+)', lambda m: environment.get(m.group(1), ''), value)
+    return [os.path.join(prime_dir, app['command'])], environment
+
+
+def _time_exec(command, environment, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.monotonic()
+        subprocess.check_call(command, env=environment)
+        timings.append(time.monotonic() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--parts', type=int, default=10,
+                        help='the number of parts adding to the environment')
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    current_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as project_dir:
+        os.chdir(project_dir)
+        try:
+            prime_dir, common.env = _setup_tree(project_dir, args.parts)
+            environment = dict(os.environ, SNAP=prime_dir,
+                               SNAP_LIBRARY_PATH='/var/lib/snapd/lib/gl')
+
+            print('Running each wrapper {} times, {} parts'.format(
+                args.runs, args.parts))
+            for wrappers in ('shell', 'optimized'):
+                command, app_environment = _wrap(
+                    wrappers, prime_dir, environment)
+                timings = _time_exec(command, app_environment, args.runs)
+                print('{:>10}: median {:.2f}ms, min {:.2f}ms, '
+                      'max {:.2f}ms'.format(
+                          wrappers, statistics.median(timings) * 1000,
+                          min(timings) * 1000, max(timings) * 1000))
+        finally:
+            os.chdir(current_dir)
+
+
+if __name__ == '__main__':
+    main()